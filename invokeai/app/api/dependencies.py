@@ -15,21 +15,25 @@ from ..services.image_files.image_files_disk import DiskImageFileStorage
 from ..services.image_records.image_records_sqlite import SqliteImageRecordStorage
 from ..services.images.images_default import ImageService
 from ..services.invocation_cache.invocation_cache_memory import MemoryInvocationCache
+from ..services.invocation_cache.invocation_cache_sqlite import SqliteInvocationCache
 from ..services.invocation_processor.invocation_processor_default import DefaultInvocationProcessor
 from ..services.invocation_queue.invocation_queue_memory import MemoryInvocationQueue
 from ..services.invocation_services import InvocationServices
 from ..services.invocation_stats.invocation_stats_default import InvocationStatsService
 from ..services.invoker import Invoker
+from ..services.item_storage.item_storage_graph_execution_sqlite import SqliteGraphExecutionStorage
 from ..services.item_storage.item_storage_sqlite import SqliteItemStorage
+from ..services.latents_collector.latents_collector_default import DefaultLatentsCollector
 from ..services.latents_storage.latents_storage_disk import DiskLatentsStorage
 from ..services.latents_storage.latents_storage_forward_cache import ForwardCacheLatentsStorage
+from ..services.latents_storage.latents_storage_write_behind import WriteBehindLatentsStorage
 from ..services.model_manager.model_manager_default import ModelManagerService
 from ..services.model_records import ModelRecordServiceSQL
 from ..services.names.names_default import SimpleNameService
 from ..services.session_processor.session_processor_default import DefaultSessionProcessor
 from ..services.session_queue.session_queue_sqlite import SqliteSessionQueue
 from ..services.shared.default_graphs import create_system_graphs
-from ..services.shared.graph import GraphExecutionState, LibraryGraph
+from ..services.shared.graph import LibraryGraph
 from ..services.shared.sqlite import SqliteDatabase
 from ..services.urls.urls_default import LocalUrlService
 from ..services.workflow_records.workflow_records_sqlite import SqliteWorkflowRecordsStorage
@@ -77,14 +81,37 @@ class ApiDependencies:
         board_images = BoardImagesService()
         board_records = SqliteBoardRecordStorage(db=db)
         boards = BoardService()
-        events = FastAPIEventService(event_handler_id)
-        graph_execution_manager = SqliteItemStorage[GraphExecutionState](db=db, table_name="graph_executions")
+        events = FastAPIEventService(event_handler_id, max_progress_rate=config.max_progress_rate)
+        graph_execution_manager = SqliteGraphExecutionStorage(db=db, table_name="graph_executions")
         graph_library = SqliteItemStorage[LibraryGraph](db=db, table_name="graphs")
-        image_files = DiskImageFileStorage(f"{output_folder}/images")
+        image_files = DiskImageFileStorage(
+            f"{output_folder}/images",
+            max_writers=config.image_writers,
+            max_intermediate_bytes=int(config.intermediate_images_size * 2**30),
+            max_cache_bytes=int(config.image_cache_size * 2**30),
+            max_thumbnail_cache_bytes=int(config.thumbnail_cache_size * 2**30),
+            thumbnail_sizes=config.thumbnail_sizes,
+            max_thumbnail_disk_bytes=int(config.thumbnail_cache_disk_size * 2**30),
+        )
         image_records = SqliteImageRecordStorage(db=db)
         images = ImageService()
-        invocation_cache = MemoryInvocationCache(max_cache_size=config.node_cache_size)
-        latents = ForwardCacheLatentsStorage(DiskLatentsStorage(f"{output_folder}/latents"))
+        invocation_cache = MemoryInvocationCache(
+            max_cache_size=config.node_cache_size,
+            underlying_cache=SqliteInvocationCache(
+                db=db,
+                max_bytes=int(config.node_cache_disk_size * 2**30),
+                max_age=config.node_cache_max_age * 24 * 60 * 60 or None,
+            )
+            if config.node_cache_disk_size > 0
+            else None,
+        )
+        disk_latents = DiskLatentsStorage(f"{output_folder}/latents")
+        latents = ForwardCacheLatentsStorage(
+            WriteBehindLatentsStorage(disk_latents, max_pending_bytes=int(config.latents_write_behind_size * 2**30))
+            if config.latents_write_behind_size > 0
+            else disk_latents,
+            max_cache_bytes=int(config.latents_cache_size * 2**30),
+        )
         model_manager = ModelManagerService(config, logger)
         model_record_service = ModelRecordServiceSQL(db=db)
         names = SimpleNameService()
@@ -123,6 +150,7 @@ class ApiDependencies:
             urls=urls,
             workflow_image_records=workflow_image_records,
             workflow_records=workflow_records,
+            latents_collector=DefaultLatentsCollector(retention=config.latents_retention),
         )
 
         create_system_graphs(services.graph_library)
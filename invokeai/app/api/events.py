@@ -2,51 +2,168 @@
 
 import asyncio
 import threading
-from queue import Empty, Queue
-from typing import Any
+from collections import deque
+from typing import Any, Optional
 
 from fastapi_events.dispatcher import dispatch
 
+import invokeai.backend.util.logging as logger
+
 from ..services.events.events_base import EventServiceBase
+from ..services.events.events_common import ProgressEventStats
+
+# (queue_id, queue_item_id)
+ProgressKey = tuple[str, int]
 
 
 class FastAPIEventService(EventServiceBase):
+    """
+    Dispatches events to the fastapi_events handlers on the event loop, from any thread.
+
+    Events are queued and the event loop is woken up to dispatch them, once for all the events queued until it gets
+    to them, so events are dispatched as soon as the event loop is free and the event loop never polls for them.
+    Events dispatched while the services stop are still dispatched, and `drain` waits until they are handled.
+
+    Only the latest generator_progress event of each queue item is kept: progress that was not sent yet is replaced
+    by newer progress, so a busy event loop does not fall behind on stale frames. With `max_progress_rate` > 0, the
+    progress of each queue item is sent at most that many times per second, and progress that is still waiting when
+    another event of its queue item is sent is dropped.
+
+    The socket layer sets every how many steps the clients watching each queue want progress images, so that progress
+    images are only made for the steps that someone will see.
+    """
+
     event_handler_id: int
-    __queue: Queue
-    __stop_event: threading.Event
+    __loop: asyncio.AbstractEventLoop
+    __queue: deque[tuple[str, Any, Optional[ProgressKey]]]
+    __scheduled: bool
+    __lock: threading.Lock
+    __progress_interval: float
+    # {key => latest progress that was not sent yet}
+    __progress: dict[ProgressKey, Any]
+    # {key => event loop time when progress was last sent}
+    __progress_sent: dict[ProgressKey, float]
+    __progress_stats: ProgressEventStats
+    # {queue_id => intervals in steps of the clients that want progress images}
+    __progress_image_intervals: dict[str, frozenset[int]]
 
-    def __init__(self, event_handler_id: int) -> None:
+    def __init__(self, event_handler_id: int, max_progress_rate: float = 0) -> None:
         self.event_handler_id = event_handler_id
-        self.__queue = Queue()
-        self.__stop_event = threading.Event()
-        asyncio.create_task(self.__dispatch_from_queue(stop_event=self.__stop_event))
+        self.__loop = asyncio.get_running_loop()
+        self.__queue = deque()
+        self.__scheduled = False
+        self.__lock = threading.Lock()
+        self.__progress_interval = 1 / max_progress_rate if max_progress_rate > 0 else 0
+        self.__progress = {}
+        self.__progress_sent = {}
+        self.__progress_stats = ProgressEventStats(max_rate=max_progress_rate)
+        self.__progress_image_intervals = {}
 
         super().__init__()
 
-    def stop(self, *args, **kwargs):
-        self.__stop_event.set()
-        self.__queue.put(None)
-
     def dispatch(self, event_name: str, payload: Any) -> None:
-        self.__queue.put({"event_name": event_name, "payload": payload})
-
-    async def __dispatch_from_queue(self, stop_event: threading.Event):
-        """Get events on from the queue and dispatch them, from the correct thread"""
-        while not stop_event.is_set():
-            try:
-                event = self.__queue.get(block=False)
-                if not event:  # Probably stopping
-                    continue
-
-                dispatch(
-                    event.get("event_name"),
-                    payload=event.get("payload"),
-                    middleware_id=self.event_handler_id,
-                )
-
-            except Empty:
-                await asyncio.sleep(0.1)
-                pass
-
-            except asyncio.CancelledError as e:
-                raise e  # Raise a proper error
+        key = get_progress_key(event_name, payload)
+        with self.__lock:
+            if key is not None and payload["event"] == "generator_progress":
+                replaced = self.__progress.get(key)
+                if replaced is not None and payload["data"].get("progress_image") is None:
+                    # progress images are not made at every step, so keep the one that was not sent yet
+                    payload["data"]["progress_image"] = replaced["data"].get("progress_image")
+                self.__progress[key] = payload
+                if replaced is not None:
+                    # the progress that was not sent yet is already queued or waiting
+                    self.__progress_stats.dropped += 1
+                    return
+                payload = None
+            self.__queue.append((event_name, payload, key))
+            if self.__scheduled:
+                return
+            self.__scheduled = True
+        try:
+            self.__loop.call_soon_threadsafe(self.__dispatch_from_queue)
+        except RuntimeError:
+            # the event loop is closed, so there is nobody left to handle events
+            with self.__lock:
+                self.__queue.clear()
+                self.__progress.clear()
+                self.__scheduled = False
+
+    def get_progress_stats(self) -> ProgressEventStats:
+        with self.__lock:
+            return self.__progress_stats.model_copy(update={"pending": len(self.__progress)})
+
+    def set_progress_image_intervals(self, queue_id: str, intervals: list[int]) -> None:
+        intervals_set = frozenset(interval for interval in intervals if interval > 0)
+        # replaced rather than changed, as it is read from the session processor thread without locking
+        self.__progress_image_intervals = {
+            **{q: i for q, i in self.__progress_image_intervals.items() if q != queue_id},
+            **({queue_id: intervals_set} if intervals_set else {}),
+        }
+
+    def wants_progress_image(self, queue_id: str, step: int) -> bool:
+        intervals = self.__progress_image_intervals.get(queue_id, ())
+        return any(step % interval == 0 for interval in intervals)
+
+    async def drain(self) -> None:
+        """Dispatches the queued events and waits until they are handled. Called on shutdown, after the services stop."""
+        tasks = asyncio.all_tasks()
+        self.__dispatch_from_queue()
+        handlers = asyncio.all_tasks() - tasks
+        if handlers:
+            await asyncio.wait(handlers, timeout=5)
+
+    def __dispatch_from_queue(self) -> None:
+        """Dispatches every queued event, on the event loop"""
+        with self.__lock:
+            events = list(self.__queue)
+            self.__queue.clear()
+            self.__scheduled = False
+        for event_name, payload, key in events:
+            if key is None:
+                self.__dispatch(event_name, payload)
+            elif payload is None:
+                self.__dispatch_progress(event_name, key)
+            else:
+                with self.__lock:
+                    # progress that is still waiting would be sent after this event, so it is stale
+                    if self.__progress.pop(key, None) is not None:
+                        self.__progress_stats.dropped += 1
+                self.__dispatch(event_name, payload)
+
+    def __dispatch_progress(self, event_name: str, key: ProgressKey) -> None:
+        """Dispatches the latest progress of a queue item, or waits until it may be sent"""
+        now = self.__loop.time()
+        wait = self.__progress_sent.get(key, -self.__progress_interval) + self.__progress_interval - now
+        if wait > 0:
+            self.__loop.call_later(wait, self.__dispatch_progress, event_name, key)
+            return
+        with self.__lock:
+            payload = self.__progress.pop(key, None)
+            if payload is None:
+                return
+            self.__progress_stats.emitted += 1
+        if self.__progress_interval > 0:
+            self.__progress_sent[key] = now
+            if len(self.__progress_sent) > 256:
+                # forget queue items whose progress may be sent again anyway
+                self.__progress_sent = {
+                    k: sent for k, sent in self.__progress_sent.items() if sent > now - self.__progress_interval
+                }
+        self.__dispatch(event_name, payload)
+
+    def __dispatch(self, event_name: str, payload: Any) -> None:
+        try:
+            dispatch(event_name, payload=payload, middleware_id=self.event_handler_id)
+        except Exception as e:
+            logger.error(f"Failed to dispatch event {event_name}: {e}")
+
+
+def get_progress_key(event_name: str, payload: Any) -> Optional[ProgressKey]:
+    """Gets the queue item of a queue event, whose progress is coalesced"""
+    if event_name != EventServiceBase.queue_event:
+        return None
+    data = payload["data"]
+    queue_item_id = data.get("queue_item_id")
+    if queue_item_id is None:
+        return None
+    return data["queue_id"], queue_item_id
@@ -7,7 +7,9 @@ from fastapi.routing import APIRouter
 from pydantic import BaseModel, Field
 
 from invokeai.app.invocations.upscale import ESRGAN_MODELS
+from invokeai.app.services.events.events_common import ProgressEventStats
 from invokeai.app.services.invocation_cache.invocation_cache_common import InvocationCacheStatus
+from invokeai.app.services.latents_collector.latents_collector_common import LatentsCollectorStatus
 from invokeai.backend.image_util.invisible_watermark import InvisibleWatermark
 from invokeai.backend.image_util.patchmatch import PatchMatch
 from invokeai.backend.image_util.safety_checker import SafetyChecker
@@ -144,3 +146,23 @@ async def disable_invocation_cache() -> None:
 async def get_invocation_cache_status() -> InvocationCacheStatus:
     """Clears the invocation cache"""
     return ApiDependencies.invoker.services.invocation_cache.get_status()
+
+
+@app_router.get(
+    "/latents_collector/status",
+    operation_id="get_latents_collector_status",
+    responses={200: {"model": LatentsCollectorStatus}},
+)
+async def get_latents_collector_status() -> LatentsCollectorStatus:
+    """Gets the status of the latents collector, including how much storage it has reclaimed"""
+    return ApiDependencies.invoker.services.latents_collector.get_status()
+
+
+@app_router.get(
+    "/progress_events/stats",
+    operation_id="get_progress_event_stats",
+    responses={200: {"model": ProgressEventStats}},
+)
+async def get_progress_event_stats() -> ProgressEventStats:
+    """Gets the number of generation progress events sent, and dropped for newer progress"""
+    return ApiDependencies.invoker.services.events.get_progress_stats()
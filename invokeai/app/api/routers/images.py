@@ -168,6 +168,22 @@ async def get_image_dto(
         raise HTTPException(status_code=404)
 
 
+@images_router.post(
+    "/images_by_names",
+    operation_id="get_images_by_names",
+    response_model=list[ImageDTO],
+)
+async def get_images_by_names(
+    image_names: list[str] = Body(description="The names of the images to get", embed=True),
+) -> list[ImageDTO]:
+    """Gets the DTOs of many images, skipping images that do not exist"""
+
+    try:
+        return ApiDependencies.invoker.services.images.get_dtos(image_names)
+    except Exception:
+        raise HTTPException(status_code=500, detail="Failed to get images")
+
+
 @images_router.get(
     "/i/{image_name}/metadata",
     operation_id="get_image_metadata",
@@ -197,7 +213,8 @@ async def get_image_metadata(
         404: {"description": "Image not found"},
     },
 )
-async def get_image_full(
+# Not async, as getting the path of an image that is still being written waits for it
+def get_image_full(
     image_name: str = Path(description="The name of full-resolution image file to get"),
 ) -> FileResponse:
     """Gets a full-resolution image file"""
@@ -232,13 +249,17 @@ async def get_image_full(
         404: {"description": "Image not found"},
     },
 )
-async def get_image_thumbnail(
+# Not async, as thumbnails are made when they are first requested
+def get_image_thumbnail(
     image_name: str = Path(description="The name of thumbnail image file to get"),
+    size: Optional[int] = Query(
+        default=None, gt=0, description="The requested size of the thumbnail. The closest available size is returned."
+    ),
 ) -> FileResponse:
-    """Gets a thumbnail image file"""
+    """Gets a thumbnail image file, making it if it does not exist yet"""
 
     try:
-        path = ApiDependencies.invoker.services.images.get_path(image_name, thumbnail=True)
+        path = ApiDependencies.invoker.services.images.get_path(image_name, thumbnail=True, thumbnail_size=size)
         if not ApiDependencies.invoker.services.images.validate_path(path):
             raise HTTPException(status_code=404)
 
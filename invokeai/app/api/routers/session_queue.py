@@ -116,10 +116,8 @@ async def cancel_by_batch_ids(
 async def clear(
     queue_id: str = Path(description="The queue id to perform this operation on"),
 ) -> ClearResult:
-    """Clears the queue entirely, immediately canceling the currently-executing session"""
-    queue_item = ApiDependencies.invoker.services.session_queue.get_current(queue_id)
-    if queue_item is not None:
-        ApiDependencies.invoker.services.session_queue.cancel_queue_item(queue_item.item_id)
+    """Clears the queue entirely, immediately canceling the currently-executing sessions"""
+    ApiDependencies.invoker.services.session_queue.cancel_by_queue_id(queue_id)
     clear_result = ApiDependencies.invoker.services.session_queue.clear(queue_id)
     return clear_result
 
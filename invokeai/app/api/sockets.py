@@ -1,5 +1,9 @@
 # Copyright (c) 2022 Kyle Schouviller (https://github.com/kyle0654)
 
+import base64
+from dataclasses import dataclass
+from typing import Any, Literal, Optional
+
 from fastapi import FastAPI
 from fastapi_events.handlers.local import local_handler
 from fastapi_events.typing import Event
@@ -7,31 +11,134 @@ from socketio import ASGIApp, AsyncServer
 
 from ..services.events.events_base import EventServiceBase
 
+# How a client receives progress images: as base64 data URLs in the JSON of the event, or as JPEG binary attachments
+PROGRESS_IMAGE_FORMAT = Literal["data_url", "binary"]
+
+
+@dataclass
+class ProgressImageSubscription:
+    """How a client subscribed to a queue wants progress images"""
+
+    image_format: PROGRESS_IMAGE_FORMAT = "data_url"
+    # every how many steps the client wants a progress image, or 0 for none
+    interval: int = 1
+    # (queue_item_id, step) of the last progress image sent to the client
+    sent: Optional[tuple[int, int]] = None
+
+    def wants(self, queue_item_id: int, step: int) -> bool:
+        if self.interval <= 0:
+            return False
+        if self.sent is None or self.sent[0] != queue_item_id or step < self.sent[1]:
+            return True
+        # progress images are not made or sent at every step, so this is not simply step % interval
+        return step - self.sent[1] >= self.interval
+
+
+def get_data_url(jpeg: bytes) -> str:
+    return "data:image/jpeg;base64," + base64.b64encode(jpeg).decode("UTF-8")
+
 
 class SocketIO:
+    """
+    Sends queue events to the socket.io clients subscribed to their queue.
+
+    Clients subscribe with `{"queue_id": ..., "progress_image_format": ..., "progress_image_interval": ...}`.
+    Progress images are sent as base64 data URLs in `progress_image.dataURL` by default. With
+    `"progress_image_format": "binary"`, they are sent as JPEG bytes in `progress_image.jpeg`, which socket.io sends as a
+    binary attachment instead of encoding it in the JSON.
+
+    Clients get a progress image every `progress_image_interval` steps, every step by default, or none with 0. Progress
+    images are only made for the steps that the clients watching the queue want.
+    """
+
     __sio: AsyncServer
     __app: ASGIApp
+    __events: Optional[EventServiceBase]
+    # {queue_id => {sid => progress image subscription}}
+    __subscribers: dict[str, dict[str, ProgressImageSubscription]]
 
     def __init__(self, app: FastAPI):
         self.__sio = AsyncServer(async_mode="asgi", cors_allowed_origins="*")
         self.__app = ASGIApp(socketio_server=self.__sio, socketio_path="socket.io")
+        self.__events = None
+        self.__subscribers = {}
         app.mount("/ws", self.__app)
 
         self.__sio.on("subscribe_queue", handler=self._handle_sub_queue)
         self.__sio.on("unsubscribe_queue", handler=self._handle_unsub_queue)
+        self.__sio.on("disconnect", handler=self._handle_disconnect)
         local_handler.register(event_name=EventServiceBase.queue_event, _func=self._handle_queue_event)
 
+    def set_event_service(self, events: EventServiceBase) -> None:
+        """Sets the event service told which progress images the subscribed clients want, once it is initialized"""
+        self.__events = events
+        for queue_id in self.__subscribers:
+            self.__update_progress_image_intervals(queue_id)
+
     async def _handle_queue_event(self, event: Event):
-        await self.__sio.emit(
-            event=event[1]["event"],
-            data=event[1]["data"],
-            room=event[1]["data"]["queue_id"],
-        )
+        event_name: str = event[1]["event"]
+        data: dict[str, Any] = event[1]["data"]
+        queue_id: str = data["queue_id"]
+        progress_image = data.get("progress_image") if event_name == "generator_progress" else None
+        if progress_image is None:
+            await self.__sio.emit(event=event_name, data=data, room=queue_id)
+            return
+
+        binary_sids: list[str] = []
+        data_url_sids: list[str] = []
+        for sid, subscription in self.__subscribers.get(queue_id, {}).items():
+            if subscription.wants(data["queue_item_id"], data["step"]):
+                subscription.sent = (data["queue_item_id"], data["step"])
+                (binary_sids if subscription.image_format == "binary" else data_url_sids).append(sid)
+        if binary_sids:
+            await self.__sio.emit(event=event_name, data=data, to=binary_sids)
+        if data_url_sids:
+            # only encoded for the clients that need it
+            data_url_image = {
+                "width": progress_image["width"],
+                "height": progress_image["height"],
+                "dataURL": get_data_url(progress_image["jpeg"]),
+            }
+            await self.__sio.emit(event=event_name, data={**data, "progress_image": data_url_image}, to=data_url_sids)
+        if len(binary_sids) + len(data_url_sids) < len(self.__subscribers.get(queue_id, {})):
+            await self.__sio.emit(
+                event=event_name,
+                data={**data, "progress_image": None},
+                room=queue_id,
+                skip_sid=binary_sids + data_url_sids,
+            )
 
     async def _handle_sub_queue(self, sid, data, *args, **kwargs):
         if "queue_id" in data:
-            await self.__sio.enter_room(sid, data["queue_id"])
+            queue_id = data["queue_id"]
+            interval = data.get("progress_image_interval", 1)
+            subscription = ProgressImageSubscription(
+                image_format="binary" if data.get("progress_image_format") == "binary" else "data_url",
+                interval=interval if isinstance(interval, int) and interval >= 0 else 1,
+            )
+            await self.__sio.enter_room(sid, queue_id)
+            self.__subscribers.setdefault(queue_id, {})[sid] = subscription
+            self.__update_progress_image_intervals(queue_id)
 
     async def _handle_unsub_queue(self, sid, data, *args, **kwargs):
         if "queue_id" in data:
             await self.__sio.leave_room(sid, data["queue_id"])
+            self.__unsubscribe(sid, data["queue_id"])
+
+    async def _handle_disconnect(self, sid, *args, **kwargs):
+        # socket.io removes disconnected clients from their rooms
+        for queue_id in list(self.__subscribers):
+            self.__unsubscribe(sid, queue_id)
+
+    def __unsubscribe(self, sid: str, queue_id: str) -> None:
+        subscribers = self.__subscribers.get(queue_id)
+        if subscribers is not None and sid in subscribers:
+            del subscribers[sid]
+            if not subscribers:
+                del self.__subscribers[queue_id]
+            self.__update_progress_image_intervals(queue_id)
+
+    def __update_progress_image_intervals(self, queue_id: str) -> None:
+        if self.__events is not None:
+            subscribers = self.__subscribers.get(queue_id, {})
+            self.__events.set_progress_image_intervals(queue_id, [s.interval for s in subscribers.values()])
@@ -38,6 +38,7 @@ if True:  # hack to make flake8 happy with imports coming after setting up the c
 
     from ..backend.util.logging import InvokeAILogger
     from .api.dependencies import ApiDependencies
+    from .api.events import FastAPIEventService
     from .api.routers import (
         app_info,
         board_images,
@@ -94,12 +95,17 @@ app.add_middleware(GZipMiddleware, minimum_size=1000)
 @app.on_event("startup")
 async def startup_event() -> None:
     ApiDependencies.initialize(config=app_config, event_handler_id=event_handler_id, logger=logger)
+    socket_io.set_event_service(ApiDependencies.invoker.services.events)
 
 
 # Shut down threads
 @app.on_event("shutdown")
 async def shutdown_event() -> None:
     ApiDependencies.shutdown()
+    # events dispatched while the services stopped are still sent
+    events = ApiDependencies.invoker.services.events if ApiDependencies.invoker else None
+    if isinstance(events, FastAPIEventService):
+        await events.drain()
 
 
 # Include all routers
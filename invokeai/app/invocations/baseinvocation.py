@@ -492,6 +492,23 @@ class MissingInputException(Exception):
         super().__init__(f"Node {node_id} missing value or connection for field {field_name}")
 
 
+InvocationLane = Literal["cpu", "gpu"]
+"""The lane an invocation runs on when independent nodes are executed concurrently"""
+
+# Invocations in these categories do not use the GPU, and may run on the CPU thread pool
+CPU_INVOCATION_CATEGORIES = {
+    "collections",
+    "controlnet",
+    "image",
+    "inpaint",
+    "math",
+    "metadata",
+    "primitives",
+    "prompt",
+    "string",
+}
+
+
 class BaseInvocation(ABC, BaseModel):
     """
     All invocations must use the `@invocation` decorator to provide their unique type.
@@ -537,6 +554,16 @@ class BaseInvocation(ABC, BaseModel):
     def get_output_type(cls) -> BaseInvocationOutput:
         return signature(cls.invoke).return_annotation
 
+    @classmethod
+    def get_lane(cls) -> InvocationLane:
+        """
+        Gets the lane this invocation runs on when independent nodes are executed concurrently. CPU invocations run
+        on a thread pool, while GPU invocations run one at a time. Defaults to the lane of the invocation's category.
+        Invocations that use the GPU in an otherwise CPU-only category should override this.
+        """
+        category = getattr(getattr(cls, "UIConfig", None), "category", None)
+        return "cpu" if category in CPU_INVOCATION_CATEGORIES else "gpu"
+
     @staticmethod
     def json_schema_extra(schema: dict[str, Any], model_class: Type[BaseModel]) -> None:
         # Add the various UI-facing attributes to the schema. These are used to build the invocation templates.
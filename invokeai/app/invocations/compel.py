@@ -1,5 +1,4 @@
 import re
-from dataclasses import dataclass
 from typing import List, Optional, Union
 
 import torch
@@ -10,6 +9,7 @@ from invokeai.app.invocations.primitives import ConditioningField, ConditioningO
 from invokeai.app.shared.fields import FieldDescriptions
 from invokeai.backend.stable_diffusion.diffusion.conditioning_data import (
     BasicConditioningInfo,
+    ConditioningFieldData,
     ExtraConditioningInfo,
     SDXLConditioningInfo,
 )
@@ -30,13 +30,6 @@ from .baseinvocation import (
 )
 from .model import ClipField
 
-
-@dataclass
-class ConditioningFieldData:
-    conditionings: List[BasicConditioningInfo]
-    # unconditioned: Optional[torch.Tensor]
-
-
 # class ConditioningAlgo(str, Enum):
 #    Compose = "compose"
 #    ComposeEx = "compose_ex"
@@ -13,7 +13,16 @@ from invokeai.app.shared.fields import FieldDescriptions
 from invokeai.backend.image_util.invisible_watermark import InvisibleWatermark
 from invokeai.backend.image_util.safety_checker import SafetyChecker
 
-from .baseinvocation import BaseInvocation, Input, InputField, InvocationContext, WithMetadata, WithWorkflow, invocation
+from .baseinvocation import (
+    BaseInvocation,
+    Input,
+    InputField,
+    InvocationContext,
+    InvocationLane,
+    WithMetadata,
+    WithWorkflow,
+    invocation,
+)
 
 
 @invocation("show_image", title="Show Image", tags=["image"], category="image", version="1.0.0")
@@ -491,6 +500,10 @@ class ImageNSFWBlurInvocation(BaseInvocation, WithMetadata, WithWorkflow):
 
     image: ImageField = InputField(description="The image to check")
 
+    @classmethod
+    def get_lane(cls) -> InvocationLane:
+        return "gpu"
+
     def invoke(self, context: InvocationContext) -> ImageOutput:
         image = context.services.images.get_pil_image(self.image.image_name)
 
@@ -13,7 +13,15 @@ from invokeai.backend.image_util.cv2_inpaint import cv2_inpaint
 from invokeai.backend.image_util.lama import LaMA
 from invokeai.backend.image_util.patchmatch import PatchMatch
 
-from .baseinvocation import BaseInvocation, InputField, InvocationContext, WithMetadata, WithWorkflow, invocation
+from .baseinvocation import (
+    BaseInvocation,
+    InputField,
+    InvocationContext,
+    InvocationLane,
+    WithMetadata,
+    WithWorkflow,
+    invocation,
+)
 from .image import PIL_RESAMPLING_MAP, PIL_RESAMPLING_MODES
 
 
@@ -251,6 +259,10 @@ class LaMaInfillInvocation(BaseInvocation, WithWorkflow, WithMetadata):
 
     image: ImageField = InputField(description="The image to infill")
 
+    @classmethod
+    def get_lane(cls) -> InvocationLane:
+        return "gpu"
+
     def invoke(self, context: InvocationContext) -> ImageOutput:
         image = context.services.images.get_pil_image(self.image.image_name)
 
@@ -199,6 +199,7 @@ class Categories(object):
     Generation = {"category": "Generation"}
     Queue = {"category": "Queue"}
     Nodes = {"category": "Nodes"}
+    Database = {"category": "Database"}
     MemoryPerformance = {"category": "Memory/Performance"}
 
 
@@ -224,6 +225,7 @@ class InvokeAIAppConfig(InvokeAISettings):
     allow_credentials   : bool = Field(default=True, description="Allow CORS credentials", json_schema_extra=Categories.WebServer)
     allow_methods       : List[str] = Field(default=["*"], description="Methods allowed for CORS", json_schema_extra=Categories.WebServer)
     allow_headers       : List[str] = Field(default=["*"], description="Headers allowed for CORS", json_schema_extra=Categories.WebServer)
+    max_progress_rate   : float = Field(default=10, ge=0, description="Maximum number of generation progress events sent per second for each queue item. Progress that is not sent yet is replaced by newer progress. Set to 0 for no limit.", json_schema_extra=Categories.WebServer)
 
     # FEATURES
     esrgan              : bool = Field(default=True, description="Enable/disable upscaling code", json_schema_extra=Categories.Features)
@@ -274,14 +276,33 @@ class InvokeAIAppConfig(InvokeAISettings):
     attention_slice_size: Literal["auto", "balanced", "max", 1, 2, 3, 4, 5, 6, 7, 8] = Field(default="auto", description='Slice size, valid when attention_type=="sliced"', json_schema_extra=Categories.Generation)
     force_tiled_decode  : bool = Field(default=False, description="Whether to enable tiled VAE decode (reduces memory consumption with some performance penalty)", json_schema_extra=Categories.Generation)
     png_compress_level  : int = Field(default=6, description="The compress_level setting of PIL.Image.save(), used for PNG encoding. All settings are lossless. 0 = fastest, largest filesize, 9 = slowest, smallest filesize", json_schema_extra=Categories.Generation)
+    image_writers       : int = Field(default=2, ge=0, description="Number of threads that encode and write images in the background, so nodes do not wait for them. Set to 0 to write images before the node finishes.", json_schema_extra=Categories.Generation)
+    intermediate_images_size : float = Field(default=0.5, ge=0, description="Maximum memory amount used to keep intermediate images in memory instead of writing them to disk (floating point number, GB). When it is full, the least recently used are written with fast compression. Set to 0 to write intermediate images like other images.", json_schema_extra=Categories.Generation)
+    image_cache_size    : float = Field(default=0.25, ge=0, description="Maximum memory amount used to keep the most recently used images in memory, counted as decoded pixels (floating point number, GB)", json_schema_extra=Categories.Generation)
+    thumbnail_cache_size: float = Field(default=0.03, ge=0, description="Maximum memory amount used to keep the most recently used thumbnails in memory, counted as decoded pixels (floating point number, GB)", json_schema_extra=Categories.Generation)
+    thumbnail_sizes     : List[int] = Field(default=[256, 512], min_length=1, description="Sizes of the thumbnails that are made when they are requested. Requests for other sizes get the closest size. Thumbnails of 256 pixels are always available.", json_schema_extra=Categories.Generation)
+    thumbnail_cache_disk_size: float = Field(default=1.0, ge=0, description="Maximum size of the thumbnails kept on disk (floating point number, GB). When it is full, the least recently used are deleted, and made again if they are requested. Set to 0 to keep every thumbnail.", json_schema_extra=Categories.Generation)
 
     # QUEUE
     max_queue_size      : int = Field(default=10000, gt=0, description="Maximum number of items in the session queue", json_schema_extra=Categories.Queue)
+    session_worker_devices : List[str] = Field(default=["auto"], min_length=1, description="Devices to run session workers on. Each worker processes one queue item at a time, e.g. [\"cuda:0\", \"cuda:1\"] processes two at once. \"auto\" uses the generation device.", json_schema_extra=Categories.Queue)
 
     # NODES
     allow_nodes         : Optional[List[str]] = Field(default=None, description="List of nodes to allow. Omit to allow all.", json_schema_extra=Categories.Nodes)
     deny_nodes          : Optional[List[str]] = Field(default=None, description="List of nodes to deny. Omit to deny none.", json_schema_extra=Categories.Nodes)
     node_cache_size     : int = Field(default=512, description="How many cached nodes to keep in memory", json_schema_extra=Categories.Nodes)
+    node_cache_disk_size: float = Field(default=1.0, ge=0, description="Maximum size of the invocation cache on disk, which keeps node outputs across restarts (floating point number, GB). Set to 0 to only cache in memory.", json_schema_extra=Categories.Nodes)
+    node_cache_max_age  : float = Field(default=30, ge=0, description="Days after which node outputs that were not used are removed from the invocation cache on disk. Set to 0 to keep them until the cache is full.", json_schema_extra=Categories.Nodes)
+    latents_cache_size  : float = Field(default=0.25, ge=0, description="Maximum memory amount used to keep the most recently used latents and conditioning in memory (floating point number, GB)", json_schema_extra=Categories.Nodes)
+    latents_write_behind_size : float = Field(default=0.5, ge=0, description="Maximum memory amount used to keep latents and conditioning that are waiting to be written to disk, so nodes do not wait for the writes (floating point number, GB). Set to 0 to write them before the node finishes.", json_schema_extra=Categories.Nodes)
+    latents_retention   : Literal["session", "queue", "forever"] = Field(default="queue", description='When the latents and conditioning of a session are deleted. Use "queue" to keep them until its queue item is deleted (e.g. when the queue is pruned), "session" to delete them when it finishes, and "forever" to keep them.', json_schema_extra=Categories.Nodes)
+    node_cpu_threads    : int = Field(default=0, ge=0, description="Number of threads to run CPU-only nodes on, alongside the GPU node. Set to 0 to run one node at a time.", json_schema_extra=Categories.Nodes)
+
+    # DATABASE
+    db_wal_mode         : bool = Field(default=False, description="Run the database in write-ahead log mode, so that queries run alongside each other and alongside writes. Not used with an in-memory database.", json_schema_extra=Categories.Database)
+    db_read_connections : int = Field(default=4, ge=1, description="Number of read-only database connections for queries, when in write-ahead log mode", json_schema_extra=Categories.Database)
+    db_synchronous      : Literal["off", "normal", "full", "extra"] = Field(default="full", description="SQLite synchronous setting. \"normal\" is faster and still safe in write-ahead log mode.", json_schema_extra=Categories.Database)
+    db_cache_size       : int = Field(default=-2000, description="SQLite page cache size of each database connection. Positive values are a number of pages, negative values are KiB.", json_schema_extra=Categories.Database)
 
     # DEPRECATED FIELDS - STILL HERE IN ORDER TO OBTAN VALUES FROM PRE-3.1 CONFIG FILES
     always_use_cpu      : bool = Field(default=False, description="If true, use the CPU for rendering even if a GPU is available.", json_schema_extra=Categories.MemoryPerformance)
@@ -2,11 +2,12 @@
 
 from typing import Any, Optional
 
+from invokeai.app.services.events.events_common import ProgressEventStats
 from invokeai.app.services.invocation_processor.invocation_processor_common import ProgressImage
 from invokeai.app.services.session_queue.session_queue_common import (
     BatchStatus,
     EnqueueBatchResult,
-    SessionQueueItem,
+    SessionQueueItemWithoutGraph,
     SessionQueueStatus,
 )
 from invokeai.app.util.misc import get_timestamp
@@ -22,6 +23,18 @@ class EventServiceBase:
     def dispatch(self, event_name: str, payload: Any) -> None:
         pass
 
+    def get_progress_stats(self) -> ProgressEventStats:
+        """Gets the counters of generator_progress events that were sent, and that were dropped for newer progress"""
+        return ProgressEventStats()
+
+    def set_progress_image_intervals(self, queue_id: str, intervals: list[int]) -> None:
+        """Sets every how many steps the clients watching a queue want progress images, with one interval per client"""
+        pass
+
+    def wants_progress_image(self, queue_id: str, step: int) -> bool:
+        """Whether a client watching a queue wants the progress image of a step, which is not made otherwise"""
+        return True
+
     def __emit_queue_event(self, event_name: str, payload: dict) -> None:
         """Queue events are emitted to a room with queue_id as the room name"""
         payload["timestamp"] = get_timestamp()
@@ -270,7 +283,7 @@ class EventServiceBase:
 
     def emit_queue_item_status_changed(
         self,
-        session_queue_item: SessionQueueItem,
+        session_queue_item: SessionQueueItemWithoutGraph,
         batch_status: BatchStatus,
         queue_status: SessionQueueStatus,
     ) -> None:
@@ -0,0 +1,13 @@
+from pydantic import BaseModel, Field
+
+
+class ProgressEventStats(BaseModel):
+    max_rate: float = Field(
+        default=0,
+        description="The maximum number of progress events sent per second for each queue item, or 0 for no limit",
+    )
+    emitted: int = Field(default=0, description="The number of progress events sent")
+    dropped: int = Field(
+        default=0, description="The number of progress events replaced by newer progress before they were sent"
+    )
+    pending: int = Field(default=0, description="The number of queue items with progress waiting to be sent")
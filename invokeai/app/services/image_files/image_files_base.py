@@ -6,6 +6,8 @@ from PIL.Image import Image as PILImageType
 
 from invokeai.app.invocations.baseinvocation import MetadataField, WorkflowField
 
+from .image_files_common import ImageCacheStats
+
 
 class ImageFileStorageBase(ABC):
     """Low-level service responsible for storing and retrieving image files."""
@@ -16,8 +18,8 @@ class ImageFileStorageBase(ABC):
         pass
 
     @abstractmethod
-    def get_path(self, image_name: str, thumbnail: bool = False) -> Path:
-        """Gets the internal path to an image or thumbnail."""
+    def get_path(self, image_name: str, thumbnail: bool = False, thumbnail_size: Optional[int] = None) -> Path:
+        """Gets the internal path to an image or thumbnail. Thumbnails are made when they are first requested, in the closest available size to `thumbnail_size`."""
         pass
 
     # TODO: We need to validate paths before starlette makes the FileResponse, else we get a
@@ -34,12 +36,17 @@ class ImageFileStorageBase(ABC):
         image_name: str,
         metadata: Optional[MetadataField] = None,
         workflow: Optional[WorkflowField] = None,
-        thumbnail_size: int = 256,
+        is_intermediate: bool = False,
     ) -> None:
-        """Saves an image and a 256x256 WEBP thumbnail. Returns a tuple of the image name, thumbnail name, and created timestamp."""
+        """Saves an image. Its WEBP thumbnails are made when they are requested. Intermediate images may be kept in memory until their path is needed."""
         pass
 
     @abstractmethod
     def delete(self, image_name: str) -> None:
         """Deletes an image and its thumbnail (if one exists)."""
         pass
+
+    @abstractmethod
+    def get_cache_stats(self, thumbnail: bool = False) -> ImageCacheStats:
+        """Gets the counters of the in-memory cache of images or thumbnails, since the storage was created."""
+        pass
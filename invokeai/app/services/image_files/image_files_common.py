@@ -1,3 +1,6 @@
+from dataclasses import dataclass
+
+
 # TODO: Should these excpetions subclass existing python exceptions?
 class ImageFileNotFoundException(Exception):
     """Raised when an image file is not found in storage."""
@@ -18,3 +21,15 @@ class ImageFileDeleteException(Exception):
 
     def __init__(self, message="Image file not deleted"):
         super().__init__(message)
+
+
+@dataclass
+class ImageCacheStats:
+    """Counters of an image cache. Sizes are bytes of decoded pixels."""
+
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    cached_images: int = 0
+    cached_bytes: int = 0
+    max_bytes: int = 0
@@ -1,7 +1,11 @@
 # Copyright (c) 2022 Kyle Schouviller (https://github.com/kyle0654) and the InvokeAI Team
+import os
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import replace
 from pathlib import Path
-from queue import Queue
-from typing import Dict, Optional, Union
+from threading import Lock, get_ident
+from typing import Dict, Optional, Sequence, Union
 
 from PIL import Image, PngImagePlugin
 from PIL.Image import Image as PILImageType
@@ -9,25 +13,148 @@ from send2trash import send2trash
 
 from invokeai.app.invocations.baseinvocation import MetadataField, WorkflowField
 from invokeai.app.services.invoker import Invoker
-from invokeai.app.util.thumbnails import get_thumbnail_name, make_thumbnail
+from invokeai.app.util.thumbnails import (
+    DEFAULT_THUMBNAIL_SIZE,
+    get_thumbnail_name,
+    make_thumbnail,
+    make_thumbnail_from_file,
+)
 
 from .image_files_base import ImageFileStorageBase
-from .image_files_common import ImageFileDeleteException, ImageFileNotFoundException, ImageFileSaveException
+from .image_files_common import (
+    ImageCacheStats,
+    ImageFileDeleteException,
+    ImageFileNotFoundException,
+    ImageFileSaveException,
+)
+
+# Intermediate images that reach the disk are usually deleted without being read again, so they are written quickly
+INTERMEDIATE_COMPRESS_LEVEL = 1
+
+
+def get_image_size(image: PILImageType) -> int:
+    """Gets the number of bytes used by the pixels of an image"""
+    bytes_per_band = 4 if image.mode in ["I", "F"] else 2 if image.mode.startswith("I;16") else 1
+    return image.width * image.height * len(image.getbands()) * bytes_per_band
+
+
+class ImageCache:
+    """
+    Thread-safe cache of the least recently used images, up to `max_bytes` of decoded pixels.
+
+    Sizes are computed from the image header, so images opened lazily with `Image.open` are cached without decoding
+    them. They are decoded when their pixels are first used.
+    """
+
+    __images: OrderedDict[Path, tuple[PILImageType, int]]
+    __stats: ImageCacheStats
+    __lock: Lock
+
+    def __init__(self, max_bytes: int):
+        self.__images = OrderedDict()
+        self.__stats = ImageCacheStats(max_bytes=max_bytes)
+        self.__lock = Lock()
+
+    def get(self, path: Path) -> Optional[PILImageType]:
+        with self.__lock:
+            cached = self.__images.get(path)
+            if cached is None:
+                self.__stats.misses += 1
+                return None
+            self.__images.move_to_end(path)
+            self.__stats.hits += 1
+            return cached[0]
+
+    def set(self, path: Path, image: PILImageType) -> None:
+        size = get_image_size(image)
+        with self.__lock:
+            self.__pop(path)
+            if size > self.__stats.max_bytes:
+                return
+            self.__images[path] = (image, size)
+            self.__stats.cached_images += 1
+            self.__stats.cached_bytes += size
+            while self.__stats.cached_bytes > self.__stats.max_bytes:
+                self.__pop(next(iter(self.__images)))
+                self.__stats.evictions += 1
+
+    def delete(self, path: Path) -> None:
+        with self.__lock:
+            self.__pop(path)
+
+    def get_stats(self) -> ImageCacheStats:
+        with self.__lock:
+            return replace(self.__stats)
+
+    def __pop(self, path: Path) -> None:
+        cached = self.__images.pop(path, None)
+        if cached is not None:
+            self.__stats.cached_images -= 1
+            self.__stats.cached_bytes -= cached[1]
 
 
 class DiskImageFileStorage(ImageFileStorageBase):
-    """Stores images on disk"""
+    """
+    Stores images on disk.
+
+    With `max_writers` > 0, images are encoded and written by a pool of that many threads, so saving only caches the
+    image and returns. Getting an image or its path waits for the image to be written if it is still pending, and
+    stopping the storage waits for every pending image. Files are written to a temporary file first, so a partially
+    written image is never served.
+
+    With `max_intermediate_bytes` > 0, intermediate images are kept in memory, up to that many bytes of pixels, and
+    are only written to disk when their path is needed, when memory runs out (starting with the least recently used),
+    or when the storage is stopped. They are written with fast compression.
+
+    Thumbnails are not made when images are saved, but when they are first requested, in the closest of
+    `thumbnail_sizes`. They are kept on disk up to `max_thumbnail_disk_bytes` (0 for no limit), and the least recently
+    used are deleted when there is no room left, to be made again if they are requested.
+
+    Recently used images and thumbnails are cached in memory, up to `max_cache_bytes` and `max_thumbnail_cache_bytes`
+    of decoded pixels respectively.
+    """
 
     __output_folder: Path
-    __cache_ids: Queue  # TODO: this is an incredibly naive cache
-    __cache: Dict[Path, PILImageType]
-    __max_cache_size: int
+    __cache: ImageCache
+    __thumbnail_cache: ImageCache
+    __lock: Lock
+    __pending: Dict[str, Future]
+    __writers: Optional[ThreadPoolExecutor]
+    __intermediates: OrderedDict[str, tuple[PILImageType, Optional[MetadataField], Optional[WorkflowField], int]]
+    __intermediates_bytes: int
+    __max_intermediate_bytes: int
+    __stopped: bool
+    __thumbnail_sizes: list[int]
+    __thumbnail_files: OrderedDict[Path, int]
+    __thumbnail_files_bytes: int
+    __max_thumbnail_disk_bytes: int
     __invoker: Invoker
 
-    def __init__(self, output_folder: Union[str, Path]):
-        self.__cache = {}
-        self.__cache_ids = Queue()
-        self.__max_cache_size = 10  # TODO: get this from config
+    def __init__(
+        self,
+        output_folder: Union[str, Path],
+        max_writers: int = 0,
+        max_intermediate_bytes: int = 0,
+        max_cache_bytes: int = 256 * 2**20,
+        max_thumbnail_cache_bytes: int = 32 * 2**20,
+        thumbnail_sizes: Sequence[int] = (DEFAULT_THUMBNAIL_SIZE,),
+        max_thumbnail_disk_bytes: int = 0,
+    ):
+        self.__cache = ImageCache(max_cache_bytes)
+        self.__thumbnail_cache = ImageCache(max_thumbnail_cache_bytes)
+        self.__lock = Lock()
+        self.__pending = {}
+        self.__writers = (
+            ThreadPoolExecutor(max_workers=max_writers, thread_name_prefix="image_writer") if max_writers > 0 else None
+        )
+        self.__intermediates = OrderedDict()
+        self.__intermediates_bytes = 0
+        self.__max_intermediate_bytes = max_intermediate_bytes
+        self.__stopped = False
+        self.__thumbnail_sizes = sorted({DEFAULT_THUMBNAIL_SIZE, *thumbnail_sizes})
+        self.__thumbnail_files = OrderedDict()
+        self.__thumbnail_files_bytes = 0
+        self.__max_thumbnail_disk_bytes = max_thumbnail_disk_bytes
 
         self.__output_folder: Path = output_folder if isinstance(output_folder, Path) else Path(output_folder)
         self.__thumbnails_folder = self.__output_folder / "thumbnails"
@@ -36,17 +163,39 @@ class DiskImageFileStorage(ImageFileStorageBase):
 
     def start(self, invoker: Invoker) -> None:
         self.__invoker = invoker
+        self.__load_thumbnail_files()
+
+    def stop(self, *args, **kwargs) -> None:
+        with self.__lock:
+            self.__stopped = True
+            intermediates = list(self.__intermediates.items())
+            self.__intermediates.clear()
+            self.__intermediates_bytes = 0
+        for image_name, (image, metadata, workflow, _) in intermediates:
+            self.__submit(image, image_name, metadata, workflow, INTERMEDIATE_COMPRESS_LEVEL)
+        with self.__lock:
+            writers = self.__writers
+            self.__writers = None
+        if writers is not None:
+            # every pending image is written before stopping, and images saved later are written immediately
+            writers.shutdown(wait=True)
 
     def get(self, image_name: str) -> PILImageType:
         try:
-            image_path = self.get_path(image_name)
+            image_path = self.__get_path(image_name)
 
-            cache_item = self.__get_cache(image_path)
-            if cache_item:
+            with self.__lock:
+                if image_name in self.__intermediates:
+                    self.__intermediates.move_to_end(image_name)
+                    return self.__intermediates[image_name][0]
+
+            cache_item = self.__cache.get(image_path)
+            if cache_item is not None:
                 return cache_item
 
+            self.__wait_for_pending(image_name)
             image = Image.open(image_path)
-            self.__set_cache(image_path, image)
+            self.__cache.set(image_path, image)
             return image
         except FileNotFoundError as e:
             raise ImageFileNotFoundException from e
@@ -57,65 +206,270 @@ class DiskImageFileStorage(ImageFileStorageBase):
         image_name: str,
         metadata: Optional[MetadataField] = None,
         workflow: Optional[WorkflowField] = None,
-        thumbnail_size: int = 256,
+        is_intermediate: bool = False,
     ) -> None:
         try:
             self.__validate_storage_folders()
-            image_path = self.get_path(image_name)
+            if is_intermediate and self.__keep_intermediate(image, image_name, metadata, workflow):
+                return
+            self.__cache.set(self.__get_path(image_name), image)
+            compress_level = self.__invoker.services.configuration.png_compress_level
+            self.__submit(image, image_name, metadata, workflow, compress_level)
+        except Exception as e:
+            raise ImageFileSaveException from e
 
-            pnginfo = PngImagePlugin.PngInfo()
+    def __keep_intermediate(
+        self,
+        image: PILImageType,
+        image_name: str,
+        metadata: Optional[MetadataField],
+        workflow: Optional[WorkflowField],
+    ) -> bool:
+        size = get_image_size(image)
+        if size > self.__max_intermediate_bytes:
+            return False
+        spilled = []
+        with self.__lock:
+            if self.__stopped:
+                # intermediates kept now would never be written
+                return False
+            if image_name in self.__pending:
+                # an earlier image of this name is being written, so this one is written after it
+                return False
+            if image_name in self.__intermediates:
+                self.__pop_intermediate(image_name)
+            self.__intermediates[image_name] = (image, metadata, workflow, size)
+            self.__intermediates_bytes += size
+            while self.__intermediates_bytes > self.__max_intermediate_bytes:
+                spilled.append(self.__pop_intermediate(next(iter(self.__intermediates))))
+        for spilled_name, (spilled_image, spilled_metadata, spilled_workflow, _) in spilled:
+            # spilled images stay readable from the cache while they are written
+            self.__cache.set(self.__get_path(spilled_name), spilled_image)
+            self.__submit(spilled_image, spilled_name, spilled_metadata, spilled_workflow, INTERMEDIATE_COMPRESS_LEVEL)
+        return True
 
-            if metadata is not None:
-                pnginfo.add_text("invokeai_metadata", metadata.model_dump_json())
-            if workflow is not None:
-                pnginfo.add_text("invokeai_workflow", workflow.model_dump_json())
+    def __pop_intermediate(
+        self, image_name: str
+    ) -> tuple[str, tuple[PILImageType, Optional[MetadataField], Optional[WorkflowField], int]]:
+        intermediate = self.__intermediates.pop(image_name)
+        self.__intermediates_bytes -= intermediate[3]
+        return image_name, intermediate
 
-            image.save(
-                image_path,
-                "PNG",
-                pnginfo=pnginfo,
-                compress_level=self.__invoker.services.configuration.png_compress_level,
-            )
+    def __spill_intermediate(self, image_name: str) -> None:
+        with self.__lock:
+            if image_name not in self.__intermediates:
+                return
+            _, (image, metadata, workflow, _) = self.__pop_intermediate(image_name)
+        self.__cache.set(self.__get_path(image_name), image)
+        self.__submit(image, image_name, metadata, workflow, INTERMEDIATE_COMPRESS_LEVEL)
 
-            thumbnail_name = get_thumbnail_name(image_name)
-            thumbnail_path = self.get_path(thumbnail_name, thumbnail=True)
+    def __submit(
+        self,
+        image: PILImageType,
+        image_name: str,
+        metadata: Optional[MetadataField],
+        workflow: Optional[WorkflowField],
+        compress_level: int,
+    ) -> None:
+        """Writes an image on the writers, or on this thread when there are none"""
+        with self.__lock:
+            previous = self.__pending.get(image_name)
+            future: Optional[Future] = None
+            if self.__writers is not None:
+                try:
+                    future = self.__writers.submit(
+                        self.__write_after, previous, image, image_name, metadata, workflow, compress_level
+                    )
+                except RuntimeError:
+                    # the writers cannot take any more work, e.g. when the interpreter is shutting down
+                    pass
+            written_here = future is None
+            if future is None:
+                # still pending while it is written, so other threads wait for it
+                future = Future()
+            self.__pending[image_name] = future
+
+        if not written_here:
+            future.add_done_callback(lambda future: self.__on_written(image_name, future))
+            return
+        try:
+            self.__write_after(previous, image, image_name, metadata, workflow, compress_level)
+        finally:
+            with self.__lock:
+                if self.__pending.get(image_name) is future:
+                    del self.__pending[image_name]
+            future.set_result(None)
+
+    def __write(
+        self,
+        image: PILImageType,
+        image_name: str,
+        metadata: Optional[MetadataField],
+        workflow: Optional[WorkflowField],
+        compress_level: int,
+    ) -> None:
+        image_path = self.__get_path(image_name)
+        pnginfo = PngImagePlugin.PngInfo()
+
+        if metadata is not None:
+            pnginfo.add_text("invokeai_metadata", metadata.model_dump_json())
+        if workflow is not None:
+            pnginfo.add_text("invokeai_workflow", workflow.model_dump_json())
+
+        temp_path = image_path.with_name(f"{image_path.name}.tmp")
+        image.save(temp_path, "PNG", pnginfo=pnginfo, compress_level=compress_level)
+        os.replace(temp_path, image_path)
+
+    def __make_thumbnail(self, image_name: str, thumbnail_size: int) -> Optional[Path]:
+        """Makes a thumbnail from the image in memory, or from its file. Returns None if there is no such image."""
+        image_path = self.__get_path(image_name)
+        with self.__lock:
+            intermediate = self.__intermediates.get(image_name)
+        image = intermediate[0] if intermediate is not None else self.__cache.get(image_path)
+        if image is not None:
             thumbnail_image = make_thumbnail(image, thumbnail_size)
-            thumbnail_image.save(thumbnail_path)
+        else:
+            self.__wait_for_pending(image_name)
+            if not image_path.exists():
+                return None
+            thumbnail_image = make_thumbnail_from_file(image_path, thumbnail_size)
 
-            self.__set_cache(image_path, image)
-            self.__set_cache(thumbnail_path, thumbnail_image)
-        except Exception as e:
-            raise ImageFileSaveException from e
+        thumbnail_path = self.__get_path(image_name, True, thumbnail_size)
+        temp_path = thumbnail_path.with_name(f"{thumbnail_path.name}.{get_ident()}.tmp")
+        thumbnail_image.save(temp_path, "WEBP")
+        size = temp_path.stat().st_size
+        os.replace(temp_path, thumbnail_path)
+
+        self.__thumbnail_cache.set(thumbnail_path, thumbnail_image)
+        self.__add_thumbnail_files([(thumbnail_path, size)])
+        return thumbnail_path
+
+    def __add_thumbnail_files(self, files: list[tuple[Path, int]]) -> None:
+        """Tracks thumbnail files, from the least recently used, and deletes the oldest when there is no room left"""
+        evicted: list[Path] = []
+        with self.__lock:
+            for path, size in files:
+                self.__forget_thumbnail_file(path)
+                self.__thumbnail_files[path] = size
+                self.__thumbnail_files_bytes += size
+            if self.__max_thumbnail_disk_bytes > 0:
+                while (
+                    self.__thumbnail_files_bytes > self.__max_thumbnail_disk_bytes and len(self.__thumbnail_files) > 1
+                ):
+                    evicted_path = next(iter(self.__thumbnail_files))
+                    self.__forget_thumbnail_file(evicted_path)
+                    evicted.append(evicted_path)
+        for path in evicted:
+            self.__thumbnail_cache.delete(path)
+            try:
+                path.unlink(missing_ok=True)
+            except OSError as e:
+                # e.g. the thumbnail is being served on Windows; it is deleted with its image
+                self.__invoker.services.logger.warning(f"Failed to delete cached thumbnail {path}: {e}")
+
+    def __forget_thumbnail_file(self, path: Path) -> None:
+        size = self.__thumbnail_files.pop(path, None)
+        if size is not None:
+            self.__thumbnail_files_bytes -= size
+
+    def __load_thumbnail_files(self) -> None:
+        files: list[tuple[float, Path, int]] = []
+        for thumbnail_size in self.__thumbnail_sizes:
+            with os.scandir(self.__get_thumbnails_folder(thumbnail_size)) as entries:
+                for entry in entries:
+                    if entry.is_file() and entry.name.endswith(".webp"):
+                        stat = entry.stat()
+                        files.append((stat.st_mtime, Path(entry.path), stat.st_size))
+        files.sort(key=lambda file: file[0])
+        self.__add_thumbnail_files([(path, size) for _, path, size in files])
+
+    def __write_after(self, previous: Optional[Future], *args) -> None:
+        # an image saved again under the same name is written after the earlier write
+        if previous is not None:
+            previous.exception()
+        self.__write(*args)
+
+    def __on_written(self, image_name: str, future: Future) -> None:
+        with self.__lock:
+            if self.__pending.get(image_name) is future:
+                del self.__pending[image_name]
+        error = future.exception()
+        if error is not None:
+            self.__invoker.services.logger.error(f"Failed to save image file {image_name}: {error}")
+
+    def __wait_for_pending(self, image_name: str) -> None:
+        with self.__lock:
+            future = self.__pending.get(image_name)
+        if future is not None:
+            future.exception()
 
     def delete(self, image_name: str) -> None:
         try:
-            image_path = self.get_path(image_name)
+            with self.__lock:
+                if image_name in self.__intermediates:
+                    self.__pop_intermediate(image_name)
+            self.__wait_for_pending(image_name)
+            image_path = self.__get_path(image_name)
 
             if image_path.exists():
                 send2trash(image_path)
-            if image_path in self.__cache:
-                del self.__cache[image_path]
+            self.__cache.delete(image_path)
 
-            thumbnail_name = get_thumbnail_name(image_name)
-            thumbnail_path = self.get_path(thumbnail_name, True)
+            for thumbnail_size in self.__thumbnail_sizes:
+                thumbnail_path = self.__get_path(image_name, True, thumbnail_size)
 
-            if thumbnail_path.exists():
-                send2trash(thumbnail_path)
-            if thumbnail_path in self.__cache:
-                del self.__cache[thumbnail_path]
+                if thumbnail_path.exists():
+                    send2trash(thumbnail_path)
+                self.__thumbnail_cache.delete(thumbnail_path)
+                with self.__lock:
+                    self.__forget_thumbnail_file(thumbnail_path)
         except Exception as e:
             raise ImageFileDeleteException from e
 
     # TODO: make this a bit more flexible for e.g. cloud storage
-    def get_path(self, image_name: str, thumbnail: bool = False) -> Path:
+    def get_path(self, image_name: str, thumbnail: bool = False, thumbnail_size: Optional[int] = None) -> Path:
+        if thumbnail:
+            thumbnail_size = self.__get_thumbnail_size(thumbnail_size)
+            path = self.__get_path(image_name, True, thumbnail_size)
+            with self.__lock:
+                if path in self.__thumbnail_files:
+                    self.__thumbnail_files.move_to_end(path)
+            if path.exists():
+                return path
+            # thumbnails are made when they are first requested, without writing intermediate images to disk
+            return self.__make_thumbnail(image_name, thumbnail_size) or path
+
+        # an image that is only kept in memory is written to disk when its path is needed
+        self.__spill_intermediate(image_name)
+        self.__wait_for_pending(image_name)
+        return self.__get_path(image_name)
+
+    def __get_thumbnail_size(self, thumbnail_size: Optional[int]) -> int:
+        """Gets the smallest thumbnail size that is at least the requested size, or the largest one"""
+        if thumbnail_size is None:
+            return DEFAULT_THUMBNAIL_SIZE
+        return next((size for size in self.__thumbnail_sizes if size >= thumbnail_size), self.__thumbnail_sizes[-1])
+
+    def __get_path(
+        self, image_name: str, thumbnail: bool = False, thumbnail_size: int = DEFAULT_THUMBNAIL_SIZE
+    ) -> Path:
         path = self.__output_folder / image_name
 
         if thumbnail:
             thumbnail_name = get_thumbnail_name(image_name)
-            path = self.__thumbnails_folder / thumbnail_name
+            path = self.__get_thumbnails_folder(thumbnail_size) / thumbnail_name
 
         return path
 
+    def __get_thumbnails_folder(self, thumbnail_size: int) -> Path:
+        # thumbnails of the default size are kept where they have always been
+        if thumbnail_size == DEFAULT_THUMBNAIL_SIZE:
+            return self.__thumbnails_folder
+        return self.__thumbnails_folder / str(thumbnail_size)
+
+    def get_cache_stats(self, thumbnail: bool = False) -> ImageCacheStats:
+        return (self.__thumbnail_cache if thumbnail else self.__cache).get_stats()
+
     def validate_path(self, path: Union[str, Path]) -> bool:
         """Validates the path given for an image or thumbnail."""
         path = path if isinstance(path, Path) else Path(path)
@@ -124,17 +478,6 @@ class DiskImageFileStorage(ImageFileStorageBase):
     def __validate_storage_folders(self) -> None:
         """Checks if the required output folders exist and create them if they don't"""
         folders: list[Path] = [self.__output_folder, self.__thumbnails_folder]
+        folders.extend(self.__get_thumbnails_folder(size) for size in self.__thumbnail_sizes)
         for folder in folders:
             folder.mkdir(parents=True, exist_ok=True)
-
-    def __get_cache(self, image_name: Path) -> Optional[PILImageType]:
-        return None if image_name not in self.__cache else self.__cache[image_name]
-
-    def __set_cache(self, image_name: Path, image: PILImageType):
-        if image_name not in self.__cache:
-            self.__cache[image_name] = image
-            self.__cache_ids.put(image_name)  # TODO: this should refresh position for LRU cache
-            if len(self.__cache) > self.__max_cache_size:
-                cache_id = self.__cache_ids.get()
-                if cache_id in self.__cache:
-                    del self.__cache[cache_id]
@@ -5,7 +5,13 @@ from typing import Optional
 from invokeai.app.invocations.metadata import MetadataField
 from invokeai.app.services.shared.pagination import OffsetPaginatedResults
 
-from .image_records_common import ImageCategory, ImageRecord, ImageRecordChanges, ResourceOrigin
+from .image_records_common import (
+    ImageCategory,
+    ImageRecord,
+    ImageRecordChanges,
+    ImageRecordWithBoardAndWorkflow,
+    ResourceOrigin,
+)
 
 
 class ImageRecordStorageBase(ABC):
@@ -41,8 +47,13 @@ class ImageRecordStorageBase(ABC):
         categories: Optional[list[ImageCategory]] = None,
         is_intermediate: Optional[bool] = None,
         board_id: Optional[str] = None,
-    ) -> OffsetPaginatedResults[ImageRecord]:
-        """Gets a page of image records."""
+    ) -> OffsetPaginatedResults[ImageRecordWithBoardAndWorkflow]:
+        """Gets a page of image records, with the ids of their boards and workflows."""
+        pass
+
+    @abstractmethod
+    def get_many_by_name(self, image_names: list[str]) -> list[ImageRecordWithBoardAndWorkflow]:
+        """Gets the records of many images, with the ids of their boards and workflows. Missing images are skipped."""
         pass
 
     # TODO: The database has a nullable `deleted_at` column, currently unused.
@@ -147,6 +147,15 @@ class ImageRecord(BaseModelExcludeNull):
     """Whether this image is starred."""
 
 
+class ImageRecordWithBoardAndWorkflow(ImageRecord):
+    """Deserialized image record, with the ids of its board and workflow."""
+
+    board_id: Optional[str] = Field(default=None, description="The id of the board the image belongs to, if any.")
+    """The id of the board the image belongs to, if any."""
+    workflow_id: Optional[str] = Field(default=None, description="The id of the workflow that generated the image.")
+    """The id of the workflow that generated the image, if any."""
+
+
 class ImageRecordChanges(BaseModelExcludeNull, extra="allow"):
     """A set of changes to apply to an image record.
 
@@ -203,3 +212,12 @@ def deserialize_image_record(image_dict: dict) -> ImageRecord:
         is_intermediate=is_intermediate,
         starred=starred,
     )
+
+
+def deserialize_image_record_with_board_and_workflow(image_dict: dict) -> ImageRecordWithBoardAndWorkflow:
+    """Deserializes an image record selected along with `board_id` and `workflow_id`."""
+    return ImageRecordWithBoardAndWorkflow(
+        **dict(deserialize_image_record(image_dict)),
+        board_id=image_dict.get("board_id", None),
+        workflow_id=image_dict.get("workflow_id", None),
+    )
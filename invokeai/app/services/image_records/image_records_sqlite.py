@@ -16,18 +16,32 @@ from .image_records_common import (
     ImageRecordDeleteException,
     ImageRecordNotFoundException,
     ImageRecordSaveException,
+    ImageRecordWithBoardAndWorkflow,
     ResourceOrigin,
     deserialize_image_record,
+    deserialize_image_record_with_board_and_workflow,
 )
 
+# The columns of an image record with the ids of its board and workflow, selected with `IMAGE_JOINS`
+IMAGE_WITH_BOARD_AND_WORKFLOW_COLS = f"{IMAGE_DTO_COLS}, board_images.board_id, workflow_images.workflow_id"
+IMAGE_JOINS = """--sql
+LEFT JOIN board_images ON board_images.image_name = images.image_name
+LEFT JOIN workflow_images ON workflow_images.image_name = images.image_name
+"""
+
+# Stays under SQLite's default limit of 999 parameters in older versions
+MAX_NAMES_PER_QUERY = 500
+
 
 class SqliteImageRecordStorage(ImageRecordStorageBase):
     _conn: sqlite3.Connection
     _cursor: sqlite3.Cursor
     _lock: threading.RLock
+    _db: SqliteDatabase
 
     def __init__(self, db: SqliteDatabase) -> None:
         super().__init__()
+        self._db = db
         self._lock = db.lock
         self._conn = db.conn
         self._cursor = self._conn.cursor()
@@ -104,6 +118,19 @@ class SqliteImageRecordStorage(ImageRecordStorageBase):
             """
         )
 
+        # Pages of images of some categories are read in order with this index, rather than sorted
+        self._cursor.execute(
+            """--sql
+            CREATE INDEX IF NOT EXISTS idx_images_image_category_starred_created_at ON images(image_category, starred, created_at);
+            """
+        )
+        # Images of some categories are counted with this index alone, without reading their rows
+        self._cursor.execute(
+            """--sql
+            CREATE INDEX IF NOT EXISTS idx_images_image_category_is_intermediate_image_name ON images(image_category, is_intermediate, image_name);
+            """
+        )
+
         # Add trigger for `updated_at`.
         self._cursor.execute(
             """--sql
@@ -119,22 +146,18 @@ class SqliteImageRecordStorage(ImageRecordStorageBase):
 
     def get(self, image_name: str) -> ImageRecord:
         try:
-            self._lock.acquire()
-
-            self._cursor.execute(
-                f"""--sql
-                SELECT {IMAGE_DTO_COLS} FROM images
-                WHERE image_name = ?;
-                """,
-                (image_name,),
-            )
+            with self._db.read() as cursor:
+                cursor.execute(
+                    f"""--sql
+                    SELECT {IMAGE_DTO_COLS} FROM images
+                    WHERE image_name = ?;
+                    """,
+                    (image_name,),
+                )
 
-            result = cast(Optional[sqlite3.Row], self._cursor.fetchone())
+                result = cast(Optional[sqlite3.Row], cursor.fetchone())
         except sqlite3.Error as e:
-            self._conn.rollback()
             raise ImageRecordNotFoundException from e
-        finally:
-            self._lock.release()
 
         if not result:
             raise ImageRecordNotFoundException
@@ -143,29 +166,25 @@ class SqliteImageRecordStorage(ImageRecordStorageBase):
 
     def get_metadata(self, image_name: str) -> Optional[MetadataField]:
         try:
-            self._lock.acquire()
-
-            self._cursor.execute(
-                """--sql
-                SELECT metadata FROM images
-                WHERE image_name = ?;
-                """,
-                (image_name,),
-            )
+            with self._db.read() as cursor:
+                cursor.execute(
+                    """--sql
+                    SELECT metadata FROM images
+                    WHERE image_name = ?;
+                    """,
+                    (image_name,),
+                )
 
-            result = cast(Optional[sqlite3.Row], self._cursor.fetchone())
+                result = cast(Optional[sqlite3.Row], cursor.fetchone())
 
-            if not result:
-                raise ImageRecordNotFoundException
+                if not result:
+                    raise ImageRecordNotFoundException
 
-            as_dict = dict(result)
-            metadata_raw = cast(Optional[str], as_dict.get("metadata", None))
-            return MetadataFieldValidator.validate_json(metadata_raw) if metadata_raw is not None else None
+                as_dict = dict(result)
+                metadata_raw = cast(Optional[str], as_dict.get("metadata", None))
+                return MetadataFieldValidator.validate_json(metadata_raw) if metadata_raw is not None else None
         except sqlite3.Error as e:
-            self._conn.rollback()
             raise ImageRecordNotFoundException from e
-        finally:
-            self._lock.release()
 
     def update(
         self,
@@ -233,10 +252,8 @@ class SqliteImageRecordStorage(ImageRecordStorageBase):
         categories: Optional[list[ImageCategory]] = None,
         is_intermediate: Optional[bool] = None,
         board_id: Optional[str] = None,
-    ) -> OffsetPaginatedResults[ImageRecord]:
-        try:
-            self._lock.acquire()
-
+    ) -> OffsetPaginatedResults[ImageRecordWithBoardAndWorkflow]:
+        with self._db.read() as cursor:
             # Manually build two queries - one for the count, one for the records
             count_query = """--sql
             SELECT COUNT(*)
@@ -245,10 +262,11 @@ class SqliteImageRecordStorage(ImageRecordStorageBase):
             WHERE 1=1
             """
 
+            # The ids of the boards and workflows are selected along, rather than queried for each image
             images_query = f"""--sql
-            SELECT {IMAGE_DTO_COLS}
+            SELECT {IMAGE_WITH_BOARD_AND_WORKFLOW_COLS}
             FROM images
-            LEFT JOIN board_images ON board_images.image_name = images.image_name
+            {IMAGE_JOINS}
             WHERE 1=1
             """
 
@@ -284,8 +302,9 @@ class SqliteImageRecordStorage(ImageRecordStorageBase):
 
             # board_id of "none" is reserved for images without a board
             if board_id == "none":
+                # `image_name` is in the index of `board_images`, so the rows of `board_images` need not be read
                 query_conditions += """--sql
-                AND board_images.board_id IS NULL
+                AND board_images.image_name IS NULL
                 """
             elif board_id is not None:
                 query_conditions += """--sql
@@ -305,23 +324,39 @@ class SqliteImageRecordStorage(ImageRecordStorageBase):
             images_params.extend([limit, offset])
 
             # Build the list of images, deserializing each row
-            self._cursor.execute(images_query, images_params)
-            result = cast(list[sqlite3.Row], self._cursor.fetchall())
-            images = [deserialize_image_record(dict(r)) for r in result]
+            cursor.execute(images_query, images_params)
+            result = cast(list[sqlite3.Row], cursor.fetchall())
+            images = [deserialize_image_record_with_board_and_workflow(dict(r)) for r in result]
 
             # Set up and execute the count query, without pagination
             count_query += query_conditions + ";"
             count_params = query_params.copy()
-            self._cursor.execute(count_query, count_params)
-            count = cast(int, self._cursor.fetchone()[0])
-        except sqlite3.Error as e:
-            self._conn.rollback()
-            raise e
-        finally:
-            self._lock.release()
+            cursor.execute(count_query, count_params)
+            count = cast(int, cursor.fetchone()[0])
 
         return OffsetPaginatedResults(items=images, offset=offset, limit=limit, total=count)
 
+    def get_many_by_name(self, image_names: list[str]) -> list[ImageRecordWithBoardAndWorkflow]:
+        records: dict[str, ImageRecordWithBoardAndWorkflow] = {}
+        unique_names = list(dict.fromkeys(image_names))
+        with self._db.read() as cursor:
+            for i in range(0, len(unique_names), MAX_NAMES_PER_QUERY):
+                names = unique_names[i : i + MAX_NAMES_PER_QUERY]
+                placeholders = ",".join("?" for _ in names)
+                cursor.execute(
+                    f"""--sql
+                    SELECT {IMAGE_WITH_BOARD_AND_WORKFLOW_COLS}
+                    FROM images
+                    {IMAGE_JOINS}
+                    WHERE images.image_name IN ({placeholders});
+                    """,
+                    names,
+                )
+                for r in cast(list[sqlite3.Row], cursor.fetchall()):
+                    record = deserialize_image_record_with_board_and_workflow(dict(r))
+                    records[record.image_name] = record
+        return [records[image_name] for image_name in unique_names if image_name in records]
+
     def delete(self, image_name: str) -> None:
         try:
             self._lock.acquire()
@@ -467,9 +502,8 @@ class SqliteImageRecordStorage(ImageRecordStorageBase):
             self._lock.release()
 
     def get_most_recent_image_for_board(self, board_id: str) -> Optional[ImageRecord]:
-        try:
-            self._lock.acquire()
-            self._cursor.execute(
+        with self._db.read() as cursor:
+            cursor.execute(
                 """--sql
                 SELECT images.*
                 FROM images
@@ -481,9 +515,7 @@ class SqliteImageRecordStorage(ImageRecordStorageBase):
                 (board_id,),
             )
 
-            result = cast(Optional[sqlite3.Row], self._cursor.fetchone())
-        finally:
-            self._lock.release()
+            result = cast(Optional[sqlite3.Row], cursor.fetchone())
         if result is None:
             return None
 
@@ -40,9 +40,11 @@ def image_record_to_dto(
 ) -> ImageDTO:
     """Converts an image record to an image DTO."""
     return ImageDTO(
-        **image_record.model_dump(),
-        image_url=image_url,
-        thumbnail_url=thumbnail_url,
-        board_id=board_id,
-        workflow_id=workflow_id,
+        **{
+            **image_record.model_dump(),
+            "image_url": image_url,
+            "thumbnail_url": thumbnail_url,
+            "board_id": board_id,
+            "workflow_id": workflow_id,
+        }
     )
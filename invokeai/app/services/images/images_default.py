@@ -18,6 +18,7 @@ from ..image_records.image_records_common import (
     ImageRecordDeleteException,
     ImageRecordNotFoundException,
     ImageRecordSaveException,
+    ImageRecordWithBoardAndWorkflow,
     InvalidImageCategoryException,
     InvalidOriginException,
     ResourceOrigin,
@@ -81,7 +82,11 @@ class ImageService(ImageServiceABC):
             if workflow_id is not None:
                 self.__invoker.services.workflow_image_records.create(workflow_id=workflow_id, image_name=image_name)
             self.__invoker.services.image_files.save(
-                image_name=image_name, image=image, metadata=metadata, workflow=workflow
+                image_name=image_name,
+                image=image,
+                metadata=metadata,
+                workflow=workflow,
+                is_intermediate=bool(is_intermediate),
             )
             image_dto = self.get_dto(image_name)
 
@@ -104,6 +109,9 @@ class ImageService(ImageServiceABC):
     ) -> ImageDTO:
         try:
             self.__invoker.services.image_records.update(image_name, changes)
+            if changes.is_intermediate is False:
+                # an image that is no longer intermediate may only be kept in memory, and is written to disk now
+                self.__invoker.services.image_files.get_path(image_name)
             image_dto = self.get_dto(image_name)
             self._on_changed(image_dto)
             return image_dto
@@ -136,17 +144,11 @@ class ImageService(ImageServiceABC):
 
     def get_dto(self, image_name: str) -> ImageDTO:
         try:
-            image_record = self.__invoker.services.image_records.get(image_name)
-
-            image_dto = image_record_to_dto(
-                image_record=image_record,
-                image_url=self.__invoker.services.urls.get_image_url(image_name),
-                thumbnail_url=self.__invoker.services.urls.get_image_url(image_name, True),
-                board_id=self.__invoker.services.board_image_records.get_board_for_image(image_name),
-                workflow_id=self.__invoker.services.workflow_image_records.get_workflow_for_image(image_name),
-            )
+            image_records = self.__invoker.services.image_records.get_many_by_name([image_name])
+            if not image_records:
+                raise ImageRecordNotFoundException
 
-            return image_dto
+            return self.__to_dto(image_records[0])
         except ImageRecordNotFoundException:
             self.__invoker.services.logger.error("Image record not found")
             raise
@@ -154,6 +156,14 @@ class ImageService(ImageServiceABC):
             self.__invoker.services.logger.error("Problem getting image DTO")
             raise e
 
+    def get_dtos(self, image_names: list[str]) -> list[ImageDTO]:
+        try:
+            image_records = self.__invoker.services.image_records.get_many_by_name(image_names)
+            return [self.__to_dto(r) for r in image_records]
+        except Exception as e:
+            self.__invoker.services.logger.error("Problem getting image DTOs")
+            raise e
+
     def get_metadata(self, image_name: str) -> Optional[MetadataField]:
         try:
             return self.__invoker.services.image_records.get_metadata(image_name)
@@ -177,9 +187,9 @@ class ImageService(ImageServiceABC):
             self.__invoker.services.logger.error("Problem getting image DTO")
             raise e
 
-    def get_path(self, image_name: str, thumbnail: bool = False) -> str:
+    def get_path(self, image_name: str, thumbnail: bool = False, thumbnail_size: Optional[int] = None) -> str:
         try:
-            return str(self.__invoker.services.image_files.get_path(image_name, thumbnail))
+            return str(self.__invoker.services.image_files.get_path(image_name, thumbnail, thumbnail_size))
         except Exception as e:
             self.__invoker.services.logger.error("Problem getting image path")
             raise e
@@ -217,16 +227,7 @@ class ImageService(ImageServiceABC):
                 board_id,
             )
 
-            image_dtos = [
-                image_record_to_dto(
-                    image_record=r,
-                    image_url=self.__invoker.services.urls.get_image_url(r.image_name),
-                    thumbnail_url=self.__invoker.services.urls.get_image_url(r.image_name, True),
-                    board_id=self.__invoker.services.board_image_records.get_board_for_image(r.image_name),
-                    workflow_id=self.__invoker.services.workflow_image_records.get_workflow_for_image(r.image_name),
-                )
-                for r in results.items
-            ]
+            image_dtos = [self.__to_dto(r) for r in results.items]
 
             return OffsetPaginatedResults[ImageDTO](
                 items=image_dtos,
@@ -238,6 +239,15 @@ class ImageService(ImageServiceABC):
             self.__invoker.services.logger.error("Problem getting paginated image DTOs")
             raise e
 
+    def __to_dto(self, image_record: ImageRecordWithBoardAndWorkflow) -> ImageDTO:
+        return image_record_to_dto(
+            image_record=image_record,
+            image_url=self.__invoker.services.urls.get_image_url(image_record.image_name),
+            thumbnail_url=self.__invoker.services.urls.get_image_url(image_record.image_name, True),
+            board_id=image_record.board_id,
+            workflow_id=image_record.workflow_id,
+        )
+
     def delete(self, image_name: str):
         try:
             self.__invoker.services.image_files.delete(image_name)
@@ -259,8 +269,7 @@ class ImageService(ImageServiceABC):
             for image_name in image_names:
                 self.__invoker.services.image_files.delete(image_name)
             self.__invoker.services.image_records.delete_many(image_names)
-            for image_name in image_names:
-                self._on_deleted(image_name)
+            self._on_deleted_many(image_names)
         except ImageRecordDeleteException:
             self.__invoker.services.logger.error("Failed to delete image records")
             raise
@@ -277,7 +286,7 @@ class ImageService(ImageServiceABC):
             count = len(image_names)
             for image_name in image_names:
                 self.__invoker.services.image_files.delete(image_name)
-                self._on_deleted(image_name)
+            self._on_deleted_many(image_names)
             return count
         except ImageRecordDeleteException:
             self.__invoker.services.logger.error("Failed to delete image records")
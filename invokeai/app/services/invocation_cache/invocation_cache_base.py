@@ -12,8 +12,10 @@ class InvocationCacheBase(ABC):
     When new invocations are executed, if they are flagged with `use_cache`, they
     will attempt to pull their value from the cache before executing.
 
-    Implementations should register for the `on_deleted` event of the `images` and `latents`
-    services, and delete any cached outputs that reference the deleted image or latent.
+    Implementations should register for the `on_deleted_many` event of the `images` service and
+    the `on_deleted` event of the `latents` service, and delete any cached outputs that reference
+    the deleted images or latents. They should index the names referenced by each output when it
+    is saved, so this does not need to look at every cached output.
 
     See the memory implementation for an example.
 
@@ -36,14 +38,19 @@ class InvocationCacheBase(ABC):
         """Deletes an invocation output from the cache"""
         pass
 
+    @abstractmethod
+    def invalidate(self, names: list[str]) -> None:
+        """Deletes the invocation outputs that reference any of the given image or latents names"""
+        pass
+
     @abstractmethod
     def clear(self) -> None:
         """Clears the cache"""
         pass
 
     @abstractmethod
-    def create_key(self, invocation: BaseInvocation) -> int:
-        """Gets the key for the invocation's cache item"""
+    def create_key(self, invocation: BaseInvocation) -> str:
+        """Gets the key for the invocation's cache item. Identical work gets the same key, in any process."""
         pass
 
     @abstractmethod
@@ -1,5 +1,30 @@
+import dataclasses
+import hashlib
+import json
+from collections import OrderedDict
+from enum import Enum
+from pathlib import Path
+from threading import Lock
+from typing import TYPE_CHECKING, Any, Iterator, NamedTuple, Optional
+
+import torch
 from pydantic import BaseModel, Field
 
+from invokeai.app.invocations.baseinvocation import BaseInvocation, BaseInvocationOutput
+
+if TYPE_CHECKING:
+    from invokeai.app.services.invocation_services import InvocationServices
+
+
+class InvocationCacheTierStatus(BaseModel):
+    name: str = Field(description="The name of the cache tier")
+    size: int = Field(description="The number of invocation outputs in the cache tier")
+    bytes: int = Field(description="The total size of the invocation outputs in the cache tier, in bytes")
+    hits: int = Field(description="The number of hits in the cache tier")
+    misses: int = Field(description="The number of misses in the cache tier")
+    max_size: Optional[int] = Field(default=None, description="The maximum number of items in the cache tier")
+    max_bytes: Optional[int] = Field(default=None, description="The maximum size of the cache tier, in bytes")
+
 
 class InvocationCacheStatus(BaseModel):
     size: int = Field(description="The current size of the invocation cache")
@@ -7,3 +32,183 @@ class InvocationCacheStatus(BaseModel):
     misses: int = Field(description="The number of cache misses")
     enabled: bool = Field(description="Whether the invocation cache is enabled")
     max_size: int = Field(description="The maximum size of the invocation cache")
+    tiers: list[InvocationCacheTierStatus] = Field(
+        default_factory=list, description="The status of each tier of the invocation cache, from fastest to slowest"
+    )
+
+
+class ContentType(str, Enum):
+    Image = "image"
+    Latents = "latents"
+    Model = "model"
+
+
+class ContentReference(NamedTuple):
+    """A reference from an invocation's inputs to an image, latents or model, whose content is stored elsewhere"""
+
+    content_type: ContentType
+    name: str
+    base_model: Optional[str] = None
+    model_type: Optional[str] = None
+
+
+# Fields that name content stored by the images or latents services. Conditioning and masks are stored as latents.
+CONTENT_NAME_FIELDS = {
+    "image_name": ContentType.Image,
+    "latents_name": ContentType.Latents,
+    "conditioning_name": ContentType.Latents,
+    "mask_name": ContentType.Latents,
+    "masked_latents_name": ContentType.Latents,
+}
+
+
+def find_content_references(value: Any) -> Iterator[ContentReference]:
+    """Finds the images, latents and models referenced by a dumped invocation"""
+    if isinstance(value, dict):
+        if all(isinstance(value.get(key), str) for key in ["model_name", "base_model", "model_type"]):
+            yield ContentReference(ContentType.Model, value["model_name"], value["base_model"], value["model_type"])
+        for key, item in value.items():
+            if key in CONTENT_NAME_FIELDS and isinstance(item, str):
+                yield ContentReference(CONTENT_NAME_FIELDS[key], item)
+            else:
+                yield from find_content_references(item)
+    elif isinstance(value, list):
+        for item in value:
+            yield from find_content_references(item)
+
+
+def find_referenced_names(invocation_output: BaseInvocationOutput) -> frozenset[str]:
+    """Finds the names of the images and latents referenced by an invocation output, for invalidation"""
+    return frozenset(
+        reference.name
+        for reference in find_content_references(invocation_output.model_dump(mode="json", warnings=False))
+        if reference.content_type is not ContentType.Model
+    )
+
+
+def create_cache_key(invocation: BaseInvocation, content_digests: "ContentDigests") -> str:
+    """
+    Creates a key for an invocation's output: a SHA-256 digest of the invocation's type, version and inputs, and of
+    the content of the images, latents and models it references.
+
+    The key does not depend on the process, so it can be used across restarts and by caches shared between workers.
+    """
+    inputs = invocation.model_dump(mode="json", exclude={"id"}, warnings=False)
+    references = sorted(set(find_content_references(inputs)))
+    key_data = {
+        "type": invocation.get_type(),
+        "version": getattr(invocation.UIConfig, "version", None),
+        "inputs": inputs,
+        "content": [[*reference, content_digests.get(reference)] for reference in references],
+    }
+    return hashlib.sha256(json.dumps(key_data, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+
+def _update_digest(digest: Any, value: Any) -> None:
+    # Latents storage holds tensors, and dataclasses of tensors for conditioning
+    if isinstance(value, torch.Tensor):
+        tensor = value.detach().cpu().contiguous()
+        digest.update(f"tensor:{tensor.dtype}:{list(tensor.shape)}:".encode())
+        digest.update(tensor.reshape(-1).view(torch.uint8).numpy().tobytes())
+    elif dataclasses.is_dataclass(value) and not isinstance(value, type):
+        digest.update(f"{type(value).__qualname__}:".encode())
+        _update_digest(digest, {field.name: getattr(value, field.name) for field in dataclasses.fields(value)})
+    elif isinstance(value, dict):
+        for key, item in sorted(value.items(), key=lambda item: str(item[0])):
+            digest.update(f"{key}=".encode())
+            _update_digest(digest, item)
+    elif isinstance(value, (list, tuple)):
+        digest.update(f"{len(value)}:".encode())
+        for item in value:
+            _update_digest(digest, item)
+    else:
+        digest.update(f"{type(value).__qualname__}:{value!r};".encode())
+
+
+class ContentDigests:
+    """
+    Computes digests of the content of images, latents and models, for cache keys.
+
+    Images and latents are not changed once saved, so their digests are kept until they are deleted. Models can be
+    changed on disk, so their digests are recomputed each time, from their config and the size and modification time
+    of their files. Reading whole models would take too long.
+    """
+
+    _services: Optional["InvocationServices"]
+    _digests: OrderedDict[ContentReference, Optional[str]]
+    _max_size: int
+    _lock: Lock
+
+    def __init__(self, max_size: int = 4096) -> None:
+        self._services = None
+        self._digests = OrderedDict()
+        self._max_size = max_size
+        self._lock = Lock()
+
+    def start(self, services: "InvocationServices") -> None:
+        self._services = services
+        services.images.on_deleted(self.forget)
+        services.latents.on_deleted(self.forget)
+
+    def get(self, reference: ContentReference) -> Optional[str]:
+        """Gets the digest of the referenced content, or None if it cannot be read"""
+        if reference.content_type is ContentType.Model:
+            return self._get_model_digest(reference)
+        with self._lock:
+            if reference in self._digests:
+                self._digests.move_to_end(reference)
+                return self._digests[reference]
+        digest = self._get_digest(reference)
+        if digest is None:
+            # not remembered, the content may be saved later
+            return None
+        with self._lock:
+            self._digests[reference] = digest
+            if len(self._digests) > self._max_size:
+                self._digests.popitem(last=False)
+        return digest
+
+    def forget(self, name: str) -> None:
+        with self._lock:
+            for content_type in [ContentType.Image, ContentType.Latents]:
+                self._digests.pop(ContentReference(content_type, name), None)
+
+    def _get_digest(self, reference: ContentReference) -> Optional[str]:
+        if self._services is None:
+            return None
+        digest = hashlib.sha256()
+        try:
+            if reference.content_type is ContentType.Image:
+                # intermediate images may only be kept in memory, so their pixels are hashed rather than their files
+                image = self._services.image_files.get(reference.name)
+                digest.update(f"{image.mode}:{image.size}".encode())
+                digest.update(image.tobytes())
+            else:
+                _update_digest(digest, self._services.latents.get(reference.name))
+        except Exception:
+            return None
+        return digest.hexdigest()
+
+    def _get_model_digest(self, reference: ContentReference) -> Optional[str]:
+        if self._services is None:
+            return None
+        try:
+            model_info = self._services.model_manager.model_info(
+                reference.name,
+                reference.base_model,
+                reference.model_type,  # type: ignore
+            )
+        except Exception:
+            return None
+        if model_info is None:
+            return None
+        digest = hashlib.sha256(json.dumps(model_info, sort_keys=True, default=str).encode())
+        path = model_info.get("path")
+        if path is not None:
+            path = Path(path)
+            if not path.is_absolute():
+                path = self._services.configuration.models_path / path
+            if path.exists():
+                stat = path.stat()
+                digest.update(f"{stat.st_size}:{stat.st_mtime_ns}".encode())
+        return digest.hexdigest()
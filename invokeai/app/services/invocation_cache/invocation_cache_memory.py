@@ -5,7 +5,13 @@ from typing import Optional, Union
 
 from invokeai.app.invocations.baseinvocation import BaseInvocation, BaseInvocationOutput
 from invokeai.app.services.invocation_cache.invocation_cache_base import InvocationCacheBase
-from invokeai.app.services.invocation_cache.invocation_cache_common import InvocationCacheStatus
+from invokeai.app.services.invocation_cache.invocation_cache_common import (
+    ContentDigests,
+    InvocationCacheStatus,
+    InvocationCacheTierStatus,
+    create_cache_key,
+    find_referenced_names,
+)
 from invokeai.app.services.invoker import Invoker
 
 
@@ -13,31 +19,52 @@ from invokeai.app.services.invoker import Invoker
 class CachedItem:
     invocation_output: BaseInvocationOutput = field(compare=False)
     invocation_output_json: str = field(compare=False)
+    names: frozenset[str] = field(compare=False)
 
 
 class MemoryInvocationCache(InvocationCacheBase):
+    """
+    Keeps the most recently used invocation outputs in memory, bounded by their number.
+
+    If an underlying cache is given (e.g. a `SqliteInvocationCache`), outputs are written through to it, and misses
+    are looked up in it. Outputs found there are brought back into memory.
+    """
+
     _cache: OrderedDict[Union[int, str], CachedItem]
+    _keys_by_name: dict[str, set[Union[int, str]]]
     _max_cache_size: int
     _disabled: bool
     _hits: int
     _misses: int
+    _bytes: int
     _invoker: Invoker
+    _content_digests: ContentDigests
     _lock: Lock
+    _underlying_cache: Optional[InvocationCacheBase]
 
-    def __init__(self, max_cache_size: int = 0) -> None:
+    def __init__(self, max_cache_size: int = 0, underlying_cache: Optional[InvocationCacheBase] = None) -> None:
         self._cache = OrderedDict()
+        self._keys_by_name = {}
         self._max_cache_size = max_cache_size
         self._disabled = False
         self._hits = 0
         self._misses = 0
+        self._bytes = 0
         self._lock = Lock()
+        self._underlying_cache = underlying_cache
+        self._content_digests = ContentDigests()
 
     def start(self, invoker: Invoker) -> None:
         self._invoker = invoker
         if self._max_cache_size == 0:
             return
-        self._invoker.services.images.on_deleted(self._delete_by_match)
-        self._invoker.services.latents.on_deleted(self._delete_by_match)
+        self._invoker.services.images.on_deleted_many(self.invalidate)
+        self._invoker.services.latents.on_deleted(self._invalidate_one)
+        self._content_digests.start(invoker.services)
+        # The underlying cache is not a service of its own, so it is started here
+        start_op = getattr(self._underlying_cache, "start", None)
+        if callable(start_op):
+            start_op(invoker)
 
     def get(self, key: Union[int, str]) -> Optional[BaseInvocationOutput]:
         with self._lock:
@@ -49,83 +76,132 @@ class MemoryInvocationCache(InvocationCacheBase):
                 self._cache.move_to_end(key)
                 return item.invocation_output
             self._misses += 1
+        if self._underlying_cache is None:
             return None
+        invocation_output = self._underlying_cache.get(key)
+        if invocation_output is not None:
+            with self._lock:
+                self._set(key, invocation_output)
+        return invocation_output
 
     def save(self, key: Union[int, str], invocation_output: BaseInvocationOutput) -> None:
         with self._lock:
             if self._max_cache_size == 0 or self._disabled or key in self._cache:
                 return
-            # If the cache is full, we need to remove the least used
-            number_to_delete = len(self._cache) + 1 - self._max_cache_size
-            self._delete_oldest_access(number_to_delete)
-            self._cache[key] = CachedItem(
-                invocation_output,
-                invocation_output.model_dump_json(
-                    warnings=False, exclude_defaults=True, exclude_unset=True, include={"type"}
-                ),
-            )
+            self._set(key, invocation_output)
+        if self._underlying_cache is not None:
+            self._underlying_cache.save(key, invocation_output)
+
+    def _set(self, key: Union[int, str], invocation_output: BaseInvocationOutput) -> None:
+        if key in self._cache:
+            return
+        # If the cache is full, we need to remove the least used
+        number_to_delete = len(self._cache) + 1 - self._max_cache_size
+        self._delete_oldest_access(number_to_delete)
+        item = CachedItem(
+            invocation_output,
+            invocation_output.model_dump_json(warnings=False),
+            find_referenced_names(invocation_output),
+        )
+        self._cache[key] = item
+        self._bytes += len(item.invocation_output_json.encode())
+        for name in item.names:
+            self._keys_by_name.setdefault(name, set()).add(key)
 
     def _delete_oldest_access(self, number_to_delete: int) -> None:
         number_to_delete = min(number_to_delete, len(self._cache))
         for _ in range(number_to_delete):
-            self._cache.popitem(last=False)
+            self._delete(next(iter(self._cache)))
 
     def _delete(self, key: Union[int, str]) -> None:
         if self._max_cache_size == 0:
             return
         if key in self._cache:
-            del self._cache[key]
+            item = self._cache.pop(key)
+            self._bytes -= len(item.invocation_output_json.encode())
+            for name in item.names:
+                keys = self._keys_by_name[name]
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_name[name]
 
     def delete(self, key: Union[int, str]) -> None:
         with self._lock:
-            return self._delete(key)
+            self._delete(key)
+        if self._underlying_cache is not None:
+            self._underlying_cache.delete(key)
 
     def clear(self, *args, **kwargs) -> None:
         with self._lock:
             if self._max_cache_size == 0:
                 return
             self._cache.clear()
+            self._keys_by_name.clear()
             self._misses = 0
             self._hits = 0
+            self._bytes = 0
+        if self._underlying_cache is not None:
+            self._underlying_cache.clear()
 
-    @staticmethod
-    def create_key(invocation: BaseInvocation) -> int:
-        return hash(invocation.model_dump_json(exclude={"id"}, warnings=False))
+    def create_key(self, invocation: BaseInvocation) -> str:
+        return create_cache_key(invocation, self._content_digests)
 
     def disable(self) -> None:
         with self._lock:
             if self._max_cache_size == 0:
                 return
             self._disabled = True
+        if self._underlying_cache is not None:
+            self._underlying_cache.disable()
 
     def enable(self) -> None:
         with self._lock:
             if self._max_cache_size == 0:
                 return
             self._disabled = False
+        if self._underlying_cache is not None:
+            self._underlying_cache.enable()
 
     def get_status(self) -> InvocationCacheStatus:
         with self._lock:
-            return InvocationCacheStatus(
+            status = InvocationCacheStatus(
                 hits=self._hits,
                 misses=self._misses,
                 enabled=not self._disabled and self._max_cache_size > 0,
                 size=len(self._cache),
                 max_size=self._max_cache_size,
+                tiers=[
+                    InvocationCacheTierStatus(
+                        name="memory",
+                        size=len(self._cache),
+                        bytes=self._bytes,
+                        hits=self._hits,
+                        misses=self._misses,
+                        max_size=self._max_cache_size,
+                    )
+                ],
             )
-
-    def _delete_by_match(self, to_match: str) -> None:
+        if self._underlying_cache is not None and self._max_cache_size > 0:
+            # only misses in memory are looked up in the underlying cache, so its misses are the overall misses
+            underlying_status = self._underlying_cache.get_status()
+            status.hits += underlying_status.hits
+            status.misses = underlying_status.misses
+            status.tiers.extend(underlying_status.tiers)
+        return status
+
+    def invalidate(self, names: list[str]) -> None:
         with self._lock:
             if self._max_cache_size == 0:
                 return
-            keys_to_delete = set()
-            for key, cached_item in self._cache.items():
-                if to_match in cached_item.invocation_output_json:
-                    keys_to_delete.add(key)
-            if not keys_to_delete:
-                return
+            keys_to_delete = {key for name in names for key in self._keys_by_name.get(name, ())}
             for key in keys_to_delete:
                 self._delete(key)
+        if self._underlying_cache is not None:
+            self._underlying_cache.invalidate(names)
+        if keys_to_delete:
             self._invoker.services.logger.debug(
-                f"Deleted {len(keys_to_delete)} cached invocation outputs for {to_match}"
+                f"Deleted {len(keys_to_delete)} cached invocation outputs for {len(names)} deleted images or latents"
             )
+
+    def _invalidate_one(self, name: str) -> None:
+        self.invalidate([name])
@@ -0,0 +1,281 @@
+import json
+import threading
+from typing import Annotated, Any, Optional, Union
+
+from pydantic import Field, TypeAdapter
+
+from invokeai.app.invocations.baseinvocation import BaseInvocation, BaseInvocationOutput
+from invokeai.app.services.invocation_cache.invocation_cache_base import InvocationCacheBase
+from invokeai.app.services.invocation_cache.invocation_cache_common import (
+    ContentDigests,
+    InvocationCacheStatus,
+    InvocationCacheTierStatus,
+    create_cache_key,
+    find_referenced_names,
+)
+from invokeai.app.services.invoker import Invoker
+from invokeai.app.services.shared.sqlite import SqliteDatabase
+
+# The time an output is used. Times only have millisecond precision, so when the latest output was used in the same
+# millisecond, the time is a millisecond after it. Otherwise outputs used in the same millisecond would be removed in
+# the order they were saved, rather than the order they were used.
+ACCESS_TIME = """
+    MAX(
+        STRFTIME('%Y-%m-%d %H:%M:%f', 'NOW'),
+        COALESCE(
+            (SELECT STRFTIME('%Y-%m-%d %H:%M:%f', MAX(accessed_at), '+0.001 seconds') FROM invocation_cache), ''
+        )
+    )
+"""
+
+
+class SqliteInvocationCache(InvocationCacheBase):
+    """
+    Stores invocation outputs in the database, so they are kept across restarts.
+
+    The cache is bounded by the total size of the serialized outputs. When it is full, the outputs that were used
+    least recently are removed. Outputs that have not been used for `max_age` seconds are removed too.
+
+    The names of the images and latents referenced by each output are indexed, so the outputs that reference deleted
+    images or latents can be found without reading every output.
+
+    This is meant to be used as the underlying cache of a `MemoryInvocationCache`, which passes deletions on to it.
+    """
+
+    _db: SqliteDatabase
+    _lock: threading.RLock
+    _max_bytes: int
+    _max_age: Optional[float]
+    _disabled: bool
+    _size: int
+    _bytes: int
+    _hits: int
+    _misses: int
+    _invoker: Invoker
+    _content_digests: ContentDigests
+    _validator: Optional[TypeAdapter[Any]]
+
+    def __init__(self, db: SqliteDatabase, max_bytes: int, max_age: Optional[float] = None) -> None:
+        self._db = db
+        self._lock = db.lock
+        self._max_bytes = max_bytes
+        self._max_age = max_age
+        self._disabled = False
+        self._hits = 0
+        self._misses = 0
+        self._validator = None
+        self._content_digests = ContentDigests()
+        self._create_tables()
+        with self._lock:
+            self._delete_expired()
+            self._db.conn.commit()
+
+    def _create_tables(self) -> None:
+        with self._lock:
+            self._db.conn.execute(
+                """--sql
+                CREATE TABLE IF NOT EXISTS invocation_cache (
+                    key TEXT NOT NULL PRIMARY KEY,
+                    invocation_output TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    accessed_at DATETIME NOT NULL DEFAULT(STRFTIME('%Y-%m-%d %H:%M:%f', 'NOW'))
+                );
+                """
+            )
+            self._db.conn.execute(
+                """--sql
+                CREATE INDEX IF NOT EXISTS idx_invocation_cache_accessed_at ON invocation_cache(accessed_at);
+                """
+            )
+            has_names = self._db.conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'invocation_cache_names';"
+            ).fetchone()
+            if has_names is None:
+                # outputs cached before the names were indexed could not be invalidated
+                self._db.conn.execute("DELETE FROM invocation_cache;")
+            self._db.conn.execute(
+                """--sql
+                CREATE TABLE IF NOT EXISTS invocation_cache_names (
+                    name TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    PRIMARY KEY (name, key),
+                    FOREIGN KEY (key) REFERENCES invocation_cache (key) ON DELETE CASCADE
+                );
+                """
+            )
+            self._db.conn.execute(
+                """--sql
+                CREATE INDEX IF NOT EXISTS idx_invocation_cache_names_key ON invocation_cache_names(key);
+                """
+            )
+            self._db.conn.commit()
+            self._update_totals()
+
+    def start(self, invoker: Invoker) -> None:
+        self._invoker = invoker
+        self._content_digests.start(invoker.services)
+
+    def _parse_output(self, invocation_output: str) -> BaseInvocationOutput:
+        if self._validator is None:
+            # The outputs union is only complete once every invocation is imported, so it is created when first needed
+            self._validator = TypeAdapter(
+                Annotated[BaseInvocationOutput.get_outputs_union(), Field(discriminator="type")]  # type: ignore
+            )
+        return self._validator.validate_json(invocation_output)
+
+    def get(self, key: Union[int, str]) -> Optional[BaseInvocationOutput]:
+        if self._disabled:
+            return None
+        with self._db.read() as cursor:
+            cursor.execute("SELECT invocation_output FROM invocation_cache WHERE key = ?;", (str(key),))
+            result = cursor.fetchone()
+        with self._lock:
+            if result is None:
+                self._misses += 1
+                return None
+            self._db.conn.execute(
+                f"UPDATE invocation_cache SET accessed_at = {ACCESS_TIME} WHERE key = ?;", (str(key),)
+            )
+            self._db.conn.commit()
+            self._hits += 1
+        return self._parse_output(result[0])
+
+    def save(self, key: Union[int, str], invocation_output: BaseInvocationOutput) -> None:
+        if self._disabled:
+            return
+        invocation_output_json = invocation_output.model_dump_json(warnings=False)
+        size = len(invocation_output_json.encode())
+        if size > self._max_bytes:
+            return
+        try:
+            self._lock.acquire()
+            self._delete_expired()
+            cursor = self._db.conn.execute(
+                f"""--sql
+                INSERT OR IGNORE INTO invocation_cache (key, invocation_output, size, accessed_at)
+                VALUES (?, ?, ?, {ACCESS_TIME});
+                """,
+                (str(key), invocation_output_json, size),
+            )
+            if cursor.rowcount > 0:
+                self._db.conn.executemany(
+                    "INSERT INTO invocation_cache_names (name, key) VALUES (?, ?);",
+                    ((name, str(key)) for name in find_referenced_names(invocation_output)),
+                )
+                self._size += 1
+                self._bytes += size
+                self._delete_least_recently_used(self._bytes - self._max_bytes)
+            self._db.conn.commit()
+        except Exception:
+            self._db.conn.rollback()
+            self._update_totals()
+            raise
+        finally:
+            self._lock.release()
+
+    def _update_totals(self) -> None:
+        result = self._db.conn.execute("SELECT COUNT(*), TOTAL(size) FROM invocation_cache;").fetchone()
+        self._size = result[0]
+        self._bytes = int(result[1])
+
+    def _delete_expired(self) -> None:
+        if not self._max_age:
+            return
+        cursor = self._db.conn.execute(
+            "DELETE FROM invocation_cache WHERE accessed_at < STRFTIME('%Y-%m-%d %H:%M:%f', 'NOW', ?);",
+            (f"-{self._max_age} seconds",),
+        )
+        if cursor.rowcount > 0:
+            self._update_totals()
+
+    def _delete_least_recently_used(self, bytes_to_delete: int) -> None:
+        if bytes_to_delete <= 0:
+            return
+        keys_to_delete: list[tuple[str]] = []
+        cursor = self._db.conn.execute("SELECT key, size FROM invocation_cache ORDER BY accessed_at, rowid;")
+        for key, size in cursor:
+            keys_to_delete.append((key,))
+            bytes_to_delete -= size
+            if bytes_to_delete <= 0:
+                break
+        cursor.close()
+        self._db.conn.executemany("DELETE FROM invocation_cache WHERE key = ?;", keys_to_delete)
+        self._update_totals()
+
+    def delete(self, key: Union[int, str]) -> None:
+        try:
+            self._lock.acquire()
+            self._db.conn.execute("DELETE FROM invocation_cache WHERE key = ?;", (str(key),))
+            self._db.conn.commit()
+            self._update_totals()
+        except Exception:
+            self._db.conn.rollback()
+            raise
+        finally:
+            self._lock.release()
+
+    def clear(self) -> None:
+        try:
+            self._lock.acquire()
+            self._db.conn.execute("DELETE FROM invocation_cache;")
+            self._db.conn.commit()
+            self._update_totals()
+            self._hits = 0
+            self._misses = 0
+        except Exception:
+            self._db.conn.rollback()
+            raise
+        finally:
+            self._lock.release()
+
+    def create_key(self, invocation: BaseInvocation) -> str:
+        return create_cache_key(invocation, self._content_digests)
+
+    def disable(self) -> None:
+        self._disabled = True
+
+    def enable(self) -> None:
+        self._disabled = False
+
+    def get_status(self) -> InvocationCacheStatus:
+        with self._lock:
+            return InvocationCacheStatus(
+                hits=self._hits,
+                misses=self._misses,
+                enabled=not self._disabled,
+                size=self._size,
+                max_size=0,
+                tiers=[
+                    InvocationCacheTierStatus(
+                        name="disk",
+                        size=self._size,
+                        bytes=self._bytes,
+                        hits=self._hits,
+                        misses=self._misses,
+                        max_bytes=self._max_bytes,
+                    )
+                ],
+            )
+
+    def invalidate(self, names: list[str]) -> None:
+        if not names:
+            return
+        keys_query = "SELECT key FROM invocation_cache_names WHERE name IN (SELECT value FROM json_each(?))"
+        try:
+            self._lock.acquire()
+            # only the affected outputs are read, so the totals are updated without reading the whole cache
+            count, total_size = self._db.conn.execute(
+                f"SELECT COUNT(*), TOTAL(size) FROM invocation_cache WHERE key IN ({keys_query});", (json.dumps(names),)
+            ).fetchone()
+            if count == 0:
+                return
+            self._db.conn.execute(f"DELETE FROM invocation_cache WHERE key IN ({keys_query});", (json.dumps(names),))
+            self._db.conn.commit()
+            self._size -= count
+            self._bytes -= int(total_size)
+        except Exception:
+            self._db.conn.rollback()
+            self._update_totals()
+            raise
+        finally:
+            self._lock.release()
@@ -1,5 +1,22 @@
 from abc import ABC
+from typing import Callable
+
+from invokeai.app.services.invocation_queue.invocation_queue_common import InvocationQueueItem
 
 
 class InvocationProcessorABC(ABC):  # noqa: B024
-    pass
+    _on_session_finished_callbacks: list[Callable[[InvocationQueueItem], None]]
+
+    def __init__(self) -> None:
+        self._on_session_finished_callbacks = []
+
+    def on_session_finished(self, on_session_finished: Callable[[InvocationQueueItem], None]) -> None:
+        """
+        Register a callback for when a session invoked with `invoke_all` completes or errors. It is called on the
+        processor thread with the last invocation queue item of the session.
+        """
+        self._on_session_finished_callbacks.append(on_session_finished)
+
+    def _on_session_finished(self, queue_item: InvocationQueueItem) -> None:
+        for callback in self._on_session_finished_callbacks:
+            callback(queue_item)
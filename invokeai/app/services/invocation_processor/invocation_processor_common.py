@@ -6,7 +6,7 @@ class ProgressImage(BaseModel):
 
     width: int = Field(description="The effective width of the image in pixels")
     height: int = Field(description="The effective height of the image in pixels")
-    dataURL: str = Field(description="The image data as a b64 data URL")
+    jpeg: bytes = Field(description="The JPEG-encoded image data, sent to clients as a b64 data URL or as binary")
 
 
 class CanceledException(Exception):
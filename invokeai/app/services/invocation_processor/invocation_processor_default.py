@@ -1,11 +1,14 @@
 import time
 import traceback
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from threading import BoundedSemaphore, Event, Thread
 from typing import Optional
 
 import invokeai.backend.util.logging as logger
-from invokeai.app.invocations.baseinvocation import InvocationContext
+from invokeai.app.invocations.baseinvocation import BaseInvocation, BaseInvocationOutput, InvocationContext
 from invokeai.app.services.invocation_queue.invocation_queue_common import InvocationQueueItem
+from invokeai.app.services.shared.graph import GraphExecutionState
+from invokeai.backend.util.devices import bind_thread_to_device
 
 from ..invoker import Invoker
 from .invocation_processor_base import InvocationProcessorABC
@@ -13,35 +16,63 @@ from .invocation_processor_common import CanceledException
 
 
 class DefaultInvocationProcessor(InvocationProcessorABC):
-    __invoker_thread: Thread
+    __invoker_threads: list[Thread]
     __stop_event: Event
     __invoker: Invoker
     __threadLimit: BoundedSemaphore
+    __cpu_pool: Optional[ThreadPoolExecutor] = None
+    __gpu_lanes: list[ThreadPoolExecutor]
+    __sessions: dict[int, GraphExecutionState]
 
     def start(self, invoker) -> None:
-        # if we do want multithreading at some point, we could make this configurable
-        self.__threadLimit = BoundedSemaphore(1)
+        # Each session worker has its own lane, which runs its invocations on the worker's device
+        devices = invoker.services.configuration.session_worker_devices
+        self.__threadLimit = BoundedSemaphore(len(devices))
         self.__invoker = invoker
+        self.__gpu_lanes = []
+        self.__sessions = {}
+        invoker.services.graph_execution_manager.on_changed(self.__on_session_changed)
+        cpu_threads = invoker.services.configuration.node_cpu_threads
+        if cpu_threads > 0:
+            # Independent nodes of a session run concurrently: CPU nodes on a shared pool, and GPU nodes one at a
+            # time on the worker's lane
+            self.__cpu_pool = ThreadPoolExecutor(max_workers=cpu_threads, thread_name_prefix="invoker_cpu")
+            self.__gpu_lanes = [
+                ThreadPoolExecutor(
+                    max_workers=1,
+                    thread_name_prefix=f"invoker_gpu_{worker_id}",
+                    initializer=bind_thread_to_device,
+                    initargs=(device,),
+                )
+                for worker_id, device in enumerate(devices)
+            ]
         self.__stop_event = Event()
-        self.__invoker_thread = Thread(
-            name="invoker_processor",
-            target=self.__process,
-            kwargs={"stop_event": self.__stop_event},
-        )
-        self.__invoker_thread.daemon = True  # TODO: make async and do not use threads
-        self.__invoker_thread.start()
+        self.__invoker_threads = []
+        for worker_id, device in enumerate(devices):
+            thread = Thread(
+                name="invoker_processor" if worker_id == 0 else f"invoker_processor_{worker_id}",
+                target=self.__process,
+                kwargs={"stop_event": self.__stop_event, "worker_id": worker_id, "device": device},
+            )
+            thread.daemon = True  # TODO: make async and do not use threads
+            thread.start()
+            self.__invoker_threads.append(thread)
 
     def stop(self, *args, **kwargs) -> None:
         self.__stop_event.set()
+        for pool in [self.__cpu_pool, *self.__gpu_lanes]:
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
 
-    def __process(self, stop_event: Event):
+    def __process(self, stop_event: Event, worker_id: int = 0, device: str = "auto"):
         try:
             self.__threadLimit.acquire()
+            bind_thread_to_device(device)
             queue_item: Optional[InvocationQueueItem] = None
 
             while not stop_event.is_set():
                 try:
-                    queue_item = self.__invoker.services.queue.get()
+                    queue_item = self.__invoker.services.queue.get(worker_id)
                 except Exception as e:
                     self.__invoker.services.logger.error("Exception while getting from queue:\n%s" % e)
 
@@ -50,9 +81,7 @@ class DefaultInvocationProcessor(InvocationProcessorABC):
                     time.sleep(0.5)
                     continue
                 try:
-                    graph_execution_state = self.__invoker.services.graph_execution_manager.get(
-                        queue_item.graph_execution_state_id
-                    )
+                    graph_execution_state = self.__get_session(queue_item)
                 except Exception as e:
                     self.__invoker.services.logger.error("Exception while retrieving session:\n%s" % e)
                     self.__invoker.services.events.emit_session_retrieval_error(
@@ -63,6 +92,7 @@ class DefaultInvocationProcessor(InvocationProcessorABC):
                         error_type=e.__class__.__name__,
                         error=traceback.format_exc(),
                     )
+                    self.__finish_session(queue_item)
                     continue
 
                 try:
@@ -78,6 +108,11 @@ class DefaultInvocationProcessor(InvocationProcessorABC):
                         error_type=e.__class__.__name__,
                         error=traceback.format_exc(),
                     )
+                    self.__finish_session(queue_item)
+                    continue
+
+                if queue_item.invoke_all and self.__cpu_pool is not None:
+                    self.__invoke_concurrently(queue_item, graph_execution_state)
                     continue
 
                 # get the source node id to provide to clients (the prepared node id is not as useful)
@@ -179,6 +214,7 @@ class DefaultInvocationProcessor(InvocationProcessorABC):
                             session_queue_id=queue_item.session_queue_id,
                             graph_execution_state=graph_execution_state,
                             invoke_all=True,
+                            worker_id=queue_item.worker_id,
                         )
                     except Exception as e:
                         self.__invoker.services.logger.error("Error while invoking:\n%s" % e)
@@ -192,6 +228,7 @@ class DefaultInvocationProcessor(InvocationProcessorABC):
                             error_type=e.__class__.__name__,
                             error=traceback.format_exc(),
                         )
+                        self.__finish_session(queue_item)
                 elif is_complete:
                     self.__invoker.services.events.emit_graph_execution_complete(
                         queue_batch_id=queue_item.session_queue_batch_id,
@@ -199,8 +236,161 @@ class DefaultInvocationProcessor(InvocationProcessorABC):
                         queue_id=queue_item.session_queue_id,
                         graph_execution_state_id=graph_execution_state.id,
                     )
+                    self.__finish_session(queue_item)
 
         except KeyboardInterrupt:
             pass  # Log something? KeyboardInterrupt is probably not going to be seen by the processor
         finally:
             self.__threadLimit.release()
+
+    def __invoke_concurrently(self, queue_item: InvocationQueueItem, graph_execution_state: GraphExecutionState):
+        """
+        Executes the rest of a session, running every ready node at once. CPU nodes run on the CPU pool and all other
+        nodes run one at a time on the session worker's GPU lane. The execution state is only read and modified on
+        this thread. Results are recorded as soon as their nodes finish, so nodes that depend on them can start without
+        waiting for nodes that were started earlier. Results of nodes that finish together are recorded in the order
+        the nodes were started.
+
+        Once the session is canceled or a node errors, no more nodes are started. Nodes already running are allowed
+        to finish, but their results are discarded. Their statistics are reset once they have finished.
+        """
+        services = self.__invoker.services
+        in_flight: dict[Future[BaseInvocationOutput], BaseInvocation] = {}
+        stopped = False
+        errored = False
+        reset_stats = False
+
+        while True:
+            if not stopped and services.queue.is_canceled(graph_execution_state.id):
+                stopped = True
+
+            if not stopped:
+                ready_nodes = graph_execution_state.next_ready()
+                if ready_nodes:
+                    # Save the prepared nodes and their inputs before they run
+                    services.graph_execution_manager.set(graph_execution_state)
+                for invocation in ready_nodes:
+                    services.events.emit_invocation_started(
+                        queue_batch_id=queue_item.session_queue_batch_id,
+                        queue_item_id=queue_item.session_queue_item_id,
+                        queue_id=queue_item.session_queue_id,
+                        graph_execution_state_id=graph_execution_state.id,
+                        node=invocation.model_dump(),
+                        source_node_id=graph_execution_state.prepared_source_mapping[invocation.id],
+                    )
+                    pool = self.__cpu_pool if invocation.get_lane() == "cpu" else self.__gpu_lanes[queue_item.worker_id]
+                    assert pool is not None
+                    try:
+                        future = pool.submit(self.__invoke, queue_item, graph_execution_state.id, invocation)
+                    except RuntimeError:
+                        # The pools are shut down when the processor stops
+                        stopped = True
+                        break
+                    in_flight[future] = invocation
+
+            if not in_flight:
+                break
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            # in_flight is in the order the nodes were started
+            for future in [f for f in in_flight if f in done]:
+                invocation = in_flight.pop(future)
+                if stopped:
+                    continue
+                source_node_id = graph_execution_state.prepared_source_mapping[invocation.id]
+                try:
+                    outputs = future.result()
+                except CanceledException:
+                    stopped = True
+                    reset_stats = True
+                    continue
+                except Exception as e:
+                    stopped = True
+                    errored = True
+                    error = traceback.format_exc()
+                    logger.error(error)
+                    graph_execution_state.set_node_error(invocation.id, error)
+                    services.graph_execution_manager.set(graph_execution_state)
+                    services.logger.error("Error while invoking:\n%s" % e)
+                    services.events.emit_invocation_error(
+                        queue_batch_id=queue_item.session_queue_batch_id,
+                        queue_item_id=queue_item.session_queue_item_id,
+                        queue_id=queue_item.session_queue_id,
+                        graph_execution_state_id=graph_execution_state.id,
+                        node=invocation.model_dump(),
+                        source_node_id=source_node_id,
+                        error_type=e.__class__.__name__,
+                        error=error,
+                    )
+                    reset_stats = True
+                    continue
+
+                if services.queue.is_canceled(graph_execution_state.id):
+                    stopped = True
+                    continue
+
+                graph_execution_state.complete(invocation.id, outputs)
+                services.graph_execution_manager.set(graph_execution_state)
+                services.events.emit_invocation_complete(
+                    queue_batch_id=queue_item.session_queue_batch_id,
+                    queue_item_id=queue_item.session_queue_item_id,
+                    queue_id=queue_item.session_queue_id,
+                    graph_execution_state_id=graph_execution_state.id,
+                    node=invocation.model_dump(),
+                    source_node_id=source_node_id,
+                    result=outputs.model_dump(),
+                )
+
+        if reset_stats:
+            services.performance_statistics.reset_stats(graph_execution_state.id)
+        if stopped:
+            if errored:
+                self.__finish_session(queue_item)
+            return
+
+        services.performance_statistics.log_stats()
+        if graph_execution_state.is_complete():
+            services.events.emit_graph_execution_complete(
+                queue_batch_id=queue_item.session_queue_batch_id,
+                queue_item_id=queue_item.session_queue_item_id,
+                queue_id=queue_item.session_queue_id,
+                graph_execution_state_id=graph_execution_state.id,
+            )
+        self.__finish_session(queue_item)
+
+    def __invoke(
+        self, queue_item: InvocationQueueItem, graph_execution_state_id: str, invocation: BaseInvocation
+    ) -> BaseInvocationOutput:
+        """Invokes a single node, on a CPU pool or GPU lane thread"""
+        with self.__invoker.services.performance_statistics.collect_stats(invocation, graph_execution_state_id):
+            return invocation.invoke_internal(
+                InvocationContext(
+                    services=self.__invoker.services,
+                    graph_execution_state_id=graph_execution_state_id,
+                    queue_item_id=queue_item.session_queue_item_id,
+                    queue_id=queue_item.session_queue_id,
+                    queue_batch_id=queue_item.session_queue_batch_id,
+                )
+            )
+
+    def __get_session(self, queue_item: InvocationQueueItem) -> GraphExecutionState:
+        """
+        Gets the session of an invocation. Each lane keeps the session it is running in memory, so handing off from
+        one node to the next does not reload the session from storage.
+        """
+        session = self.__sessions.get(queue_item.worker_id)
+        if session is None or session.id != queue_item.graph_execution_state_id:
+            session = self.__invoker.services.graph_execution_manager.get(queue_item.graph_execution_state_id)
+            self.__sessions[queue_item.worker_id] = session
+        return session
+
+    def __on_session_changed(self, session: GraphExecutionState) -> None:
+        # Sessions saved from elsewhere (e.g. the sessions API) replace the copy held by a lane
+        for worker_id, lane_session in list(self.__sessions.items()):
+            if lane_session.id == session.id and lane_session is not session:
+                self.__sessions.pop(worker_id, None)
+
+    def __finish_session(self, queue_item: InvocationQueueItem) -> None:
+        self.__sessions.pop(queue_item.worker_id, None)
+        if queue_item.invoke_all:
+            self._on_session_finished(queue_item)
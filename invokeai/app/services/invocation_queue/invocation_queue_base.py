@@ -10,11 +10,13 @@ class InvocationQueueABC(ABC):
     """Abstract base class for all invocation queues"""
 
     @abstractmethod
-    def get(self) -> InvocationQueueItem:
+    def get(self, worker_id: int = 0) -> Optional[InvocationQueueItem]:
+        """Gets the next invocation for the given session worker, blocking until there is one. Gets `None` when stopping."""
         pass
 
     @abstractmethod
     def put(self, item: Optional[InvocationQueueItem]) -> None:
+        """Queues an invocation for its session worker. Putting `None` wakes every worker, so they can stop."""
         pass
 
     @abstractmethod
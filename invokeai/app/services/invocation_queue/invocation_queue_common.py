@@ -16,4 +16,5 @@ class InvocationQueueItem(BaseModel):
         description="The ID of the session batch from which this invocation queue item came"
     )
     invoke_all: bool = Field(default=False)
+    worker_id: int = Field(default=0, description="The ID of the session worker whose lane runs this invocation")
     timestamp: float = Field(default_factory=time.time)
@@ -2,6 +2,7 @@
 
 import time
 from queue import Queue
+from threading import Lock
 from typing import Optional
 
 from .invocation_queue_base import InvocationQueueABC
@@ -9,32 +10,57 @@ from .invocation_queue_common import InvocationQueueItem
 
 
 class MemoryInvocationQueue(InvocationQueueABC):
-    __queue: Queue
+    __queues: dict[int, Queue]
     __cancellations: dict[str, float]
+    __last_timestamps: dict[int, float]
+    __lock: Lock
 
     def __init__(self):
-        self.__queue = Queue()
+        self.__queues = {}
         self.__cancellations = {}
+        self.__last_timestamps = {}
+        self.__lock = Lock()
 
-    def get(self) -> InvocationQueueItem:
-        item = self.__queue.get()
+    def __get_queue(self, worker_id: int) -> Queue:
+        with self.__lock:
+            if worker_id not in self.__queues:
+                self.__queues[worker_id] = Queue()
+                self.__last_timestamps[worker_id] = 0.0
+            return self.__queues[worker_id]
+
+    def get(self, worker_id: int = 0) -> Optional[InvocationQueueItem]:
+        queue = self.__get_queue(worker_id)
+        item = queue.get()
 
         while (
             isinstance(item, InvocationQueueItem)
             and item.graph_execution_state_id in self.__cancellations
             and self.__cancellations[item.graph_execution_state_id] > item.timestamp
         ):
-            item = self.__queue.get()
+            item = queue.get()
+
+        if item is None:
+            return item
 
-        # Clear old items
-        for graph_execution_state_id in list(self.__cancellations.keys()):
-            if self.__cancellations[graph_execution_state_id] < item.timestamp:
-                del self.__cancellations[graph_execution_state_id]
+        # Clear old items, once every worker's queue has moved past them
+        with self.__lock:
+            self.__last_timestamps[worker_id] = item.timestamp
+            oldest_timestamp = min(self.__last_timestamps.values())
+            for graph_execution_state_id in list(self.__cancellations.keys()):
+                if self.__cancellations[graph_execution_state_id] < oldest_timestamp:
+                    del self.__cancellations[graph_execution_state_id]
 
         return item
 
     def put(self, item: Optional[InvocationQueueItem]) -> None:
-        self.__queue.put(item)
+        if item is None:
+            self.__get_queue(0)
+            with self.__lock:
+                queues = list(self.__queues.values())
+            for queue in queues:
+                queue.put(None)
+            return
+        self.__get_queue(item.worker_id).put(item)
 
     def cancel(self, graph_execution_state_id: str) -> None:
         if graph_execution_state_id not in self.__cancellations:
@@ -20,6 +20,7 @@ if TYPE_CHECKING:
     from .invocation_queue.invocation_queue_base import InvocationQueueABC
     from .invocation_stats.invocation_stats_base import InvocationStatsServiceBase
     from .item_storage.item_storage_base import ItemStorageABC
+    from .latents_collector.latents_collector_base import LatentsCollectorBase
     from .latents_storage.latents_storage_base import LatentsStorageBase
     from .model_manager.model_manager_base import ModelManagerServiceBase
     from .model_records import ModelRecordServiceBase
@@ -61,6 +62,7 @@ class InvocationServices:
     urls: "UrlServiceBase"
     workflow_image_records: "WorkflowImageRecordsStorageBase"
     workflow_records: "WorkflowRecordsStorageBase"
+    latents_collector: "LatentsCollectorBase"
 
     def __init__(
         self,
@@ -89,6 +91,7 @@ class InvocationServices:
         urls: "UrlServiceBase",
         workflow_image_records: "WorkflowImageRecordsStorageBase",
         workflow_records: "WorkflowRecordsStorageBase",
+        latents_collector: "LatentsCollectorBase",
     ):
         self.board_images = board_images
         self.board_image_records = board_image_records
@@ -115,3 +118,5 @@ class InvocationServices:
         self.urls = urls
         self.workflow_image_records = workflow_image_records
         self.workflow_records = workflow_records
+        # started last, after every service it reclaims latents through
+        self.latents_collector = latents_collector
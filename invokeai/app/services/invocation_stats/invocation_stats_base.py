@@ -33,6 +33,7 @@ from contextlib import AbstractContextManager
 from typing import Dict
 
 from invokeai.app.invocations.baseinvocation import BaseInvocation
+from invokeai.app.services.image_files.image_files_common import ImageCacheStats
 from invokeai.backend.model_management.model_cache import CacheStats
 
 from .invocation_stats_common import NodeLog
@@ -44,6 +45,8 @@ class InvocationStatsServiceBase(ABC):
     # {graph_id => NodeLog}
     _stats: Dict[str, NodeLog]
     _cache_stats: Dict[str, CacheStats]
+    # {graph_id => image cache counters when the graph started}
+    _image_cache_stats: Dict[str, ImageCacheStats]
     ram_used: float
     ram_changed: float
 
@@ -1,3 +1,4 @@
+import threading
 import time
 from typing import Dict
 
@@ -6,6 +7,7 @@ import torch
 
 import invokeai.backend.util.logging as logger
 from invokeai.app.invocations.baseinvocation import BaseInvocation
+from invokeai.app.services.image_files.image_files_common import ImageCacheStats
 from invokeai.app.services.invoker import Invoker
 from invokeai.app.services.model_manager.model_manager_base import ModelManagerServiceBase
 from invokeai.backend.model_management.model_cache import CacheStats
@@ -16,14 +18,17 @@ from .invocation_stats_common import GIG, NodeLog, NodeStats
 
 class InvocationStatsService(InvocationStatsServiceBase):
     """Accumulate performance information about a running graph. Collects time spent in each node,
-    as well as the maximum and current VRAM utilisation for CUDA systems"""
+    as well as the maximum and current VRAM utilisation for CUDA systems. Nodes may run on several threads at once,
+    so the statistics are guarded by a lock."""
 
     _invoker: Invoker
 
     def __init__(self):
+        self._lock = threading.Lock()
         # {graph_id => NodeLog}
         self._stats: Dict[str, NodeLog] = {}
         self._cache_stats: Dict[str, CacheStats] = {}
+        self._image_cache_stats: Dict[str, ImageCacheStats] = {}
         self.ram_used: float = 0.0
         self.ram_changed: float = 0.0
 
@@ -39,6 +44,8 @@ class InvocationStatsService(InvocationStatsServiceBase):
         start_time: float
         ram_used: int
         model_manager: ModelManagerServiceBase
+        cache_stats: CacheStats
+        track_vram: bool
 
         def __init__(
             self,
@@ -46,6 +53,7 @@ class InvocationStatsService(InvocationStatsServiceBase):
             graph_id: str,
             model_manager: ModelManagerServiceBase,
             collector: "InvocationStatsServiceBase",
+            cache_stats: CacheStats,
         ):
             """Initialize statistics for this run."""
             self.invocation = invocation
@@ -54,14 +62,17 @@ class InvocationStatsService(InvocationStatsServiceBase):
             self.start_time = 0.0
             self.ram_used = 0
             self.model_manager = model_manager
+            self.cache_stats = cache_stats
+            # CPU nodes may run alongside a GPU node, whose peak VRAM they must not reset
+            self.track_vram = torch.cuda.is_available() and invocation.get_lane() != "cpu"
 
         def __enter__(self):
             self.start_time = time.time()
-            if torch.cuda.is_available():
+            if self.track_vram:
                 torch.cuda.reset_peak_memory_stats()
             self.ram_used = psutil.Process().memory_info().rss
             if self.model_manager:
-                self.model_manager.collect_cache_stats(self.collector._cache_stats[self.graph_id])
+                self.model_manager.collect_cache_stats(self.cache_stats)
 
         def __exit__(self, *args):
             """Called on exit from the context."""
@@ -74,7 +85,7 @@ class InvocationStatsService(InvocationStatsServiceBase):
                 graph_id=self.graph_id,
                 invocation_type=self.invocation.type,  # type: ignore # `type` is not on the `BaseInvocation` model, but *is* on all invocations
                 time_used=time.time() - self.start_time,
-                vram_used=torch.cuda.max_memory_allocated() / GIG if torch.cuda.is_available() else 0.0,
+                vram_used=torch.cuda.max_memory_allocated() / GIG if self.track_vram else 0.0,
             )
 
     def collect_stats(
@@ -82,28 +93,42 @@ class InvocationStatsService(InvocationStatsServiceBase):
         invocation: BaseInvocation,
         graph_execution_state_id: str,
     ) -> StatsContext:
-        if not self._stats.get(graph_execution_state_id):  # first time we're seeing this
-            self._stats[graph_execution_state_id] = NodeLog()
-            self._cache_stats[graph_execution_state_id] = CacheStats()
-        return self.StatsContext(invocation, graph_execution_state_id, self._invoker.services.model_manager, self)
+        with self._lock:
+            if not self._stats.get(graph_execution_state_id):  # first time we're seeing this
+                self._stats[graph_execution_state_id] = NodeLog()
+                self._cache_stats[graph_execution_state_id] = CacheStats()
+                if self._invoker.services.image_files:
+                    self._image_cache_stats[graph_execution_state_id] = (
+                        self._invoker.services.image_files.get_cache_stats()
+                    )
+            cache_stats = self._cache_stats[graph_execution_state_id]
+        return self.StatsContext(
+            invocation, graph_execution_state_id, self._invoker.services.model_manager, self, cache_stats
+        )
 
     def reset_all_stats(self):
         """Zero all statistics"""
-        self._stats = {}
+        with self._lock:
+            self._stats = {}
+            self._image_cache_stats = {}
 
     def reset_stats(self, graph_execution_id: str):
-        try:
-            self._stats.pop(graph_execution_id)
-        except KeyError:
-            logger.warning(f"Attempted to clear statistics for unknown graph {graph_execution_id}")
+        with self._lock:
+            try:
+                self._stats.pop(graph_execution_id)
+                self._cache_stats.pop(graph_execution_id, None)
+                self._image_cache_stats.pop(graph_execution_id, None)
+            except KeyError:
+                logger.warning(f"Attempted to clear statistics for unknown graph {graph_execution_id}")
 
     def update_mem_stats(
         self,
         ram_used: float,
         ram_changed: float,
     ):
-        self.ram_used = ram_used
-        self.ram_changed = ram_changed
+        with self._lock:
+            self.ram_used = ram_used
+            self.ram_changed = ram_changed
 
     def update_invocation_stats(
         self,
@@ -112,14 +137,19 @@ class InvocationStatsService(InvocationStatsServiceBase):
         time_used: float,
         vram_used: float,
     ):
-        if not self._stats[graph_id].nodes.get(invocation_type):
-            self._stats[graph_id].nodes[invocation_type] = NodeStats()
-        stats = self._stats[graph_id].nodes[invocation_type]
-        stats.calls += 1
-        stats.time_used += time_used
-        stats.max_vram = max(stats.max_vram, vram_used)
+        with self._lock:
+            if not self._stats[graph_id].nodes.get(invocation_type):
+                self._stats[graph_id].nodes[invocation_type] = NodeStats()
+            stats = self._stats[graph_id].nodes[invocation_type]
+            stats.calls += 1
+            stats.time_used += time_used
+            stats.max_vram = max(stats.max_vram, vram_used)
 
     def log_stats(self):
+        with self._lock:
+            self._log_stats()
+
+    def _log_stats(self):
         completed = set()
         errored = set()
         for graph_id, _node_log in self._stats.items():
@@ -155,13 +185,29 @@ class InvocationStatsService(InvocationStatsServiceBase):
             logger.info(f"   Models cached: {cache_stats.in_cache}")
             logger.info(f"   Models cleared from cache: {cache_stats.cleared}")
             logger.info(f"   Cache high water mark: {hwm:4.2f}/{tot:4.2f}G")
+            image_cache_stats = self._image_cache_stats.get(graph_id)
+            if image_cache_stats is not None:
+                current = self._invoker.services.image_files.get_cache_stats()
+                hits = current.hits - image_cache_stats.hits
+                misses = current.misses - image_cache_stats.misses
+                hit_rate = hits / (hits + misses) if hits + misses else 0.0
+                logger.info("Image cache statistics:")
+                logger.info(f"   Image cache hits: {hits} ({hit_rate:.0%})")
+                logger.info(f"   Image cache misses: {misses}")
+                logger.info(f"   Images evicted from cache: {current.evictions - image_cache_stats.evictions}")
+                logger.info(
+                    f"   Image cache size: {current.cached_bytes / GIG:4.2f}/{current.max_bytes / GIG:4.2f}G"
+                    f" ({current.cached_images} images)"
+                )
 
             completed.add(graph_id)
 
         for graph_id in completed:
             del self._stats[graph_id]
             del self._cache_stats[graph_id]
+            self._image_cache_stats.pop(graph_id, None)
 
         for graph_id in errored:
             del self._stats[graph_id]
             del self._cache_stats[graph_id]
+            self._image_cache_stats.pop(graph_id, None)
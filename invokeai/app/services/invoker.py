@@ -23,8 +23,9 @@ class Invoker:
         session_queue_batch_id: str,
         graph_execution_state: GraphExecutionState,
         invoke_all: bool = False,
+        worker_id: int = 0,
     ) -> Optional[str]:
-        """Determines the next node to invoke and enqueues it, preparing if needed.
+        """Determines the next node to invoke and enqueues it on the given session worker's lane, preparing if needed.
         Returns the id of the queued node, or `None` if there are no nodes left to enqueue."""
 
         # Get the next invocation
@@ -44,6 +45,7 @@ class Invoker:
                 graph_execution_state_id=graph_execution_state.id,
                 invocation_id=invocation.id,
                 invoke_all=invoke_all,
+                worker_id=worker_id,
             )
         )
 
@@ -0,0 +1,167 @@
+from typing import Optional
+
+from pydantic import TypeAdapter
+
+from invokeai.app.services.invoker import Invoker
+from invokeai.app.services.session_queue.session_queue_common import SessionQueueItemWithoutGraph
+from invokeai.app.services.shared.graph import GraphExecutionState, GraphExecutionStateChange
+from invokeai.app.services.shared.sqlite import SqliteDatabase
+
+from .item_storage_sqlite import SqliteItemStorage
+
+
+class SqliteGraphExecutionStorage(SqliteItemStorage[GraphExecutionState]):
+    """
+    Stores graph execution states as a snapshot plus an append-only log of changes.
+
+    Saving a state that was loaded from (or saved to) this storage only appends the changes recorded since, so the
+    cost of saving after each node is proportional to that node's prepared inputs and outputs, not to the whole
+    session. The log is compacted into a new snapshot every `compact_after` saves, when the session completes, and
+    when its queue item finishes, e.g. because it was canceled. The length of each session's log is tracked in memory
+    until then, or until its queue item is deleted.
+    """
+
+    _log_table_name: str
+    _compact_after: int
+    _log_lengths: dict[str, int]
+    _changes_validator: TypeAdapter[list[GraphExecutionStateChange]]
+
+    def __init__(self, db: SqliteDatabase, table_name: str = "graph_executions", compact_after: int = 100):
+        self._log_table_name = f"{table_name}_log"
+        super().__init__(db=db, table_name=table_name)
+        # `__orig_class__` is not available on subclasses, so the item validator is set up here
+        self._validator = TypeAdapter(GraphExecutionState)
+        self._changes_validator = TypeAdapter(list[GraphExecutionStateChange])
+        self._compact_after = compact_after
+        self._log_lengths = {}
+
+    def start(self, invoker: Invoker) -> None:
+        session_queue = invoker.services.session_queue
+        if session_queue is not None:
+            session_queue.on_finished(self._on_queue_item_finished)
+            session_queue.on_deleted(self._forget_log_lengths)
+
+    def _on_queue_item_finished(self, queue_item: SessionQueueItemWithoutGraph) -> None:
+        # A canceled or failed session is not saved as complete, so its log would be kept otherwise
+        self._compact(queue_item.session_id)
+
+    def _compact(self, session_id: str) -> None:
+        """Writes a new snapshot of a session that has logged changes, and deletes its log"""
+        try:
+            self._lock.acquire()
+            self._cursor.execute(
+                f"""SELECT 1 FROM {self._log_table_name} WHERE session_id = ? LIMIT 1;""", (session_id,)
+            )
+            if self._cursor.fetchone() is None:
+                self._log_lengths.pop(session_id, None)
+                return
+            self._cursor.execute(f"""SELECT item FROM {self._table_name} WHERE id = ?;""", (session_id,))
+            result = self._cursor.fetchone()
+            if result:
+                self._write_snapshot(self._parse_item(result[0]))
+            else:
+                self._cursor.execute(f"""DELETE FROM {self._log_table_name} WHERE session_id = ?;""", (session_id,))
+                self._log_lengths.pop(session_id, None)
+            self._conn.commit()
+        finally:
+            self._lock.release()
+
+    def _forget_log_lengths(self, session_ids: list[str]) -> None:
+        # A finished session is not saved again, or only rarely, so its log length need not be kept
+        with self._lock:
+            for session_id in session_ids:
+                self._log_lengths.pop(session_id, None)
+
+    def _create_table(self):
+        super()._create_table()
+        try:
+            self._lock.acquire()
+            self._cursor.execute(
+                f"""CREATE TABLE IF NOT EXISTS {self._log_table_name} (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                changes TEXT NOT NULL);"""
+            )
+            self._cursor.execute(
+                f"""CREATE INDEX IF NOT EXISTS {self._log_table_name}_session_id ON {self._log_table_name}(session_id);"""
+            )
+        finally:
+            self._lock.release()
+
+    def _parse_item(self, item: str) -> GraphExecutionState:
+        # Replays the logged changes over the snapshot. Callers hold the lock, so the log matches the snapshot.
+        state = super()._parse_item(item)
+        self._cursor.execute(
+            f"""SELECT changes FROM {self._log_table_name} WHERE session_id = ? ORDER BY id;""", (state.id,)
+        )
+        log = self._cursor.fetchall()
+        for row in log:
+            state.apply_changes(self._changes_validator.validate_json(row[0]))
+        if log:
+            self._log_lengths[state.id] = len(log)
+        else:
+            self._log_lengths.pop(state.id, None)
+        state.start_change_log()
+        return state
+
+    def set(self, item: GraphExecutionState) -> None:
+        changes = item.get_change_log()
+        try:
+            self._lock.acquire()
+            if changes is None or self._log_lengths.get(item.id, 0) >= self._compact_after or item.is_complete():
+                self._write_snapshot(item)
+            elif changes:
+                self._cursor.execute(
+                    f"""INSERT INTO {self._log_table_name} (session_id, changes) VALUES (?, ?);""",
+                    (item.id, self._changes_validator.dump_json(changes, warnings=False, exclude_none=True).decode()),
+                )
+                self._log_lengths[item.id] = self._log_lengths.get(item.id, 0) + 1
+            self._conn.commit()
+            item.start_change_log()
+        finally:
+            self._lock.release()
+        self._on_changed(item)
+
+    def _write_snapshot(self, item: GraphExecutionState) -> None:
+        self._cursor.execute(
+            f"""INSERT OR REPLACE INTO {self._table_name} (item) VALUES (?);""",
+            (item.model_dump_json(warnings=False, exclude_none=True),),
+        )
+        self._cursor.execute(f"""DELETE FROM {self._log_table_name} WHERE session_id = ?;""", (item.id,))
+        self._log_lengths.pop(item.id, None)
+
+    def get(self, id: str) -> Optional[GraphExecutionState]:
+        try:
+            self._lock.acquire()
+            self._cursor.execute(f"""SELECT item FROM {self._table_name} WHERE id = ?;""", (str(id),))
+            result = self._cursor.fetchone()
+            if not result:
+                return None
+            return self._parse_item(result[0])
+        finally:
+            self._lock.release()
+
+    def get_raw(self, id: str) -> Optional[str]:
+        try:
+            self._lock.acquire()
+            self._cursor.execute(f"""SELECT item FROM {self._table_name} WHERE id = ?;""", (str(id),))
+            result = self._cursor.fetchone()
+            if not result:
+                return None
+            self._cursor.execute(f"""SELECT 1 FROM {self._log_table_name} WHERE session_id = ? LIMIT 1;""", (str(id),))
+            if self._cursor.fetchone() is None:
+                # without logged changes, the snapshot is the whole state
+                return result[0]
+            item = self._parse_item(result[0])
+        finally:
+            self._lock.release()
+        return item.model_dump_json(warnings=False, exclude_none=True)
+
+    def delete(self, id: str):
+        try:
+            self._lock.acquire()
+            self._cursor.execute(f"""DELETE FROM {self._log_table_name} WHERE session_id = ?;""", (str(id),))
+            self._log_lengths.pop(str(id), None)
+        finally:
+            self._lock.release()
+        super().delete(id)
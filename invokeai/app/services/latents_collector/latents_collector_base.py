@@ -0,0 +1,22 @@
+from abc import ABC, abstractmethod
+
+from invokeai.app.services.latents_collector.latents_collector_common import LatentsCollectorStatus
+
+
+class LatentsCollectorBase(ABC):
+    """
+    Base class for the latents collector.
+
+    The latents collector reclaims the latents and conditioning saved by sessions that are no longer needed, according
+    to its retention policy.
+    """
+
+    @abstractmethod
+    def collect(self, session_ids: list[str]) -> None:
+        """Reclaims the latents of the given sessions in the background"""
+        pass
+
+    @abstractmethod
+    def get_status(self) -> LatentsCollectorStatus:
+        """Gets the status of the latents collector"""
+        pass
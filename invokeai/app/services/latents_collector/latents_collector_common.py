@@ -0,0 +1,13 @@
+from typing import Literal
+
+from pydantic import BaseModel, Field
+
+LATENTS_RETENTION = Literal["session", "queue", "forever"]
+
+
+class LatentsCollectorStatus(BaseModel):
+    retention: LATENTS_RETENTION = Field(description="When the latents of a session are reclaimed")
+    pending_sessions: int = Field(description="The number of sessions whose latents are waiting to be reclaimed")
+    reclaimed_sessions: int = Field(description="The number of sessions whose latents were reclaimed")
+    reclaimed_files: int = Field(description="The number of latents and conditioning files reclaimed")
+    reclaimed_bytes: int = Field(description="The number of bytes reclaimed")
@@ -0,0 +1,157 @@
+import re
+from threading import Condition, Thread
+from typing import Optional
+
+from invokeai.app.services.invoker import Invoker
+from invokeai.app.services.session_queue.session_queue_common import SessionQueueItemWithoutGraph
+
+from .latents_collector_base import LatentsCollectorBase
+from .latents_collector_common import LATENTS_RETENTION, LatentsCollectorStatus
+
+# Latents are named after the session that saved them, e.g. "{session_id}__{node_id}"
+SESSION_ID_PATTERN = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}(?=_)")
+
+
+class DefaultLatentsCollector(LatentsCollectorBase):
+    """
+    Reclaims the latents of sessions on a background thread, deleting up to `batch_size` files at a time.
+
+    With the "queue" retention, the latents of a session are kept until its queue item is deleted, e.g. when the queue
+    is pruned or cleared. With the "session" retention, they are reclaimed as soon as its queue item finishes. With
+    the "forever" retention, they are never reclaimed.
+
+    When started, the collector sweeps the latents once, reclaiming those of every session that is not retained. This
+    includes sessions that were deleted before the collector existed, and sessions run without the queue.
+    """
+
+    __invoker: Invoker
+    __retention: LATENTS_RETENTION
+    __batch_size: int
+    __condition: Condition
+    __pending_sessions: set[str]
+    __sweep_requested: bool
+    __stopped: bool
+    __thread: Optional[Thread]
+    __reclaimed_sessions: int
+    __reclaimed_files: int
+    __reclaimed_bytes: int
+
+    def __init__(self, retention: LATENTS_RETENTION = "queue", batch_size: int = 256) -> None:
+        self.__retention = retention
+        self.__batch_size = batch_size
+        self.__condition = Condition()
+        self.__pending_sessions = set()
+        self.__sweep_requested = False
+        self.__stopped = False
+        self.__thread = None
+        self.__reclaimed_sessions = 0
+        self.__reclaimed_files = 0
+        self.__reclaimed_bytes = 0
+
+    def start(self, invoker: Invoker) -> None:
+        self.__invoker = invoker
+        if self.__retention == "forever":
+            return
+        invoker.services.session_queue.on_deleted(self.collect)
+        if self.__retention == "session":
+            invoker.services.session_queue.on_finished(self.__on_queue_item_finished)
+        self.__sweep_requested = True
+        self.__thread = Thread(name="latents_collector", target=self.__collect_pending, daemon=True)
+        self.__thread.start()
+
+    def stop(self, *args, **kwargs) -> None:
+        with self.__condition:
+            self.__stopped = True
+            self.__condition.notify_all()
+        if self.__thread is not None:
+            self.__thread.join()
+
+    def collect(self, session_ids: list[str]) -> None:
+        with self.__condition:
+            self.__pending_sessions.update(session_ids)
+            self.__condition.notify_all()
+
+    def get_status(self) -> LatentsCollectorStatus:
+        with self.__condition:
+            return LatentsCollectorStatus(
+                retention=self.__retention,
+                pending_sessions=len(self.__pending_sessions),
+                reclaimed_sessions=self.__reclaimed_sessions,
+                reclaimed_files=self.__reclaimed_files,
+                reclaimed_bytes=self.__reclaimed_bytes,
+            )
+
+    def wait(self) -> None:
+        """Waits until the latents of every pending session are reclaimed"""
+        with self.__condition:
+            while (self.__pending_sessions or self.__sweep_requested) and not self.__stopped:
+                self.__condition.wait()
+
+    def __on_queue_item_finished(self, queue_item: SessionQueueItemWithoutGraph) -> None:
+        self.collect([queue_item.session_id])
+
+    def __collect_pending(self) -> None:
+        while True:
+            with self.__condition:
+                while not self.__pending_sessions and not self.__sweep_requested and not self.__stopped:
+                    self.__condition.wait()
+                if self.__stopped:
+                    return
+                sweep = self.__sweep_requested
+                session_ids = self.__pending_sessions.copy()
+            try:
+                self.__reclaim(session_ids, sweep)
+            except Exception as e:
+                self.__invoker.services.logger.error(f"Failed to reclaim latents: {e}")
+            with self.__condition:
+                self.__pending_sessions.difference_update(session_ids)
+                if sweep:
+                    self.__sweep_requested = False
+                self.__condition.notify_all()
+
+    def __reclaim(self, session_ids: set[str], sweep: bool) -> None:
+        latents = self.__invoker.services.latents
+        names_by_session: dict[str, list[tuple[str, int]]] = {}
+        for name, size in latents.get_sizes().items():
+            match = SESSION_ID_PATTERN.match(name)
+            if match is not None:
+                names_by_session.setdefault(match.group(), []).append((name, size))
+        if sweep:
+            session_ids = session_ids | self.__get_unretained(list(names_by_session))
+
+        items = [item for session_id in session_ids for item in names_by_session.get(session_id, [])]
+        reclaimed_sessions = len(session_ids & names_by_session.keys())
+        reclaimed_files = 0
+        reclaimed_bytes = 0
+        for start in range(0, len(items), self.__batch_size):
+            batch_files = 0
+            batch_bytes = 0
+            for name, size in items[start : start + self.__batch_size]:
+                try:
+                    latents.delete(name)
+                except FileNotFoundError:
+                    continue
+                batch_files += 1
+                batch_bytes += size
+            reclaimed_files += batch_files
+            reclaimed_bytes += batch_bytes
+            with self.__condition:
+                self.__reclaimed_files += batch_files
+                self.__reclaimed_bytes += batch_bytes
+                if self.__stopped:
+                    return
+        with self.__condition:
+            self.__reclaimed_sessions += reclaimed_sessions
+        if reclaimed_files > 0:
+            self.__invoker.services.logger.info(
+                f"Reclaimed {reclaimed_files} latents files of {reclaimed_sessions} sessions"
+                f" ({reclaimed_bytes / 2**20:.1f}MB)"
+            )
+
+    def __get_unretained(self, session_ids: list[str]) -> set[str]:
+        statuses = self.__invoker.services.session_queue.get_session_statuses(session_ids)
+        if self.__retention == "session":
+            retained = {session_id for session_id, status in statuses.items() if status in ["pending", "in_progress"]}
+        else:
+            retained = set(statuses)
+        return set(session_ids) - retained
@@ -28,6 +28,11 @@ class LatentsStorageBase(ABC):
     def delete(self, name: str) -> None:
         pass
 
+    @abstractmethod
+    def get_sizes(self) -> dict[str, int]:
+        """Gets the names of all stored items, with the number of bytes each one uses"""
+        pass
+
     def on_changed(self, on_changed: Callable[[torch.Tensor], None]) -> None:
         """Register a callback for when an item is changed"""
         self._on_changed_callbacks.append(on_changed)
@@ -1,15 +1,36 @@
 # Copyright (c) 2023 Kyle Schouviller (https://github.com/kyle0654)
 
+import json
+import os
 from pathlib import Path
-from typing import Union
+from typing import Any, Union
 
 import torch
+from safetensors import safe_open
+from safetensors.torch import save_file
+
+from invokeai.backend.stable_diffusion.diffusion.conditioning_data import (
+    BasicConditioningInfo,
+    ConditioningFieldData,
+    ExtraConditioningInfo,
+    SDXLConditioningInfo,
+)
 
 from .latents_storage_base import LatentsStorageBase
 
+# Files written by `torch.save` are zip archives
+TORCH_SAVE_MAGIC = b"PK\x03\x04"
+
 
 class DiskLatentsStorage(LatentsStorageBase):
-    """Stores latents in a folder on disk without caching"""
+    """
+    Stores latents in a folder on disk without caching.
+
+    Tensors and conditioning are stored as safetensors files, which are read through a memory map. Conditioning is
+    stored as its tensors, with its structure in the file's metadata. Conditioning that cannot be stored this way (with
+    cross-attention control) is stored with `torch.save`, as are files saved by earlier versions, which can still be
+    read.
+    """
 
     __output_folder: Path
 
@@ -19,16 +40,112 @@ class DiskLatentsStorage(LatentsStorageBase):
 
     def get(self, name: str) -> torch.Tensor:
         latent_path = self.get_path(name)
-        return torch.load(latent_path)
+        with open(latent_path, "rb") as file:
+            magic = file.read(len(TORCH_SAVE_MAGIC))
+        if magic == TORCH_SAVE_MAGIC:
+            return torch.load(latent_path)
+
+        with safe_open(latent_path, framework="pt") as file:  # type: ignore [attr-defined]
+            metadata = file.metadata()
+            device = metadata.get("device", "cpu")
+            tensors = {key: file.get_tensor(key).to(device) for key in file.keys()}
+        if metadata.get("format") == "conditioning":
+            return _to_conditioning(tensors, metadata)  # type: ignore [return-value]
+        return tensors["latents"]
 
     def save(self, name: str, data: torch.Tensor) -> None:
         self.__output_folder.mkdir(parents=True, exist_ok=True)
         latent_path = self.get_path(name)
-        torch.save(data, latent_path)
+        # written to a temporary file first, so a partially written file is never read
+        temp_path = latent_path.with_name(f"{latent_path.name}.tmp")
+        if isinstance(data, torch.Tensor):
+            save_file({"latents": data.contiguous()}, temp_path, {"format": "tensor", "device": str(data.device)})
+        elif _can_store_conditioning(data):
+            tensors, metadata = _from_conditioning(data)
+            save_file(tensors, temp_path, metadata)
+        else:
+            torch.save(data, temp_path)
+        os.replace(temp_path, latent_path)
 
     def delete(self, name: str) -> None:
         latent_path = self.get_path(name)
         latent_path.unlink()
 
+    def get_sizes(self) -> dict[str, int]:
+        sizes: dict[str, int] = {}
+        with os.scandir(self.__output_folder) as entries:
+            for entry in entries:
+                # temporary files belong to writes in progress
+                if entry.is_file() and not entry.name.endswith(".tmp"):
+                    sizes[entry.name] = entry.stat().st_size
+        return sizes
+
+    def sync(self, names: list[str]) -> None:
+        """Flushes the files of the given items, and the folder that lists them, to disk"""
+        for name in names:
+            fd = os.open(self.get_path(name), os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        if os.name != "nt":
+            # folders cannot be opened on Windows
+            fd = os.open(self.__output_folder, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
     def get_path(self, name: str) -> Path:
         return self.__output_folder / name
+
+
+def _can_store_conditioning(data: Any) -> bool:
+    return isinstance(data, ConditioningFieldData) and all(
+        type(conditioning) in [BasicConditioningInfo, SDXLConditioningInfo]
+        and (
+            conditioning.extra_conditioning is None or not conditioning.extra_conditioning.wants_cross_attention_control
+        )
+        for conditioning in data.conditionings
+    )
+
+
+def _from_conditioning(data: ConditioningFieldData) -> tuple[dict[str, torch.Tensor], dict[str, str]]:
+    tensors: dict[str, torch.Tensor] = {}
+    conditionings: list[dict[str, Any]] = []
+    for index, conditioning in enumerate(data.conditionings):
+        tensors[f"conditionings.{index}.embeds"] = conditioning.embeds.contiguous()
+        if isinstance(conditioning, SDXLConditioningInfo):
+            tensors[f"conditionings.{index}.pooled_embeds"] = conditioning.pooled_embeds.contiguous()
+            tensors[f"conditionings.{index}.add_time_ids"] = conditioning.add_time_ids.contiguous()
+        extra_conditioning = conditioning.extra_conditioning
+        conditionings.append(
+            {
+                "type": "sdxl" if isinstance(conditioning, SDXLConditioningInfo) else "basic",
+                "tokens_count_including_eos_bos": extra_conditioning.tokens_count_including_eos_bos
+                if extra_conditioning is not None
+                else None,
+            }
+        )
+    device = str(data.conditionings[0].embeds.device) if data.conditionings else "cpu"
+    return tensors, {"format": "conditioning", "device": device, "conditionings": json.dumps(conditionings)}
+
+
+def _to_conditioning(tensors: dict[str, torch.Tensor], metadata: dict[str, str]) -> ConditioningFieldData:
+    conditionings: list[BasicConditioningInfo] = []
+    for index, conditioning in enumerate(json.loads(metadata["conditionings"])):
+        tokens_count = conditioning["tokens_count_including_eos_bos"]
+        extra_conditioning = ExtraConditioningInfo(tokens_count) if tokens_count is not None else None
+        embeds = tensors[f"conditionings.{index}.embeds"]
+        if conditioning["type"] == "sdxl":
+            conditionings.append(
+                SDXLConditioningInfo(
+                    embeds=embeds,
+                    extra_conditioning=extra_conditioning,
+                    pooled_embeds=tensors[f"conditionings.{index}.pooled_embeds"],
+                    add_time_ids=tensors[f"conditionings.{index}.add_time_ids"],
+                )
+            )
+        else:
+            conditionings.append(BasicConditioningInfo(embeds=embeds, extra_conditioning=extra_conditioning))
+    return ConditioningFieldData(conditionings=conditionings)
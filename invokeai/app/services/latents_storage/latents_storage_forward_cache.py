@@ -1,27 +1,46 @@
 # Copyright (c) 2023 Kyle Schouviller (https://github.com/kyle0654)
 
-from queue import Queue
-from typing import Dict, Optional
+import dataclasses
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Optional
 
 import torch
 
+from invokeai.app.services.invoker import Invoker
+
 from .latents_storage_base import LatentsStorageBase
 
 
 class ForwardCacheLatentsStorage(LatentsStorageBase):
-    """Caches the latest N latents in memory, writing-thorugh to and reading from underlying storage"""
+    """
+    Caches the most recently used latents in memory, up to a total size in bytes, writing-through to and reading from
+    underlying storage
+    """
 
-    __cache: Dict[str, torch.Tensor]
-    __cache_ids: Queue
-    __max_cache_size: int
+    __cache: OrderedDict[str, tuple[torch.Tensor, int]]
+    __cache_bytes: int
+    __max_cache_bytes: int
+    __lock: Lock
     __underlying_storage: LatentsStorageBase
 
-    def __init__(self, underlying_storage: LatentsStorageBase, max_cache_size: int = 20):
+    def __init__(self, underlying_storage: LatentsStorageBase, max_cache_bytes: int = 256 * 2**20):
         super().__init__()
         self.__underlying_storage = underlying_storage
-        self.__cache = {}
-        self.__cache_ids = Queue()
-        self.__max_cache_size = max_cache_size
+        self.__cache = OrderedDict()
+        self.__cache_bytes = 0
+        self.__max_cache_bytes = max_cache_bytes
+        self.__lock = Lock()
+
+    def start(self, invoker: Invoker) -> None:
+        start_op = getattr(self.__underlying_storage, "start", None)
+        if callable(start_op):
+            start_op(invoker)
+
+    def stop(self, invoker: Invoker) -> None:
+        stop_op = getattr(self.__underlying_storage, "stop", None)
+        if callable(stop_op):
+            stop_op(invoker)
 
     def get(self, name: str) -> torch.Tensor:
         cache_item = self.__get_cache(name)
@@ -39,16 +58,43 @@ class ForwardCacheLatentsStorage(LatentsStorageBase):
 
     def delete(self, name: str) -> None:
         self.__underlying_storage.delete(name)
-        if name in self.__cache:
-            del self.__cache[name]
+        with self.__lock:
+            self.__delete_cache(name)
         self._on_deleted(name)
 
+    def get_sizes(self) -> dict[str, int]:
+        return self.__underlying_storage.get_sizes()
+
     def __get_cache(self, name: str) -> Optional[torch.Tensor]:
-        return None if name not in self.__cache else self.__cache[name]
+        with self.__lock:
+            if name not in self.__cache:
+                return None
+            self.__cache.move_to_end(name)
+            return self.__cache[name][0]
 
     def __set_cache(self, name: str, data: torch.Tensor):
-        if name not in self.__cache:
-            self.__cache[name] = data
-            self.__cache_ids.put(name)
-            if self.__cache_ids.qsize() > self.__max_cache_size:
-                self.__cache.pop(self.__cache_ids.get())
+        size = get_size(data)
+        with self.__lock:
+            self.__delete_cache(name)
+            if size > self.__max_cache_bytes:
+                return
+            self.__cache[name] = (data, size)
+            self.__cache_bytes += size
+            while self.__cache_bytes > self.__max_cache_bytes:
+                self.__delete_cache(next(iter(self.__cache)))
+
+    def __delete_cache(self, name: str):
+        if name in self.__cache:
+            _, size = self.__cache.pop(name)
+            self.__cache_bytes -= size
+
+
+def get_size(data: Any) -> int:
+    """Gets the number of bytes used by the tensors in latents or conditioning"""
+    if isinstance(data, torch.Tensor):
+        return data.element_size() * data.nelement()
+    if dataclasses.is_dataclass(data) and not isinstance(data, type):
+        return sum(get_size(getattr(data, field.name)) for field in dataclasses.fields(data))
+    if isinstance(data, (list, tuple)):
+        return sum(get_size(item) for item in data)
+    return 0
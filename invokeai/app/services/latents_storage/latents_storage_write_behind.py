@@ -0,0 +1,195 @@
+import time
+from collections import OrderedDict
+from threading import Condition, Thread
+from typing import Optional
+
+import torch
+
+import invokeai.backend.util.logging as logger
+from invokeai.app.services.invoker import Invoker
+
+from .latents_storage_base import LatentsStorageBase
+from .latents_storage_forward_cache import get_size
+
+
+class WriteBehindLatentsStorage(LatentsStorageBase):
+    """
+    Saves latents to underlying storage on a background thread, so saving does not wait for the write.
+
+    Items that have not been written yet are kept in memory and read from there, so reading never waits for a write.
+    The writer writes the pending items in batches, asking the underlying storage to `sync` each batch to disk at once.
+    When the pending items use more than `max_pending_bytes`, saving waits for the writer to catch up.
+
+    An item that fails to write stays pending, and is written again after `retry_interval` seconds. Flushing raises the
+    error of a failed item, and so does saving when it has to wait for failed items.
+
+    Stopping the storage writes every pending item before returning, giving up on items that fail once more. Items saved
+    after that are written immediately.
+    """
+
+    __underlying_storage: LatentsStorageBase
+    __pending: OrderedDict[str, tuple[torch.Tensor, int]]
+    __pending_bytes: int
+    __max_pending_bytes: int
+    __batch_size: int
+    __retry_interval: float
+    __writing: set[str]
+    __failed: dict[str, tuple[Exception, float]]
+    __condition: Condition
+    __stopped: bool
+    __writer: Thread
+
+    def __init__(
+        self,
+        underlying_storage: LatentsStorageBase,
+        max_pending_bytes: int = 256 * 2**20,
+        batch_size: int = 16,
+        retry_interval: float = 1.0,
+    ):
+        super().__init__()
+        self.__underlying_storage = underlying_storage
+        self.__pending = OrderedDict()
+        self.__pending_bytes = 0
+        self.__max_pending_bytes = max_pending_bytes
+        self.__batch_size = batch_size
+        self.__retry_interval = retry_interval
+        self.__writing = set()
+        self.__failed = {}
+        self.__condition = Condition()
+        self.__stopped = False
+        self.__writer = Thread(name="latents_writer", target=self.__write_pending, daemon=True)
+        self.__writer.start()
+
+    def start(self, invoker: Invoker) -> None:
+        start_op = getattr(self.__underlying_storage, "start", None)
+        if callable(start_op):
+            start_op(invoker)
+
+    def stop(self, invoker: Invoker) -> None:
+        with self.__condition:
+            self.__stopped = True
+            self.__condition.notify_all()
+        self.__writer.join()
+        stop_op = getattr(self.__underlying_storage, "stop", None)
+        if callable(stop_op):
+            stop_op(invoker)
+
+    def get(self, name: str) -> torch.Tensor:
+        with self.__condition:
+            pending = self.__pending.get(name)
+        if pending is not None:
+            return pending[0]
+        return self.__underlying_storage.get(name)
+
+    def save(self, name: str, data: torch.Tensor) -> None:
+        size = get_size(data)
+        with self.__condition:
+            while not self.__stopped and self.__pending and self.__pending_bytes + size > self.__max_pending_bytes:
+                # waiting for items that cannot be written would never end
+                self.__raise_failure()
+                self.__condition.wait()
+            if not self.__stopped:
+                self.__remove_pending(name)
+                self.__pending[name] = (data, size)
+                self.__pending_bytes += size
+                self.__condition.notify_all()
+        if self.__stopped:
+            self.__underlying_storage.save(name, data)
+        self._on_changed(data)
+
+    def delete(self, name: str) -> None:
+        with self.__condition:
+            # an item that is being written is deleted once it is written
+            while name in self.__writing:
+                self.__condition.wait()
+            was_pending = self.__remove_pending(name)
+        try:
+            self.__underlying_storage.delete(name)
+        except FileNotFoundError:
+            # an item that was never written only needs to be forgotten
+            if not was_pending:
+                raise
+        self._on_deleted(name)
+
+    def get_sizes(self) -> dict[str, int]:
+        sizes = self.__underlying_storage.get_sizes()
+        with self.__condition:
+            for name, (_, size) in self.__pending.items():
+                sizes.setdefault(name, size)
+        return sizes
+
+    def flush(self) -> None:
+        """Waits until every pending item is written, raising the error of an item that failed to write"""
+        with self.__condition:
+            while self.__pending and self.__writer.is_alive():
+                self.__raise_failure()
+                self.__condition.wait()
+
+    def __raise_failure(self) -> None:
+        """Raises the error of a failed item, when the writer is only left with failed items"""
+        if self.__writing or any(name not in self.__failed for name in self.__pending):
+            return
+        name, (error, _) = next(iter(self.__failed.items()))
+        raise RuntimeError(f"Failed to write latents {name}") from error
+
+    def __remove_pending(self, name: str) -> bool:
+        self.__failed.pop(name, None)
+        pending = self.__pending.pop(name, None)
+        if pending is None:
+            return False
+        self.__pending_bytes -= pending[1]
+        self.__condition.notify_all()
+        return True
+
+    def __next_batch(self) -> Optional[list[tuple[str, tuple[torch.Tensor, int]]]]:
+        """Waits for items to write, skipping failed items until they are due to be written again"""
+        with self.__condition:
+            while True:
+                now = time.monotonic()
+                # once stopped, failed items are written one last time
+                batch = [
+                    (name, pending)
+                    for name, pending in self.__pending.items()
+                    if self.__stopped or name not in self.__failed or self.__failed[name][1] <= now
+                ][: self.__batch_size]
+                if batch:
+                    self.__writing = {name for name, _ in batch}
+                    return batch
+                if not self.__pending and self.__stopped:
+                    return None
+                retry_at = min((retry_at for _, retry_at in self.__failed.values()), default=None)
+                self.__condition.wait(None if retry_at is None else retry_at - now)
+
+    def __write_pending(self) -> None:
+        while (batch := self.__next_batch()) is not None:
+            written: list[str] = []
+            failed: dict[str, Exception] = {}
+            for name, (data, _) in batch:
+                try:
+                    self.__underlying_storage.save(name, data)
+                    written.append(name)
+                except Exception as e:
+                    failed[name] = e
+            sync_op = getattr(self.__underlying_storage, "sync", None)
+            if callable(sync_op) and written:
+                try:
+                    sync_op(written)
+                except Exception as e:
+                    failed.update((name, e) for name in written)
+            with self.__condition:
+                self.__writing = set()
+                retry_at = time.monotonic() + self.__retry_interval
+                for name, (data, _) in batch:
+                    # an item saved again while it was written stays pending, to write its new data
+                    pending: Optional[tuple[torch.Tensor, int]] = self.__pending.get(name)
+                    if pending is None or pending[0] is not data:
+                        continue
+                    if name not in failed:
+                        self.__remove_pending(name)
+                    elif self.__stopped:
+                        logger.error(f"Failed to write latents {name}, giving up: {failed[name]}")
+                        self.__remove_pending(name)
+                    else:
+                        logger.error(f"Failed to write latents {name}, retrying: {failed[name]}")
+                        self.__failed[name] = (failed[name], retry_at)
+                self.__condition.notify_all()
@@ -7,9 +7,9 @@ class SessionProcessorBase(ABC):
     """
     Base class for session processor.
 
-    The session processor is responsible for executing sessions. It runs a simple polling loop,
-    checking the session queue for new sessions to execute. It must coordinate with the
-    invocation queue to ensure only one session is executing at a time.
+    The session processor is responsible for executing sessions. Each of its session workers runs a
+    simple polling loop, checking the session queue for new sessions to execute. It must coordinate
+    with the invocation queue to ensure each worker executes only one session at a time.
     """
 
     @abstractmethod
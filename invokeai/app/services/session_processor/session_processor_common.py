@@ -1,6 +1,18 @@
+from typing import Optional
+
 from pydantic import BaseModel, Field
 
 
+class SessionWorkerStatus(BaseModel):
+    worker_id: int = Field(description="The ID of the session worker")
+    device: str = Field(description="The device the session worker runs on")
+    is_processing: bool = Field(description="Whether the session worker is processing a queue item")
+    item_id: Optional[int] = Field(default=None, description="The ID of the queue item being processed")
+    batch_id: Optional[str] = Field(default=None, description="The batch ID of the queue item being processed")
+    session_id: Optional[str] = Field(default=None, description="The session ID of the queue item being processed")
+
+
 class SessionProcessorStatus(BaseModel):
     is_started: bool = Field(description="Whether the session processor is started")
     is_processing: bool = Field(description="Whether a session is being processed")
+    workers: list[SessionWorkerStatus] = Field(default_factory=list, description="The status of each session worker")
@@ -7,44 +7,98 @@ from fastapi_events.handlers.local import local_handler
 from fastapi_events.typing import Event as FastAPIEvent
 
 from invokeai.app.services.events.events_base import EventServiceBase
-from invokeai.app.services.session_queue.session_queue_common import SessionQueueItem
+from invokeai.app.services.invocation_queue.invocation_queue_common import InvocationQueueItem
+from invokeai.app.services.session_queue.session_queue_common import EnqueueBatchResult, SessionQueueItem
 
 from ..invoker import Invoker
 from .session_processor_base import SessionProcessorBase
-from .session_processor_common import SessionProcessorStatus
-
-POLLING_INTERVAL = 1
-THREAD_LIMIT = 1
+from .session_processor_common import SessionProcessorStatus, SessionWorkerStatus
+
+# Workers are woken directly when a batch is enqueued and when their session finishes. Polling is only a fallback.
+POLLING_INTERVAL = 10
+
+
+class SessionWorker:
+    """A session worker processes one queue item at a time, running its invocations on the worker's device"""
+
+    worker_id: int
+    device: str
+    queue_item: Optional[SessionQueueItem]
+    poll_now_event: ThreadEvent
+    thread: Thread
+
+    def __init__(self, worker_id: int, device: str) -> None:
+        self.worker_id = worker_id
+        self.device = device
+        self.queue_item = None
+        self.poll_now_event = ThreadEvent()
+
+    def get_status(self) -> SessionWorkerStatus:
+        queue_item = self.queue_item
+        return SessionWorkerStatus(
+            worker_id=self.worker_id,
+            device=self.device,
+            is_processing=queue_item is not None,
+            item_id=queue_item.item_id if queue_item is not None else None,
+            batch_id=queue_item.batch_id if queue_item is not None else None,
+            session_id=queue_item.session_id if queue_item is not None else None,
+        )
 
 
 class DefaultSessionProcessor(SessionProcessorBase):
     def start(self, invoker: Invoker) -> None:
         self.__invoker: Invoker = invoker
-        self.__queue_item: Optional[SessionQueueItem] = None
+        devices = invoker.services.configuration.session_worker_devices
+        self.__workers = [SessionWorker(worker_id, device) for worker_id, device in enumerate(devices)]
 
         self.__resume_event = ThreadEvent()
         self.__stop_event = ThreadEvent()
-        self.__poll_now_event = ThreadEvent()
 
         local_handler.register(event_name=EventServiceBase.queue_event, _func=self._on_queue_event)
-
-        self.__threadLimit = BoundedSemaphore(THREAD_LIMIT)
-        self.__thread = Thread(
-            name="session_processor",
-            target=self.__process,
-            kwargs={
-                "stop_event": self.__stop_event,
-                "poll_now_event": self.__poll_now_event,
-                "resume_event": self.__resume_event,
-            },
-        )
-        self.__thread.start()
+        invoker.services.session_queue.on_enqueued(self._on_enqueued)
+        invoker.services.processor.on_session_finished(self._on_session_finished)
+
+        self.__threadLimit = BoundedSemaphore(len(self.__workers))
+        self.__stop_event.clear()
+        self.__resume_event.set()
+        for worker in self.__workers:
+            worker.thread = Thread(
+                name="session_processor" if worker.worker_id == 0 else f"session_processor_{worker.worker_id}",
+                target=self.__process,
+                kwargs={
+                    "worker": worker,
+                    "stop_event": self.__stop_event,
+                    "resume_event": self.__resume_event,
+                },
+            )
+            worker.thread.start()
 
     def stop(self, *args, **kwargs) -> None:
         self.__stop_event.set()
+        self._poll_now()
 
     def _poll_now(self) -> None:
-        self.__poll_now_event.set()
+        for worker in self.__workers:
+            worker.poll_now_event.set()
+
+    def __get_worker(self, queue_item_id: int) -> Optional[SessionWorker]:
+        return next(
+            (w for w in self.__workers if w.queue_item is not None and w.queue_item.item_id == queue_item_id),
+            None,
+        )
+
+    def __release_worker(self, worker: Optional[SessionWorker]) -> None:
+        if worker is None:
+            return
+        worker.queue_item = None
+        worker.poll_now_event.set()
+
+    def _on_enqueued(self, enqueue_result: EnqueueBatchResult) -> None:
+        if enqueue_result.enqueued > 0:
+            self._poll_now()
+
+    def _on_session_finished(self, queue_item: InvocationQueueItem) -> None:
+        self.__release_worker(self.__get_worker(queue_item.session_queue_item_id))
 
     async def _on_queue_event(self, event: FastAPIEvent) -> None:
         event_name = event[1]["event"]
@@ -55,25 +109,19 @@ class DefaultSessionProcessor(SessionProcessorBase):
             "invocation_error",
             "session_retrieval_error",
             "invocation_retrieval_error",
+            "session_canceled",
         ]:
-            self.__queue_item = None
-            self._poll_now()
-        elif (
-            event_name == "session_canceled"
-            and self.__queue_item is not None
-            and self.__queue_item.session_id == event[1]["data"]["graph_execution_state_id"]
-        ):
-            self.__queue_item = None
-            self._poll_now()
+            self.__release_worker(self.__get_worker(event[1]["data"]["queue_item_id"]))
         elif event_name == "batch_enqueued":
             self._poll_now()
         elif event_name == "queue_cleared":
-            self.__queue_item = None
-            self._poll_now()
+            for worker in self.__workers:
+                self.__release_worker(worker)
 
     def resume(self) -> SessionProcessorStatus:
         if not self.__resume_event.is_set():
             self.__resume_event.set()
+            self._poll_now()
         return self.get_status()
 
     def pause(self) -> SessionProcessorStatus:
@@ -82,32 +130,35 @@ class DefaultSessionProcessor(SessionProcessorBase):
         return self.get_status()
 
     def get_status(self) -> SessionProcessorStatus:
+        workers = [worker.get_status() for worker in self.__workers]
         return SessionProcessorStatus(
             is_started=self.__resume_event.is_set(),
-            is_processing=self.__queue_item is not None,
+            is_processing=any(worker.is_processing for worker in workers),
+            workers=workers,
         )
 
     def __process(
         self,
+        worker: SessionWorker,
         stop_event: ThreadEvent,
-        poll_now_event: ThreadEvent,
         resume_event: ThreadEvent,
     ):
+        poll_now_event = worker.poll_now_event
         try:
-            stop_event.clear()
-            resume_event.set()
             self.__threadLimit.acquire()
             queue_item: Optional[SessionQueueItem] = None
             while not stop_event.is_set():
                 poll_now_event.clear()
                 try:
-                    # do not dequeue if there is already a session running
-                    if self.__queue_item is None and resume_event.is_set():
+                    # do not dequeue if the worker is already running a session
+                    if worker.queue_item is None and resume_event.is_set():
                         queue_item = self.__invoker.services.session_queue.dequeue()
 
                         if queue_item is not None:
-                            self.__invoker.services.logger.debug(f"Executing queue item {queue_item.item_id}")
-                            self.__queue_item = queue_item
+                            self.__invoker.services.logger.debug(
+                                f"Executing queue item {queue_item.item_id} on worker {worker.worker_id}"
+                            )
+                            worker.queue_item = queue_item
                             self.__invoker.services.graph_execution_manager.set(queue_item.session)
                             self.__invoker.invoke(
                                 session_queue_batch_id=queue_item.batch_id,
@@ -115,6 +166,7 @@ class DefaultSessionProcessor(SessionProcessorBase):
                                 session_queue_item_id=queue_item.item_id,
                                 graph_execution_state=queue_item.session,
                                 invoke_all=True,
+                                worker_id=worker.worker_id,
                             )
                             queue_item = None
 
@@ -134,7 +186,6 @@ class DefaultSessionProcessor(SessionProcessorBase):
             self.__invoker.services.logger.error(f"Fatal Error in session processor: {e}")
             pass
         finally:
-            stop_event.clear()
             poll_now_event.clear()
-            self.__queue_item = None
+            worker.queue_item = None
             self.__threadLimit.release()
@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import Optional
+from typing import Callable, Optional
 
 from invokeai.app.services.session_queue.session_queue_common import (
     QUEUE_ITEM_STATUS,
@@ -14,6 +14,7 @@ from invokeai.app.services.session_queue.session_queue_common import (
     PruneResult,
     SessionQueueItem,
     SessionQueueItemDTO,
+    SessionQueueItemWithoutGraph,
     SessionQueueStatus,
 )
 from invokeai.app.services.shared.pagination import CursorPaginatedResults
@@ -22,6 +23,41 @@ from invokeai.app.services.shared.pagination import CursorPaginatedResults
 class SessionQueueBase(ABC):
     """Base class for session queue"""
 
+    _on_enqueued_callbacks: list[Callable[[EnqueueBatchResult], None]]
+    _on_finished_callbacks: list[Callable[[SessionQueueItemWithoutGraph], None]]
+    _on_deleted_callbacks: list[Callable[[list[str]], None]]
+
+    def __init__(self) -> None:
+        self._on_enqueued_callbacks = []
+        self._on_finished_callbacks = []
+        self._on_deleted_callbacks = []
+
+    def on_enqueued(self, on_enqueued: Callable[[EnqueueBatchResult], None]) -> None:
+        """Register a callback for when a batch is enqueued. It is called on the enqueuing thread."""
+        self._on_enqueued_callbacks.append(on_enqueued)
+
+    def _on_enqueued(self, enqueue_result: EnqueueBatchResult) -> None:
+        for callback in self._on_enqueued_callbacks:
+            callback(enqueue_result)
+
+    def on_finished(self, on_finished: Callable[[SessionQueueItemWithoutGraph], None]) -> None:
+        """Register a callback for when a queue item is completed, fails or is canceled"""
+        self._on_finished_callbacks.append(on_finished)
+
+    def on_deleted(self, on_deleted: Callable[[list[str]], None]) -> None:
+        """Register a callback for when queue items are deleted. It is called with the IDs of their sessions."""
+        self._on_deleted_callbacks.append(on_deleted)
+
+    def _on_finished(self, queue_item: SessionQueueItemWithoutGraph) -> None:
+        for callback in self._on_finished_callbacks:
+            callback(queue_item)
+
+    def _on_deleted(self, session_ids: list[str]) -> None:
+        if not session_ids:
+            return
+        for callback in self._on_deleted_callbacks:
+            callback(session_ids)
+
     @abstractmethod
     def dequeue(self) -> Optional[SessionQueueItem]:
         """Dequeues the next session queue item."""
@@ -103,3 +139,8 @@ class SessionQueueBase(ABC):
     def get_queue_item(self, item_id: int) -> SessionQueueItem:
         """Gets a session queue item by ID"""
         pass
+
+    @abstractmethod
+    def get_session_statuses(self, session_ids: list[str]) -> dict[str, QUEUE_ITEM_STATUS]:
+        """Gets the statuses of the queue items of the given sessions. Sessions without a queue item are left out."""
+        pass
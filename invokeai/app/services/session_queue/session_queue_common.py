@@ -1,5 +1,6 @@
 import datetime
 import json
+import math
 from itertools import chain, product
 from typing import Generator, Iterable, Literal, NamedTuple, Optional, TypeAlias, Union, cast
 
@@ -156,14 +157,30 @@ def get_field_values(queue_item_dict: dict) -> Optional[list[NodeFieldValue]]:
 
 
 GraphExecutionStateValidator = TypeAdapter(GraphExecutionState)
+GraphValidator = TypeAdapter(Graph)
 
 
 def get_session(queue_item_dict: dict) -> GraphExecutionState:
     session_raw = queue_item_dict.get("session", "{}")
+    if session_raw is None:
+        # The queue item stores only its field values. Its session is materialized from the batch graph.
+        return materialize_session(
+            graph_raw=queue_item_dict["batch_graph"],
+            session_id=queue_item_dict["session_id"],
+            field_values=queue_item_dict.get("field_values") or [],
+        )
     session = GraphExecutionStateValidator.validate_json(session_raw, strict=False)
     return session
 
 
+def materialize_session(graph_raw: str, session_id: str, field_values: list[NodeFieldValue]) -> GraphExecutionState:
+    """Creates the session of a queue item from its batch's graph and the field values applied to it."""
+    graph = GraphValidator.validate_json(graph_raw, strict=False)
+    session = GraphExecutionState(graph=populate_graph(graph, field_values))
+    session.id = session_id
+    return session
+
+
 class SessionQueueItemWithoutGraph(BaseModel):
     """Session queue item without the full graph. Used for serialization."""
 
@@ -219,6 +236,7 @@ class SessionQueueItem(SessionQueueItemWithoutGraph):
         # must parse these manually
         queue_item_dict["field_values"] = get_field_values(queue_item_dict)
         queue_item_dict["session"] = get_session(queue_item_dict)
+        queue_item_dict.pop("batch_graph", None)
         return SessionQueueItem(**queue_item_dict)
 
     model_config = ConfigDict(
@@ -332,17 +350,12 @@ def populate_graph(graph: Graph, node_field_values: Iterable[NodeFieldValue]) ->
     return graph_clone
 
 
-def create_session_nfv_tuples(
-    batch: Batch, maximum: int
-) -> Generator[tuple[GraphExecutionState, list[NodeFieldValue]], None, None]:
+def create_field_values(batch: Batch, maximum: int) -> Generator[list[NodeFieldValue], None, None]:
     """
-    Create all graph permutations from the given batch data and graph. Yields tuples
-    of the form (graph, batch_data_items) where batch_data_items is the list of BatchDataItems
-    that was applied to the graph.
+    Create the field values of every graph permutation of the given batch data, without
+    creating the graphs themselves.
     """
 
-    # TODO: Should this be a class method on Batch?
-
     data: list[list[tuple[NodeFieldValue]]] = []
     batch_data_collection = batch.data if batch.data is not None else []
     for batch_datum_list in batch_data_collection:
@@ -357,42 +370,51 @@ def create_session_nfv_tuples(
             node_field_values_to_zip.append(node_field_values)
         data.append(list(zip(*node_field_values_to_zip, strict=True)))  # type: ignore [arg-type]
 
-    # create generator to yield session,nfv tuples
+    # create generator to yield the flattened field values of each permutation
     count = 0
     for _ in range(batch.runs):
         for d in product(*data):
             if count >= maximum:
                 return
-            flat_node_field_values = list(chain.from_iterable(d))
-            graph = populate_graph(batch.graph, flat_node_field_values)
-            yield (GraphExecutionState(graph=graph), flat_node_field_values)
+            yield list(chain.from_iterable(d))
             count += 1
 
 
+def create_session_nfv_tuples(
+    batch: Batch, maximum: int
+) -> Generator[tuple[GraphExecutionState, list[NodeFieldValue]], None, None]:
+    """
+    Create all graph permutations from the given batch data and graph. Yields tuples
+    of the form (graph, batch_data_items) where batch_data_items is the list of BatchDataItems
+    that was applied to the graph.
+    """
+
+    # TODO: Should this be a class method on Batch?
+
+    for flat_node_field_values in create_field_values(batch, maximum):
+        graph = populate_graph(batch.graph, flat_node_field_values)
+        yield (GraphExecutionState(graph=graph), flat_node_field_values)
+
+
 def calc_session_count(batch: Batch) -> int:
     """
     Calculates the number of sessions that would be created by the batch, without incurring
-    the overhead of actually generating them. Adapted from `create_sessions().
+    the overhead of actually generating them. Each list of zipped batch data contributes its
+    length as a factor, so the count is computed in closed form.
     """
     # TODO: Should this be a class method on Batch?
     if not batch.data:
         return batch.runs
-    data = []
-    for batch_datum_list in batch.data:
-        to_zip = []
-        for batch_datum in batch_datum_list:
-            batch_data_items = range(len(batch_datum.items))
-            to_zip.append(batch_data_items)
-        data.append(list(zip(*to_zip, strict=True)))
-    data_product = list(product(*data))
-    return len(data_product) * batch.runs
+    # zipped batch data all have the same length, which the Batch validators enforce
+    zipped_lengths = (len(batch_datum_list[0].items) if batch_datum_list else 0 for batch_datum_list in batch.data)
+    return math.prod(zipped_lengths) * batch.runs
 
 
 class SessionQueueValueToInsert(NamedTuple):
     """A tuple of values to insert into the session_queue table"""
 
     queue_id: str  # queue_id
-    session: str  # session json
+    session: Optional[str]  # session json, or None if the session is materialized from the batch graph on dequeue
     session_id: str  # session_id
     batch_id: str  # batch_id
     field_values: Optional[str]  # field_values json
@@ -402,13 +424,21 @@ class SessionQueueValueToInsert(NamedTuple):
 ValuesToInsert: TypeAlias = list[SessionQueueValueToInsert]
 
 
-def prepare_values_to_insert(queue_id: str, batch: Batch, priority: int, max_new_queue_items: int) -> ValuesToInsert:
-    values_to_insert: ValuesToInsert = []
-    for session, field_values in create_session_nfv_tuples(batch, max_new_queue_items):
-        # sessions must have unique id
-        session.id = uuid_string()
-        values_to_insert.append(
-            SessionQueueValueToInsert(
+def create_values_to_insert(
+    queue_id: str, batch: Batch, priority: int, max_new_queue_items: int, include_sessions: bool = True
+) -> Generator[SessionQueueValueToInsert, None, None]:
+    """
+    Lazily creates the values to insert for each session of the batch. Sessions are created one at a
+    time as the generator is consumed, so a large batch is never held in memory all at once.
+
+    If `include_sessions` is False, sessions are not created at all. Only their ids and field values
+    are inserted, and each session is materialized from the batch graph when it is dequeued.
+    """
+    if include_sessions:
+        for session, field_values in create_session_nfv_tuples(batch, max_new_queue_items):
+            # sessions must have unique id
+            session.id = uuid_string()
+            yield SessionQueueValueToInsert(
                 queue_id,  # queue_id
                 session.model_dump_json(warnings=False, exclude_none=True),  # session (json)
                 session.id,  # session_id
@@ -417,8 +447,20 @@ def prepare_values_to_insert(queue_id: str, batch: Batch, priority: int, max_new
                 json.dumps(field_values, default=to_jsonable_python) if field_values else None,  # field_values (json)
                 priority,  # priority
             )
-        )
-    return values_to_insert
+    else:
+        for field_values in create_field_values(batch, max_new_queue_items):
+            yield SessionQueueValueToInsert(
+                queue_id,  # queue_id
+                None,  # session (materialized from the batch graph)
+                uuid_string(),  # session_id
+                batch.batch_id,  # batch_id
+                json.dumps(field_values, default=to_jsonable_python) if field_values else None,  # field_values (json)
+                priority,  # priority
+            )
+
+
+def prepare_values_to_insert(queue_id: str, batch: Batch, priority: int, max_new_queue_items: int) -> ValuesToInsert:
+    return list(create_values_to_insert(queue_id, batch, priority, max_new_queue_items))
 
 
 # endregion Util
@@ -1,5 +1,7 @@
+import json
 import sqlite3
 import threading
+from itertools import islice
 from typing import Optional, Union, cast
 
 from fastapi_events.handlers.local import local_handler
@@ -23,19 +25,39 @@ from invokeai.app.services.session_queue.session_queue_common import (
     SessionQueueItem,
     SessionQueueItemDTO,
     SessionQueueItemNotFoundError,
+    SessionQueueItemWithoutGraph,
     SessionQueueStatus,
     calc_session_count,
-    prepare_values_to_insert,
+    create_values_to_insert,
 )
 from invokeai.app.services.shared.pagination import CursorPaginatedResults
 from invokeai.app.services.shared.sqlite import SqliteDatabase
 
+# The number of queue items inserted at a time when enqueueing a batch. This bounds the memory used to enqueue a batch,
+# however many sessions it creates.
+ENQUEUE_CHUNK_SIZE = 100
+
+# The columns of a queue item without its session, which are read without materializing the session
+QUEUE_ITEM_DTO_COLS = """item_id,
+    status,
+    priority,
+    field_values,
+    error,
+    created_at,
+    updated_at,
+    completed_at,
+    started_at,
+    session_id,
+    batch_id,
+    queue_id"""
+
 
 class SqliteSessionQueue(SessionQueueBase):
     __invoker: Invoker
     __conn: sqlite3.Connection
     __cursor: sqlite3.Cursor
     __lock: threading.RLock
+    __db: SqliteDatabase
 
     def start(self, invoker: Invoker) -> None:
         self.__invoker = invoker
@@ -46,6 +68,7 @@ class SqliteSessionQueue(SessionQueueBase):
 
     def __init__(self, db: SqliteDatabase) -> None:
         super().__init__()
+        self.__db = db
         self.__lock = db.lock
         self.__conn = db.conn
         self.__cursor = self.__conn.cursor()
@@ -72,7 +95,7 @@ class SqliteSessionQueue(SessionQueueBase):
             # When a queue item has an error, we get an error event, then a completed event.
             # Mark the queue item completed only if it isn't already marked completed, e.g.
             # by a previously-handled error event.
-            queue_item = self.get_queue_item(item_id)
+            queue_item = self._get_queue_item_dto(item_id)
             if queue_item.status not in ["completed", "failed", "canceled"]:
                 queue_item = self._set_queue_item_status(item_id=queue_item.item_id, status="completed")
         except SessionQueueItemNotFoundError:
@@ -82,7 +105,7 @@ class SqliteSessionQueue(SessionQueueBase):
         try:
             item_id = event[1]["data"]["queue_item_id"]
             error = event[1]["data"]["error"]
-            queue_item = self.get_queue_item(item_id)
+            queue_item = self._get_queue_item_dto(item_id)
             # always set to failed if have an error, even if previously the item was marked completed or canceled
             queue_item = self._set_queue_item_status(item_id=queue_item.item_id, status="failed", error=error)
         except SessionQueueItemNotFoundError:
@@ -91,7 +114,7 @@ class SqliteSessionQueue(SessionQueueBase):
     async def _handle_cancel_event(self, event: FastAPIEvent) -> None:
         try:
             item_id = event[1]["data"]["queue_item_id"]
-            queue_item = self.get_queue_item(item_id)
+            queue_item = self._get_queue_item_dto(item_id)
             if queue_item.status not in ["completed", "failed", "canceled"]:
                 queue_item = self._set_queue_item_status(item_id=queue_item.item_id, status="canceled")
         except SessionQueueItemNotFoundError:
@@ -101,6 +124,11 @@ class SqliteSessionQueue(SessionQueueBase):
         """Creates the session queue tables, indicies, and triggers"""
         try:
             self.__lock.acquire()
+            migrate_sessions = self._sessions_are_required()
+            if migrate_sessions:
+                # Queue items used to store their full session. It is now optional, so the table is rebuilt.
+                self.__cursor.execute("ALTER TABLE session_queue RENAME TO session_queue_old;")
+
             self.__cursor.execute(
                 """--sql
                 CREATE TABLE IF NOT EXISTS session_queue (
@@ -109,7 +137,7 @@ class SqliteSessionQueue(SessionQueueBase):
                     queue_id TEXT NOT NULL, -- identifier of the queue this queue item belongs to
                     session_id TEXT NOT NULL UNIQUE, -- duplicated data from the session column, for ease of access
                     field_values TEXT, -- NULL if no values are associated with this queue item
-                    session TEXT NOT NULL, -- the session to be executed
+                    session TEXT, -- the session to be executed, NULL if it is materialized from the batch graph on dequeue
                     status TEXT NOT NULL DEFAULT 'pending', -- the status of the queue item, one of 'pending', 'in_progress', 'completed', 'failed', 'canceled'
                     priority INTEGER NOT NULL DEFAULT 0, -- the priority, higher is more important
                     error TEXT, -- any errors associated with this queue item
@@ -123,6 +151,26 @@ class SqliteSessionQueue(SessionQueueBase):
                 """
             )
 
+            self.__cursor.execute(
+                """--sql
+                CREATE TABLE IF NOT EXISTS session_queue_batches (
+                    batch_id TEXT NOT NULL PRIMARY KEY, -- identifier of the batch
+                    graph TEXT NOT NULL -- the batch graph, which each queue item's field values are applied to
+                );
+                """
+            )
+
+            if migrate_sessions:
+                self.__cursor.execute(
+                    """--sql
+                    INSERT INTO session_queue
+                    SELECT item_id, batch_id, queue_id, session_id, field_values, session, status, priority, error,
+                      created_at, updated_at, started_at, completed_at
+                    FROM session_queue_old;
+                    """
+                )
+                self.__cursor.execute("DROP TABLE session_queue_old;")
+
             self.__cursor.execute(
                 """--sql
                 CREATE UNIQUE INDEX IF NOT EXISTS idx_session_queue_item_id ON session_queue(item_id);
@@ -141,9 +189,20 @@ class SqliteSessionQueue(SessionQueueBase):
                 """
             )
 
+            # Superseded by idx_session_queue_pending
+            self.__cursor.execute(
+                """--sql
+                DROP INDEX IF EXISTS idx_session_queue_created_priority;
+                """
+            )
+
+            # Pending items in the order they are dequeued in. Queries for pending items name it with INDEXED BY, as
+            # the planner otherwise prefers the status index and sorts every pending item.
             self.__cursor.execute(
                 """--sql
-                CREATE INDEX IF NOT EXISTS idx_session_queue_created_priority ON session_queue(priority);
+                CREATE INDEX IF NOT EXISTS idx_session_queue_pending
+                ON session_queue(priority DESC, item_id ASC)
+                WHERE status = 'pending';
                 """
             )
 
@@ -198,6 +257,77 @@ class SqliteSessionQueue(SessionQueueBase):
                 """
             )
 
+            self.__cursor.execute(
+                """--sql
+                CREATE TABLE IF NOT EXISTS session_queue_counts (
+                    queue_id TEXT NOT NULL, -- identifier of the queue
+                    batch_id TEXT NOT NULL, -- identifier of the batch
+                    status TEXT NOT NULL, -- the status of the queue items counted
+                    count INTEGER NOT NULL DEFAULT 0, -- the number of queue items with this status
+                    PRIMARY KEY (queue_id, batch_id, status)
+                );
+                """
+            )
+
+            # The counts are rebuilt on startup, so they are right for databases from before the counts existed
+            self.__cursor.execute("DELETE FROM session_queue_counts;")
+            self.__cursor.execute(
+                """--sql
+                INSERT INTO session_queue_counts (queue_id, batch_id, status, count)
+                SELECT queue_id, batch_id, status, count(*)
+                FROM session_queue
+                GROUP BY queue_id, batch_id, status;
+                """
+            )
+
+            # Inserted queue items are counted by enqueue_batch, once per batch rather than once per row
+            self.__cursor.execute(
+                """--sql
+                CREATE TRIGGER IF NOT EXISTS tg_session_queue_counts_status
+                AFTER UPDATE OF status ON session_queue
+                FOR EACH ROW
+                WHEN NEW.status != OLD.status
+                BEGIN
+                  UPDATE session_queue_counts
+                  SET count = count - 1
+                  WHERE queue_id = OLD.queue_id AND batch_id = OLD.batch_id AND status = OLD.status;
+                  DELETE FROM session_queue_counts
+                  WHERE queue_id = OLD.queue_id AND batch_id = OLD.batch_id AND status = OLD.status AND count = 0;
+                  INSERT INTO session_queue_counts (queue_id, batch_id, status, count)
+                  VALUES (NEW.queue_id, NEW.batch_id, NEW.status, 1)
+                  ON CONFLICT (queue_id, batch_id, status) DO UPDATE SET count = count + 1;
+                END;
+                """
+            )
+
+            self.__cursor.execute(
+                """--sql
+                CREATE TRIGGER IF NOT EXISTS tg_session_queue_counts_deleted
+                AFTER DELETE ON session_queue
+                FOR EACH ROW
+                BEGIN
+                  UPDATE session_queue_counts
+                  SET count = count - 1
+                  WHERE queue_id = OLD.queue_id AND batch_id = OLD.batch_id AND status = OLD.status;
+                  DELETE FROM session_queue_counts
+                  WHERE queue_id = OLD.queue_id AND batch_id = OLD.batch_id AND status = OLD.status AND count = 0;
+                END;
+                """
+            )
+
+            self.__cursor.execute(
+                """--sql
+                CREATE TRIGGER IF NOT EXISTS tg_session_queue_batches_deleted
+                AFTER DELETE ON session_queue
+                FOR EACH ROW
+                WHEN NOT EXISTS (SELECT 1 FROM session_queue WHERE batch_id = OLD.batch_id)
+                BEGIN
+                  DELETE FROM session_queue_batches
+                  WHERE batch_id = OLD.batch_id;
+                END;
+                """
+            )
+
             self.__conn.commit()
         except Exception:
             self.__conn.rollback()
@@ -205,6 +335,13 @@ class SqliteSessionQueue(SessionQueueBase):
         finally:
             self.__lock.release()
 
+    def _sessions_are_required(self) -> bool:
+        """Checks if the session_queue table predates queue items without a session"""
+        self.__cursor.execute("PRAGMA table_info(session_queue)")
+        columns = {column[1]: column for column in self.__cursor.fetchall()}
+        # the notnull flag is the fourth column of table_info
+        return "session" in columns and columns["session"][3] == 1
+
     def _set_in_progress_to_canceled(self) -> None:
         """
         Sets all in_progress queue items to canceled. Run on app startup, not associated with any queue.
@@ -225,26 +362,43 @@ class SqliteSessionQueue(SessionQueueBase):
         finally:
             self.__lock.release()
 
+    def _get_status_counts(
+        self, cursor: sqlite3.Cursor, queue_id: str, batch_id: Optional[str] = None
+    ) -> dict[str, int]:
+        """Gets the number of queue items with each status in a queue, or in one of its batches"""
+        if batch_id is None:
+            cursor.execute(
+                """--sql
+                SELECT status, SUM(count)
+                FROM session_queue_counts
+                WHERE queue_id = ?
+                GROUP BY status
+                """,
+                (queue_id,),
+            )
+        else:
+            cursor.execute(
+                """--sql
+                SELECT status, count
+                FROM session_queue_counts
+                WHERE
+                  queue_id = ?
+                  AND batch_id = ?
+                """,
+                (queue_id, batch_id),
+            )
+        return {row[0]: row[1] for row in cast(list[sqlite3.Row], cursor.fetchall())}
+
     def _get_current_queue_size(self, queue_id: str) -> int:
         """Gets the current number of pending queue items"""
-        self.__cursor.execute(
-            """--sql
-            SELECT count(*)
-            FROM session_queue
-            WHERE
-              queue_id = ?
-              AND status = 'pending'
-            """,
-            (queue_id,),
-        )
-        return cast(int, self.__cursor.fetchone()[0])
+        return self._get_status_counts(self.__cursor, queue_id).get("pending", 0)
 
     def _get_highest_priority(self, queue_id: str) -> int:
         """Gets the highest priority value in the queue"""
         self.__cursor.execute(
             """--sql
             SELECT MAX(priority)
-            FROM session_queue
+            FROM session_queue INDEXED BY idx_session_queue_pending
             WHERE
               queue_id = ?
               AND status = 'pending'
@@ -267,24 +421,36 @@ class SqliteSessionQueue(SessionQueueBase):
                 priority = self._get_highest_priority(queue_id) + 1
 
             requested_count = calc_session_count(batch)
-            values_to_insert = prepare_values_to_insert(
+            include_sessions = not self._set_batch_graph(batch)
+            values_to_insert = create_values_to_insert(
                 queue_id=queue_id,
                 batch=batch,
                 priority=priority,
                 max_new_queue_items=max_new_queue_items,
+                include_sessions=include_sessions,
             )
-            enqueued_count = len(values_to_insert)
 
-            if requested_count > enqueued_count:
-                values_to_insert = values_to_insert[:max_new_queue_items]
-
-            self.__cursor.executemany(
+            # Sessions are created and inserted a chunk at a time, in a single transaction
+            enqueued_count = 0
+            while chunk := list(islice(values_to_insert, ENQUEUE_CHUNK_SIZE)):
+                self.__cursor.executemany(
+                    """--sql
+                    INSERT INTO session_queue (queue_id, session, session_id, batch_id, field_values, priority)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    """,
+                    chunk,
+                )
+                enqueued_count += len(chunk)
+            self.__cursor.execute(
                 """--sql
-                INSERT INTO session_queue (queue_id, session, session_id, batch_id, field_values, priority)
-                VALUES (?, ?, ?, ?, ?, ?)
+                INSERT INTO session_queue_counts (queue_id, batch_id, status, count)
+                VALUES (?, ?, 'pending', ?)
+                ON CONFLICT (queue_id, batch_id, status) DO UPDATE SET count = count + excluded.count
                 """,
-                values_to_insert,
+                (queue_id, batch.batch_id, enqueued_count),
             )
+            if enqueued_count == 0 and not include_sessions:
+                self.__cursor.execute("DELETE FROM session_queue_batches WHERE batch_id = ?", (batch.batch_id,))
             self.__conn.commit()
         except Exception:
             self.__conn.rollback()
@@ -298,16 +464,81 @@ class SqliteSessionQueue(SessionQueueBase):
             batch=batch,
             priority=priority,
         )
+        self._on_enqueued(enqueue_result)
         self.__invoker.services.events.emit_batch_enqueued(enqueue_result)
         return enqueue_result
 
+    def _set_batch_graph(self, batch: Batch) -> bool:
+        """
+        Stores the graph of a batch, which its queue items are materialized from. Returns False if the batch id is
+        already in use with a different graph, in which case queue items must store their full session.
+        """
+        graph = batch.graph.model_dump_json(warnings=False, exclude_none=True)
+        self.__cursor.execute(
+            """--sql
+            SELECT graph
+            FROM session_queue_batches
+            WHERE batch_id = ?
+            """,
+            (batch.batch_id,),
+        )
+        result = cast(Union[sqlite3.Row, None], self.__cursor.fetchone())
+        if result is not None:
+            return cast(str, result[0]) == graph
+        self.__cursor.execute(
+            """--sql
+            INSERT INTO session_queue_batches (batch_id, graph)
+            VALUES (?, ?)
+            """,
+            (batch.batch_id, graph),
+        )
+        return True
+
     def dequeue(self) -> Optional[SessionQueueItem]:
         try:
             self.__lock.acquire()
+            # Several session workers may dequeue at once, so the next pending item is selected and claimed in a
+            # single statement. This makes the claim safe against other connections to the database, too.
+            if sqlite3.sqlite_version_info < (3, 35, 0):
+                item_id = self._claim_next_without_returning()
+            else:
+                self.__cursor.execute(
+                    """--sql
+                    UPDATE session_queue
+                    SET status = 'in_progress', error = NULL
+                    WHERE item_id = (
+                      SELECT item_id
+                      FROM session_queue INDEXED BY idx_session_queue_pending
+                      WHERE status = 'pending'
+                      ORDER BY
+                        priority DESC,
+                        item_id ASC
+                      LIMIT 1
+                    )
+                    RETURNING item_id
+                    """
+                )
+                result = cast(Union[sqlite3.Row, None], self.__cursor.fetchone())
+                item_id = result[0] if result is not None else None
+            self.__conn.commit()
+            if item_id is None:
+                return None
+        except Exception:
+            self.__conn.rollback()
+            raise
+        finally:
+            self.__lock.release()
+        queue_item = self.get_queue_item(item_id)
+        self._emit_queue_item_status_changed(queue_item)
+        return queue_item
+
+    def _claim_next_without_returning(self) -> Optional[int]:
+        """Claims the next pending queue item on SQLite versions without RETURNING, which was added in 3.35.0"""
+        while True:
             self.__cursor.execute(
                 """--sql
-                SELECT *
-                FROM session_queue
+                SELECT item_id
+                FROM session_queue INDEXED BY idx_session_queue_pending
                 WHERE status = 'pending'
                 ORDER BY
                   priority DESC,
@@ -316,30 +547,33 @@ class SqliteSessionQueue(SessionQueueBase):
                 """
             )
             result = cast(Union[sqlite3.Row, None], self.__cursor.fetchone())
-        except Exception:
-            self.__conn.rollback()
-            raise
-        finally:
-            self.__lock.release()
-        if result is None:
-            return None
-        queue_item = SessionQueueItem.queue_item_from_dict(dict(result))
-        queue_item = self._set_queue_item_status(item_id=queue_item.item_id, status="in_progress")
-        return queue_item
+            if result is None:
+                return None
+            self.__cursor.execute(
+                """--sql
+                UPDATE session_queue
+                SET status = 'in_progress', error = NULL
+                WHERE item_id = ? AND status = 'pending'
+                """,
+                (result[0],),
+            )
+            if self.__cursor.rowcount == 1:
+                return cast(int, result[0])
 
     def get_next(self, queue_id: str) -> Optional[SessionQueueItem]:
         try:
             self.__lock.acquire()
             self.__cursor.execute(
                 """--sql
-                SELECT *
-                FROM session_queue
+                SELECT session_queue.*, session_queue_batches.graph AS batch_graph
+                FROM session_queue INDEXED BY idx_session_queue_pending
+                LEFT JOIN session_queue_batches USING (batch_id)
                 WHERE
                   queue_id = ?
                   AND status = 'pending'
                 ORDER BY
                   priority DESC,
-                  created_at ASC
+                  item_id ASC
                 LIMIT 1
                 """,
                 (queue_id,),
@@ -359,8 +593,9 @@ class SqliteSessionQueue(SessionQueueBase):
             self.__lock.acquire()
             self.__cursor.execute(
                 """--sql
-                SELECT *
+                SELECT session_queue.*, session_queue_batches.graph AS batch_graph
                 FROM session_queue
+                LEFT JOIN session_queue_batches USING (batch_id)
                 WHERE
                   queue_id = ?
                   AND status = 'in_progress'
@@ -378,9 +613,42 @@ class SqliteSessionQueue(SessionQueueBase):
             return None
         return SessionQueueItem.queue_item_from_dict(dict(result))
 
+    def _get_in_progress(self, queue_id: str) -> list[SessionQueueItemDTO]:
+        """Gets every queue item being processed by a session worker, without materializing their sessions"""
+        with self.__db.read() as cursor:
+            cursor.execute(
+                f"""--sql
+                SELECT {QUEUE_ITEM_DTO_COLS}
+                FROM session_queue
+                WHERE
+                  queue_id = ?
+                  AND status = 'in_progress'
+                """,
+                (queue_id,),
+            )
+            results = cast(list[sqlite3.Row], cursor.fetchall())
+        return [SessionQueueItemDTO.queue_item_dto_from_dict(dict(result)) for result in results]
+
+    def _get_queue_item_dto(self, item_id: int) -> SessionQueueItemDTO:
+        """Gets a queue item without materializing its session, for callers that only need its status and ids"""
+        with self.__db.read() as cursor:
+            cursor.execute(
+                f"""--sql
+                SELECT {QUEUE_ITEM_DTO_COLS}
+                FROM session_queue
+                WHERE
+                  item_id = ?
+                """,
+                (item_id,),
+            )
+            result = cast(Union[sqlite3.Row, None], cursor.fetchone())
+        if result is None:
+            raise SessionQueueItemNotFoundError(f"No queue item with id {item_id}")
+        return SessionQueueItemDTO.queue_item_dto_from_dict(dict(result))
+
     def _set_queue_item_status(
         self, item_id: int, status: QUEUE_ITEM_STATUS, error: Optional[str] = None
-    ) -> SessionQueueItem:
+    ) -> SessionQueueItemDTO:
         try:
             self.__lock.acquire()
             self.__cursor.execute(
@@ -397,7 +665,13 @@ class SqliteSessionQueue(SessionQueueBase):
             raise
         finally:
             self.__lock.release()
-        queue_item = self.get_queue_item(item_id)
+        queue_item = self._get_queue_item_dto(item_id)
+        self._emit_queue_item_status_changed(queue_item)
+        if status in ["completed", "failed", "canceled"]:
+            self._on_finished(queue_item)
+        return queue_item
+
+    def _emit_queue_item_status_changed(self, queue_item: SessionQueueItemWithoutGraph) -> None:
         batch_status = self.get_batch_status(queue_id=queue_item.queue_id, batch_id=queue_item.batch_id)
         queue_status = self.get_queue_status(queue_id=queue_item.queue_id)
         self.__invoker.services.events.emit_queue_item_status_changed(
@@ -405,49 +679,20 @@ class SqliteSessionQueue(SessionQueueBase):
             batch_status=batch_status,
             queue_status=queue_status,
         )
-        return queue_item
 
     def is_empty(self, queue_id: str) -> IsEmptyResult:
-        try:
-            self.__lock.acquire()
-            self.__cursor.execute(
-                """--sql
-                SELECT count(*)
-                FROM session_queue
-                WHERE queue_id = ?
-                """,
-                (queue_id,),
-            )
-            is_empty = cast(int, self.__cursor.fetchone()[0]) == 0
-        except Exception:
-            self.__conn.rollback()
-            raise
-        finally:
-            self.__lock.release()
+        with self.__db.read() as cursor:
+            is_empty = sum(self._get_status_counts(cursor, queue_id).values()) == 0
         return IsEmptyResult(is_empty=is_empty)
 
     def is_full(self, queue_id: str) -> IsFullResult:
-        try:
-            self.__lock.acquire()
-            self.__cursor.execute(
-                """--sql
-                SELECT count(*)
-                FROM session_queue
-                WHERE queue_id = ?
-                """,
-                (queue_id,),
-            )
+        with self.__db.read() as cursor:
             max_queue_size = self.__invoker.services.configuration.max_queue_size
-            is_full = cast(int, self.__cursor.fetchone()[0]) >= max_queue_size
-        except Exception:
-            self.__conn.rollback()
-            raise
-        finally:
-            self.__lock.release()
+            is_full = sum(self._get_status_counts(cursor, queue_id).values()) >= max_queue_size
         return IsFullResult(is_full=is_full)
 
-    def delete_queue_item(self, item_id: int) -> SessionQueueItem:
-        queue_item = self.get_queue_item(item_id=item_id)
+    def delete_queue_item(self, item_id: int) -> SessionQueueItemDTO:
+        queue_item = self._get_queue_item_dto(item_id)
         try:
             self.__lock.acquire()
             self.__cursor.execute(
@@ -464,6 +709,7 @@ class SqliteSessionQueue(SessionQueueBase):
             raise
         finally:
             self.__lock.release()
+        self._on_deleted([queue_item.session_id])
         return queue_item
 
     def clear(self, queue_id: str) -> ClearResult:
@@ -471,13 +717,13 @@ class SqliteSessionQueue(SessionQueueBase):
             self.__lock.acquire()
             self.__cursor.execute(
                 """--sql
-                SELECT COUNT(*)
+                SELECT session_id
                 FROM session_queue
                 WHERE queue_id = ?
                 """,
                 (queue_id,),
             )
-            count = self.__cursor.fetchone()[0]
+            session_ids = [row[0] for row in self.__cursor.fetchall()]
             self.__cursor.execute(
                 """--sql
                 DELETE
@@ -492,8 +738,9 @@ class SqliteSessionQueue(SessionQueueBase):
             raise
         finally:
             self.__lock.release()
+        self._on_deleted(session_ids)
         self.__invoker.services.events.emit_queue_cleared(queue_id)
-        return ClearResult(deleted=count)
+        return ClearResult(deleted=len(session_ids))
 
     def prune(self, queue_id: str) -> PruneResult:
         try:
@@ -509,13 +756,13 @@ class SqliteSessionQueue(SessionQueueBase):
             self.__lock.acquire()
             self.__cursor.execute(
                 f"""--sql
-                SELECT COUNT(*)
+                SELECT session_id
                 FROM session_queue
                 {where};
                 """,
                 (queue_id,),
             )
-            count = self.__cursor.fetchone()[0]
+            session_ids = [row[0] for row in self.__cursor.fetchall()]
             self.__cursor.execute(
                 f"""--sql
                 DELETE
@@ -530,10 +777,11 @@ class SqliteSessionQueue(SessionQueueBase):
             raise
         finally:
             self.__lock.release()
-        return PruneResult(deleted=count)
+        self._on_deleted(session_ids)
+        return PruneResult(deleted=len(session_ids))
 
     def cancel_queue_item(self, item_id: int, error: Optional[str] = None) -> SessionQueueItem:
-        queue_item = self.get_queue_item(item_id)
+        queue_item = self._get_queue_item_dto(item_id)
         if queue_item.status not in ["canceled", "failed", "completed"]:
             status = "failed" if error is not None else "canceled"
             queue_item = self._set_queue_item_status(item_id=item_id, status=status, error=error)  # type: ignore [arg-type] # mypy seems to not narrow the Literals here
@@ -544,11 +792,12 @@ class SqliteSessionQueue(SessionQueueBase):
                 queue_batch_id=queue_item.batch_id,
                 graph_execution_state_id=queue_item.session_id,
             )
-        return queue_item
+        # only the returned item has its session materialized
+        return self.get_queue_item(item_id)
 
     def cancel_by_batch_ids(self, queue_id: str, batch_ids: list[str]) -> CancelByBatchIDsResult:
         try:
-            current_queue_item = self.get_current(queue_id)
+            current_queue_items = self._get_in_progress(queue_id)
             self.__lock.acquire()
             placeholders = ", ".join(["?" for _ in batch_ids])
             where = f"""--sql
@@ -578,21 +827,9 @@ class SqliteSessionQueue(SessionQueueBase):
                 tuple(params),
             )
             self.__conn.commit()
-            if current_queue_item is not None and current_queue_item.batch_id in batch_ids:
-                self.__invoker.services.queue.cancel(current_queue_item.session_id)
-                self.__invoker.services.events.emit_session_canceled(
-                    queue_item_id=current_queue_item.item_id,
-                    queue_id=current_queue_item.queue_id,
-                    queue_batch_id=current_queue_item.batch_id,
-                    graph_execution_state_id=current_queue_item.session_id,
-                )
-                batch_status = self.get_batch_status(queue_id=queue_id, batch_id=current_queue_item.batch_id)
-                queue_status = self.get_queue_status(queue_id=queue_id)
-                self.__invoker.services.events.emit_queue_item_status_changed(
-                    session_queue_item=current_queue_item,
-                    batch_status=batch_status,
-                    queue_status=queue_status,
-                )
+            for current_queue_item in current_queue_items:
+                if current_queue_item.batch_id in batch_ids:
+                    self._cancel_in_progress(current_queue_item)
         except Exception:
             self.__conn.rollback()
             raise
@@ -602,7 +839,7 @@ class SqliteSessionQueue(SessionQueueBase):
 
     def cancel_by_queue_id(self, queue_id: str) -> CancelByQueueIDResult:
         try:
-            current_queue_item = self.get_current(queue_id)
+            current_queue_items = self._get_in_progress(queue_id)
             self.__lock.acquire()
             where = """--sql
                 WHERE
@@ -630,21 +867,8 @@ class SqliteSessionQueue(SessionQueueBase):
                 tuple(params),
             )
             self.__conn.commit()
-            if current_queue_item is not None and current_queue_item.queue_id == queue_id:
-                self.__invoker.services.queue.cancel(current_queue_item.session_id)
-                self.__invoker.services.events.emit_session_canceled(
-                    queue_item_id=current_queue_item.item_id,
-                    queue_id=current_queue_item.queue_id,
-                    queue_batch_id=current_queue_item.batch_id,
-                    graph_execution_state_id=current_queue_item.session_id,
-                )
-                batch_status = self.get_batch_status(queue_id=queue_id, batch_id=current_queue_item.batch_id)
-                queue_status = self.get_queue_status(queue_id=queue_id)
-                self.__invoker.services.events.emit_queue_item_status_changed(
-                    session_queue_item=current_queue_item,
-                    batch_status=batch_status,
-                    queue_status=queue_status,
-                )
+            for current_queue_item in current_queue_items:
+                self._cancel_in_progress(current_queue_item)
         except Exception:
             self.__conn.rollback()
             raise
@@ -652,27 +876,46 @@ class SqliteSessionQueue(SessionQueueBase):
             self.__lock.release()
         return CancelByQueueIDResult(canceled=count)
 
+    def _cancel_in_progress(self, queue_item: SessionQueueItemDTO) -> None:
+        """Stops a queue item that was in progress when it was canceled, freeing its session worker"""
+        self.__invoker.services.queue.cancel(queue_item.session_id)
+        self.__invoker.services.events.emit_session_canceled(
+            queue_item_id=queue_item.item_id,
+            queue_id=queue_item.queue_id,
+            queue_batch_id=queue_item.batch_id,
+            graph_execution_state_id=queue_item.session_id,
+        )
+        self._emit_queue_item_status_changed(queue_item)
+
     def get_queue_item(self, item_id: int) -> SessionQueueItem:
-        try:
-            self.__lock.acquire()
-            self.__cursor.execute(
+        with self.__db.read() as cursor:
+            cursor.execute(
                 """--sql
-                SELECT * FROM session_queue
+                SELECT session_queue.*, session_queue_batches.graph AS batch_graph
+                FROM session_queue
+                LEFT JOIN session_queue_batches USING (batch_id)
                 WHERE
                   item_id = ?
                 """,
                 (item_id,),
             )
-            result = cast(Union[sqlite3.Row, None], self.__cursor.fetchone())
-        except Exception:
-            self.__conn.rollback()
-            raise
-        finally:
-            self.__lock.release()
+            result = cast(Union[sqlite3.Row, None], cursor.fetchone())
         if result is None:
             raise SessionQueueItemNotFoundError(f"No queue item with id {item_id}")
         return SessionQueueItem.queue_item_from_dict(dict(result))
 
+    def get_session_statuses(self, session_ids: list[str]) -> dict[str, QUEUE_ITEM_STATUS]:
+        with self.__db.read() as cursor:
+            cursor.execute(
+                """--sql
+                SELECT session_id, status
+                FROM session_queue
+                WHERE session_id IN (SELECT value FROM json_each(?));
+                """,
+                (json.dumps(session_ids),),
+            )
+            return {row[0]: row[1] for row in cursor.fetchall()}
+
     def list_queue_items(
         self,
         queue_id: str,
@@ -681,9 +924,7 @@ class SqliteSessionQueue(SessionQueueBase):
         cursor: Optional[int] = None,
         status: Optional[QUEUE_ITEM_STATUS] = None,
     ) -> CursorPaginatedResults[SessionQueueItemDTO]:
-        try:
-            item_id = cursor
-            self.__lock.acquire()
+        with self.__db.read() as db_cursor:
             query = """--sql
                 SELECT item_id,
                     status,
@@ -708,11 +949,11 @@ class SqliteSessionQueue(SessionQueueBase):
                     """
                 params.append(status)
 
-            if item_id is not None:
+            if cursor is not None:
                 query += """--sql
                     AND (priority < ?) OR (priority = ? AND item_id > ?)
                     """
-                params.extend([priority, priority, item_id])
+                params.extend([priority, priority, cursor])
 
             query += """--sql
                 ORDER BY
@@ -721,48 +962,39 @@ class SqliteSessionQueue(SessionQueueBase):
                 LIMIT ?
                 """
             params.append(limit + 1)
-            self.__cursor.execute(query, params)
-            results = cast(list[sqlite3.Row], self.__cursor.fetchall())
+            db_cursor.execute(query, params)
+            results = cast(list[sqlite3.Row], db_cursor.fetchall())
             items = [SessionQueueItemDTO.queue_item_dto_from_dict(dict(result)) for result in results]
             has_more = False
             if len(items) > limit:
                 # remove the extra item
                 items.pop()
                 has_more = True
-        except Exception:
-            self.__conn.rollback()
-            raise
-        finally:
-            self.__lock.release()
         return CursorPaginatedResults(items=items, limit=limit, has_more=has_more)
 
     def get_queue_status(self, queue_id: str) -> SessionQueueStatus:
-        try:
-            self.__lock.acquire()
-            self.__cursor.execute(
+        with self.__db.read() as cursor:
+            counts = self._get_status_counts(cursor, queue_id)
+            # only the ids of the current item are needed, so its session is not materialized
+            cursor.execute(
                 """--sql
-                SELECT status, count(*)
+                SELECT item_id, session_id, batch_id
                 FROM session_queue
-                WHERE queue_id = ?
-                GROUP BY status
+                WHERE
+                  queue_id = ?
+                  AND status = 'in_progress'
+                LIMIT 1
                 """,
                 (queue_id,),
             )
-            counts_result = cast(list[sqlite3.Row], self.__cursor.fetchall())
-        except Exception:
-            self.__conn.rollback()
-            raise
-        finally:
-            self.__lock.release()
+            current_item = cast(Union[sqlite3.Row, None], cursor.fetchone())
 
-        current_item = self.get_current(queue_id=queue_id)
-        total = sum(row[1] for row in counts_result)
-        counts: dict[str, int] = {row[0]: row[1] for row in counts_result}
+        total = sum(counts.values())
         return SessionQueueStatus(
             queue_id=queue_id,
-            item_id=current_item.item_id if current_item else None,
-            session_id=current_item.session_id if current_item else None,
-            batch_id=current_item.batch_id if current_item else None,
+            item_id=current_item["item_id"] if current_item else None,
+            session_id=current_item["session_id"] if current_item else None,
+            batch_id=current_item["batch_id"] if current_item else None,
             pending=counts.get("pending", 0),
             in_progress=counts.get("in_progress", 0),
             completed=counts.get("completed", 0),
@@ -772,27 +1004,9 @@ class SqliteSessionQueue(SessionQueueBase):
         )
 
     def get_batch_status(self, queue_id: str, batch_id: str) -> BatchStatus:
-        try:
-            self.__lock.acquire()
-            self.__cursor.execute(
-                """--sql
-                SELECT status, count(*)
-                FROM session_queue
-                WHERE
-                  queue_id = ?
-                  AND batch_id = ?
-                GROUP BY status
-                """,
-                (queue_id, batch_id),
-            )
-            result = cast(list[sqlite3.Row], self.__cursor.fetchall())
-            total = sum(row[1] for row in result)
-            counts: dict[str, int] = {row[0]: row[1] for row in result}
-        except Exception:
-            self.__conn.rollback()
-            raise
-        finally:
-            self.__lock.release()
+        with self.__db.read() as cursor:
+            counts = self._get_status_counts(cursor, queue_id, batch_id)
+            total = sum(counts.values())
 
         return BatchStatus(
             batch_id=batch_id,
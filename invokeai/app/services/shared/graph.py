@@ -2,10 +2,11 @@
 
 import copy
 import itertools
-from typing import Annotated, Any, Optional, Union, get_args, get_origin, get_type_hints
+import weakref
+from typing import Annotated, Any, Callable, Literal, Optional, TypeVar, Union, get_args, get_origin, get_type_hints
 
 import networkx as nx
-from pydantic import BaseModel, ConfigDict, field_validator, model_validator
+from pydantic import BaseModel, ConfigDict, PrivateAttr, field_validator, model_validator
 from pydantic.fields import Field
 
 # Importing * is bad karma but needed here for node detection
@@ -16,6 +17,7 @@ from invokeai.app.invocations.baseinvocation import (
     Input,
     InputField,
     InvocationContext,
+    InvocationLane,
     OutputField,
     UIType,
     invocation,
@@ -26,6 +28,8 @@ from invokeai.app.util.misc import uuid_string
 # in 3.10 this would be "from types import NoneType"
 NoneType = type(None)
 
+T = TypeVar("T")
+
 
 class EdgeConnection(BaseModel):
     node_id: str = Field(description="The id of the node for this edge connection")
@@ -219,6 +223,10 @@ class IterateInvocation(BaseInvocation):
     )
     index: int = InputField(description="The index, will be provided on executed iterators", default=0, ui_hidden=True)
 
+    @classmethod
+    def get_lane(cls) -> InvocationLane:
+        return "cpu"
+
     def invoke(self, context: InvocationContext) -> IterateInvocationOutput:
         """Produces the outputs as values"""
         return IterateInvocationOutput(item=self.collection[self.index])
@@ -246,6 +254,10 @@ class CollectInvocation(BaseInvocation):
         description="The collection, will be provided on execution", default_factory=list, ui_hidden=True
     )
 
+    @classmethod
+    def get_lane(cls) -> InvocationLane:
+        return "cpu"
+
     def invoke(self, context: InvocationContext) -> CollectInvocationOutput:
         """Invoke with provided services and return outputs."""
         return CollectInvocationOutput(collection=copy.copy(self.collection))
@@ -255,6 +267,42 @@ InvocationsUnion: Any = BaseInvocation.get_invocations_union()
 InvocationOutputsUnion: Any = BaseInvocationOutput.get_outputs_union()
 
 
+class _GraphViewCache:
+    """
+    Holds views derived from a graph's nodes and edges (e.g. NetworkX graphs), so repeated read-only queries do not
+    rebuild them. The owning graph clears it whenever it is modified. Copies of a graph start with an empty cache.
+
+    Views of a graph may include its subgraphs, so the caches of subgraphs clear the caches of their parent graphs.
+
+    The generation counts how many times the cache was cleared, so callers can tell if the graph was modified.
+    """
+
+    def __init__(self) -> None:
+        self._views: dict[str, Any] = {}
+        self._parents: weakref.WeakSet[_GraphViewCache] = weakref.WeakSet()
+        self.generation = 0
+
+    def has(self, name: str) -> bool:
+        return name in self._views
+
+    def get(self, name: str, build: Callable[[], T]) -> T:
+        if name not in self._views:
+            self._views[name] = build()
+        return self._views[name]
+
+    def add_parent(self, parent: "_GraphViewCache") -> None:
+        self._parents.add(parent)
+
+    def clear(self) -> None:
+        self._views.clear()
+        self.generation += 1
+        for parent in list(self._parents):
+            parent.clear()
+
+    def __deepcopy__(self, memo: dict) -> "_GraphViewCache":
+        return _GraphViewCache()
+
+
 class Graph(BaseModel):
     id: str = Field(description="The id of this graph", default_factory=uuid_string)
     # TODO: use a list (and never use dict in a BaseModel) because pydantic/fastapi hates me
@@ -266,6 +314,31 @@ class Graph(BaseModel):
         default_factory=list,
     )
 
+    # Cached views of this graph. These are only invalidated by the methods below, including those of subgraphs -
+    # modifying `nodes` or `edges` directly after querying a view will leave the views stale.
+    _views: _GraphViewCache = PrivateAttr(default_factory=_GraphViewCache)
+
+    def _get_view(self, name: str, build: Callable[[], T]) -> T:
+        """Gets a cached view of this graph, building it if the graph or any of its subgraphs was modified"""
+        if not self._views.has(name):
+            self._link_subgraph_views()
+        return self._views.get(name, build)
+
+    def _link_subgraph_views(self) -> None:
+        """Makes subgraphs clear the views of this graph when they are modified"""
+        for node in self.nodes.values():
+            if isinstance(node, GraphInvocation) and node.graph is not None:
+                node.graph._views.add_parent(self._views)
+                node.graph._link_subgraph_views()
+
+    def _invalidate_views(self, node_path: Optional[str] = None) -> None:
+        """Clears the cached views of this graph, and of any subgraphs along the given node path"""
+        self._views.clear()
+        if node_path is not None and "." in node_path:
+            node = self.nodes.get(node_path[: node_path.index(".")])
+            if isinstance(node, GraphInvocation) and node.graph is not None:
+                node.graph._invalidate_views(node_path[node_path.index(".") + 1 :])
+
     def add_node(self, node: BaseInvocation) -> None:
         """Adds a node to a graph
 
@@ -276,6 +349,7 @@ class Graph(BaseModel):
             raise NodeAlreadyInGraphError()
 
         self.nodes[node.id] = node
+        self._invalidate_views()
 
     def _get_graph_and_node(self, node_path: str) -> tuple["Graph", str]:
         """Returns the graph and node id for a node path."""
@@ -312,6 +386,7 @@ class Graph(BaseModel):
                 edge_graph.delete_edge(edge)
 
             del graph.nodes[node_id]
+            self._invalidate_views(node_path)
 
         except NodeNotFoundError:
             pass  # Ignore, not doesn't exist (should this throw?)
@@ -325,6 +400,7 @@ class Graph(BaseModel):
         self._validate_edge(edge)
         if edge not in self.edges:
             self.edges.append(edge)
+            self._invalidate_views()
         else:
             raise InvalidEdgeError()
 
@@ -333,6 +409,7 @@ class Graph(BaseModel):
 
         try:
             self.edges.remove(edge)
+            self._invalidate_views()
         except KeyError:
             pass
 
@@ -464,10 +541,14 @@ class Graph(BaseModel):
                 f"Edge to node {edge.destination.node_id} field {edge.destination.field} already exists"
             )
 
-        # Validate that no cycles would be created
+        # Validate that no cycles would be created (the new edge closes a cycle if its source is reachable from its
+        # destination)
         g = self.nx_graph_flat()
-        g.add_edge(edge.source.node_id, edge.destination.node_id)
-        if not nx.is_directed_acyclic_graph(g):
+        if edge.source.node_id == edge.destination.node_id or (
+            edge.source.node_id in g
+            and edge.destination.node_id in g
+            and nx.has_path(g, edge.destination.node_id, edge.source.node_id)
+        ):
             raise InvalidEdgeError(
                 f"Edge creates a cycle in the graph: {edge.source.node_id} -> {edge.destination.node_id}"
             )
@@ -554,6 +635,7 @@ class Graph(BaseModel):
 
         # Set the new node in the graph
         graph.nodes[new_node.id] = new_node
+        self._invalidate_views(node_path)
         if new_node.id != node.id:
             input_edges = self._get_input_edges_and_graphs(node_path)
             output_edges = self._get_output_edges_and_graphs(node_path)
@@ -756,8 +838,14 @@ class Graph(BaseModel):
         return True
 
     def nx_graph(self) -> nx.DiGraph:
-        """Returns a NetworkX DiGraph representing the layout of this graph"""
-        # TODO: Cache this?
+        """
+        Returns a NetworkX DiGraph representing the layout of this graph.
+
+        The result is cached until the graph is modified, and must not be mutated.
+        """
+        return self._get_view("nx_graph", self._build_nx_graph)
+
+    def _build_nx_graph(self) -> nx.DiGraph:
         g = nx.DiGraph()
         g.add_nodes_from(list(self.nodes.keys()))
         g.add_edges_from({(e.source.node_id, e.destination.node_id) for e in self.edges})
@@ -771,9 +859,16 @@ class Graph(BaseModel):
         return g
 
     def nx_graph_flat(self, nx_graph: Optional[nx.DiGraph] = None, prefix: Optional[str] = None) -> nx.DiGraph:
-        """Returns a flattened NetworkX DiGraph, including all subgraphs (but not with iterations expanded)"""
-        g = nx_graph or nx.DiGraph()
+        """
+        Returns a flattened NetworkX DiGraph, including all subgraphs (but not with iterations expanded).
+
+        When called without arguments, the result is cached until the graph is modified, and must not be mutated.
+        """
+        if nx_graph is None and prefix is None:
+            return self._get_view("nx_graph_flat", lambda: self._build_nx_graph_flat(nx.DiGraph()))
+        return self._build_nx_graph_flat(nx_graph or nx.DiGraph(), prefix)
 
+    def _build_nx_graph_flat(self, g: nx.DiGraph, prefix: Optional[str] = None) -> nx.DiGraph:
         # Add all nodes from this graph except graph/iteration nodes
         g.add_nodes_from(
             [
@@ -794,6 +889,161 @@ class Graph(BaseModel):
         return g
 
 
+class _SourceGraphIndex:
+    """
+    Derived, read-only structures over a graph, used to schedule its preparation.
+
+    Built once per graph layout rather than on every call to `GraphExecutionState._prepare()`.
+    """
+
+    def __init__(self, graph: Graph):
+        self.nx_graph = graph.nx_graph_flat()
+        self.sorted_nodes: list[str] = list(nx.topological_sort(self.nx_graph))
+        self.iterators: set[str] = {n for n in self.sorted_nodes if isinstance(graph.get_node(n), IterateInvocation)}
+        collectors = {n for n in self.sorted_nodes if isinstance(graph.get_node(n), CollectInvocation)}
+
+        # All iterate ancestors of each node
+        self.iterate_ancestors: dict[str, set[str]] = {}
+        # Iterate ancestors of each node, ignoring edges into collectors - these are the iterators active for a node
+        self.node_iterators: dict[str, list[str]] = {}
+
+        # Both are accumulated in topological order, so each node only visits its direct parents
+        for n in self.sorted_nodes:
+            ancestors: set[str] = set()
+            active: set[str] = set()
+            for p in self.nx_graph.predecessors(n):
+                ancestors |= self.iterate_ancestors[p]
+                if p in self.iterators:
+                    ancestors.add(p)
+                if n not in collectors:
+                    active.update(self.node_iterators[p])
+                    if p in self.iterators:
+                        active.add(p)
+            self.iterate_ancestors[n] = ancestors
+            self.node_iterators[n] = [a for a in self.sorted_nodes if a in active]
+
+
+class _ExecutionGraphIndex:
+    """
+    Tracks which nodes of an execution graph are ready to execute.
+
+    Every unexecuted node keeps a count of its unexecuted parents, and completing a node only visits its children,
+    so updates cost O(degree). Ready nodes are kept on a stack, so the children readied by a node run before its
+    siblings (depth-first execution). Nodes handed out for concurrent execution are tracked as in flight until they
+    complete or error.
+    """
+
+    def __init__(self, execution_graph: Graph, executed: set[str], prepared_source_mapping: dict[str, str]):
+        self.nx_graph = execution_graph.nx_graph().copy()
+        self.input_edges: dict[str, list[Edge]] = {n: [] for n in execution_graph.nodes}
+        for e in execution_graph.edges:
+            self.input_edges[e.destination.node_id].append(e)
+
+        # Unexecuted parents of each unexecuted node
+        self.pending_inputs: dict[str, int] = {}
+        # Unexecuted prepared nodes of each source node
+        self.pending_prepared: dict[str, int] = {}
+        self.ready: list[str] = []
+        self.in_flight: set[str] = set()
+
+        # Push in reverse depth-first order so the first node of the traversal is on top of the stack
+        for n in reversed(list(nx.dfs_preorder_nodes(self.nx_graph))):
+            if n in executed:
+                continue
+            pending = sum(1 for p in self.nx_graph.predecessors(n) if p not in executed)
+            self.pending_inputs[n] = pending
+            if pending == 0:
+                self.ready.append(n)
+
+        for n, source_node_id in prepared_source_mapping.items():
+            if n not in executed:
+                self.pending_prepared[source_node_id] = self.pending_prepared.get(source_node_id, 0) + 1
+
+    def add_node(self, node_id: str, source_node_id: str, input_edges: list[Edge], executed: set[str]) -> None:
+        """Adds a newly prepared node"""
+        parents = {e.source.node_id for e in input_edges}
+        self.nx_graph.add_node(node_id)
+        self.nx_graph.add_edges_from((p, node_id) for p in parents)
+        self.input_edges[node_id] = input_edges
+
+        pending = sum(1 for p in parents if p not in executed)
+        self.pending_inputs[node_id] = pending
+        self.pending_prepared[source_node_id] = self.pending_prepared.get(source_node_id, 0) + 1
+        if pending == 0:
+            self.ready.append(node_id)
+
+    def complete(self, node_id: str, source_node_id: str) -> bool:
+        """
+        Marks a node as executed, readying any children with no other unexecuted inputs.
+
+        Returns True if this was the last unexecuted node prepared from its source node.
+        """
+        if self.pending_inputs.pop(node_id, None) is None:
+            return False  # already completed
+        self.in_flight.discard(node_id)
+        if self.ready and self.ready[-1] == node_id:
+            self.ready.pop()
+        elif node_id in self.ready:
+            self.ready.remove(node_id)
+
+        for child in self.nx_graph.successors(node_id):
+            if child not in self.pending_inputs:
+                continue
+            self.pending_inputs[child] -= 1
+            if self.pending_inputs[child] == 0:
+                self.ready.append(child)
+
+        self.pending_prepared[source_node_id] -= 1
+        return self.pending_prepared[source_node_id] == 0
+
+    def peek(self) -> Optional[str]:
+        """Gets the next ready node, without removing it"""
+        return self.ready[-1] if self.ready else None
+
+    def take_ready(self) -> list[str]:
+        """Gets every ready node that is not in flight, in depth-first order, and marks them as in flight"""
+        taken = [n for n in reversed(self.ready) if n not in self.in_flight]
+        self.in_flight.update(taken)
+        return taken
+
+
+class PreparedNodeChange(BaseModel):
+    """A node was added to the execution graph"""
+
+    type: Literal["prepared"] = "prepared"
+    node: Annotated[InvocationsUnion, Field(discriminator="type")] = Field(description="The prepared node")
+    source_node_id: str = Field(description="The id of the source graph node the node was prepared from")
+    edges: list[Edge] = Field(description="The input edges of the prepared node")
+
+
+class NodeInputsChange(BaseModel):
+    """The inputs of an execution graph node were populated from its parents' results"""
+
+    type: Literal["inputs"] = "inputs"
+    node: Annotated[InvocationsUnion, Field(discriminator="type")] = Field(description="The node with its inputs")
+
+
+class NodeCompletedChange(BaseModel):
+    """An execution graph node completed"""
+
+    type: Literal["completed"] = "completed"
+    node_id: str = Field(description="The id of the completed node")
+    output: Annotated[InvocationOutputsUnion, Field(discriminator="type")] = Field(description="The node's output")
+
+
+class NodeErrorChange(BaseModel):
+    """An execution graph node errored"""
+
+    type: Literal["error"] = "error"
+    node_id: str = Field(description="The id of the errored node")
+    error: str = Field(description="The error")
+
+
+GraphExecutionStateChange = Annotated[
+    Union[PreparedNodeChange, NodeInputsChange, NodeCompletedChange, NodeErrorChange], Field(discriminator="type")
+]
+
+
 class GraphExecutionState(BaseModel):
     """Tracks the state of a graph execution"""
 
@@ -834,6 +1084,14 @@ class GraphExecutionState(BaseModel):
         default_factory=dict,
     )
 
+    # Scheduling structures derived from the execution graph. They are not serialized, and are rebuilt on first use.
+    _execution_index: Optional[_ExecutionGraphIndex] = PrivateAttr(default=None)
+
+    # Changes made since `start_change_log()` was called, or None if changes are not being tracked
+    _change_log: Optional[list[GraphExecutionStateChange]] = PrivateAttr(default=None)
+    # The generation of the source graph's views when the change log was started
+    _change_log_graph_generation: int = PrivateAttr(default=0)
+
     @field_validator("graph")
     def graph_is_valid(cls, v: Graph):
         """Validates that the graph is valid"""
@@ -859,9 +1117,6 @@ class GraphExecutionState(BaseModel):
     def next(self) -> Optional[BaseInvocation]:
         """Gets the next node ready to execute."""
 
-        # TODO: enable multiple nodes to execute simultaneously by tracking currently executing nodes
-        #       possibly with a timeout?
-
         # If there are no prepared nodes, prepare some nodes
         next_node = self._get_next_node()
         if next_node is None:
@@ -875,10 +1130,29 @@ class GraphExecutionState(BaseModel):
         # Get values from edges
         if next_node is not None:
             self._prepare_inputs(next_node)
+            self._log_change(NodeInputsChange(node=next_node))
 
         # If next is still none, there's no next node, return None
         return next_node
 
+    def next_ready(self) -> list[BaseInvocation]:
+        """
+        Gets every node that is ready to execute and not already executing, for concurrent execution.
+
+        The returned nodes are tracked as executing until they are completed or errored, so they are not returned
+        again. Executing nodes are not persisted; a state loaded from storage does not know about them.
+        """
+        # Prepare as many nodes as we can, so every independent branch has its ready nodes
+        while self._prepare() is not None:
+            pass
+
+        index = self._get_execution_index()
+        ready_nodes = [self.execution_graph.nodes[n] for n in index.take_ready()]
+        for node in ready_nodes:
+            self._prepare_inputs(node)
+            self._log_change(NodeInputsChange(node=node))
+        return ready_nodes
+
     def complete(self, node_id: str, output: InvocationOutputsUnion):
         """Marks a node as complete"""
 
@@ -886,24 +1160,64 @@ class GraphExecutionState(BaseModel):
             return  # TODO: log error?
 
         # Mark node as executed
+        source_node = self.prepared_source_mapping[node_id]
+        is_source_complete = self._get_execution_index().complete(node_id, source_node)
         self.executed.add(node_id)
         self.results[node_id] = output
 
         # Check if source node is complete (all prepared nodes are complete)
-        source_node = self.prepared_source_mapping[node_id]
-        prepared_nodes = self.source_prepared_mapping[source_node]
-
-        if all(n in self.executed for n in prepared_nodes):
+        if is_source_complete:
             self.executed.add(source_node)
             self.executed_history.append(source_node)
 
+        self._log_change(NodeCompletedChange(node_id=node_id, output=output))
+
     def set_node_error(self, node_id: str, error: str):
         """Marks a node as errored"""
         self.errors[node_id] = error
+        if self._execution_index is not None:
+            self._execution_index.in_flight.discard(node_id)
+        self._log_change(NodeErrorChange(node_id=node_id, error=error))
+
+    def start_change_log(self) -> None:
+        """
+        Starts recording changes to the execution of this state, discarding any previously recorded changes.
+
+        Storage calls this after loading or saving the state, so that later saves may only write the changes.
+        """
+        self._change_log = []
+        self._change_log_graph_generation = self.graph._views.generation
+
+    def get_change_log(self) -> Optional[list[GraphExecutionStateChange]]:
+        """
+        Gets the changes recorded since `start_change_log()` was called.
+
+        Returns None if changes are not being recorded, or if the state was changed in a way that cannot be
+        recorded (e.g. the source graph was modified). In that case, the state must be saved in full.
+        """
+        if self.graph._views.generation != self._change_log_graph_generation:
+            return None
+        return self._change_log
+
+    def apply_changes(self, changes: list[GraphExecutionStateChange]) -> None:
+        """Replays changes recorded by another instance of this state"""
+        for change in changes:
+            if isinstance(change, PreparedNodeChange):
+                self._add_execution_node(change.node, change.source_node_id, change.edges)
+            elif isinstance(change, NodeInputsChange):
+                self.execution_graph.nodes[change.node.id] = change.node
+            elif isinstance(change, NodeCompletedChange):
+                self.complete(change.node_id, change.output)
+            elif isinstance(change, NodeErrorChange):
+                self.set_node_error(change.node_id, change.error)
+
+    def _log_change(self, change: GraphExecutionStateChange) -> None:
+        if self._change_log is not None:
+            self._change_log.append(change)
 
     def is_complete(self) -> bool:
         """Returns true if the graph is complete"""
-        node_ids = set(self.graph.nx_graph_flat().nodes)
+        node_ids = self._get_source_index().sorted_nodes
         return self.has_error() or all((k in self.executed for k in node_ids))
 
     def has_error(self) -> bool:
@@ -959,67 +1273,76 @@ class GraphExecutionState(BaseModel):
             if isinstance(new_node, IterateInvocation):
                 new_node.index = i
 
-            # Add to execution graph
-            self.execution_graph.add_node(new_node)
-            self.prepared_source_mapping[new_node.id] = node_path
-            if node_path not in self.source_prepared_mapping:
-                self.source_prepared_mapping[node_path] = set()
-            self.source_prepared_mapping[node_path].add(new_node.id)
-
             # Add new edges to execution graph
-            for edge in new_edges:
-                new_edge = Edge(
+            new_node_edges = [
+                Edge(
                     source=edge.source,
                     destination=EdgeConnection(node_id=new_node.id, field=edge.destination.field),
                 )
-                self.execution_graph.add_edge(new_edge)
+                for edge in new_edges
+            ]
 
+            # Add to execution graph
+            self._add_execution_node(new_node, node_path, new_node_edges)
+            self._log_change(PreparedNodeChange(node=new_node, source_node_id=node_path, edges=new_node_edges))
             new_nodes.append(new_node.id)
 
         return new_nodes
 
-    def _iterator_graph(self) -> nx.DiGraph:
-        """Gets a DiGraph with edges to collectors removed so an ancestor search produces all active iterators for any node"""
-        g = self.graph.nx_graph_flat()
-        collectors = (n for n in self.graph.nodes if isinstance(self.graph.get_node(n), CollectInvocation))
-        for c in collectors:
-            g.remove_edges_from(list(g.in_edges(c)))
-        return g
+    def _add_execution_node(self, node: BaseInvocation, source_node_id: str, edges: list[Edge]) -> None:
+        """Adds a prepared node and its input edges to the execution graph"""
+        execution_index = self._get_execution_index()
+        self.execution_graph.add_node(node)
+        self.prepared_source_mapping[node.id] = source_node_id
+        if source_node_id not in self.source_prepared_mapping:
+            self.source_prepared_mapping[source_node_id] = set()
+        self.source_prepared_mapping[source_node_id].add(node.id)
+
+        # These are copies of validated edges in the source graph, so they are not validated again (which would
+        # rebuild the flattened execution graph for every edge).
+        self.execution_graph.edges.extend(edges)
+        self.execution_graph._invalidate_views()
+
+        execution_index.add_node(node.id, source_node_id, edges, self.executed)
+
+    def _get_source_index(self) -> _SourceGraphIndex:
+        """Gets the scheduling index of the source graph, which is cached with the graph's other views"""
+        return self.graph._get_view("source_index", lambda: _SourceGraphIndex(self.graph))
+
+    def _get_execution_index(self) -> _ExecutionGraphIndex:
+        """Gets the scheduling index of the execution graph, building it if needed"""
+        if self._execution_index is None:
+            self._execution_index = _ExecutionGraphIndex(
+                self.execution_graph, self.executed, self.prepared_source_mapping
+            )
+        return self._execution_index
 
     def _get_node_iterators(self, node_id: str) -> list[str]:
         """Gets iterators for a node"""
-        g = self._iterator_graph()
-        iterators = [n for n in nx.ancestors(g, node_id) if isinstance(self.graph.get_node(n), IterateInvocation)]
-        return iterators
+        return self._get_source_index().node_iterators[node_id]
 
     def _prepare(self) -> Optional[str]:
         # Get flattened source graph
-        g = self.graph.nx_graph_flat()
+        index = self._get_source_index()
+        g = index.nx_graph
 
         # Find next node that:
         # - was not already prepared
         # - is not an iterate node whose inputs have not been executed
         # - does not have an unexecuted iterate ancestor
-        sorted_nodes = nx.topological_sort(g)
         next_node_id = next(
             (
                 n
-                for n in sorted_nodes
+                for n in index.sorted_nodes
                 # exclude nodes that have already been prepared
                 if n not in self.source_prepared_mapping
                 # exclude iterate nodes whose inputs have not been executed
                 and not (
-                    isinstance(self.graph.get_node(n), IterateInvocation)  # `n` is an iterate node...
-                    and not all((e[0] in self.executed for e in g.in_edges(n)))  # ...that has unexecuted inputs
+                    n in index.iterators  # `n` is an iterate node...
+                    and not all((p in self.executed for p in g.predecessors(n)))  # ...that has unexecuted inputs
                 )
                 # exclude nodes who have unexecuted iterate ancestors
-                and not any(
-                    (
-                        isinstance(self.graph.get_node(a), IterateInvocation)  # `a` is an iterate ancestor of `n`...
-                        and a not in self.executed  # ...that is not executed
-                        for a in nx.ancestors(g, n)  # for all ancestors `a` of node `n`
-                    )
-                )
+                and not any((a not in self.executed for a in index.iterate_ancestors[n]))
             ),
             None,
         )
@@ -1052,7 +1375,7 @@ class GraphExecutionState(BaseModel):
             # Select the correct prepared parents for each iteration
             # For every iterator, the parent must either not be a child of that iterator, or must match the prepared iteration for that iterator
             # TODO: Handle a node mapping to none
-            eg = self.execution_graph.nx_graph_flat()
+            eg = self._get_execution_index().nx_graph
             prepared_parent_mappings = [
                 [(n, self._get_iteration_node(n, g, eg, it)) for n in next_node_parents]
                 for it in iterator_node_prepared_combinations
@@ -1087,27 +1410,16 @@ class GraphExecutionState(BaseModel):
         iterator_source_node_mapping = [(n, self.prepared_source_mapping[n]) for n in prepared_iterator_nodes]
         parent_iterators = [itn for itn in iterator_source_node_mapping if nx.has_path(graph, itn[1], source_node_path)]
 
-        return next(
-            (n for n in prepared_nodes if all(nx.has_path(execution_graph, pit[0], n) for pit in parent_iterators)),
-            None,
-        )
+        # Narrow down to the prepared nodes downstream of every parent iterator
+        matching_nodes = prepared_nodes
+        for pit in parent_iterators:
+            matching_nodes = matching_nodes & nx.descendants(execution_graph, pit[0])
+
+        return next(iter(matching_nodes), None)
 
     def _get_next_node(self) -> Optional[BaseInvocation]:
         """Gets the deepest node that is ready to be executed"""
-        g = self.execution_graph.nx_graph()
-
-        # Depth-first search with pre-order traversal is a depth-first topological sort
-        sorted_nodes = nx.dfs_preorder_nodes(g)
-
-        next_node = next(
-            (
-                n
-                for n in sorted_nodes
-                if n not in self.executed  # the node must not already be executed...
-                and all((e[0] in self.executed for e in g.in_edges(n)))  # ...and all its inputs must be executed
-            ),
-            None,
-        )
+        next_node = self._get_execution_index().peek()
 
         if next_node is None:
             return None
@@ -1115,7 +1427,7 @@ class GraphExecutionState(BaseModel):
         return self.execution_graph.nodes[next_node]
 
     def _prepare_inputs(self, node: BaseInvocation):
-        input_edges = [e for e in self.execution_graph.edges if e.destination.node_id == node.id]
+        input_edges = self._get_execution_index().input_edges[node.id]
         if isinstance(node, CollectInvocation):
             output_collection = [
                 getattr(self.results[edge.source.node_id], edge.source.field)
@@ -1148,6 +1460,7 @@ class GraphExecutionState(BaseModel):
 
     def add_node(self, node: BaseInvocation) -> None:
         self.graph.add_node(node)
+        self._change_log = None
 
     def update_node(self, node_path: str, new_node: BaseInvocation) -> None:
         if not self._is_node_updatable(node_path):
@@ -1155,6 +1468,7 @@ class GraphExecutionState(BaseModel):
                 f"Node {node_path} has already been prepared or executed and cannot be updated"
             )
         self.graph.update_node(node_path, new_node)
+        self._change_log = None
 
     def delete_node(self, node_path: str) -> None:
         if not self._is_node_updatable(node_path):
@@ -1162,6 +1476,7 @@ class GraphExecutionState(BaseModel):
                 f"Node {node_path} has already been prepared or executed and cannot be deleted"
             )
         self.graph.delete_node(node_path)
+        self._change_log = None
 
     def add_edge(self, edge: Edge) -> None:
         if not self._is_node_updatable(edge.destination.node_id):
@@ -1169,6 +1484,7 @@ class GraphExecutionState(BaseModel):
                 f"Destination node {edge.destination.node_id} has already been prepared or executed and cannot be linked to"
             )
         self.graph.add_edge(edge)
+        self._change_log = None
 
     def delete_edge(self, edge: Edge) -> None:
         if not self._is_node_updatable(edge.destination.node_id):
@@ -1176,6 +1492,7 @@ class GraphExecutionState(BaseModel):
                 f"Destination node {edge.destination.node_id} has already been prepared or executed and cannot have a source edge deleted"
             )
         self.graph.delete_edge(edge)
+        self._change_log = None
 
 
 class ExposedNodeInput(BaseModel):
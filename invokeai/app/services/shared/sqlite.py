@@ -1,6 +1,10 @@
 import sqlite3
 import threading
+from contextlib import contextmanager
 from logging import Logger
+from pathlib import Path
+from queue import Queue
+from typing import Generator, Optional
 
 from invokeai.app.services.config import InvokeAIAppConfig
 
@@ -8,14 +12,24 @@ sqlite_memory = ":memory:"
 
 
 class SqliteDatabase:
+    """
+    The app's database. Writes go through `conn`, a single connection shared by every service and serialized by
+    `lock`.
+
+    In write-ahead log mode, queries that only read can use `read()` instead, which takes a connection from a pool
+    of read-only connections. These queries run alongside each other and alongside writes, without the lock.
+    """
+
     conn: sqlite3.Connection
     lock: threading.RLock
     _logger: Logger
     _config: InvokeAIAppConfig
+    _read_connections: Optional[Queue[sqlite3.Connection]]
 
     def __init__(self, config: InvokeAIAppConfig, logger: Logger):
         self._logger = logger
         self._config = config
+        self._read_connections = None
 
         if self._config.use_memory_db:
             location = sqlite_memory
@@ -26,14 +40,53 @@ class SqliteDatabase:
             location = str(db_path)
             self._logger.info(f"Using database at {location}")
 
-        self.conn = sqlite3.connect(location, check_same_thread=False)
+        self.conn = self._connect(location)
         self.lock = threading.RLock()
-        self.conn.row_factory = sqlite3.Row
+
+        self.conn.execute("PRAGMA foreign_keys = ON;")
+
+        if self._config.db_wal_mode and location != sqlite_memory:
+            self.conn.execute("PRAGMA journal_mode = WAL;")
+            self._read_connections = Queue()
+            for _ in range(self._config.db_read_connections):
+                self._read_connections.put(self._connect(f"{Path(location).absolute().as_uri()}?mode=ro", uri=True))
+            self._logger.info(f"Using write-ahead log with {self._config.db_read_connections} read connections")
+
+    def _connect(self, location: str, uri: bool = False) -> sqlite3.Connection:
+        conn = sqlite3.connect(location, check_same_thread=False, uri=uri)
+        conn.row_factory = sqlite3.Row
 
         if self._config.log_sql:
-            self.conn.set_trace_callback(self._logger.debug)
+            conn.set_trace_callback(self._logger.debug)
 
-        self.conn.execute("PRAGMA foreign_keys = ON;")
+        conn.execute(f"PRAGMA synchronous = {self._config.db_synchronous.upper()};")
+        conn.execute(f"PRAGMA cache_size = {self._config.db_cache_size};")
+        return conn
+
+    @contextmanager
+    def read(self) -> Generator[sqlite3.Cursor, None, None]:
+        """
+        Gets a cursor for queries that only read. It sees every write committed before it was taken.
+
+        In write-ahead log mode, the cursor is on a read-only connection from the pool, and the lock is not held.
+        Otherwise, it is on the shared connection, and the lock is held while it is in use.
+        """
+        if self._read_connections is None:
+            with self.lock:
+                cursor = self.conn.cursor()
+                try:
+                    yield cursor
+                finally:
+                    cursor.close()
+            return
+
+        conn = self._read_connections.get()
+        cursor = conn.cursor()
+        try:
+            yield cursor
+        finally:
+            cursor.close()
+            self._read_connections.put(conn)
 
     def clean(self) -> None:
         try:
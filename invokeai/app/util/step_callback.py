@@ -1,3 +1,5 @@
+import io
+
 import torch
 from PIL import Image
 
@@ -5,7 +7,6 @@ from invokeai.app.services.invocation_processor.invocation_processor_common impo
 
 from ...backend.model_management.models import BaseModelType
 from ...backend.stable_diffusion import PipelineIntermediateState
-from ...backend.util.util import image_to_dataURL
 from ..invocations.baseinvocation import InvocationContext
 
 
@@ -24,16 +25,7 @@ def sample_to_lowres_estimated_image(samples, latent_rgb_factors, smooth_matrix=
     return Image.fromarray(latents_ubyte.numpy())
 
 
-def stable_diffusion_step_callback(
-    context: InvocationContext,
-    intermediate_state: PipelineIntermediateState,
-    node: dict,
-    source_node_id: str,
-    base_model: BaseModelType,
-):
-    if context.services.queue.is_canceled(context.graph_execution_state_id):
-        raise CanceledException
-
+def make_progress_image(intermediate_state: PipelineIntermediateState, base_model: BaseModelType) -> ProgressImage:
     # Some schedulers report not only the noisy latents at the current timestep,
     # but also their estimate so far of what the de-noised latents will be. Use
     # that estimate if it is available.
@@ -55,8 +47,6 @@ def stable_diffusion_step_callback(
     #     latents = sample
     #     step = intermediate_state.step
 
-    # TODO: only output a preview image when requested
-
     if base_model in [BaseModelType.StableDiffusionXL, BaseModelType.StableDiffusionXLRefiner]:
         # fast latents preview matrix for sdxl
         # generated by @StAlKeR7779
@@ -106,7 +96,26 @@ def stable_diffusion_step_callback(
     width *= 8
     height *= 8
 
-    dataURL = image_to_dataURL(image, image_format="JPEG")
+    # encoded as a data URL by the socket layer, only for the clients that need it
+    jpeg = io.BytesIO()
+    image.save(jpeg, format="JPEG")
+    return ProgressImage(width=width, height=height, jpeg=jpeg.getvalue())
+
+
+def stable_diffusion_step_callback(
+    context: InvocationContext,
+    intermediate_state: PipelineIntermediateState,
+    node: dict,
+    source_node_id: str,
+    base_model: BaseModelType,
+):
+    if context.services.queue.is_canceled(context.graph_execution_state_id):
+        raise CanceledException
+
+    # progress images are only made for the steps that the clients watching the queue want
+    progress_image = None
+    if context.services.events.wants_progress_image(context.queue_id, intermediate_state.step):
+        progress_image = make_progress_image(intermediate_state, base_model)
 
     context.services.events.emit_generator_progress(
         queue_id=context.queue_id,
@@ -115,7 +124,7 @@ def stable_diffusion_step_callback(
         graph_execution_state_id=context.graph_execution_state_id,
         node=node,
         source_node_id=source_node_id,
-        progress_image=ProgressImage(width=width, height=height, dataURL=dataURL),
+        progress_image=progress_image,
         step=intermediate_state.step,
         order=intermediate_state.order,
         total_steps=intermediate_state.total_steps,
@@ -1,7 +1,11 @@
 import os
+from pathlib import Path
+from typing import Union
 
 from PIL import Image
 
+DEFAULT_THUMBNAIL_SIZE = 256
+
 
 def get_thumbnail_name(image_name: str) -> str:
     """Formats given an image name, returns the appropriate thumbnail image name"""
@@ -9,8 +13,23 @@ def get_thumbnail_name(image_name: str) -> str:
     return thumbnail_name
 
 
-def make_thumbnail(image: Image.Image, size: int = 256) -> Image.Image:
-    """Makes a thumbnail from a PIL Image"""
-    thumbnail = image.copy()
-    thumbnail.thumbnail(size=(size, size))
-    return thumbnail
+def get_thumbnail_dimensions(width: int, height: int, size: int = DEFAULT_THUMBNAIL_SIZE) -> tuple[int, int]:
+    """Gets the dimensions of a thumbnail that fits in a `size` x `size` square, keeping the aspect ratio"""
+    scale = min(size / width, size / height, 1.0)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def make_thumbnail(image: Image.Image, size: int = DEFAULT_THUMBNAIL_SIZE) -> Image.Image:
+    """Makes a thumbnail from a PIL Image, which is left unchanged.
+
+    The image is first downscaled by an integer factor with `reduce`, which is much faster than resampling it at full
+    size, and it is never copied at full size.
+    """
+    return image.resize(get_thumbnail_dimensions(*image.size, size), Image.Resampling.BICUBIC, reducing_gap=2.0)
+
+
+def make_thumbnail_from_file(path: Union[str, Path], size: int = DEFAULT_THUMBNAIL_SIZE) -> Image.Image:
+    """Makes a thumbnail from an image file. JPEG files are decoded at a reduced scale with `draft`."""
+    with Image.open(path) as image:
+        image.draft(None, (size, size))
+        return make_thumbnail(image, size)
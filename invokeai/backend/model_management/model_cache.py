@@ -13,6 +13,8 @@ context. Use like this:
           cache.get_model('stabilityai/stable-diffusion-2') as SD2:
        do_something_in_GPU(SD1,SD2)
 
+A cache is shared by the threads that run invocations on its execution device. It is locked while a thread loads a
+model or uses a model it got from the cache, so that other threads do not move or offload models in use.
 
 """
 
@@ -21,6 +23,7 @@ import hashlib
 import math
 import os
 import sys
+import threading
 import time
 from contextlib import suppress
 from dataclasses import dataclass, field
@@ -151,6 +154,8 @@ class ModelCache(object):
 
         self._cached_models = {}
         self._cache_stack = []
+        # held while a model is loaded, and while a ModelLocker moves a model or counts its locks
+        self._lock = threading.RLock()
 
     def _capture_memory_snapshot(self) -> Optional[MemorySnapshot]:
         if self._log_memory_usage:
@@ -201,6 +206,18 @@ class ModelCache(object):
         model_type: ModelType,
         submodel: Optional[SubModelType] = None,
         gpu_load: bool = True,
+    ) -> Any:
+        with self._lock:
+            return self._get_model(model_path, model_class, base_model, model_type, submodel, gpu_load)
+
+    def _get_model(
+        self,
+        model_path: Union[str, Path],
+        model_class: Type[ModelBase],
+        base_model: BaseModelType,
+        model_type: ModelType,
+        submodel: Optional[SubModelType] = None,
+        gpu_load: bool = True,
     ) -> Any:
         if not isinstance(model_path, Path):
             model_path = Path(model_path)
@@ -220,7 +237,6 @@ class ModelCache(object):
             model_type=model_type,
             submodel_type=submodel,
         )
-        # TODO: lock for no copies on simultaneous calls?
         cache_entry = self._cached_models.get(key, None)
         if cache_entry is None:
             self.logger.info(
@@ -342,29 +358,32 @@ class ModelCache(object):
             if not hasattr(self.model, "to"):
                 return self.model
 
-            # NOTE that the model has to have the to() method in order for this
-            # code to move it into GPU!
-            if self.gpu_load:
-                self.cache_entry.lock()
+            # the lock is only held to move the model and count its locks, not while it is in use. A locked model is
+            # not moved or offloaded by other threads.
+            with self.cache._lock:
+                # NOTE that the model has to have the to() method in order for this
+                # code to move it into GPU!
+                if self.gpu_load:
+                    self.cache_entry.lock()
 
-                try:
-                    if self.cache.lazy_offloading:
-                        self.cache._offload_unlocked_models(self.size_needed)
+                    try:
+                        if self.cache.lazy_offloading:
+                            self.cache._offload_unlocked_models(self.size_needed)
 
-                    self.cache._move_model_to_device(self.key, self.cache.execution_device)
+                        self.cache._move_model_to_device(self.key, self.cache.execution_device)
 
-                    self.cache.logger.debug(f"Locking {self.key} in {self.cache.execution_device}")
-                    self.cache._print_cuda_stats()
+                        self.cache.logger.debug(f"Locking {self.key} in {self.cache.execution_device}")
+                        self.cache._print_cuda_stats()
 
-                except Exception:
-                    self.cache_entry.unlock()
-                    raise
+                    except Exception:
+                        self.cache_entry.unlock()
+                        raise
 
-            # TODO: not fully understand
-            # in the event that the caller wants the model in RAM, we
-            # move it into CPU if it is in GPU and not locked
-            elif self.cache_entry.loaded and not self.cache_entry.locked:
-                self.cache._move_model_to_device(self.key, self.cache.storage_device)
+                # TODO: not fully understand
+                # in the event that the caller wants the model in RAM, we
+                # move it into CPU if it is in GPU and not locked
+                elif self.cache_entry.loaded and not self.cache_entry.locked:
+                    self.cache._move_model_to_device(self.key, self.cache.storage_device)
 
             return self.model
 
@@ -372,16 +391,19 @@ class ModelCache(object):
             if not hasattr(self.model, "to"):
                 return
 
-            self.cache_entry.unlock()
-            if not self.cache.lazy_offloading:
-                self.cache._offload_unlocked_models()
-                self.cache._print_cuda_stats()
+            with self.cache._lock:
+                if self.gpu_load:
+                    self.cache_entry.unlock()
+                if not self.cache.lazy_offloading:
+                    self.cache._offload_unlocked_models()
+                    self.cache._print_cuda_stats()
 
     # TODO: should it be called untrack_model?
     def uncache_model(self, cache_id: str):
-        with suppress(ValueError):
-            self._cache_stack.remove(cache_id)
-        self._cached_models.pop(cache_id, None)
+        with self._lock:
+            with suppress(ValueError):
+                self._cache_stack.remove(cache_id)
+            self._cached_models.pop(cache_id, None)
 
     def model_hash(
         self,
@@ -433,8 +455,8 @@ class ModelCache(object):
 
         if current_size + bytes_needed > maximum_size:
             self.logger.debug(
-                f"Max cache size exceeded: {(current_size/GIG):.2f}/{self.max_cache_size:.2f} GB, need an additional"
-                f" {(bytes_needed/GIG):.2f} GB"
+                f"Max cache size exceeded: {(current_size / GIG):.2f}/{self.max_cache_size:.2f} GB, need an additional"
+                f" {(bytes_needed / GIG):.2f} GB"
             )
 
         self.logger.debug(f"Before unloading: cached_models={len(self._cached_models)}")
@@ -482,7 +504,7 @@ class ModelCache(object):
             # 1 from onnx runtime object
             if not cache_entry.locked and refs <= (3 if "onnx" in model_key else 2):
                 self.logger.debug(
-                    f"Unloading model {model_key} to free {(model_size/GIG):.2f} GB (-{(cache_entry.size/GIG):.2f} GB)"
+                    f"Unloading model {model_key} to free {(model_size / GIG):.2f} GB (-{(cache_entry.size/GIG):.2f} GB)"
                 )
                 current_size -= cache_entry.size
                 models_cleared += 1
@@ -518,7 +540,7 @@ class ModelCache(object):
     def _offload_unlocked_models(self, size_needed: int = 0):
         reserved = self.max_vram_cache_size * GIG
         vram_in_use = torch.cuda.memory_allocated()
-        self.logger.debug(f"{(vram_in_use/GIG):.2f}GB VRAM used for models; max allowed={(reserved/GIG):.2f}GB")
+        self.logger.debug(f"{(vram_in_use / GIG):.2f}GB VRAM used for models; max allowed={(reserved / GIG):.2f}GB")
         for model_key, cache_entry in sorted(self._cached_models.items(), key=lambda x: x[1].size):
             if vram_in_use <= reserved:
                 break
@@ -526,7 +548,9 @@ class ModelCache(object):
                 self._move_model_to_device(model_key, self.storage_device)
 
                 vram_in_use = torch.cuda.memory_allocated()
-                self.logger.debug(f"{(vram_in_use/GIG):.2f}GB VRAM used for models; max allowed={(reserved/GIG):.2f}GB")
+                self.logger.debug(
+                    f"{(vram_in_use / GIG):.2f}GB VRAM used for models; max allowed={(reserved / GIG):.2f}GB"
+                )
 
         torch.cuda.empty_cache()
         if choose_torch_device() == torch.device("mps"):
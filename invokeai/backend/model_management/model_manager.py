@@ -227,16 +227,18 @@ The path points to a file or directory on disk. If a relative path,
 the root is the InvokeAI ROOTDIR.
 
 """
+
 from __future__ import annotations
 
 import hashlib
 import os
 import textwrap
+import threading
 import types
 from dataclasses import dataclass
 from pathlib import Path
 from shutil import move, rmtree
-from typing import Callable, Dict, List, Literal, Optional, Set, Tuple, Union, cast
+from typing import Any, Callable, Dict, List, Literal, Optional, Set, Tuple, Union, cast
 
 import torch
 import yaml
@@ -247,6 +249,7 @@ from pydantic import BaseModel, ConfigDict, Field
 import invokeai.backend.util.logging as logger
 from invokeai.app.services.config import InvokeAIAppConfig
 from invokeai.backend.util import CUDA_DEVICE, Chdir
+from invokeai.backend.util.devices import get_thread_device
 
 from .model_cache import ModelCache, ModelLocker
 from .model_search import ModelSearch
@@ -343,19 +346,56 @@ class ModelManager(object):
 
         self.app_config = InvokeAIAppConfig.get_config()
         self.logger = logger
-        self.cache = ModelCache(
-            max_cache_size=max_cache_size,
-            max_vram_cache_size=self.app_config.vram_cache_size,
-            lazy_offloading=self.app_config.lazy_offload,
-            execution_device=device_type,
-            precision=precision,
-            sequential_offload=sequential_offload,
-            logger=logger,
-            log_memory_usage=self.app_config.log_memory_usage,
-        )
+        self._device_type = device_type
+        self._cache_options: Dict[str, Any] = {
+            "max_cache_size": max_cache_size,
+            "max_vram_cache_size": self.app_config.vram_cache_size,
+            "lazy_offloading": self.app_config.lazy_offload,
+            "precision": precision,
+            "sequential_offload": sequential_offload,
+            "logger": logger,
+            "log_memory_usage": self.app_config.log_memory_usage,
+        }
+        # {execution device => model cache}
+        self._caches: Dict[torch.device, ModelCache] = {}
+        self._caches_lock = threading.Lock()
 
         self._read_models(config)
 
+    @property
+    def cache(self) -> ModelCache:
+        """
+        The model cache of the calling thread's device.
+
+        Session workers bound to a device have a cache of their own, so that models are never moved between devices
+        while they are in use. Other threads share the cache of the default device. The RAM budget is split evenly
+        between the caches, so together they use no more than `max_cache_size`.
+        """
+        device = get_thread_device() or torch.device(self._device_type)
+        if device.type == "cuda" and device.index is None:
+            # "cuda" is the current device, so it shares the cache of e.g. "cuda:0"
+            device = torch.device("cuda", torch.cuda.current_device() if torch.cuda.is_available() else 0)
+        with self._caches_lock:
+            cache = self._caches.get(device)
+            if cache is not None:
+                return cache
+            cache = self._caches[device] = ModelCache(execution_device=device, **self._cache_options)
+            others = [c for c in self._caches.values() if c is not cache]
+            cache.max_cache_size = self._cache_options["max_cache_size"] / len(self._caches)
+            for other in others:
+                other.max_cache_size = cache.max_cache_size
+        # the other caches give up models they can no longer hold
+        for other in others:
+            with other._lock:
+                other._make_cache_room(0)
+        return cache
+
+    def _uncache_model(self, cache_id: str) -> None:
+        with self._caches_lock:
+            caches = list(self._caches.values())
+        for cache in caches:
+            cache.uncache_model(cache_id)
+
     def _read_models(self, config: Optional[DictConfig] = None):
         if not config:
             if self.config_path:
@@ -494,7 +534,8 @@ class ModelManager(object):
             config=model_config,
         )
 
-        model_context = self.cache.get_model(
+        cache = self.cache
+        model_context = cache.get_model(
             model_path=model_path,
             model_class=model_class,
             base_model=base_model,
@@ -515,8 +556,8 @@ class ModelManager(object):
             type=submodel_type or model_type,
             hash=model_hash,
             location=model_path,  # TODO:
-            precision=self.cache.precision,
-            _cache=self.cache,
+            precision=cache.precision,
+            _cache=cache,
         )
 
     def _get_model_path(
@@ -656,7 +697,7 @@ class ModelManager(object):
         # TODO: redo
         for model_dict in self.list_models():
             for _model_name, model_info in model_dict.items():
-                line = f'{model_info["name"]:25s} {model_info["type"]:10s} {model_info["description"]}'
+                line = f"{model_info['name']:25s} {model_info['type']:10s} {model_info['description']}"
                 print(line)
 
     # Tested - LS
@@ -678,7 +719,7 @@ class ModelManager(object):
         # note: it not garantie to release memory(model can has other references)
         cache_ids = self.cache_keys.pop(model_key, [])
         for cache_id in cache_ids:
-            self.cache.uncache_model(cache_id)
+            self._uncache_model(cache_id)
 
         # if model inside invoke models folder - delete files
         model_path = self.resolve_model_path(model_cfg.path)
@@ -740,7 +781,7 @@ class ModelManager(object):
             # note: it not guaranteed to release memory(model can has other references)
             cache_ids = self.cache_keys.pop(model_key, [])
             for cache_id in cache_ids:
-                self.cache.uncache_model(cache_id)
+                self._uncache_model(cache_id)
 
         self.models[model_key] = model_config
         self.commit()
@@ -801,7 +842,7 @@ class ModelManager(object):
 
         cache_ids = self.cache_keys.pop(model_key, [])
         for cache_id in cache_ids:
-            self.cache.uncache_model(cache_id)
+            self._uncache_model(cache_id)
 
         self.models.pop(model_key, None)  # delete
         self.models[new_key] = model_cfg
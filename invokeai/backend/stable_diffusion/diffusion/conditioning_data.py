@@ -43,6 +43,12 @@ class SDXLConditioningInfo(BasicConditioningInfo):
         return super().to(device=device, dtype=dtype)
 
 
+@dataclass
+class ConditioningFieldData:
+    conditionings: List[BasicConditioningInfo]
+    # unconditioned: Optional[torch.Tensor]
+
+
 @dataclass(frozen=True)
 class PostprocessingSettings:
     threshold: float
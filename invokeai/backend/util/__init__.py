@@ -1,11 +1,13 @@
 """
 Initialization file for invokeai.backend.util
 """
+
 from .attention import auto_detect_slice_size  # noqa: F401
 from .devices import (  # noqa: F401
     CPU_DEVICE,
     CUDA_DEVICE,
     MPS_DEVICE,
+    bind_thread_to_device,
     choose_precision,
     choose_torch_device,
     normalize_device,
@@ -11,13 +11,13 @@ import locale
 import os
 import shutil
 import sqlite3
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
-import PIL
-import PIL.ImageOps
-import PIL.PngImagePlugin
 import yaml
 
+from invokeai.app.util.thumbnails import make_thumbnail_from_file
+
 
 class ConfigMapper:
     """Configuration loader."""
@@ -252,13 +252,12 @@ class PhysicalFileMapper:
         return glob.glob(thumbnails_directory + "/*.webp", recursive=False)
 
     def generate_thumbnail_for_image_name(self, image_filename):  # noqa D102
-        # create thumbnail
+        # create thumbnail, writing it to a temporary file first so a partially written thumbnail is never served
         file_path = self.get_image_path_for_image_name(image_filename)
         thumb_path = self.get_thumbnail_path_for_image(image_filename)
-        thumb_size = 256, 256
-        with PIL.Image.open(file_path) as source_image:
-            source_image.thumbnail(thumb_size)
-            source_image.save(thumb_path, "webp")
+        temp_path = thumb_path + ".tmp"
+        make_thumbnail_from_file(file_path).save(temp_path, "webp")
+        os.replace(temp_path, thumb_path)
 
 
 class MaintenanceOperation(str, enum.Enum):
@@ -276,12 +275,14 @@ class InvokeAIDatabaseMaintenanceApp:
 
     _operation: MaintenanceOperation
     _headless: bool = False
+    _workers: int
     __stats: MaintenanceStats = MaintenanceStats()
 
-    def __init__(self, operation: MaintenanceOperation = MaintenanceOperation.Ask):
+    def __init__(self, operation: MaintenanceOperation = MaintenanceOperation.Ask, workers: int = 0):
         """Initialize maintenance app."""
         self._operation = MaintenanceOperation(operation)
         self._headless = operation != MaintenanceOperation.Ask
+        self._workers = workers or os.cpu_count() or 1
 
     def ask_for_operation(self) -> MaintenanceOperation:
         """Ask user to choose the operation to perform."""
@@ -479,17 +480,23 @@ class InvokeAIDatabaseMaintenanceApp:
             print()
 
         phys_files = file_mapper.get_all_png_filenames_in_directory(config.outputs_path)
-        for phys_file in phys_files:
-            try:
-                if not file_mapper.thumbnail_exists_for_filename(phys_file):
-                    print(f"Found file without thumbnail {phys_file}...Regenerating Thumbnail...", end="")
-                    file_mapper.generate_thumbnail_for_image_name(phys_file)
-                    print("Done!")
+        missing_files = [f for f in phys_files if not file_mapper.thumbnail_exists_for_filename(f)]
+        # decoding, downscaling and encoding release the GIL, so thumbnails are regenerated on several threads
+        with ThreadPoolExecutor(max_workers=self._workers) as executor:
+            futures = {
+                executor.submit(file_mapper.generate_thumbnail_for_image_name, phys_file): phys_file
+                for phys_file in missing_files
+            }
+            for future in as_completed(futures):
+                phys_file = futures[future]
+                try:
+                    future.result()
+                    print(f"Regenerated thumbnail for file {phys_file}")
                     self.__stats.count_thumbnails_regenerated += 1
-            except Exception as ex:
-                print("Error found trying to regenerate thumbnail, error was:")
-                print(ex)
-                self.__stats.count_errors += 1
+                except Exception as ex:
+                    print(f"Error found trying to regenerate thumbnail for {phys_file}, error was:")
+                    print(ex)
+                    self.__stats.count_errors += 1
 
     def main(self):  # noqa D107
         print("\n===============================================================================")
@@ -553,10 +560,13 @@ def main():  # noqa D107
     parser.add_argument(
         "--operation", default="ask", choices=[x.value for x in MaintenanceOperation], help="Operation to perform."
     )
+    parser.add_argument(
+        "--workers", default=0, type=int, help="Number of threads that regenerate thumbnails [default: one per CPU]"
+    )
     args = parser.parse_args()
     try:
         os.chdir(args.root)
-        app = InvokeAIDatabaseMaintenanceApp(args.operation)
+        app = InvokeAIDatabaseMaintenanceApp(args.operation, args.workers)
         app.main()
     except KeyboardInterrupt:
         print("\n\nUser cancelled execution.")
@@ -1,8 +1,9 @@
 from __future__ import annotations
 
 import platform
+import threading
 from contextlib import nullcontext
-from typing import Union
+from typing import Optional, Union
 
 import torch
 from packaging import version
@@ -15,9 +16,31 @@ CUDA_DEVICE = torch.device("cuda")
 MPS_DEVICE = torch.device("mps")
 config = InvokeAIAppConfig.get_config()
 
+# The device a thread is bound to, e.g. by a session worker
+_thread_device = threading.local()
+
+
+def bind_thread_to_device(device: str) -> None:
+    """Makes `choose_torch_device()` return the given device on the calling thread. "auto" leaves it unbound."""
+    if device == "auto":
+        _thread_device.device = None
+        return
+    _thread_device.device = torch.device(device)
+    if _thread_device.device.type == "cuda" and _thread_device.device.index is not None:
+        # Tensors created on "cuda" without an index are placed on the thread's current device
+        torch.cuda.set_device(_thread_device.device)
+
+
+def get_thread_device() -> Optional[torch.device]:
+    """Gets the device the calling thread is bound to, if any"""
+    return getattr(_thread_device, "device", None)
+
 
 def choose_torch_device() -> torch.device:
     """Convenience routine for guessing which GPU device to run model on"""
+    thread_device = get_thread_device()
+    if thread_device is not None:
+        return thread_device
     if config.use_cpu:  # legacy setting - force CPU
         return CPU_DEVICE
     elif config.device == "auto":
@@ -0,0 +1,246 @@
+import asyncio
+import threading
+import time
+from queue import Empty, Queue
+from typing import Any, Callable
+
+import pytest
+from fastapi_events import handler_store
+from fastapi_events.dispatcher import dispatch
+from fastapi_events.handlers.base import BaseEventHandler
+from fastapi_events.typing import Event
+
+# This import must happen before other invoke imports or test in other files(!!) break
+from .test_nodes import TestEventService  # noqa: F401
+
+# isort: split
+
+from invokeai.app.api.events import FastAPIEventService
+from invokeai.app.services.events.events_base import EventServiceBase
+from invokeai.app.services.invocation_processor.invocation_processor_common import ProgressImage
+
+HANDLER_ID = 1234
+
+
+class RecordingHandler(BaseEventHandler):
+    def __init__(self):
+        self.events: list[tuple[Event, float]] = []
+
+    async def handle(self, event: Event) -> None:
+        self.events.append((event, time.perf_counter()))
+
+    def payloads(self) -> list[Any]:
+        return [payload for (_, payload), _ in self.events]
+
+
+@pytest.fixture
+def handler():
+    handler = RecordingHandler()
+    handler_store[HANDLER_ID] = [handler]
+    yield handler
+    del handler_store[HANDLER_ID]
+
+
+async def wait_until(condition: Callable[[], bool], timeout: float = 5) -> None:
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        assert time.perf_counter() < deadline
+        await asyncio.sleep(0.001)
+
+
+def test_fastapi_event_service_dispatches_events_from_threads_in_order(handler: RecordingHandler):
+    async def run():
+        events = FastAPIEventService(HANDLER_ID)
+        threads = [
+            threading.Thread(target=lambda t=t: [events.dispatch("test", {"t": t, "i": i}) for i in range(100)])
+            for t in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        await wait_until(lambda: len(handler.events) == 400)
+        for thread in threads:
+            thread.join()
+
+    asyncio.run(run())
+    for t in range(4):
+        assert [payload["i"] for payload in handler.payloads() if payload["t"] == t] == list(range(100))
+
+
+def test_fastapi_event_service_drains_queued_events(handler: RecordingHandler):
+    async def run() -> FastAPIEventService:
+        events = FastAPIEventService(HANDLER_ID)
+        # the event loop does not get to these events before draining
+        for i in range(3):
+            events.dispatch("test", {"i": i})
+        await events.drain()
+        assert handler.payloads() == [{"i": 0}, {"i": 1}, {"i": 2}]
+        return events
+
+    events = asyncio.run(run())
+    # once the event loop is closed, events are dropped
+    events.dispatch("test", {"i": 3})
+    assert len(handler.events) == 3
+
+
+def emit_progress(events: EventServiceBase, queue_item_id: int, step: int) -> None:
+    events.emit_generator_progress(
+        queue_id="default",
+        queue_item_id=queue_item_id,
+        queue_batch_id="batch",
+        graph_execution_state_id="session",
+        node={"id": "node"},
+        source_node_id="node",
+        progress_image=None,
+        step=step,
+        order=0,
+        total_steps=10,
+    )
+
+
+def sent_events(handler: RecordingHandler) -> list[tuple[str, int, Any]]:
+    return [
+        (payload["event"], payload["data"]["queue_item_id"], payload["data"].get("step"))
+        for payload in handler.payloads()
+    ]
+
+
+def test_fastapi_event_service_keeps_latest_progress_of_queue_items(handler: RecordingHandler):
+    async def run():
+        events = FastAPIEventService(HANDLER_ID)
+        # the event loop does not get to these events before draining, as if it were busy
+        for step in range(10):
+            emit_progress(events, 1, step)
+            if step < 5:
+                emit_progress(events, 2, step)
+        await events.drain()
+        assert sent_events(handler) == [("generator_progress", 1, 9), ("generator_progress", 2, 4)]
+        stats = events.get_progress_stats()
+        assert (stats.emitted, stats.dropped, stats.pending) == (2, 13, 0)
+
+    asyncio.run(run())
+
+
+def test_fastapi_event_service_limits_progress_rate(handler: RecordingHandler):
+    async def run():
+        events = FastAPIEventService(HANDLER_ID, max_progress_rate=20)
+        emit_progress(events, 1, 0)
+        await wait_until(lambda: len(handler.events) == 1)
+        # progress sent less than 50ms later waits, and is replaced by newer progress meanwhile
+        emit_progress(events, 1, 1)
+        await asyncio.sleep(0.01)
+        emit_progress(events, 1, 2)
+        emit_progress(events, 2, 0)
+        await wait_until(lambda: len(handler.events) == 2)
+        assert time.perf_counter() - handler.events[0][1] < 0.05
+        await wait_until(lambda: len(handler.events) == 3)
+        assert time.perf_counter() - handler.events[0][1] >= 0.05
+
+        # progress that is still waiting when the queue item goes on is dropped
+        emit_progress(events, 1, 3)
+        events.emit_invocation_complete("default", 1, "batch", "session", {}, {"id": "node"}, "node")
+        await wait_until(lambda: len(handler.events) == 4)
+        await asyncio.sleep(0.1)
+        assert sent_events(handler) == [
+            ("generator_progress", 1, 0),
+            ("generator_progress", 2, 0),
+            ("generator_progress", 1, 2),
+            ("invocation_complete", 1, None),
+        ]
+        stats = events.get_progress_stats()
+        assert (stats.max_rate, stats.emitted, stats.dropped, stats.pending) == (20, 3, 2, 0)
+
+    asyncio.run(run())
+
+
+def test_fastapi_event_service_wants_progress_images_at_client_intervals(handler: RecordingHandler):
+    async def run():
+        events = FastAPIEventService(HANDLER_ID)
+        assert not events.wants_progress_image("default", 0)
+        events.set_progress_image_intervals("default", [2, 3, 0])
+        assert [step for step in range(7) if events.wants_progress_image("default", step)] == [0, 2, 3, 4, 6]
+        assert not events.wants_progress_image("other", 0)
+        events.set_progress_image_intervals("default", [0])
+        assert not events.wants_progress_image("default", 0)
+
+        # the progress image that was not sent yet is kept when it is replaced by progress without one
+        events.emit_generator_progress(
+            "default",
+            1,
+            "batch",
+            "session",
+            {"id": "node"},
+            "node",
+            ProgressImage(width=8, height=8, jpeg=b"0"),
+            0,
+            0,
+            2,
+        )
+        emit_progress(events, 1, 1)
+        await events.drain()
+        assert [payload["data"]["progress_image"] for payload in handler.payloads()] == [
+            {"width": 8, "height": 8, "jpeg": b"0"}
+        ]
+
+    asyncio.run(run())
+
+
+class PollingEventService(EventServiceBase):
+    """The former FastAPIEventService, which polled its queue every 100ms when it was empty"""
+
+    def __init__(self, event_handler_id: int) -> None:
+        self.event_handler_id = event_handler_id
+        self.__queue: Queue = Queue()
+        self.__stop_event = threading.Event()
+        asyncio.create_task(self.__dispatch_from_queue())
+        super().__init__()
+
+    def stop(self) -> None:
+        self.__stop_event.set()
+
+    def dispatch(self, event_name: str, payload: Any) -> None:
+        self.__queue.put({"event_name": event_name, "payload": payload})
+
+    async def __dispatch_from_queue(self) -> None:
+        while not self.__stop_event.is_set():
+            try:
+                event = self.__queue.get(block=False)
+                dispatch(event["event_name"], payload=event["payload"], middleware_id=self.event_handler_id)
+            except Empty:
+                await asyncio.sleep(0.1)
+
+
+@pytest.mark.slow
+def test_fastapi_event_service_benchmark(handler: RecordingHandler, record_property):
+    async def run(event_service_class: type) -> tuple[float, float, float]:
+        events = event_service_class(HANDLER_ID)
+        handler.events.clear()
+
+        def send_progress():
+            # progress events of a generation, one per step
+            for _ in range(50):
+                events.dispatch("test", {"sent": time.perf_counter()})
+                time.sleep(0.02)
+
+        thread = threading.Thread(target=send_progress)
+        thread.start()
+        await wait_until(lambda: len(handler.events) == 50)
+        thread.join()
+        latencies = sorted(received - payload["sent"] for (_, payload), received in handler.events)
+
+        start = time.process_time()
+        await asyncio.sleep(1)
+        idle_cpu_time = time.process_time() - start
+
+        if isinstance(events, PollingEventService):
+            events.stop()
+        return sum(latencies) / len(latencies), latencies[-1], idle_cpu_time
+
+    results = {}
+    for event_service_class in [PollingEventService, FastAPIEventService]:
+        mean, worst, idle = asyncio.run(run(event_service_class))
+        results[event_service_class] = mean
+        record_property(f"{event_service_class.__name__}_mean_latency_ms", mean * 1000)
+        record_property(f"{event_service_class.__name__}_worst_latency_ms", worst * 1000)
+        record_property(f"{event_service_class.__name__}_idle_cpu_ms_per_s", idle * 1000)
+    assert results[FastAPIEventService] < 0.001
+    assert results[FastAPIEventService] < results[PollingEventService] / 10
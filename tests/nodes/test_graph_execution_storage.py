@@ -0,0 +1,229 @@
+import logging
+import time
+from types import SimpleNamespace
+
+import pytest
+
+# This import must happen before other invoke imports or test in other files(!!) break
+from .test_nodes import PromptTestInvocation  # isort: split
+
+from invokeai.app.invocations.baseinvocation import InvocationContext
+from invokeai.app.invocations.collections import RangeInvocation
+from invokeai.app.invocations.math import AddInvocation, MultiplyInvocation
+from invokeai.app.services.config.config_default import InvokeAIAppConfig
+from invokeai.app.services.item_storage.item_storage_base import ItemStorageABC
+from invokeai.app.services.item_storage.item_storage_graph_execution_sqlite import SqliteGraphExecutionStorage
+from invokeai.app.services.item_storage.item_storage_sqlite import SqliteItemStorage
+from invokeai.app.services.session_queue.session_queue_common import DEFAULT_QUEUE_ID
+from invokeai.app.services.shared.graph import CollectInvocation, Graph, GraphExecutionState, IterateInvocation
+from invokeai.app.services.shared.sqlite import SqliteDatabase
+
+from .test_invoker import create_edge
+
+
+@pytest.fixture
+def db() -> SqliteDatabase:
+    return SqliteDatabase(InvokeAIAppConfig(use_memory_db=True), logging.getLogger())
+
+
+@pytest.fixture
+def storage(db: SqliteDatabase) -> SqliteGraphExecutionStorage:
+    return SqliteGraphExecutionStorage(db=db, table_name="graph_executions", compact_after=3)
+
+
+def create_iterate_graph(size: int) -> Graph:
+    graph = Graph()
+    graph.add_node(RangeInvocation(id="range", start=0, stop=size, step=1))
+    graph.add_node(IterateInvocation(id="iterate"))
+    graph.add_node(MultiplyInvocation(id="multiply", b=10))
+    graph.add_node(AddInvocation(id="add", b=1))
+    graph.add_node(CollectInvocation(id="collect"))
+    graph.add_edge(create_edge("range", "collection", "iterate", "collection"))
+    graph.add_edge(create_edge("iterate", "item", "multiply", "a"))
+    graph.add_edge(create_edge("multiply", "value", "add", "a"))
+    graph.add_edge(create_edge("add", "value", "collect", "item"))
+    return graph
+
+
+def execute_with_reloads(storage: ItemStorageABC[GraphExecutionState], state: GraphExecutionState) -> None:
+    """Executes a state the way the invocation processor does: reloading it and saving it around every node"""
+    storage.set(state)
+    context = InvocationContext(
+        queue_batch_id="1", queue_item_id=1, queue_id=DEFAULT_QUEUE_ID, services=None, graph_execution_state_id="1"
+    )
+    while True:
+        state = storage.get(state.id)
+        n = state.next()
+        if n is None:
+            break
+        storage.set(state)
+        state = storage.get(state.id)
+        n = state.execution_graph.get_node(n.id)
+        state.complete(n.id, n.invoke(context))
+        storage.set(state)
+
+
+def count_log_rows(db: SqliteDatabase, session_id: str) -> int:
+    cursor = db.conn.cursor()
+    cursor.execute("SELECT count(*) FROM graph_executions_log WHERE session_id = ?;", (session_id,))
+    return cursor.fetchone()[0]
+
+
+def test_logged_changes_restore_state(storage: SqliteGraphExecutionStorage):
+    state = GraphExecutionState(graph=create_iterate_graph(3))
+    storage.set(state)
+
+    # Execute a few nodes on a single in-memory instance, saving after each
+    for _ in range(4):
+        n = state.next()
+        state.complete(n.id, n.invoke(None))  # type: ignore
+        storage.set(state)
+
+    loaded = storage.get(state.id)
+    assert loaded is not None
+    assert loaded.model_dump() == state.model_dump()
+
+
+def test_logged_changes_are_compacted(db: SqliteDatabase, storage: SqliteGraphExecutionStorage):
+    state = GraphExecutionState(graph=create_iterate_graph(3))
+    storage.set(state)
+    assert count_log_rows(db, state.id) == 0
+
+    for _ in range(3):
+        n = state.next()
+        state.complete(n.id, n.invoke(None))  # type: ignore
+        storage.set(state)
+    assert count_log_rows(db, state.id) == 3
+
+    # The next save exceeds the compaction threshold, so it writes a new snapshot
+    n = state.next()
+    state.complete(n.id, n.invoke(None))  # type: ignore
+    storage.set(state)
+    assert count_log_rows(db, state.id) == 0
+    assert storage.get(state.id).model_dump() == state.model_dump()
+
+
+def test_executes_with_reloads(db: SqliteDatabase, storage: SqliteGraphExecutionStorage):
+    state = GraphExecutionState(graph=create_iterate_graph(3))
+    execute_with_reloads(storage, state)
+
+    loaded = storage.get(state.id)
+    assert loaded.is_complete()
+    collect_node = next(iter(loaded.source_prepared_mapping["collect"]))
+    assert sorted(loaded.results[collect_node].collection) == [1, 11, 21]
+    # Completed sessions are compacted
+    assert count_log_rows(db, state.id) == 0
+
+
+def test_graph_changes_are_saved_in_full(storage: SqliteGraphExecutionStorage):
+    state = GraphExecutionState(graph=create_iterate_graph(3))
+    storage.set(state)
+    state = storage.get(state.id)
+
+    state.add_node(PromptTestInvocation(id="prompt", prompt="Banana sushi"))
+    assert state.get_change_log() is None
+    storage.set(state)
+
+    assert storage.get(state.id).graph.has_node("prompt")
+
+    # Modifying the graph directly is also detected
+    state = storage.get(state.id)
+    state.graph.add_node(PromptTestInvocation(id="prompt_2", prompt="Cat sushi"))
+    assert state.get_change_log() is None
+    storage.set(state)
+
+    assert storage.get(state.id).graph.has_node("prompt_2")
+
+
+def test_delete_removes_logged_changes(db: SqliteDatabase, storage: SqliteGraphExecutionStorage):
+    state = GraphExecutionState(graph=create_iterate_graph(3))
+    storage.set(state)
+    n = state.next()
+    state.complete(n.id, n.invoke(None))  # type: ignore
+    storage.set(state)
+    assert count_log_rows(db, state.id) == 1
+
+    storage.delete(state.id)
+    assert storage.get(state.id) is None
+    assert count_log_rows(db, state.id) == 0
+
+
+class CallbackSessionQueue:
+    def on_finished(self, on_finished) -> None:
+        self.finished = on_finished
+
+    def on_deleted(self, on_deleted) -> None:
+        self.deleted = on_deleted
+
+
+def test_logs_are_compacted_when_their_queue_items_finish(db: SqliteDatabase, storage: SqliteGraphExecutionStorage):
+    session_queue = CallbackSessionQueue()
+    storage.start(SimpleNamespace(services=SimpleNamespace(session_queue=session_queue)))  # type: ignore
+    states = [GraphExecutionState(graph=create_iterate_graph(3)) for _ in range(3)]
+    for state in states:
+        storage.set(state)
+        n = state.next()
+        state.complete(n.id, n.invoke(None))  # type: ignore
+        storage.set(state)
+    assert storage._log_lengths == {state.id: 1 for state in states}
+
+    # e.g. a canceled session, which is never saved as complete
+    session_queue.finished(SimpleNamespace(session_id=states[0].id))
+    assert count_log_rows(db, states[0].id) == 0
+    assert storage.get(states[0].id).model_dump() == states[0].model_dump()  # type: ignore
+    session_queue.deleted([states[1].id])
+    storage.delete(states[2].id)
+    assert storage._log_lengths == {}
+    # reading a session without logged changes does not track it
+    state = GraphExecutionState(graph=create_iterate_graph(3))
+    storage.set(state)
+    storage.get(state.id)
+    assert storage._log_lengths == {}
+
+
+def test_get_raw_returns_the_snapshot_without_logged_changes(
+    storage: SqliteGraphExecutionStorage, monkeypatch: pytest.MonkeyPatch
+):
+    state = GraphExecutionState(graph=create_iterate_graph(3))
+    storage.set(state)
+    n = state.next()
+    state.complete(n.id, n.invoke(None))  # type: ignore
+    storage.set(state)
+    assert GraphExecutionState.model_validate_json(storage.get_raw(state.id)).model_dump() == state.model_dump()
+
+    state.graph.add_node(PromptTestInvocation(id="prompt", prompt="Banana sushi"))
+    storage.set(state)
+    monkeypatch.setattr(storage, "_parse_item", None)
+    assert storage.get_raw(state.id) == state.model_dump_json(warnings=False, exclude_none=True)
+    assert storage.get_raw("missing") is None
+
+
+def timed_saves(storage: ItemStorageABC[GraphExecutionState], size: int) -> list[float]:
+    original_set = storage.set
+    save_times: list[float] = []
+
+    def timed_set(item: GraphExecutionState) -> None:
+        start = time.perf_counter()
+        original_set(item)
+        save_times.append(time.perf_counter() - start)
+
+    storage.set = timed_set  # type: ignore
+    execute_with_reloads(storage, GraphExecutionState(graph=create_iterate_graph(size)))
+    return save_times
+
+
+@pytest.mark.slow
+def test_graph_execution_storage_benchmark(db: SqliteDatabase, record_property):
+    """Benchmarks per-node save cost of full snapshots against the change log on a large iterate graph"""
+    snapshot_storage = SqliteItemStorage[GraphExecutionState](db=db, table_name="snapshot_executions")
+    log_storage = SqliteGraphExecutionStorage(db=db, table_name="logged_executions")
+
+    last_saves: dict[str, float] = {}
+    for name, storage in (("snapshot", snapshot_storage), ("log", log_storage)):
+        save_times = timed_saves(storage, 150)
+        first, last = save_times[1:51], save_times[-51:-1]
+        last_saves[name] = sum(last) / len(last)
+        record_property(f"{name}_first_50_saves_us", sum(first) / len(first) * 1e6)
+        record_property(f"{name}_last_50_saves_us", last_saves[name] * 1e6)
+
+    assert last_saves["log"] * 10 < last_saves["snapshot"]
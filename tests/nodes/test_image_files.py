@@ -0,0 +1,324 @@
+import logging
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import pytest
+from PIL import Image
+
+# This import must happen before other invoke imports or test in other files(!!) break
+from .test_nodes import TestEventService  # isort: split
+
+from invokeai.app.invocations.baseinvocation import MetadataField
+from invokeai.app.services.config.config_default import InvokeAIAppConfig
+from invokeai.app.services.image_files.image_files_disk import DiskImageFileStorage, ImageCache
+from invokeai.app.services.invocation_services import InvocationServices
+from invokeai.app.services.invoker import Invoker
+from invokeai.app.util.thumbnails import make_thumbnail
+
+
+def start_image_files(
+    tmp_path: Path, max_writers: int, max_intermediate_bytes: int = 0, **kwargs
+) -> DiskImageFileStorage:
+    image_files = DiskImageFileStorage(
+        tmp_path, max_writers=max_writers, max_intermediate_bytes=max_intermediate_bytes, **kwargs
+    )
+    services = InvocationServices(
+        board_image_records=None,  # type: ignore
+        board_images=None,  # type: ignore
+        board_records=None,  # type: ignore
+        boards=None,  # type: ignore
+        configuration=InvokeAIAppConfig(use_memory_db=True),
+        events=TestEventService(),
+        graph_execution_manager=None,  # type: ignore
+        graph_library=None,  # type: ignore
+        image_files=image_files,
+        image_records=None,  # type: ignore
+        images=None,  # type: ignore
+        invocation_cache=None,  # type: ignore
+        latents=None,  # type: ignore
+        logger=logging,  # type: ignore
+        model_manager=None,  # type: ignore
+        model_records=None,  # type: ignore
+        names=None,  # type: ignore
+        performance_statistics=None,  # type: ignore
+        processor=None,  # type: ignore
+        queue=None,  # type: ignore
+        session_processor=None,  # type: ignore
+        session_queue=None,  # type: ignore
+        urls=None,  # type: ignore
+        workflow_image_records=None,  # type: ignore
+        workflow_records=None,  # type: ignore
+        latents_collector=None,  # type: ignore
+    )
+    Invoker(services=services)
+    return image_files
+
+
+def noise_image(size: int = 64) -> Image.Image:
+    return Image.fromarray(np.random.randint(0, 256, (size, size, 3), dtype=np.uint8))
+
+
+@pytest.fixture
+def gate(monkeypatch: pytest.MonkeyPatch) -> threading.Event:
+    """Makes writers wait for the returned event before they write images"""
+    gate = threading.Event()
+    write = DiskImageFileStorage._DiskImageFileStorage__write  # type: ignore
+
+    def gated_write(*args, **kwargs):
+        assert gate.wait(timeout=5)
+        return write(*args, **kwargs)
+
+    monkeypatch.setattr(DiskImageFileStorage, "_DiskImageFileStorage__write", gated_write)
+    return gate
+
+
+def test_disk_image_file_storage_writes_in_background(tmp_path: Path, gate: threading.Event):
+    image_files = start_image_files(tmp_path, max_writers=2)
+    image = noise_image()
+    image_files.save(image, "image.png", metadata=MetadataField.model_validate({"seed": 1}))
+    # the image is cached, so getting it or its thumbnail does not wait for the write
+    assert image_files.get("image.png") is image
+    assert image_files.get_path("image.png", thumbnail=True) == tmp_path / "thumbnails" / "image.webp"
+    assert (tmp_path / "thumbnails" / "image.webp").exists()
+
+    paths: list[Path] = []
+    thread = threading.Thread(target=lambda: paths.append(image_files.get_path("image.png")))
+    thread.start()
+    thread.join(timeout=0.2)
+    assert paths == []
+
+    gate.set()
+    thread.join(timeout=5)
+    assert paths == [tmp_path / "image.png"]
+    written = Image.open(paths[0])
+    assert written.info["invokeai_metadata"] == '{"seed":1}'
+    assert np.array_equal(np.asarray(written), np.asarray(image))
+    assert not list(tmp_path.rglob("*.tmp"))
+    image_files.stop()
+
+
+def test_disk_image_file_storage_writes_pending_images_on_stop(tmp_path: Path, gate: threading.Event):
+    image_files = start_image_files(tmp_path, max_writers=2)
+    for i in range(4):
+        image_files.save(noise_image(), f"{i}.png")
+    threading.Timer(0.1, gate.set).start()
+    image_files.stop()
+    for i in range(4):
+        assert (tmp_path / f"{i}.png").exists()
+        # thumbnails are only made when they are requested
+        assert not (tmp_path / "thumbnails" / f"{i}.webp").exists()
+
+    # once stopped, images are written immediately
+    image_files.save(noise_image(), "after.png")
+    assert (tmp_path / "after.png").exists()
+
+
+def test_disk_image_file_storage_deletes_pending_images(tmp_path: Path, gate: threading.Event):
+    image_files = start_image_files(tmp_path, max_writers=1)
+    image_files.save(noise_image(), "image.png")
+    image_files.get_path("image.png", thumbnail=True)
+    threading.Timer(0.1, gate.set).start()
+    image_files.delete("image.png")
+    assert not (tmp_path / "image.png").exists()
+    assert not (tmp_path / "thumbnails" / "image.webp").exists()
+    image_files.stop()
+
+
+def test_disk_image_file_storage_writes_synchronously_without_writers(tmp_path: Path):
+    image_files = start_image_files(tmp_path, max_writers=0)
+    image_files.save(noise_image(), "image.png")
+    assert (tmp_path / "image.png").exists()
+    assert not (tmp_path / "thumbnails" / "image.webp").exists()
+
+
+def test_disk_image_file_storage_writes_synchronously_when_writers_are_shut_down(tmp_path: Path):
+    image_files = start_image_files(tmp_path, max_writers=1)
+    # e.g. by the interpreter shutting down, so the writers raise when images are submitted
+    image_files._DiskImageFileStorage__writers.shutdown()  # type: ignore
+    image_files.save(noise_image(), "image.png")
+    assert (tmp_path / "image.png").exists()
+    image_files.stop()
+
+
+def stored_images(tmp_path: Path) -> set[str]:
+    return {path.name for path in tmp_path.rglob("*.*")}
+
+
+@pytest.mark.parametrize("max_writers", [0, 2])
+def test_disk_image_file_storage_keeps_intermediates_in_memory(tmp_path: Path, max_writers: int):
+    image_files = start_image_files(tmp_path, max_writers=max_writers, max_intermediate_bytes=2**20)
+    image = noise_image()
+    image_files.save(image, "image.png", is_intermediate=True)
+    assert image_files.get("image.png") is image
+    assert stored_images(tmp_path) == set()
+
+    # its thumbnail is made without writing it, and it is written when its path is needed
+    assert image_files.get_path("image.png", thumbnail=True).exists()
+    assert stored_images(tmp_path) == {"image.webp"}
+    assert image_files.get_path("image.png").exists()
+    assert stored_images(tmp_path) == {"image.png", "image.webp"}
+    assert np.array_equal(np.asarray(Image.open(tmp_path / "image.png")), np.asarray(image))
+    image_files.stop()
+
+    # once stopped, intermediates are written immediately
+    image_files.save(noise_image(), "after.png", is_intermediate=True)
+    assert (tmp_path / "after.png").exists()
+
+
+def test_disk_image_file_storage_spills_least_recently_used_intermediates(tmp_path: Path):
+    # room for two 64x64 RGB images
+    image_files = start_image_files(tmp_path, max_writers=0, max_intermediate_bytes=2 * 64 * 64 * 3)
+    images = {name: noise_image() for name in ["a.png", "b.png", "c.png"]}
+    image_files.save(images["a.png"], "a.png", is_intermediate=True)
+    image_files.save(images["b.png"], "b.png", is_intermediate=True)
+    image_files.get("a.png")
+    image_files.save(images["c.png"], "c.png", is_intermediate=True)
+    assert stored_images(tmp_path) == {"b.png"}
+    for name, image in images.items():
+        assert np.array_equal(np.asarray(image_files.get(name)), np.asarray(image))
+
+    # intermediates larger than the memory are saved like other images
+    image_files.save(noise_image(128), "large.png", is_intermediate=True)
+    assert stored_images(tmp_path) == {"b.png", "large.png"}
+
+    image_files.delete("a.png")
+    image_files.stop()
+    assert stored_images(tmp_path) == {"b.png", "c.png", "large.png"}
+
+
+def test_disk_image_file_storage_replaces_intermediates(tmp_path: Path, gate: threading.Event):
+    # room for two 64x64 RGB images
+    image_files = start_image_files(tmp_path, max_writers=2, max_intermediate_bytes=2 * 64 * 64 * 3)
+    for _ in range(3):
+        image = noise_image()
+        image_files.save(image, "a.png", is_intermediate=True)
+    assert image_files._DiskImageFileStorage__intermediates_bytes == 64 * 64 * 3  # type: ignore
+    assert image_files.get("a.png") is image
+
+    # an image saved again while its earlier image is written is written after it
+    image_files.save(noise_image(), "b.png")
+    image = noise_image()
+    image_files.save(image, "b.png", is_intermediate=True)
+    assert image_files._DiskImageFileStorage__intermediates_bytes == 64 * 64 * 3  # type: ignore
+    gate.set()
+    assert np.array_equal(np.asarray(Image.open(image_files.get_path("b.png"))), np.asarray(image))
+    image_files.stop()
+
+
+def test_image_cache_evicts_least_recently_used_images(tmp_path: Path):
+    # room for two 64x64 RGB images
+    cache = ImageCache(2 * 64 * 64 * 3)
+    images = {tmp_path / name: noise_image() for name in ["a.png", "b.png", "c.png"]}
+    for path, image in images.items():
+        cache.set(path, image)
+        if path.name == "b.png":
+            # refreshes a.png, so b.png is evicted instead
+            assert cache.get(tmp_path / "a.png") is images[tmp_path / "a.png"]
+    assert cache.get(tmp_path / "b.png") is None
+    assert cache.get(tmp_path / "c.png") is images[tmp_path / "c.png"]
+
+    # images larger than the cache are not cached
+    cache.set(tmp_path / "large.png", noise_image(128))
+    assert cache.get(tmp_path / "large.png") is None
+    stats = cache.get_stats()
+    assert (stats.hits, stats.misses, stats.evictions) == (2, 2, 1)
+    assert (stats.cached_images, stats.cached_bytes) == (2, 2 * 64 * 64 * 3)
+
+
+def test_disk_image_file_storage_caches_images_and_thumbnails_separately(tmp_path: Path):
+    image_files = start_image_files(
+        tmp_path / "images", max_writers=0, max_cache_bytes=2 * 64 * 64 * 3, max_thumbnail_cache_bytes=2**20
+    )
+    for name in ["a.png", "b.png", "c.png"]:
+        noise_image().save(tmp_path / name)
+
+    image_files.save(noise_image(), "saved.png")
+    image_files.get_path("saved.png", thumbnail=True)
+    assert image_files.get_cache_stats(thumbnail=True).cached_images == 1
+    image_files.get("saved.png")
+    # the thumbnail was made from the cached image
+    assert image_files.get_cache_stats().hits == 2
+
+    # images read from disk are cached without decoding them
+    for name in ["a.png", "b.png", "c.png"]:
+        (tmp_path / name).rename(tmp_path / "images" / name)
+        image = image_files.get(name)
+        assert image.fp is not None
+        assert image_files.get(name) is image
+    stats = image_files.get_cache_stats()
+    assert (stats.hits, stats.misses, stats.evictions, stats.cached_images) == (5, 3, 2, 2)
+    # thumbnails do not take room from images
+    assert image_files.get_cache_stats(thumbnail=True).cached_images == 1
+
+    image_files.delete("c.png")
+    assert image_files.get_cache_stats().cached_images == 1
+    image_files.delete("saved.png")
+    assert image_files.get_cache_stats(thumbnail=True).cached_images == 0
+
+
+def test_disk_image_file_storage_makes_thumbnails_of_requested_sizes(tmp_path: Path):
+    image_files = start_image_files(tmp_path, max_writers=0, max_cache_bytes=0, thumbnail_sizes=[128, 512])
+    image_files.save(noise_image(1024).crop((0, 0, 1024, 768)), "image.png")
+    assert stored_images(tmp_path) == {"image.png"}
+
+    # requests get the smallest size that is at least as large, or the largest size
+    for size, path in [
+        (None, "thumbnails/image.webp"),
+        (100, "thumbnails/128/image.webp"),
+        (256, "thumbnails/image.webp"),
+        (300, "thumbnails/512/image.webp"),
+        (2048, "thumbnails/512/image.webp"),
+    ]:
+        assert image_files.get_path("image.png", thumbnail=True, thumbnail_size=size) == tmp_path / path
+    for path, dimensions in [
+        ("thumbnails/128/image.webp", (128, 96)),
+        ("thumbnails/image.webp", (256, 192)),
+        ("thumbnails/512/image.webp", (512, 384)),
+    ]:
+        assert Image.open(tmp_path / path).size == dimensions
+
+    # thumbnails of images that do not exist are not made
+    assert not image_files.get_path("missing.png", thumbnail=True).exists()
+
+    image_files.delete("image.png")
+    assert stored_images(tmp_path) == set()
+
+
+def test_disk_image_file_storage_deletes_least_recently_used_thumbnails(tmp_path: Path):
+    for name in ["old.png", "a.png", "b.png"]:
+        noise_image().save(tmp_path / name)
+    # thumbnails on disk before the storage started are the least recently used
+    (tmp_path / "thumbnails").mkdir()
+    make_thumbnail(noise_image()).save(tmp_path / "thumbnails" / "old.webp")
+    thumbnail_size = (tmp_path / "thumbnails" / "old.webp").stat().st_size
+
+    image_files = start_image_files(tmp_path, max_writers=0, max_thumbnail_disk_bytes=int(thumbnail_size * 2.5))
+    image_files.get_path("a.png", thumbnail=True)
+    image_files.get_path("old.png", thumbnail=True)
+    image_files.get_path("b.png", thumbnail=True)
+    assert stored_images(tmp_path / "thumbnails") == {"old.webp", "b.webp"}
+
+    # deleted thumbnails are made again when they are requested
+    assert image_files.get_path("a.png", thumbnail=True).exists()
+    assert stored_images(tmp_path / "thumbnails") == {"b.webp", "a.webp"}
+
+
+@pytest.mark.slow
+def test_disk_image_file_storage_benchmark(tmp_path: Path, record_property):
+    # 1024x1024 SDXL outputs
+    images = [noise_image(1024) for _ in range(8)]
+    for max_writers in [0, 2]:
+        image_files = start_image_files(tmp_path / str(max_writers), max_writers=max_writers)
+        start = time.perf_counter()
+        for i, image in enumerate(images):
+            image_files.save(image, f"{i}.png")
+        save_time = time.perf_counter() - start
+        image_files.stop()
+        total_time = time.perf_counter() - start
+        record_property(f"{max_writers}_writers_save_ms_per_image", save_time / len(images) * 1000)
+        record_property(f"{max_writers}_writers_written_ms_per_image", total_time / len(images) * 1000)
+        if max_writers == 0:
+            sync_save_time = save_time
+    assert save_time < sync_save_time / 10
@@ -0,0 +1,160 @@
+import json
+import logging
+import time
+
+import pytest
+
+# This import must happen before other invoke imports or test in other files(!!) break
+from .test_nodes import TestEventService
+
+# isort: split
+
+from invokeai.app.invocations.baseinvocation import WorkflowField
+from invokeai.app.services.board_image_records.board_image_records_sqlite import SqliteBoardImageRecordStorage
+from invokeai.app.services.board_records.board_records_sqlite import SqliteBoardRecordStorage
+from invokeai.app.services.config.config_default import InvokeAIAppConfig
+from invokeai.app.services.image_records.image_records_common import ImageCategory, ResourceOrigin
+from invokeai.app.services.image_records.image_records_sqlite import SqliteImageRecordStorage
+from invokeai.app.services.images.images_common import ImageDTO, image_record_to_dto
+from invokeai.app.services.images.images_default import ImageService
+from invokeai.app.services.invocation_services import InvocationServices
+from invokeai.app.services.invoker import Invoker
+from invokeai.app.services.shared.sqlite import SqliteDatabase
+from invokeai.app.services.urls.urls_default import LocalUrlService
+from invokeai.app.services.workflow_image_records.workflow_image_records_sqlite import (
+    SqliteWorkflowImageRecordsStorage,
+)
+from invokeai.app.services.workflow_records.workflow_records_sqlite import SqliteWorkflowRecordsStorage
+from invokeai.backend.util.logging import InvokeAILogger
+
+
+@pytest.fixture
+def mock_services(tmp_path) -> InvocationServices:
+    db = SqliteDatabase(InvokeAIAppConfig(root=tmp_path, db_wal_mode=True), InvokeAILogger.get_logger())
+    return InvocationServices(
+        board_image_records=SqliteBoardImageRecordStorage(db=db),
+        board_images=None,  # type: ignore
+        board_records=SqliteBoardRecordStorage(db=db),
+        boards=None,  # type: ignore
+        configuration=None,  # type: ignore
+        events=TestEventService(),
+        graph_execution_manager=None,  # type: ignore
+        graph_library=None,  # type: ignore
+        image_files=None,  # type: ignore
+        image_records=SqliteImageRecordStorage(db=db),
+        images=ImageService(),
+        invocation_cache=None,  # type: ignore
+        latents=None,  # type: ignore
+        logger=logging,  # type: ignore
+        model_manager=None,  # type: ignore
+        model_records=None,  # type: ignore
+        names=None,  # type: ignore
+        performance_statistics=None,  # type: ignore
+        processor=None,  # type: ignore
+        queue=None,  # type: ignore
+        session_processor=None,  # type: ignore
+        session_queue=None,  # type: ignore
+        urls=LocalUrlService(),
+        workflow_records=SqliteWorkflowRecordsStorage(db=db),
+        workflow_image_records=SqliteWorkflowImageRecordsStorage(db=db),
+        latents_collector=None,  # type: ignore
+    )
+
+
+def save_images(services: InvocationServices, count: int) -> list[str]:
+    image_names = [f"{i:06}.png" for i in range(count)]
+    for image_name in image_names:
+        services.image_records.save(image_name, ResourceOrigin.INTERNAL, ImageCategory.GENERAL, 512, 512)
+    return image_names
+
+
+def test_image_service_gets_boards_and_workflows_with_image_records(mock_services: InvocationServices):
+    images = Invoker(mock_services).services.images
+    image_names = save_images(mock_services, 3)
+    board_id = mock_services.board_records.save("board").board_id
+    workflow_id = mock_services.workflow_records.create(WorkflowField({"name": "workflow"})).root["id"]
+    mock_services.board_image_records.add_image_to_board(board_id, image_names[0])
+    mock_services.workflow_image_records.create(workflow_id, image_names[1])
+
+    expected = {
+        image_names[0]: (board_id, None),
+        image_names[1]: (None, workflow_id),
+        image_names[2]: (None, None),
+    }
+    page = images.get_many(limit=10)
+    assert page.total == 3
+    assert {dto.image_name: (dto.board_id, dto.workflow_id) for dto in page.items} == expected
+
+    dtos = images.get_dtos([image_names[2], "missing.png", image_names[0], image_names[2]])
+    assert [(dto.image_name, dto.board_id, dto.workflow_id) for dto in dtos] == [
+        (image_names[2], None, None),
+        (image_names[0], board_id, None),
+    ]
+    assert images.get_dto(image_names[1]) == page.items[[dto.image_name for dto in page.items].index(image_names[1])]
+    assert images.get_dto(image_names[1]).thumbnail_url == f"api/v1/images/i/{image_names[1]}/thumbnail"
+
+
+@pytest.mark.slow
+def test_image_service_get_many_benchmark(mock_services: InvocationServices, record_property):
+    images = Invoker(mock_services).services.images
+    # a large gallery, inserted in bulk, with half of the images on a board
+    db_conn = mock_services.image_records._conn  # type: ignore
+    metadata = json.dumps({"positive_prompt": "a photo of a cat " * 20, "seed": 1234, "steps": 30})
+    db_conn.executemany(
+        "INSERT INTO images (image_name, image_origin, image_category, width, height, metadata) VALUES (?, ?, ?, ?, ?, ?);",
+        ((f"{i:06}.png", "internal", "general", 1024, 1024, metadata) for i in range(100000)),
+    )
+    board_id = mock_services.board_records.save("board").board_id
+    db_conn.executemany(
+        "INSERT INTO board_images (board_id, image_name) VALUES (?, ?);",
+        ((board_id, f"{i:06}.png") for i in range(1, 100000, 2)),
+    )
+    db_conn.commit()
+
+    def get_many_per_image(limit: int) -> list[ImageDTO]:
+        """The former assembly of image DTOs, which queried the board and workflow of each image"""
+        results = mock_services.image_records.get_many(0, limit, None, [ImageCategory.GENERAL], False, "none")
+        return [
+            image_record_to_dto(
+                image_record=r,
+                image_url=mock_services.urls.get_image_url(r.image_name),
+                thumbnail_url=mock_services.urls.get_image_url(r.image_name, True),
+                board_id=mock_services.board_image_records.get_board_for_image(r.image_name),
+                workflow_id=mock_services.workflow_image_records.get_workflow_for_image(r.image_name),
+            )
+            for r in results.items
+        ]
+
+    def get_many_joined(limit: int) -> list[ImageDTO]:
+        return images.get_many(0, limit, None, [ImageCategory.GENERAL], False, "none").items
+
+    # count the statements of every connection, including the pooled read connections
+    statements: list[str] = []
+    db = mock_services.image_records._db  # type: ignore
+    connections = [db.conn, *(db._read_connections.queue if db._read_connections is not None else [])]
+    for conn in connections:
+        conn.set_trace_callback(statements.append)
+
+    for name, get_page in [("per image", get_many_per_image), ("joined", get_many_joined)]:
+        counts = {}
+        for limit in (10, 100):
+            statements.clear()
+            page = get_page(limit)
+            counts[limit] = len(statements)
+            assert len(page) == limit and all(dto.board_id is None for dto in page)
+        record_property(f"{name}_statements_per_page", counts[100])
+        if name == "joined":
+            # the number of statements does not grow with the size of the page
+            assert counts[10] == counts[100]
+        else:
+            assert counts[100] > counts[10]
+
+    for conn in connections:
+        conn.set_trace_callback(None)
+    for name, get_page in [("per image", get_many_per_image), ("joined", get_many_joined)]:
+        get_page(100)
+        start = time.perf_counter()
+        for _ in range(10):
+            get_page(100)
+        # timings depend on the machine, so they are only recorded
+        record_property(f"{name}_ms_per_page", (time.perf_counter() - start) / 10 * 1000)
@@ -0,0 +1,397 @@
+import logging
+import os
+import re
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Optional
+
+import pytest
+import torch
+from PIL import Image
+
+from .test_nodes import (  # isort: split
+    ImageTestInvocationOutput,
+    ImageToImageTestInvocation,
+    ListPassThroughInvocationOutput,
+    PromptTestInvocation,
+    PromptTestInvocationOutput,
+    TextToImageTestInvocation,
+)
+
+from invokeai.app.invocations.baseinvocation import BaseInvocation
+from invokeai.app.invocations.latent import ScaleLatentsInvocation
+from invokeai.app.invocations.model import MainModelField, MainModelLoaderInvocation
+from invokeai.app.invocations.primitives import ImageField, LatentsField, LatentsOutput
+from invokeai.app.services.config.config_default import InvokeAIAppConfig
+from invokeai.app.services.image_files import image_files_disk
+from invokeai.app.services.image_files.image_files_disk import DiskImageFileStorage
+from invokeai.app.services.images.images_default import ImageService
+from invokeai.app.services.invocation_cache.invocation_cache_memory import MemoryInvocationCache
+from invokeai.app.services.invocation_cache.invocation_cache_sqlite import SqliteInvocationCache
+from invokeai.app.services.invocation_services import InvocationServices
+from invokeai.app.services.invoker import Invoker
+from invokeai.app.services.latents_storage.latents_storage_disk import DiskLatentsStorage
+from invokeai.app.services.latents_storage.latents_storage_forward_cache import ForwardCacheLatentsStorage
+from invokeai.app.services.shared.sqlite import SqliteDatabase
+from invokeai.backend.model_management.models import BaseModelType, ModelType
+from invokeai.backend.util.logging import InvokeAILogger
+
+
+def create_db(path: Path) -> SqliteDatabase:
+    return SqliteDatabase(InvokeAIAppConfig(root=path), InvokeAILogger.get_logger())
+
+
+def start_cache(cache: MemoryInvocationCache, tmp_path: Path, **kwargs) -> InvocationServices:
+    services = InvocationServices(
+        board_image_records=None,  # type: ignore
+        board_images=None,  # type: ignore
+        board_records=None,  # type: ignore
+        boards=None,  # type: ignore
+        configuration=kwargs.get("configuration", None),
+        events=None,  # type: ignore
+        graph_execution_manager=None,  # type: ignore
+        graph_library=None,  # type: ignore
+        image_files=DiskImageFileStorage(tmp_path / "images"),
+        image_records=None,  # type: ignore
+        images=ImageService(),
+        invocation_cache=cache,
+        latents=ForwardCacheLatentsStorage(DiskLatentsStorage(tmp_path / "latents")),
+        logger=logging,  # type: ignore
+        model_manager=kwargs.get("model_manager", None),
+        model_records=None,  # type: ignore
+        names=None,  # type: ignore
+        performance_statistics=None,  # type: ignore
+        processor=None,  # type: ignore
+        queue=None,  # type: ignore
+        session_processor=None,  # type: ignore
+        session_queue=None,  # type: ignore
+        urls=None,  # type: ignore
+        workflow_records=None,  # type: ignore
+        latents_collector=None,  # type: ignore
+        workflow_image_records=None,  # type: ignore
+    )
+    Invoker(services=services)
+    return services
+
+
+def create_cache(db: SqliteDatabase, tmp_path: Path, max_cache_size: int = 2, max_bytes: int = 2**20):
+    cache = MemoryInvocationCache(
+        max_cache_size=max_cache_size, underlying_cache=SqliteInvocationCache(db=db, max_bytes=max_bytes)
+    )
+    start_cache(cache, tmp_path)
+    return cache
+
+
+def test_invocation_cache_memory_tier(tmp_path: Path):
+    cache = MemoryInvocationCache(max_cache_size=2)
+    start_cache(cache, tmp_path)
+    cache.save("1", PromptTestInvocationOutput(prompt="1"))
+    cache.save("2", PromptTestInvocationOutput(prompt="2"))
+    assert cache.get("1") == PromptTestInvocationOutput(prompt="1")
+    cache.save("3", PromptTestInvocationOutput(prompt="3"))
+    # "2" was used least recently
+    assert cache.get("2") is None
+    assert cache.get("3") == PromptTestInvocationOutput(prompt="3")
+
+    status = cache.get_status()
+    assert (status.size, status.hits, status.misses) == (2, 2, 1)
+    assert [tier.name for tier in status.tiers] == ["memory"]
+    assert status.tiers[0].bytes == sum(
+        len(PromptTestInvocationOutput(prompt=prompt).model_dump_json()) for prompt in ["1", "3"]
+    )
+
+
+def test_invocation_cache_disk_tier(tmp_path: Path):
+    cache = create_cache(create_db(tmp_path), tmp_path)
+    for i in range(3):
+        cache.save(str(i), PromptTestInvocationOutput(prompt=str(i)))
+
+    # "0" was evicted from memory, and is found on disk
+    assert cache.get("0") == PromptTestInvocationOutput(prompt="0")
+    assert cache.get("0") == PromptTestInvocationOutput(prompt="0")
+    assert cache.get("3") is None
+
+    status = cache.get_status()
+    assert (status.hits, status.misses) == (2, 1)
+    memory, disk = status.tiers
+    assert (memory.name, memory.size, memory.hits, memory.misses) == ("memory", 2, 1, 2)
+    assert (disk.name, disk.size, disk.hits, disk.misses) == ("disk", 3, 1, 1)
+    assert disk.bytes == sum(len(PromptTestInvocationOutput(prompt=str(i)).model_dump_json()) for i in range(3))
+
+
+def test_invocation_cache_survives_restarts(tmp_path: Path):
+    cache = create_cache(create_db(tmp_path), tmp_path)
+    cache.save("1", PromptTestInvocationOutput(prompt="1"))
+
+    cache = create_cache(create_db(tmp_path), tmp_path)
+    assert cache.get("1") == PromptTestInvocationOutput(prompt="1")
+    assert cache.get_status().tiers[1].hits == 1
+
+
+def test_invocation_cache_disk_tier_evicts_by_bytes(tmp_path: Path):
+    size = len(PromptTestInvocationOutput(prompt="0").model_dump_json())
+    cache = create_cache(create_db(tmp_path), tmp_path, max_cache_size=1, max_bytes=size * 3)
+    for i in range(3):
+        cache.save(str(i), PromptTestInvocationOutput(prompt=str(i)))
+    # using "0" makes "1" the least recently used on disk
+    assert cache.get("0") is not None
+    cache.save("3", PromptTestInvocationOutput(prompt="3"))
+
+    disk = cache.get_status().tiers[1]
+    assert (disk.size, disk.bytes, disk.max_bytes) == (3, size * 3, size * 3)
+    assert cache.get("1") is None
+    assert all(cache.get(key) is not None for key in ["0", "2", "3"])
+
+
+def test_invocation_cache_disk_tier_evicts_by_age(tmp_path: Path):
+    db = create_db(tmp_path)
+    cache = create_cache(db, tmp_path)
+    cache.save("1", PromptTestInvocationOutput(prompt="1"))
+    cache.save("2", PromptTestInvocationOutput(prompt="2"))
+    db.conn.execute(
+        "UPDATE invocation_cache SET accessed_at = STRFTIME('%Y-%m-%d %H:%M:%f', 'NOW', '-2 days') WHERE key = '1';"
+    )
+    db.conn.commit()
+
+    disk_cache = SqliteInvocationCache(db=db, max_bytes=2**20, max_age=24 * 60 * 60)
+    assert disk_cache.get("1") is None
+    assert disk_cache.get("2") == PromptTestInvocationOutput(prompt="2")
+    assert disk_cache.get_status().size == 1
+
+
+def test_invocation_cache_deletes_outputs_of_deleted_images(tmp_path: Path):
+    cache = MemoryInvocationCache(
+        max_cache_size=2, underlying_cache=SqliteInvocationCache(db=create_db(tmp_path), max_bytes=2**20)
+    )
+    services = start_cache(cache, tmp_path)
+    cache.save("1", ImageTestInvocationOutput(image=ImageField(image_name="image_1.png")))
+    cache.save("2", ImageTestInvocationOutput(image=ImageField(image_name="image_2.png")))
+    services.images._on_deleted("image_1.png")
+
+    assert cache.get("1") is None
+    assert cache.get("2") is not None
+    assert [tier.size for tier in cache.get_status().tiers] == [1, 1]
+
+
+def test_invocation_cache_clear_and_disable(tmp_path: Path):
+    cache = create_cache(create_db(tmp_path), tmp_path)
+    cache.save("1", PromptTestInvocationOutput(prompt="1"))
+    cache.disable()
+    assert cache.get("1") is None
+    assert not cache.get_status().enabled
+    cache.enable()
+    assert cache.get("1") is not None
+    cache.clear()
+    assert cache.get("1") is None
+    assert [(tier.size, tier.bytes) for tier in cache.get_status().tiers] == [(0, 0), (0, 0)]
+
+
+@pytest.mark.parametrize("max_cache_size", [0, 2])
+def test_invocation_cache_disk_tier_is_not_used_when_disabled(tmp_path: Path, max_cache_size: int):
+    cache = create_cache(create_db(tmp_path), tmp_path, max_cache_size=max_cache_size)
+    cache.save("1", PromptTestInvocationOutput(prompt="1"))
+    cache.disable()
+    cache.save("2", PromptTestInvocationOutput(prompt="2"))
+    disk_status = cache._underlying_cache.get_status()  # type: ignore
+    assert disk_status.size == (1 if max_cache_size else 0)
+
+
+class MockModelManager:
+    def __init__(self, models: dict[str, dict]) -> None:
+        self.models = models
+
+    def model_info(self, model_name: str, base_model: BaseModelType, model_type: ModelType) -> Optional[dict]:
+        return self.models.get(model_name)
+
+
+def create_key(tmp_path: Path, invocation: BaseInvocation, **kwargs) -> str:
+    """Creates a key with a new cache, as another process or worker would"""
+    cache = MemoryInvocationCache(max_cache_size=2)
+    start_cache(cache, tmp_path, **kwargs)
+    return cache.create_key(invocation)
+
+
+def test_invocation_cache_key_ignores_id(tmp_path: Path):
+    key = create_key(tmp_path, PromptTestInvocation(id="1", prompt="a"))
+    assert re.fullmatch("[0-9a-f]{64}", key)
+    assert create_key(tmp_path, PromptTestInvocation(id="2", prompt="a")) == key
+
+
+@pytest.mark.parametrize(
+    "invocation",
+    [
+        PromptTestInvocation(id="1", prompt="b"),
+        PromptTestInvocation(id="1", prompt="a", is_intermediate=True),
+        TextToImageTestInvocation(id="1", prompt="a"),
+    ],
+)
+def test_invocation_cache_key_changes_with_inputs(tmp_path: Path, invocation: BaseInvocation):
+    assert create_key(tmp_path, invocation) != create_key(tmp_path, PromptTestInvocation(id="1", prompt="a"))
+
+
+def test_invocation_cache_key_changes_with_version(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    key = create_key(tmp_path, PromptTestInvocation(id="1", prompt="a"))
+    monkeypatch.setattr(PromptTestInvocation.UIConfig, "version", "2.0.0", raising=False)
+    assert create_key(tmp_path, PromptTestInvocation(id="1", prompt="a")) != key
+
+
+def test_invocation_cache_key_is_stable_across_processes(tmp_path: Path):
+    script = (
+        "from tests.nodes.test_invocation_cache import create_key;"
+        "from tests.nodes.test_nodes import PromptTestInvocation;"
+        "from pathlib import Path;"
+        f"print(create_key(Path({str(tmp_path)!r}), PromptTestInvocation(id='1', prompt='a')))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", script],
+        env={**os.environ, "PYTHONHASHSEED": "1"},
+        cwd=Path(__file__).parents[2],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert result.stdout.strip().splitlines()[-1] == create_key(tmp_path, PromptTestInvocation(id="1", prompt="a"))
+
+
+def test_invocation_cache_key_changes_with_image_content(tmp_path: Path):
+    invocation = ImageToImageTestInvocation(id="1", image=ImageField(image_name="image.png"))
+    image_path = DiskImageFileStorage(tmp_path / "images").get_path("image.png")
+
+    Image.new("RGB", (8, 8), "red").save(image_path)
+    key = create_key(tmp_path, invocation)
+    assert create_key(tmp_path, invocation) == key
+
+    Image.new("RGB", (8, 8), "blue").save(image_path)
+    assert create_key(tmp_path, invocation) != key
+
+
+def test_invocation_cache_key_changes_with_latents_content(tmp_path: Path):
+    invocation = ScaleLatentsInvocation(id="1", latents=LatentsField(latents_name="latents"), scale_factor=2)
+    latents = DiskLatentsStorage(tmp_path / "latents")
+
+    latents.save("latents", torch.zeros(1, 4, 8, 8))
+    key = create_key(tmp_path, invocation)
+    assert create_key(tmp_path, invocation) == key
+
+    latents.save("latents", torch.ones(1, 4, 8, 8))
+    assert create_key(tmp_path, invocation) != key
+    latents.save("latents", torch.zeros(1, 4, 8, 8, dtype=torch.float16))
+    assert create_key(tmp_path, invocation) != key
+
+
+def test_invocation_cache_key_forgets_deleted_content(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    invocation = ImageToImageTestInvocation(id="1", image=ImageField(image_name="image.png"))
+    cache = MemoryInvocationCache(max_cache_size=2)
+    services = start_cache(cache, tmp_path)
+
+    image_path = services.image_files.get_path("image.png")
+
+    Image.new("RGB", (8, 8), "red").save(image_path)
+    key = cache.create_key(invocation)
+    Image.new("RGB", (8, 8), "blue").save(image_path)
+    # the digest of the image is remembered until it is deleted
+    assert cache.create_key(invocation) == key
+    monkeypatch.setattr(image_files_disk, "send2trash", os.remove)
+    services.image_files.delete("image.png")
+    Image.new("RGB", (8, 8), "blue").save(image_path)
+    services.images._on_deleted("image.png")
+    assert cache.create_key(invocation) != key
+
+
+def test_invocation_cache_key_changes_with_model(tmp_path: Path):
+    model_path = tmp_path / "model.safetensors"
+    model_path.write_bytes(b"model")
+    model_manager = MockModelManager({"model": {"path": str(model_path), "format": "checkpoint"}})
+    invocation = MainModelLoaderInvocation(
+        id="1", model=MainModelField(model_name="model", base_model=BaseModelType.StableDiffusion1, model_type="main")
+    )
+    key = create_key(tmp_path, invocation, model_manager=model_manager)
+    assert create_key(tmp_path, invocation, model_manager=model_manager) == key
+
+    model_manager.models["model"]["format"] = "diffusers"
+    assert create_key(tmp_path, invocation, model_manager=model_manager) != key
+    model_manager.models["model"]["format"] = "checkpoint"
+    model_path.write_bytes(b"another model")
+    assert create_key(tmp_path, invocation, model_manager=model_manager) != key
+
+
+def image_output(image_name: str) -> ImageTestInvocationOutput:
+    return ImageTestInvocationOutput(image=ImageField(image_name=image_name))
+
+
+def test_invocation_cache_invalidates_deleted_images_together(tmp_path: Path):
+    db = create_db(tmp_path)
+    cache = MemoryInvocationCache(max_cache_size=3, underlying_cache=SqliteInvocationCache(db=db, max_bytes=2**20))
+    services = start_cache(cache, tmp_path)
+    for i in range(4):
+        cache.save(str(i), image_output(f"image_{i}.png"))
+    cache.save("collection", ListPassThroughInvocationOutput(collection=[ImageField(image_name="image_0.png")]))
+
+    deleted: list[list[str]] = []
+    services.images.on_deleted_many(deleted.append)
+    services.images._on_deleted_many(["image_0.png", "image_3.png", "image_9.png"])
+    assert deleted == [["image_0.png", "image_3.png", "image_9.png"]]
+
+    assert [tier.size for tier in cache.get_status().tiers] == [1, 2]
+    assert all(cache.get(key) is None for key in ["0", "3", "collection"])
+    assert all(cache.get(key) is not None for key in ["1", "2"])
+    # the index only holds the names of the cached outputs
+    assert set(cache._keys_by_name) == {"image_1.png", "image_2.png"}
+    names = db.conn.execute("SELECT name FROM invocation_cache_names ORDER BY name;").fetchall()
+    assert [row[0] for row in names] == ["image_1.png", "image_2.png"]
+
+
+def test_invocation_cache_invalidates_deleted_latents(tmp_path: Path):
+    cache = create_cache(create_db(tmp_path), tmp_path)
+    services = cache._invoker.services
+    services.latents.save("latents", torch.zeros(1))
+    cache.save("1", LatentsOutput(latents=LatentsField(latents_name="latents"), width=8, height=8))
+    cache.save("2", LatentsOutput(latents=LatentsField(latents_name="other_latents"), width=8, height=8))
+    services.latents.delete("latents")
+    assert cache.get("1") is None
+    assert cache.get("2") is not None
+
+
+def test_invocation_cache_index_follows_evictions(tmp_path: Path):
+    db = create_db(tmp_path)
+    size = len(image_output("image_0.png").model_dump_json())
+    cache = create_cache(db, tmp_path, max_cache_size=2, max_bytes=size * 3)
+    for i in range(5):
+        cache.save(str(i), image_output(f"image_{i}.png"))
+    assert set(cache._keys_by_name) == {"image_3.png", "image_4.png"}
+    assert db.conn.execute("SELECT COUNT(*) FROM invocation_cache_names;").fetchone()[0] == 3
+    cache.clear()
+    assert cache._keys_by_name == {}
+    assert db.conn.execute("SELECT COUNT(*) FROM invocation_cache_names;").fetchone()[0] == 0
+
+
+def test_invocation_cache_drops_outputs_cached_without_index(tmp_path: Path):
+    db = create_db(tmp_path)
+    db.conn.execute(
+        "CREATE TABLE invocation_cache (key TEXT NOT NULL PRIMARY KEY, invocation_output TEXT NOT NULL, "
+        "size INTEGER NOT NULL, accessed_at DATETIME NOT NULL DEFAULT(STRFTIME('%Y-%m-%d %H:%M:%f', 'NOW')));"
+    )
+    db.conn.execute("INSERT INTO invocation_cache (key, invocation_output, size) VALUES ('1', '{}', 2);")
+    db.conn.commit()
+    disk_cache = SqliteInvocationCache(db=db, max_bytes=2**20)
+    assert disk_cache.get_status().size == 0
+
+
+@pytest.mark.slow
+def test_invocation_cache_invalidation_benchmark(tmp_path: Path, record_property):
+    names = [f"intermediate_{i}.png" for i in range(5000)]
+    times = {}
+    for size in [512, 5120]:
+        cache = create_cache(create_db(tmp_path / str(size)), tmp_path, max_cache_size=size)
+        for i in range(size):
+            cache.save(str(i), image_output(f"image_{i}.png"))
+        start = time.perf_counter()
+        cache._invoker.services.images._on_deleted_many(names)
+        times[size] = time.perf_counter() - start
+        record_property(f"invalidate_{len(names)}_names_with_{size}_cached_outputs_ms", times[size] * 1000)
+        assert cache.get_status().tiers[0].size == size
+
+    # the time depends on the number of names and affected outputs, not on the size of the cache
+    assert times[5120] < times[512] * 3
@@ -1,6 +1,7 @@
 import logging
 
 import pytest
+import torch
 
 from invokeai.app.services.config.config_default import InvokeAIAppConfig
 from invokeai.backend.util.logging import InvokeAILogger
@@ -15,12 +16,15 @@ from .test_nodes import (  # isort: split
     wait_until,
 )
 
+from invokeai.app.invocations.math import AddInvocation, MultiplyInvocation
 from invokeai.app.services.invocation_cache.invocation_cache_memory import MemoryInvocationCache
 from invokeai.app.services.invocation_processor.invocation_processor_default import DefaultInvocationProcessor
 from invokeai.app.services.invocation_queue.invocation_queue_memory import MemoryInvocationQueue
 from invokeai.app.services.invocation_services import InvocationServices
+from invokeai.app.services.invocation_stats.invocation_stats_common import GIG
 from invokeai.app.services.invocation_stats.invocation_stats_default import InvocationStatsService
 from invokeai.app.services.invoker import Invoker
+from invokeai.app.services.item_storage.item_storage_graph_execution_sqlite import SqliteGraphExecutionStorage
 from invokeai.app.services.item_storage.item_storage_sqlite import SqliteItemStorage
 from invokeai.app.services.session_queue.session_queue_common import DEFAULT_QUEUE_ID
 from invokeai.app.services.shared.graph import Graph, GraphExecutionState, GraphInvocation, LibraryGraph
@@ -56,7 +60,7 @@ def mock_services() -> InvocationServices:
     configuration = InvokeAIAppConfig(use_memory_db=True, node_cache_size=0)
 
     # NOTE: none of these are actually called by the test invocations
-    graph_execution_manager = SqliteItemStorage[GraphExecutionState](db=db, table_name="graph_executions")
+    graph_execution_manager = SqliteGraphExecutionStorage(db=db, table_name="graph_executions")
     return InvocationServices(
         board_image_records=None,  # type: ignore
         board_images=None,  # type: ignore
@@ -82,6 +86,7 @@ def mock_services() -> InvocationServices:
         session_queue=None,  # type: ignore
         urls=None,  # type: ignore
         workflow_records=None,  # type: ignore
+        latents_collector=None,  # type: ignore
         workflow_image_records=None,  # type: ignore
     )
 
@@ -91,6 +96,12 @@ def mock_invoker(mock_services: InvocationServices) -> Invoker:
     return Invoker(services=mock_services)
 
 
+@pytest.fixture()
+def mock_concurrent_invoker(mock_services: InvocationServices) -> Invoker:
+    mock_services.configuration = InvokeAIAppConfig(use_memory_db=True, node_cache_size=0, node_cpu_threads=2)
+    return Invoker(services=mock_services)
+
+
 def test_can_create_graph_state(mock_invoker: Invoker):
     g = mock_invoker.create_execution_state()
     mock_invoker.stop()
@@ -178,3 +189,80 @@ def test_handles_errors(mock_invoker: Invoker):
     assert g.is_complete()
 
     assert all((i in g.errors for i in g.source_prepared_mapping["1"]))
+
+
+def test_can_invoke_all_concurrently(mock_concurrent_invoker: Invoker):
+    g = Graph()
+    g.add_node(PromptTestInvocation(id="1", prompt="Banana sushi"))
+    g.add_node(TextToImageTestInvocation(id="2"))
+    g.add_edge(create_edge("1", "prompt", "2", "prompt"))
+    g.add_node(AddInvocation(id="3", a=1, b=2))
+    g.add_node(MultiplyInvocation(id="4", b=10))
+    g.add_edge(create_edge("3", "value", "4", "a"))
+
+    state = mock_concurrent_invoker.create_execution_state(graph=g)
+    mock_concurrent_invoker.invoke(
+        session_queue_batch_id="1",
+        session_queue_item_id=1,
+        session_queue_id=DEFAULT_QUEUE_ID,
+        graph_execution_state=state,
+        invoke_all=True,
+    )
+
+    def has_executed_all(g: GraphExecutionState):
+        g = mock_concurrent_invoker.services.graph_execution_manager.get(g.id)
+        return g.is_complete()
+
+    wait_until(lambda: has_executed_all(state), timeout=5, interval=0.1)
+    mock_concurrent_invoker.stop()
+
+    state = mock_concurrent_invoker.services.graph_execution_manager.get(state.id)
+    assert not state.has_error()
+    prepared = {state.prepared_source_mapping[n]: n for n in state.executed if n in state.prepared_source_mapping}
+    assert state.execution_graph.get_node(prepared["2"]).prompt == "Banana sushi"
+    assert state.results[prepared["4"]].value == 30
+
+
+def test_handles_errors_concurrently(mock_concurrent_invoker: Invoker):
+    g = mock_concurrent_invoker.create_execution_state()
+    g.graph.add_node(ErrorInvocation(id="1"))
+    g.graph.add_node(AddInvocation(id="2", a=1, b=2))
+
+    mock_concurrent_invoker.invoke(
+        session_queue_batch_id="1",
+        session_queue_item_id=1,
+        session_queue_id=DEFAULT_QUEUE_ID,
+        graph_execution_state=g,
+        invoke_all=True,
+    )
+
+    def has_executed_all(g: GraphExecutionState):
+        g = mock_concurrent_invoker.services.graph_execution_manager.get(g.id)
+        return g.is_complete()
+
+    wait_until(lambda: has_executed_all(g), timeout=5, interval=0.1)
+    mock_concurrent_invoker.stop()
+
+    g = mock_concurrent_invoker.services.graph_execution_manager.get(g.id)
+    assert g.has_error()
+    assert all((i in g.errors for i in g.source_prepared_mapping["1"]))
+
+
+def test_stats_only_track_the_vram_of_gpu_nodes(mock_invoker: Invoker, monkeypatch: pytest.MonkeyPatch):
+    resets = []
+    monkeypatch.setattr(torch.cuda, "is_available", lambda: True)
+    monkeypatch.setattr(torch.cuda, "reset_peak_memory_stats", lambda: resets.append(True))
+    monkeypatch.setattr(torch.cuda, "max_memory_allocated", lambda: GIG)
+    stats = InvocationStatsService()
+    stats.start(mock_invoker)
+
+    with stats.collect_stats(TextToImageTestInvocation(id="1"), "graph"):
+        # a CPU node running alongside the GPU node does not reset its peak VRAM
+        with stats.collect_stats(AddInvocation(id="2"), "graph"):
+            pass
+    mock_invoker.stop()
+
+    assert resets == [True]
+    nodes = stats._stats["graph"].nodes
+    assert nodes["test_text_to_image"].max_vram == 1.0
+    assert nodes["add"].max_vram == 0.0
@@ -0,0 +1,142 @@
+import logging
+from pathlib import Path
+
+import pytest
+import torch
+
+# This import must happen before other invoke imports or test in other files(!!) break
+from .test_nodes import PromptTestInvocation, TestEventService  # isort: split
+
+from invokeai.app.services.config.config_default import InvokeAIAppConfig
+from invokeai.app.services.invocation_queue.invocation_queue_memory import MemoryInvocationQueue
+from invokeai.app.services.invocation_services import InvocationServices
+from invokeai.app.services.invoker import Invoker
+from invokeai.app.services.latents_collector.latents_collector_common import LATENTS_RETENTION
+from invokeai.app.services.latents_collector.latents_collector_default import DefaultLatentsCollector
+from invokeai.app.services.latents_storage.latents_storage_disk import DiskLatentsStorage
+from invokeai.app.services.latents_storage.latents_storage_forward_cache import ForwardCacheLatentsStorage
+from invokeai.app.services.session_queue.session_queue_common import DEFAULT_QUEUE_ID, Batch
+from invokeai.app.services.session_queue.session_queue_sqlite import SqliteSessionQueue
+from invokeai.app.services.shared.graph import Graph
+from invokeai.app.services.shared.sqlite import SqliteDatabase
+from invokeai.backend.util.logging import InvokeAILogger
+
+ORPHAN_SESSION_ID = "00000000-0000-4000-8000-000000000000"
+
+
+def start_collector(
+    tmp_path: Path, retention: LATENTS_RETENTION, runs: int = 3
+) -> tuple[DefaultLatentsCollector, SqliteSessionQueue, InvocationServices, list[tuple[int, str]]]:
+    """Starts a collector over latents saved by the sessions of a queue, and by a session that is not queued"""
+    db = SqliteDatabase(InvokeAIAppConfig(use_memory_db=True), InvokeAILogger.get_logger())
+    session_queue = SqliteSessionQueue(db=db)
+    disk = DiskLatentsStorage(tmp_path)
+    collector = DefaultLatentsCollector(retention=retention, batch_size=2)
+    services = InvocationServices(
+        board_image_records=None,  # type: ignore
+        board_images=None,  # type: ignore
+        board_records=None,  # type: ignore
+        boards=None,  # type: ignore
+        configuration=InvokeAIAppConfig(use_memory_db=True),
+        events=TestEventService(),
+        graph_execution_manager=None,  # type: ignore
+        graph_library=None,  # type: ignore
+        image_files=None,  # type: ignore
+        image_records=None,  # type: ignore
+        images=None,  # type: ignore
+        invocation_cache=None,  # type: ignore
+        latents=ForwardCacheLatentsStorage(disk),
+        logger=logging,  # type: ignore
+        model_manager=None,  # type: ignore
+        model_records=None,  # type: ignore
+        names=None,  # type: ignore
+        performance_statistics=None,  # type: ignore
+        processor=None,  # type: ignore
+        queue=MemoryInvocationQueue(),
+        session_processor=None,  # type: ignore
+        session_queue=session_queue,
+        urls=None,  # type: ignore
+        workflow_image_records=None,  # type: ignore
+        workflow_records=None,  # type: ignore
+        latents_collector=None,  # type: ignore
+    )
+    invoker = Invoker(services=services)
+
+    graph = Graph()
+    graph.add_node(PromptTestInvocation(id="1", prompt="Banana sushi"))
+    session_queue.enqueue_batch(DEFAULT_QUEUE_ID, Batch(graph=graph, runs=runs), prepend=False)
+    items = [
+        (row[0], row[1]) for row in db.conn.execute("SELECT item_id, session_id FROM session_queue ORDER BY item_id")
+    ]
+    for session_id in [session_id for _, session_id in items] + [ORPHAN_SESSION_ID]:
+        disk.save(f"{session_id}__latents", torch.zeros(16))
+        disk.save(f"{session_id}_conditioning_conditioning", torch.zeros(16))
+    # latents that are not named after a session are never reclaimed
+    disk.save("custom", torch.zeros(16))
+
+    services.latents_collector = collector
+    collector.start(invoker)
+    return collector, session_queue, services, items
+
+
+def stored_sessions(services: InvocationServices) -> set[str]:
+    return {name.split("_")[0] for name in services.latents.get_sizes()}
+
+
+@pytest.mark.parametrize("retention", ["queue", "session"])
+def test_latents_collector_sweeps_unqueued_sessions(tmp_path: Path, retention: LATENTS_RETENTION):
+    collector, _, services, items = start_collector(tmp_path, retention)
+    collector.wait()
+    assert stored_sessions(services) == {session_id for _, session_id in items} | {"custom"}
+    status = collector.get_status()
+    assert status.reclaimed_sessions == 1
+    assert status.reclaimed_files == 2
+    assert status.reclaimed_bytes == 2 * services.latents.get_sizes()[f"{items[0][1]}__latents"]
+    collector.stop()
+
+
+def test_latents_collector_keeps_latents_until_queue_items_are_deleted(tmp_path: Path):
+    collector, session_queue, services, items = start_collector(tmp_path, "queue")
+    session_queue.cancel_queue_item(items[0][0])
+    collector.wait()
+    assert items[0][1] in stored_sessions(services)
+
+    session_queue.prune(DEFAULT_QUEUE_ID)
+    session_queue.delete_queue_item(items[1][0])
+    collector.wait()
+    assert stored_sessions(services) == {items[2][1], "custom"}
+    assert collector.get_status().reclaimed_sessions == 3
+    collector.stop()
+
+
+def test_latents_collector_reclaims_latents_of_finished_sessions(tmp_path: Path):
+    collector, session_queue, services, items = start_collector(tmp_path, "session")
+    session_queue.cancel_queue_item(items[0][0])
+    collector.wait()
+    assert stored_sessions(services) == {items[1][1], items[2][1], "custom"}
+
+    session_queue.clear(DEFAULT_QUEUE_ID)
+    collector.wait()
+    assert stored_sessions(services) == {"custom"}
+    collector.stop()
+
+
+def test_latents_collector_reclaims_through_latents_storage(tmp_path: Path):
+    collector, session_queue, services, items = start_collector(tmp_path, "queue")
+    collector.wait()
+    deleted: list[str] = []
+    services.latents.on_deleted(deleted.append)
+    session_queue.delete_queue_item(items[0][0])
+    collector.wait()
+    # deletions are reported, so outputs that reference the latents are removed from the invocation cache
+    assert sorted(deleted) == sorted([f"{items[0][1]}__latents", f"{items[0][1]}_conditioning_conditioning"])
+    collector.stop()
+
+
+def test_latents_collector_keeps_latents_forever(tmp_path: Path):
+    collector, session_queue, services, items = start_collector(tmp_path, "forever")
+    session_queue.clear(DEFAULT_QUEUE_ID)
+    collector.wait()
+    assert len(stored_sessions(services)) == len(items) + 2
+    assert collector.get_status().reclaimed_files == 0
+    collector.stop()
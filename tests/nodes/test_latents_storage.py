@@ -0,0 +1,422 @@
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+import torch
+
+from invokeai.app.services.latents_storage.latents_storage_base import LatentsStorageBase
+from invokeai.app.services.latents_storage.latents_storage_disk import TORCH_SAVE_MAGIC, DiskLatentsStorage
+from invokeai.app.services.latents_storage.latents_storage_forward_cache import ForwardCacheLatentsStorage, get_size
+from invokeai.app.services.latents_storage.latents_storage_write_behind import WriteBehindLatentsStorage
+from invokeai.backend.stable_diffusion.diffusion.conditioning_data import (
+    BasicConditioningInfo,
+    ConditioningFieldData,
+    ExtraConditioningInfo,
+    SDXLConditioningInfo,
+)
+
+
+def sdxl_conditioning() -> ConditioningFieldData:
+    return ConditioningFieldData(
+        conditionings=[
+            SDXLConditioningInfo(
+                embeds=torch.randn(1, 77, 2048, dtype=torch.float16),
+                extra_conditioning=ExtraConditioningInfo(tokens_count_including_eos_bos=12),
+                pooled_embeds=torch.randn(1, 1280, dtype=torch.float16),
+                add_time_ids=torch.tensor([[1024.0, 1024.0, 0.0, 0.0, 1024.0, 1024.0]]),
+            )
+        ]
+    )
+
+
+def assert_conditionings_equal(a: ConditioningFieldData, b: ConditioningFieldData) -> None:
+    assert len(a.conditionings) == len(b.conditionings)
+    for x, y in zip(a.conditionings, b.conditionings, strict=True):
+        assert type(x) is type(y)
+        assert x.extra_conditioning == y.extra_conditioning
+        assert torch.equal(x.embeds, y.embeds)
+        if isinstance(x, SDXLConditioningInfo):
+            assert isinstance(y, SDXLConditioningInfo)
+            assert torch.equal(x.pooled_embeds, y.pooled_embeds)
+            assert torch.equal(x.add_time_ids, y.add_time_ids)
+
+
+@pytest.mark.parametrize("dtype", [torch.float32, torch.float16, torch.bfloat16])
+def test_disk_latents_storage_saves_safetensors(tmp_path: Path, dtype: torch.dtype):
+    storage = DiskLatentsStorage(tmp_path)
+    latents = torch.randn(1, 4, 64, 64).to(dtype)
+    storage.save("latents", latents)
+    assert not storage.get_path("latents").read_bytes().startswith(TORCH_SAVE_MAGIC)
+    loaded = storage.get("latents")
+    assert loaded.dtype == dtype
+    assert torch.equal(loaded, latents)
+    assert list(tmp_path.iterdir()) == [storage.get_path("latents")]
+
+
+@pytest.mark.parametrize(
+    "conditioning",
+    [
+        sdxl_conditioning(),
+        ConditioningFieldData(
+            conditionings=[BasicConditioningInfo(embeds=torch.randn(1, 77, 768), extra_conditioning=None)]
+        ),
+    ],
+)
+def test_disk_latents_storage_saves_conditioning(tmp_path: Path, conditioning: ConditioningFieldData):
+    storage = DiskLatentsStorage(tmp_path)
+    storage.save("conditioning", conditioning)  # type: ignore
+    assert not storage.get_path("conditioning").read_bytes().startswith(TORCH_SAVE_MAGIC)
+    assert_conditionings_equal(storage.get("conditioning"), conditioning)  # type: ignore
+
+
+def test_disk_latents_storage_saves_cross_attention_control_with_torch(tmp_path: Path):
+    storage = DiskLatentsStorage(tmp_path)
+    conditioning = ConditioningFieldData(
+        conditionings=[
+            BasicConditioningInfo(
+                embeds=torch.randn(1, 77, 768),
+                extra_conditioning=ExtraConditioningInfo(12, cross_attention_control_args={"edit": 1}),  # type: ignore
+            )
+        ]
+    )
+    storage.save("conditioning", conditioning)  # type: ignore
+    assert storage.get_path("conditioning").read_bytes().startswith(TORCH_SAVE_MAGIC)
+    loaded = storage.get("conditioning")
+    assert loaded.conditionings[0].extra_conditioning.cross_attention_control_args == {"edit": 1}  # type: ignore
+
+
+def test_disk_latents_storage_reads_torch_save_files(tmp_path: Path):
+    storage = DiskLatentsStorage(tmp_path)
+    latents = torch.randn(1, 4, 8, 8)
+    torch.save(latents, storage.get_path("latents"))
+    assert torch.equal(storage.get("latents"), latents)
+    conditioning = sdxl_conditioning()
+    torch.save(conditioning, storage.get_path("conditioning"))
+    assert_conditionings_equal(storage.get("conditioning"), conditioning)  # type: ignore
+
+
+class CountingLatentsStorage(LatentsStorageBase):
+    def __init__(self) -> None:
+        super().__init__()
+        self.items: dict[str, torch.Tensor] = {}
+        self.gets: list[str] = []
+
+    def get(self, name: str) -> torch.Tensor:
+        self.gets.append(name)
+        return self.items[name]
+
+    def save(self, name: str, data: torch.Tensor) -> None:
+        self.items[name] = data
+
+    def delete(self, name: str) -> None:
+        if name not in self.items:
+            raise FileNotFoundError(name)
+        del self.items[name]
+
+    def get_sizes(self) -> dict[str, int]:
+        return {name: get_size(data) for name, data in self.items.items()}
+
+
+def test_forward_cache_latents_storage_is_lru_by_bytes():
+    underlying = CountingLatentsStorage()
+    # room for three 1 KiB tensors
+    storage = ForwardCacheLatentsStorage(underlying, max_cache_bytes=3 * 1024)
+    for name in ["a", "b", "c"]:
+        storage.save(name, torch.zeros(256))
+    storage.get("a")
+    storage.save("d", torch.zeros(256))
+    # "b" was used least recently
+    for name in ["a", "c", "d", "b"]:
+        storage.get(name)
+    assert underlying.gets == ["b"]
+
+    # a tensor of twice the size evicts two tensors
+    underlying.gets.clear()
+    storage.save("e", torch.zeros(512))
+    for name in ["e", "b", "d", "c"]:
+        storage.get(name)
+    assert underlying.gets == ["d", "c"]
+
+
+def test_forward_cache_latents_storage_does_not_cache_large_items():
+    underlying = CountingLatentsStorage()
+    storage = ForwardCacheLatentsStorage(underlying, max_cache_bytes=1024)
+    storage.save("small", torch.zeros(128))
+    storage.save("large", torch.zeros(1024))
+    storage.get("small")
+    storage.get("large")
+    assert underlying.gets == ["large"]
+
+
+def test_forward_cache_latents_storage_sizes_conditioning():
+    conditioning = sdxl_conditioning()
+    assert get_size(conditioning) == (77 * 2048 + 1280) * 2 + 6 * 4
+
+
+def test_forward_cache_latents_storage_deletes(tmp_path: Path):
+    storage = ForwardCacheLatentsStorage(DiskLatentsStorage(tmp_path))
+    deleted = []
+    storage.on_deleted(deleted.append)
+    storage.save("latents", torch.zeros(4))
+    storage.delete("latents")
+    assert deleted == ["latents"]
+    with pytest.raises(FileNotFoundError):
+        storage.get("latents")
+
+
+class GatedLatentsStorage(CountingLatentsStorage):
+    """Waits for `gate` before each write, and records the batches that are synced"""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.gate = threading.Event()
+        self.writing = threading.Event()
+        self.synced: list[list[str]] = []
+
+    def save(self, name: str, data: torch.Tensor) -> None:
+        self.writing.set()
+        assert self.gate.wait(timeout=5)
+        super().save(name, data)
+
+    def sync(self, names: list[str]) -> None:
+        self.synced.append(names)
+
+
+def test_write_behind_latents_storage_reads_pending_items():
+    underlying = GatedLatentsStorage()
+    storage = WriteBehindLatentsStorage(underlying)
+    storage.save("a", torch.zeros(4))
+    storage.save("b", torch.ones(4))
+    assert underlying.writing.wait(timeout=5)
+    # the writer is blocked writing "a", but neither item waits for it
+    assert torch.equal(storage.get("a"), torch.zeros(4))
+    assert torch.equal(storage.get("b"), torch.ones(4))
+    assert underlying.gets == []
+
+    underlying.gate.set()
+    storage.flush()
+    assert set(underlying.items) == {"a", "b"}
+    assert sorted(name for batch in underlying.synced for name in batch) == ["a", "b"]
+    assert torch.equal(storage.get("b"), torch.ones(4))
+    assert underlying.gets == ["b"]
+
+
+def test_write_behind_latents_storage_writes_in_batches():
+    underlying = GatedLatentsStorage()
+    storage = WriteBehindLatentsStorage(underlying, batch_size=4)
+    storage.save("first", torch.zeros(4))
+    assert underlying.writing.wait(timeout=5)
+    # these are saved while the first item is written, so they are written together
+    for i in range(8):
+        storage.save(str(i), torch.zeros(4))
+    underlying.gate.set()
+    storage.flush()
+    assert underlying.synced == [["first"], ["0", "1", "2", "3"], ["4", "5", "6", "7"]]
+
+
+def test_write_behind_latents_storage_bounds_pending_bytes():
+    underlying = GatedLatentsStorage()
+    # room for two 1 KiB tensors
+    storage = WriteBehindLatentsStorage(underlying, max_pending_bytes=2 * 1024)
+    storage.save("a", torch.zeros(256))
+    storage.save("b", torch.zeros(256))
+    saved = threading.Event()
+    thread = threading.Thread(target=lambda: (storage.save("c", torch.zeros(256)), saved.set()))
+    thread.start()
+    assert not saved.wait(timeout=0.2)
+    underlying.gate.set()
+    assert saved.wait(timeout=5)
+    thread.join()
+    storage.flush()
+    assert set(underlying.items) == {"a", "b", "c"}
+
+
+def test_write_behind_latents_storage_keeps_data_saved_while_writing():
+    underlying = GatedLatentsStorage()
+    storage = WriteBehindLatentsStorage(underlying)
+    storage.save("a", torch.zeros(4))
+    assert underlying.writing.wait(timeout=5)
+    storage.save("a", torch.ones(4))
+    underlying.gate.set()
+    storage.flush()
+    assert torch.equal(underlying.items["a"], torch.ones(4))
+
+
+def test_write_behind_latents_storage_deletes(tmp_path: Path):
+    underlying = GatedLatentsStorage()
+    storage = WriteBehindLatentsStorage(underlying)
+    deleted = []
+    storage.on_deleted(deleted.append)
+    storage.save("a", torch.zeros(4))
+    assert underlying.writing.wait(timeout=5)
+    storage.save("b", torch.zeros(4))
+    # "b" was never written, so it is only forgotten
+    storage.delete("b")
+    underlying.gate.set()
+    # "a" is deleted once it is written
+    storage.delete("a")
+    storage.flush()
+    assert deleted == ["b", "a"]
+    assert underlying.items == {}
+    with pytest.raises(KeyError):
+        storage.get("a")
+
+    storage = WriteBehindLatentsStorage(DiskLatentsStorage(tmp_path))
+    with pytest.raises(FileNotFoundError):
+        storage.delete("missing")
+
+
+class FailingLatentsStorage(CountingLatentsStorage):
+    """Fails to write the items named in `failing`"""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.failing: set[str] = set()
+
+    def save(self, name: str, data: torch.Tensor) -> None:
+        if name in self.failing:
+            raise OSError(f"No space left on device: {name}")
+        super().save(name, data)
+
+
+def test_write_behind_latents_storage_keeps_items_that_fail_to_write():
+    underlying = FailingLatentsStorage()
+    underlying.failing = {"a"}
+    storage = WriteBehindLatentsStorage(underlying, retry_interval=0.1)
+    storage.save("a", torch.zeros(4))
+    storage.save("b", torch.ones(4))
+    with pytest.raises(RuntimeError, match="Failed to write latents a") as e:
+        storage.flush()
+    assert isinstance(e.value.__cause__, OSError)
+    # the failed item is still read from memory
+    assert torch.equal(storage.get("a"), torch.zeros(4))
+    assert set(underlying.items) == {"b"}
+
+    # and is written once the underlying storage recovers
+    underlying.failing = set()
+    deadline = time.monotonic() + 5
+    while "a" not in underlying.items and time.monotonic() < deadline:
+        time.sleep(0.05)
+    storage.flush()
+    assert torch.equal(underlying.items["a"], torch.zeros(4))
+
+
+def test_write_behind_latents_storage_raises_when_saving_waits_for_failed_items():
+    underlying = FailingLatentsStorage()
+    underlying.failing = {"a", "b"}
+    # room for two 1 KiB tensors
+    storage = WriteBehindLatentsStorage(underlying, max_pending_bytes=2 * 1024, retry_interval=60)
+    storage.save("a", torch.zeros(256))
+    storage.save("b", torch.zeros(256))
+    with pytest.raises(RuntimeError, match="Failed to write latents"):
+        storage.save("c", torch.zeros(256))
+    # stopping gives up on items that fail once more
+    storage.stop(None)  # type: ignore
+    assert underlying.items == {}
+
+
+def test_write_behind_latents_storage_writes_pending_items_on_stop(tmp_path: Path):
+    storage = ForwardCacheLatentsStorage(WriteBehindLatentsStorage(DiskLatentsStorage(tmp_path)))
+    for i in range(10):
+        storage.save(str(i), torch.full((4,), i))
+    storage.stop(None)  # type: ignore
+    disk = DiskLatentsStorage(tmp_path)
+    for i in range(10):
+        assert torch.equal(disk.get(str(i)), torch.full((4,), i))
+    # once stopped, items are written immediately
+    storage.save("after", torch.zeros(4))
+    assert disk.get_path("after").exists()
+
+
+PEAK_RSS_SCRIPT = """
+import resource, sys, torch
+from invokeai.app.services.latents_storage.latents_storage_disk import DiskLatentsStorage
+folder, use_torch = sys.argv[1], sys.argv[2] == "torch"
+storage = DiskLatentsStorage(folder)
+before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+items = [torch.load(storage.get_path(str(i))) if use_torch else storage.get(str(i)) for i in range(int(sys.argv[3]))]
+print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before)
+"""
+
+
+@pytest.mark.slow
+def test_disk_latents_storage_benchmark(tmp_path: Path, record_property):
+    # latents and conditioning of a 1024x1024 SDXL generation
+    items = [torch.randn(1, 4, 128, 128), sdxl_conditioning()] * 25
+    results = {}
+    for use_torch in [True, False]:
+        folder = tmp_path / ("torch" if use_torch else "safetensors")
+        storage = DiskLatentsStorage(folder)
+        start = time.perf_counter()
+        for i, item in enumerate(items):
+            if use_torch:
+                torch.save(item, storage.get_path(str(i)))
+            else:
+                storage.save(str(i), item)  # type: ignore
+        save_time = time.perf_counter() - start
+        start = time.perf_counter()
+        for i in range(len(items)):
+            torch.load(storage.get_path(str(i))) if use_torch else storage.get(str(i))
+        load_time = time.perf_counter() - start
+
+        # the growth of the peak RSS is measured in a new process, while loading every item
+        peak_rss = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                PEAK_RSS_SCRIPT,
+                str(folder),
+                "torch" if use_torch else "safetensors",
+                str(len(items)),
+            ],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.split()[-1]
+        results[use_torch] = (save_time, load_time, int(peak_rss))
+        name = "torch.save" if use_torch else "safetensors"
+        record_property(f"{name}_save_ms_per_item", save_time / len(items) * 1000)
+        record_property(f"{name}_load_ms_per_item", load_time / len(items) * 1000)
+        record_property(f"{name}_peak_rss_growth_mib", int(peak_rss) / 1024)
+
+    assert results[False][1] < results[True][1]
+
+
+def run_txt2img_img2img_chain(
+    storage: LatentsStorageBase, index: int, conditioning: ConditioningFieldData, latents: torch.Tensor
+) -> None:
+    """Saves and reads latents and conditioning like a txt2img -> img2img graph"""
+    for step in ["txt2img", "img2img"]:
+        storage.save(f"{index}-{step}-positive", conditioning)  # type: ignore
+        storage.save(f"{index}-{step}-negative", conditioning)  # type: ignore
+        storage.save(f"{index}-{step}-noise", latents)
+        storage.get(f"{index}-{step}-positive")
+        storage.get(f"{index}-{step}-negative")
+        storage.get(f"{index}-{step}-noise")
+        if step == "img2img":
+            storage.get(f"{index}-txt2img-latents")
+        storage.save(f"{index}-{step}-latents", latents)
+        storage.get(f"{index}-{step}-latents")
+
+
+@pytest.mark.slow
+def test_write_behind_latents_storage_benchmark(tmp_path: Path, record_property):
+    chains = 20
+    conditioning = sdxl_conditioning()
+    latents = torch.randn(1, 4, 128, 128)
+    results = {}
+    for write_behind in [False, True]:
+        disk = DiskLatentsStorage(tmp_path / str(write_behind))
+        storage = ForwardCacheLatentsStorage(WriteBehindLatentsStorage(disk) if write_behind else disk)
+        start = time.perf_counter()
+        for i in range(chains):
+            run_txt2img_img2img_chain(storage, i, conditioning, latents)
+        results[write_behind] = time.perf_counter() - start
+        storage.stop(None)  # type: ignore
+        name = "write-behind" if write_behind else "synchronous"
+        record_property(f"{name}_ms_per_chain", results[write_behind] / chains * 1000)
+
+    assert results[True] < results[False]
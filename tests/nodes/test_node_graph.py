@@ -1,3 +1,5 @@
+import time
+
 import pytest
 from pydantic import TypeAdapter
 
@@ -8,6 +10,7 @@ from invokeai.app.invocations.baseinvocation import (
     invocation,
     invocation_output,
 )
+from invokeai.app.invocations.collections import RangeInvocation
 from invokeai.app.invocations.image import ShowImageInvocation
 from invokeai.app.invocations.math import AddInvocation, SubtractInvocation
 from invokeai.app.invocations.primitives import (
@@ -586,6 +589,118 @@ def test_graph_gets_networkx_graph():
     assert ("1", "2") in nxg.edges
 
 
+def test_graph_caches_networkx_graphs():
+    g = Graph()
+    g.add_node(TextToImageTestInvocation(id="1", prompt="Banana sushi"))
+    g.add_node(ESRGANInvocation(id="2"))
+    g.add_edge(create_edge("1", "image", "2", "image"))
+
+    assert g.nx_graph() is g.nx_graph()
+    assert g.nx_graph_flat() is g.nx_graph_flat()
+
+
+def test_graph_invalidates_cached_networkx_graphs():
+    g = Graph()
+    g.add_node(TextToImageTestInvocation(id="1", prompt="Banana sushi"))
+    g.add_node(ESRGANInvocation(id="2"))
+    assert set(g.nx_graph_flat().nodes) == {"1", "2"}
+
+    e = create_edge("1", "image", "2", "image")
+    g.add_edge(e)
+    assert set(g.nx_graph().edges) == {("1", "2")}
+    assert set(g.nx_graph_flat().edges) == {("1", "2")}
+
+    g.delete_edge(e)
+    assert set(g.nx_graph_flat().edges) == set()
+
+    g.update_node("2", ESRGANInvocation(id="3"))
+    assert set(g.nx_graph().nodes) == {"1", "3"}
+
+    g.delete_node("3")
+    assert set(g.nx_graph().nodes) == {"1"}
+    assert set(g.nx_graph_flat().nodes) == {"1"}
+
+
+def test_graph_invalidates_cached_networkx_graphs_for_subgraph_changes():
+    g = Graph()
+    n1 = GraphInvocation(id="1")
+    n1.graph = Graph()
+    n1.graph.add_node(AddInvocation(id="1", a=1, b=2))
+    n1.graph.add_node(SubtractInvocation(id="2", b=3))
+    g.add_node(n1)
+    assert set(g.nx_graph_flat().nodes) == {"1.1", "1.2"}
+
+    g.delete_node("1.2")
+    assert set(g.nx_graph_flat().nodes) == {"1.1"}
+    assert set(n1.graph.nx_graph().nodes) == {"1"}
+
+
+def test_graph_invalidates_cached_networkx_graphs_when_subgraphs_are_modified():
+    g = Graph()
+    n1 = GraphInvocation(id="1", graph=Graph())
+    n2 = GraphInvocation(id="2", graph=Graph())
+    n2.graph.add_node(AddInvocation(id="1", a=1, b=2))
+    n1.graph.add_node(n2)
+    g.add_node(n1)
+    assert set(g.nx_graph_flat().nodes) == {"1.2.1"}
+    generation = g._views.generation
+
+    # the subgraphs are modified directly, after the parent's views were read
+    n1.graph.add_node(SubtractInvocation(id="3", b=3))
+    assert set(g.nx_graph_flat().nodes) == {"1.2.1", "1.3"}
+    n2.graph.add_node(SubtractInvocation(id="2", b=3))
+    n2.graph.add_edge(create_edge("1", "value", "2", "a"))
+    assert set(g.nx_graph_flat().edges) == {("1.2.1", "1.2.2")}
+    n2.graph.delete_node("1")
+    assert set(g.nx_graph_flat().nodes) == {"1.2.2", "1.3"}
+    assert g._views.generation > generation
+
+
+def test_graph_copy_does_not_share_cached_networkx_graphs():
+    g = Graph()
+    g.add_node(TextToImageTestInvocation(id="1", prompt="Banana sushi"))
+    _ = g.nx_graph_flat()
+
+    g2 = g.model_copy(deep=True)
+    g2.add_node(ESRGANInvocation(id="2"))
+
+    assert set(g.nx_graph_flat().nodes) == {"1"}
+    assert set(g2.nx_graph_flat().nodes) == {"1", "2"}
+
+
+@pytest.mark.slow
+def test_graph_cached_views_benchmark(record_property):
+    """Benchmarks read-only graph queries over a 500-node iterate/collect graph"""
+    g = Graph()
+    g.add_node(RangeInvocation(id="range", start=0, stop=10, step=1))
+    g.add_node(IterateInvocation(id="iterate"))
+    g.add_node(CollectInvocation(id="collect"))
+    g.add_edge(create_edge("range", "collection", "iterate", "collection"))
+    for i in range(497):
+        g.add_node(AddInvocation(id=f"add_{i}", b=i))
+        g.add_edge(create_edge("iterate", "item", f"add_{i}", "a"))
+        g.add_edge(create_edge(f"add_{i}", "value", "collect", "item"))
+
+    calls = 100
+
+    start = time.perf_counter()
+    for _ in range(calls):
+        g._invalidate_views()
+        g.nx_graph()
+        g.nx_graph_flat()
+    uncached = (time.perf_counter() - start) / calls
+
+    start = time.perf_counter()
+    for _ in range(calls):
+        g.nx_graph()
+        g.nx_graph_flat()
+    cached = (time.perf_counter() - start) / calls
+
+    record_property("uncached_us_per_query", uncached * 1e6)
+    record_property("cached_us_per_query", cached * 1e6)
+    assert cached * 100 < uncached
+
+
 # TODO: Graph serializes and deserializes
 def test_graph_can_serialize():
     g = Graph()
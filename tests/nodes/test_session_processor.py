@@ -0,0 +1,205 @@
+import logging
+import threading
+import time
+from typing import Any
+
+import pytest
+
+# This import must happen before other invoke imports or test in other files(!!) break
+from .test_nodes import PromptTestInvocation, TestEventService, TextToImageTestInvocation, wait_until  # isort: split
+
+from invokeai.app.services.config.config_default import InvokeAIAppConfig
+from invokeai.app.services.invocation_cache.invocation_cache_memory import MemoryInvocationCache
+from invokeai.app.services.invocation_processor.invocation_processor_default import DefaultInvocationProcessor
+from invokeai.app.services.invocation_queue.invocation_queue_memory import MemoryInvocationQueue
+from invokeai.app.services.invocation_services import InvocationServices
+from invokeai.app.services.invocation_stats.invocation_stats_default import InvocationStatsService
+from invokeai.app.services.invoker import Invoker
+from invokeai.app.services.item_storage.item_storage_graph_execution_sqlite import SqliteGraphExecutionStorage
+from invokeai.app.services.item_storage.item_storage_sqlite import SqliteItemStorage
+from invokeai.app.services.session_processor.session_processor_default import DefaultSessionProcessor
+from invokeai.app.services.session_queue.session_queue_common import DEFAULT_QUEUE_ID, Batch
+from invokeai.app.services.session_queue.session_queue_sqlite import SqliteSessionQueue
+from invokeai.app.services.shared.graph import Graph, LibraryGraph
+from invokeai.app.services.shared.sqlite import SqliteDatabase
+from invokeai.backend.util.logging import InvokeAILogger
+
+from .test_invoker import create_edge
+
+
+class TimedEventService(TestEventService):
+    """Records the time each queue event is dispatched at"""
+
+    def dispatch(self, event_name: str, payload: Any) -> None:
+        self.events.append((time.perf_counter(), payload["event"], payload["data"]))
+
+    def times(self, event: str) -> list[float]:
+        return [t for t, e, _ in self.events if e == event]
+
+
+@pytest.fixture
+def simple_graph() -> Graph:
+    g = Graph()
+    g.add_node(PromptTestInvocation(id="1", prompt="Banana sushi"))
+    g.add_node(TextToImageTestInvocation(id="2"))
+    g.add_edge(create_edge("1", "prompt", "2", "prompt"))
+    return g
+
+
+# This must be defined here to avoid issues with the dynamic creation of the union of all invocation types
+# Defining it in a separate module will cause the union to be incomplete, and pydantic will not validate
+# the test invocations.
+@pytest.fixture
+def mock_services() -> InvocationServices:
+    configuration = InvokeAIAppConfig(use_memory_db=True, node_cache_size=0, session_worker_devices=["cpu", "cpu"])
+    db = SqliteDatabase(configuration, InvokeAILogger.get_logger())
+    return InvocationServices(
+        board_image_records=None,  # type: ignore
+        board_images=None,  # type: ignore
+        board_records=None,  # type: ignore
+        boards=None,  # type: ignore
+        configuration=configuration,
+        events=TimedEventService(),
+        graph_execution_manager=SqliteGraphExecutionStorage(db=db, table_name="graph_executions"),
+        graph_library=SqliteItemStorage[LibraryGraph](db=db, table_name="graphs"),
+        image_files=None,  # type: ignore
+        image_records=None,  # type: ignore
+        images=None,  # type: ignore
+        invocation_cache=MemoryInvocationCache(max_cache_size=0),
+        latents=None,  # type: ignore
+        logger=logging,  # type: ignore
+        model_manager=None,  # type: ignore
+        model_records=None,  # type: ignore
+        names=None,  # type: ignore
+        performance_statistics=InvocationStatsService(),
+        processor=DefaultInvocationProcessor(),
+        queue=MemoryInvocationQueue(),
+        session_processor=DefaultSessionProcessor(),
+        session_queue=SqliteSessionQueue(db=db),
+        urls=None,  # type: ignore
+        workflow_records=None,  # type: ignore
+        latents_collector=None,  # type: ignore
+        workflow_image_records=None,  # type: ignore
+    )
+
+
+@pytest.fixture()
+def mock_invoker(mock_services: InvocationServices):
+    invoker = Invoker(services=mock_services)
+    yield invoker
+    invoker.stop()
+
+
+def is_complete(invoker: Invoker, session_id: str) -> bool:
+    session = invoker.services.graph_execution_manager.get(session_id)
+    return session is not None and session.is_complete()
+
+
+def test_session_queue_dequeue_is_atomic(mock_invoker: Invoker, simple_graph: Graph):
+    session_queue = mock_invoker.services.session_queue
+    mock_invoker.services.session_processor.pause()
+    session_queue.enqueue_batch(DEFAULT_QUEUE_ID, Batch(graph=simple_graph, runs=50), prepend=False)
+
+    dequeued: list[int] = []
+
+    def dequeue_all():
+        while (queue_item := session_queue.dequeue()) is not None:
+            dequeued.append(queue_item.item_id)
+
+    threads = [threading.Thread(target=dequeue_all) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(dequeued) == 50
+    assert len(set(dequeued)) == 50
+    assert session_queue.get_queue_status(DEFAULT_QUEUE_ID).in_progress == 50
+
+
+def test_session_workers_process_queue_items_at_once(mock_invoker: Invoker, simple_graph: Graph):
+    session_queue = mock_invoker.services.session_queue
+    finished_on: dict[int, int] = {}
+    mock_invoker.services.processor.on_session_finished(
+        lambda queue_item: finished_on.update({queue_item.session_queue_item_id: queue_item.worker_id})
+    )
+    session_queue.enqueue_batch(DEFAULT_QUEUE_ID, Batch(graph=simple_graph, runs=8), prepend=False)
+
+    wait_until(lambda: len(finished_on) == 8, timeout=5, interval=0.05)
+
+    status = mock_invoker.services.session_processor.get_status()
+    assert [w.device for w in status.workers] == ["cpu", "cpu"]
+    # Each worker's sessions run to completion on its own lane
+    assert set(finished_on.values()) == {0, 1}
+    items = session_queue.list_queue_items(DEFAULT_QUEUE_ID, limit=10, priority=0).items
+    for item in items:
+        wait_until(lambda session_id=item.session_id: is_complete(mock_invoker, session_id), timeout=5, interval=0.05)
+
+
+def test_cancel_by_queue_id_cancels_every_worker(mock_invoker: Invoker, simple_graph: Graph):
+    session_queue = mock_invoker.services.session_queue
+    mock_invoker.services.session_processor.pause()
+    session_queue.enqueue_batch(DEFAULT_QUEUE_ID, Batch(graph=simple_graph, runs=3), prepend=False)
+    first = session_queue.dequeue()
+    second = session_queue.dequeue()
+    assert first is not None and second is not None
+
+    result = session_queue.cancel_by_queue_id(DEFAULT_QUEUE_ID)
+
+    assert result.canceled == 3
+    assert mock_invoker.services.queue.is_canceled(first.session_id)
+    assert mock_invoker.services.queue.is_canceled(second.session_id)
+
+
+def test_session_workers_are_woken_when_sessions_finish(mock_invoker: Invoker, simple_graph: Graph):
+    # The test event service does not deliver events, so workers must be woken by the queue and processor directly
+    session_queue = mock_invoker.services.session_queue
+    session_queue.enqueue_batch(DEFAULT_QUEUE_ID, Batch(graph=simple_graph, runs=5), prepend=False)
+
+    wait_until(
+        lambda: (
+            session_queue.get_queue_status(DEFAULT_QUEUE_ID).pending == 0
+            and not mock_invoker.services.session_processor.get_status().is_processing
+        ),
+        timeout=5,
+        interval=0.05,
+    )
+
+    items = session_queue.list_queue_items(DEFAULT_QUEUE_ID, limit=10, priority=0).items
+    assert len(items) == 5
+    for item in items:
+        wait_until(lambda session_id=item.session_id: is_complete(mock_invoker, session_id), timeout=5, interval=0.05)
+
+
+@pytest.mark.slow
+def test_session_processor_latency(mock_invoker: Invoker, simple_graph: Graph, record_property):
+    events: TimedEventService = mock_invoker.services.events  # type: ignore
+    session_queue = mock_invoker.services.session_queue
+    runs = 20
+
+    # Let the workers go idle, so the first item is picked up by a wake-up rather than a poll
+    time.sleep(0.5)
+    enqueued_at = time.perf_counter()
+    session_queue.enqueue_batch(DEFAULT_QUEUE_ID, Batch(graph=simple_graph, runs=runs), prepend=False)
+    wait_until(lambda: len(events.times("graph_execution_state_complete")) == runs, timeout=30, interval=0.01)
+
+    enqueue_to_start = events.times("invocation_started")[0] - enqueued_at
+
+    # Time from a node completing to the next node of the same session starting
+    handoffs: list[float] = []
+    completed_at: dict[str, float] = {}
+    for t, event, data in events.events:
+        session_id = data.get("graph_execution_state_id")
+        if event == "invocation_complete":
+            completed_at[session_id] = t
+        elif event == "invocation_started" and session_id in completed_at:
+            handoffs.append(t - completed_at.pop(session_id))
+    handoffs.sort()
+
+    record_property("enqueue_to_start_ms", enqueue_to_start * 1000)
+    record_property("node_handoff_median_ms", handoffs[len(handoffs) // 2] * 1000)
+    record_property("node_handoff_max_ms", handoffs[-1] * 1000)
+
+    # Before workers were woken directly, they picked up new items on a 1s polling interval
+    assert enqueue_to_start < 0.1
+    assert handoffs[len(handoffs) // 2] < 0.1
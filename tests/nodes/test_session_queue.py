@@ -1,18 +1,37 @@
+import asyncio
+import logging
+import sqlite3
+import time
+import tracemalloc
+from itertools import islice
+
 import pytest
 from pydantic import TypeAdapter, ValidationError
 
+# This import must happen before other invoke imports or test in other files(!!) break
+from .test_nodes import PromptTestInvocation, TestEventService  # isort: split
+
+from invokeai.app.services.config.config_default import InvokeAIAppConfig
+from invokeai.app.services.invocation_queue.invocation_queue_memory import MemoryInvocationQueue
+from invokeai.app.services.invocation_services import InvocationServices
+from invokeai.app.services.invoker import Invoker
 from invokeai.app.services.session_queue.session_queue_common import (
+    DEFAULT_QUEUE_ID,
     Batch,
     BatchDataCollection,
     BatchDatum,
     NodeFieldValue,
+    SessionQueueItem,
     calc_session_count,
     create_session_nfv_tuples,
+    create_values_to_insert,
     populate_graph,
     prepare_values_to_insert,
 )
+from invokeai.app.services.session_queue.session_queue_sqlite import SqliteSessionQueue
 from invokeai.app.services.shared.graph import Graph, GraphExecutionState, GraphInvocation
-from tests.nodes.test_nodes import PromptTestInvocation
+from invokeai.app.services.shared.sqlite import SqliteDatabase
+from invokeai.backend.util.logging import InvokeAILogger
 
 
 @pytest.fixture
@@ -39,6 +58,50 @@ def batch_graph() -> Graph:
     return g
 
 
+@pytest.fixture
+def db() -> SqliteDatabase:
+    return SqliteDatabase(InvokeAIAppConfig(use_memory_db=True), InvokeAILogger.get_logger())
+
+
+def start_session_queue(db: SqliteDatabase) -> SqliteSessionQueue:
+    session_queue = SqliteSessionQueue(db=db)
+    services = InvocationServices(
+        board_image_records=None,  # type: ignore
+        board_images=None,  # type: ignore
+        board_records=None,  # type: ignore
+        boards=None,  # type: ignore
+        configuration=InvokeAIAppConfig(use_memory_db=True),
+        events=TestEventService(),
+        graph_execution_manager=None,  # type: ignore
+        graph_library=None,  # type: ignore
+        image_files=None,  # type: ignore
+        image_records=None,  # type: ignore
+        images=None,  # type: ignore
+        invocation_cache=None,  # type: ignore
+        latents=None,  # type: ignore
+        logger=logging,  # type: ignore
+        model_manager=None,  # type: ignore
+        model_records=None,  # type: ignore
+        names=None,  # type: ignore
+        performance_statistics=None,  # type: ignore
+        processor=None,  # type: ignore
+        queue=MemoryInvocationQueue(),
+        session_processor=None,  # type: ignore
+        session_queue=session_queue,
+        urls=None,  # type: ignore
+        workflow_records=None,  # type: ignore
+        latents_collector=None,  # type: ignore
+        workflow_image_records=None,  # type: ignore
+    )
+    Invoker(services=services)
+    return session_queue
+
+
+@pytest.fixture
+def session_queue(db: SqliteDatabase) -> SqliteSessionQueue:
+    return start_session_queue(db)
+
+
 def test_populate_graph_with_subgraph():
     g1 = Graph()
     g1.add_node(PromptTestInvocation(id="1", prompt="Banana sushi"))
@@ -145,6 +208,25 @@ def test_calc_session_count(batch_data_collection, batch_graph):
     assert calc_session_count(batch=b) == 8
 
 
+def test_calc_session_count_matches_sessions_created(batch_data_collection, batch_graph):
+    b = Batch(graph=batch_graph, data=batch_data_collection, runs=3)
+    assert calc_session_count(batch=b) == len(list(create_session_nfv_tuples(batch=b, maximum=1000)))
+    b = Batch(graph=batch_graph, data=[[], *batch_data_collection])
+    assert calc_session_count(batch=b) == len(list(create_session_nfv_tuples(batch=b, maximum=1000))) == 0
+    b = Batch(graph=batch_graph, runs=3)
+    assert calc_session_count(batch=b) == len(list(create_session_nfv_tuples(batch=b, maximum=1000))) == 3
+
+
+def test_calc_session_count_does_not_create_sessions(batch_graph):
+    items = list(range(1000))
+    b = Batch(
+        graph=batch_graph,
+        data=[[BatchDatum(node_path=str(i), field_name="prompt", items=[str(x) for x in items])] for i in (1, 2, 3)],
+        runs=10,
+    )
+    assert calc_session_count(batch=b) == 1000**3 * 10
+
+
 def test_prepare_values_to_insert(batch_data_collection, batch_graph):
     b = Batch(graph=batch_graph, data=batch_data_collection, runs=2)
     values = prepare_values_to_insert(queue_id="default", batch=b, priority=0, max_new_queue_items=1000)
@@ -189,6 +271,50 @@ def test_prepare_values_to_insert_with_max(batch_data_collection, batch_graph):
     assert len(values) == 5
 
 
+def test_create_values_to_insert_is_lazy(batch_graph):
+    b = Batch(
+        graph=batch_graph,
+        data=[[BatchDatum(node_path=str(i), field_name="prompt", items=[str(x) for x in range(1000)])] for i in (1, 2)],
+    )
+    values = create_values_to_insert(queue_id="default", batch=b, priority=0, max_new_queue_items=10**6)
+    first = next(values)
+    assert first.field_values is not None
+    assert len(list(islice(values, 9))) == 9
+
+
+def peak_memory_to_create_values(batch: Batch, chunk_size: int) -> int:
+    values = create_values_to_insert(queue_id="default", batch=batch, priority=0, max_new_queue_items=10**6)
+    tracemalloc.start()
+    try:
+        while list(islice(values, chunk_size)):
+            pass
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+@pytest.mark.slow
+def test_create_values_to_insert_memory(batch_graph, record_property):
+    def batch(runs: int) -> Batch:
+        return Batch(
+            graph=batch_graph,
+            data=[[BatchDatum(node_path="1", field_name="prompt", items=[str(x) for x in range(100)])]],
+            runs=runs,
+        )
+
+    small = peak_memory_to_create_values(batch(runs=5), chunk_size=100)
+    large = peak_memory_to_create_values(batch(runs=50), chunk_size=100)
+    materialized = len(
+        prepare_values_to_insert(queue_id="default", batch=batch(50), priority=0, max_new_queue_items=10**6)
+    )
+    record_property("peak_memory_500_sessions_kib", small / 1024)
+    record_property("peak_memory_5000_sessions_kib", large / 1024)
+
+    assert materialized == 5000
+    # Memory depends on the chunk size, not on the number of sessions
+    assert large < small * 1.5
+
+
 def test_cannot_create_bad_batch_items_length(batch_graph):
     with pytest.raises(ValidationError, match="Zipped batch items must all have the same length"):
         Batch(
@@ -255,3 +381,297 @@ def test_cannot_create_bad_batch_fields_exist(
                 ],
             ],
         )
+
+
+def count_batch_graphs(db: SqliteDatabase) -> int:
+    return db.conn.execute("SELECT COUNT(*) FROM session_queue_batches").fetchone()[0]
+
+
+def test_enqueue_batch_stores_batch_graph_once(session_queue, db, batch_data_collection, batch_graph):
+    b = Batch(graph=batch_graph, data=batch_data_collection, runs=2)
+    session_queue.enqueue_batch(DEFAULT_QUEUE_ID, b, prepend=False)
+
+    assert count_batch_graphs(db) == 1
+    assert db.conn.execute("SELECT COUNT(*) FROM session_queue WHERE session IS NULL").fetchone()[0] == 8
+
+    # sessions are materialized from the batch graph, with the queue item's field values applied
+    expected = [(session.graph.model_dump(), nfvs) for session, nfvs in create_session_nfv_tuples(b, 1000)]
+    queue_items = []
+    while (queue_item := session_queue.dequeue()) is not None:
+        queue_items.append(queue_item)
+    assert [(q.session.graph.model_dump(), q.field_values) for q in queue_items] == expected
+    assert all(q.session.id == q.session_id for q in queue_items)
+    assert len({q.session_id for q in queue_items}) == 8
+    queue_item = session_queue.get_queue_item(queue_items[0].item_id)
+    assert queue_item.session.id == queue_items[0].session.id
+    assert queue_item.session.graph.model_dump() == queue_items[0].session.graph.model_dump()
+
+
+def test_batch_graph_is_deleted_with_its_queue_items(session_queue, db, batch_data_collection, batch_graph):
+    b = Batch(graph=batch_graph, data=batch_data_collection)
+    session_queue.enqueue_batch(DEFAULT_QUEUE_ID, b, prepend=False)
+    queue_item = session_queue.dequeue()
+    assert queue_item is not None
+
+    session_queue.delete_queue_item(queue_item.item_id)
+    assert count_batch_graphs(db) == 1
+    session_queue.clear(DEFAULT_QUEUE_ID)
+    assert count_batch_graphs(db) == 0
+
+
+def test_session_queue_reports_finished_and_deleted_sessions(session_queue, db, batch_graph):
+    finished = []
+    deleted = []
+    session_queue.on_finished(lambda queue_item: finished.append(queue_item.session_id))
+    session_queue.on_deleted(deleted.append)
+    session_queue.enqueue_batch(DEFAULT_QUEUE_ID, Batch(graph=batch_graph, runs=4), prepend=False)
+    items = db.conn.execute("SELECT item_id, session_id FROM session_queue ORDER BY item_id").fetchall()
+    session_ids = [row[1] for row in items]
+    assert session_queue.get_session_statuses([*session_ids[:2], "missing"]) == {
+        session_ids[0]: "pending",
+        session_ids[1]: "pending",
+    }
+
+    session_queue.cancel_queue_item(items[0][0])
+    assert finished == [session_ids[0]]
+    session_queue.delete_queue_item(items[1][0])
+    session_queue.prune(DEFAULT_QUEUE_ID)
+    session_queue.clear(DEFAULT_QUEUE_ID)
+    assert deleted == [[session_ids[1]], [session_ids[0]], session_ids[2:]]
+    # nothing is reported when nothing is deleted
+    session_queue.prune(DEFAULT_QUEUE_ID)
+    assert len(deleted) == 3
+
+
+def test_session_queue_changes_status_without_materializing_sessions(session_queue, db, batch_graph, monkeypatch):
+    session_queue.enqueue_batch(DEFAULT_QUEUE_ID, Batch(graph=batch_graph, runs=3), prepend=False)
+    queue_item = session_queue.dequeue()
+    assert queue_item is not None
+    materialized = []
+    queue_item_from_dict = SessionQueueItem.queue_item_from_dict
+
+    def recording_queue_item_from_dict(queue_item_dict: dict) -> SessionQueueItem:
+        materialized.append(queue_item_dict["item_id"])
+        return queue_item_from_dict(queue_item_dict)
+
+    monkeypatch.setattr(SessionQueueItem, "queue_item_from_dict", recording_queue_item_from_dict)
+
+    event = ("queue_event", {"event": "graph_execution_state_complete", "data": {"queue_item_id": queue_item.item_id}})
+    asyncio.run(session_queue._on_session_event(event))
+    assert session_queue._get_queue_item_dto(queue_item.item_id).status == "completed"
+    item_ids = [row[0] for row in db.conn.execute("SELECT item_id FROM session_queue WHERE status = 'pending'")]
+    session_queue.delete_queue_item(item_ids[0])
+    assert materialized == []
+    # the canceled item is returned with its session
+    canceled = session_queue.cancel_queue_item(item_ids[1])
+    assert canceled.status == "canceled" and canceled.session.id == canceled.session_id
+    assert materialized == [item_ids[1]]
+
+
+def test_enqueue_batch_with_reused_batch_id(session_queue, db, batch_graph):
+    first = Batch(graph=batch_graph)
+    session_queue.enqueue_batch(DEFAULT_QUEUE_ID, first, prepend=False)
+    other_graph = batch_graph.model_copy(deep=True)
+    other_graph.get_node("1").prompt = "Ford"  # type: ignore
+    second = Batch(batch_id=first.batch_id, graph=other_graph)
+    session_queue.enqueue_batch(DEFAULT_QUEUE_ID, second, prepend=False)
+
+    first_item = session_queue.dequeue()
+    second_item = session_queue.dequeue()
+    assert first_item is not None and second_item is not None
+    assert first_item.session.graph.get_node("1").prompt == "Chevy"  # type: ignore
+    assert second_item.session.graph.get_node("1").prompt == "Ford"  # type: ignore
+
+
+def test_session_queue_migrates_sessions(db, batch_data_collection, batch_graph):
+    # a queue table from before sessions were optional
+    db.conn.execute(
+        """
+        CREATE TABLE session_queue (
+            item_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            batch_id TEXT NOT NULL,
+            queue_id TEXT NOT NULL,
+            session_id TEXT NOT NULL UNIQUE,
+            field_values TEXT,
+            session TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            priority INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            created_at DATETIME NOT NULL DEFAULT(STRFTIME('%Y-%m-%d %H:%M:%f', 'NOW')),
+            updated_at DATETIME NOT NULL DEFAULT(STRFTIME('%Y-%m-%d %H:%M:%f', 'NOW')),
+            started_at DATETIME,
+            completed_at DATETIME
+        );
+        """
+    )
+    b = Batch(graph=batch_graph, data=batch_data_collection)
+    values = prepare_values_to_insert(DEFAULT_QUEUE_ID, b, priority=0, max_new_queue_items=1000)
+    db.conn.executemany(
+        "INSERT INTO session_queue (queue_id, session, session_id, batch_id, field_values, priority) VALUES (?, ?, ?, ?, ?, ?)",
+        values,
+    )
+    db.conn.commit()
+
+    session_queue = start_session_queue(db)
+
+    queue_item = session_queue.dequeue()
+    assert queue_item is not None
+    assert queue_item.session.model_dump_json(warnings=False, exclude_none=True) == values[0].session
+    with pytest.raises(sqlite3.IntegrityError):
+        # the migrated table keeps its constraints
+        db.conn.execute(
+            "INSERT INTO session_queue (queue_id, session_id, batch_id) VALUES (?, ?, ?)",
+            (DEFAULT_QUEUE_ID, queue_item.session_id, b.batch_id),
+        )
+    session_queue.enqueue_batch(DEFAULT_QUEUE_ID, b, prepend=False)
+    assert session_queue.get_queue_status(DEFAULT_QUEUE_ID).pending == 7
+
+
+def database_size(db: SqliteDatabase) -> int:
+    return db.conn.execute("PRAGMA page_count").fetchone()[0] * db.conn.execute("PRAGMA page_size").fetchone()[0]
+
+
+@pytest.mark.slow
+def test_enqueue_batch_benchmark(batch_graph, record_property):
+    b = Batch(
+        graph=batch_graph,
+        data=[[BatchDatum(node_path="1", field_name="prompt", items=[f"prompt {i}" for i in range(10_000)])]],
+    )
+
+    # queue items storing their full session, as before the batch graph was stored once per batch
+    full_db = SqliteDatabase(InvokeAIAppConfig(use_memory_db=True), InvokeAILogger.get_logger())
+    start_session_queue(full_db)
+    start = time.perf_counter()
+    values = create_values_to_insert(DEFAULT_QUEUE_ID, b, priority=0, max_new_queue_items=10_000)
+    with full_db.conn:
+        while chunk := list(islice(values, 100)):
+            full_db.conn.executemany(
+                "INSERT INTO session_queue (queue_id, session, session_id, batch_id, field_values, priority) VALUES (?, ?, ?, ?, ?, ?)",
+                chunk,
+            )
+    full_time = time.perf_counter() - start
+
+    db = SqliteDatabase(InvokeAIAppConfig(use_memory_db=True), InvokeAILogger.get_logger())
+    session_queue = start_session_queue(db)
+    start = time.perf_counter()
+    result = session_queue.enqueue_batch(DEFAULT_QUEUE_ID, b, prepend=False)
+    template_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(100):
+        session_queue.dequeue()
+    dequeue_time = (time.perf_counter() - start) / 100
+
+    record_property("full_sessions_enqueue_s", full_time)
+    record_property("full_sessions_db_mib", database_size(full_db) / 2**20)
+    record_property("batch_graph_enqueue_s", template_time)
+    record_property("batch_graph_db_mib", database_size(db) / 2**20)
+    record_property("dequeue_ms", dequeue_time * 1000)
+    assert result.enqueued == 10_000
+    assert template_time * 3 < full_time
+    assert database_size(db) * 2 < database_size(full_db)
+
+
+def assert_status_counts_match(session_queue, db) -> None:
+    counted = {
+        tuple(row[:3]): row[3]
+        for row in db.conn.execute(
+            "SELECT queue_id, batch_id, status, count(*) FROM session_queue GROUP BY queue_id, batch_id, status"
+        )
+    }
+    maintained = {
+        tuple(row[:3]): row[3]
+        for row in db.conn.execute("SELECT queue_id, batch_id, status, count FROM session_queue_counts")
+    }
+    assert maintained == counted
+    status = session_queue.get_queue_status(DEFAULT_QUEUE_ID)
+    assert status.total == sum(v for (queue_id, _, _), v in counted.items() if queue_id == DEFAULT_QUEUE_ID)
+
+
+def test_session_queue_status_counts(session_queue, db, batch_data_collection, batch_graph):
+    b = Batch(graph=batch_graph, data=batch_data_collection, runs=2)
+    session_queue.enqueue_batch(DEFAULT_QUEUE_ID, b, prepend=False)
+    session_queue.enqueue_batch("other", Batch(graph=batch_graph), prepend=False)
+    assert_status_counts_match(session_queue, db)
+    assert session_queue.get_queue_status(DEFAULT_QUEUE_ID).pending == 8
+
+    first = session_queue.dequeue()
+    second = session_queue.dequeue()
+    assert first is not None and second is not None
+    session_queue.cancel_queue_item(first.item_id)
+    session_queue.delete_queue_item(second.item_id)
+    assert_status_counts_match(session_queue, db)
+    status = session_queue.get_queue_status(DEFAULT_QUEUE_ID)
+    assert (status.pending, status.in_progress, status.canceled, status.total) == (6, 0, 1, 7)
+    assert not session_queue.is_empty(DEFAULT_QUEUE_ID).is_empty
+
+    session_queue.cancel_by_batch_ids(DEFAULT_QUEUE_ID, [b.batch_id])
+    session_queue.prune(DEFAULT_QUEUE_ID)
+    assert_status_counts_match(session_queue, db)
+    assert session_queue.is_empty(DEFAULT_QUEUE_ID).is_empty
+    assert not session_queue.is_empty("other").is_empty
+
+    # the counts are rebuilt on startup
+    db.conn.execute("UPDATE session_queue_counts SET count = 100")
+    db.conn.commit()
+    start_session_queue(db)
+    assert_status_counts_match(session_queue, db)
+
+
+@pytest.mark.parametrize("supports_returning", [True, False])
+def test_dequeue_order(session_queue, batch_graph, monkeypatch, supports_returning):
+    if not supports_returning:
+        monkeypatch.setattr(sqlite3, "sqlite_version_info", (3, 34, 0))
+    first = session_queue.enqueue_batch(DEFAULT_QUEUE_ID, Batch(graph=batch_graph, runs=2), prepend=False)
+    prepended = session_queue.enqueue_batch(DEFAULT_QUEUE_ID, Batch(graph=batch_graph), prepend=True)
+    assert prepended.priority == 1
+
+    next_item = session_queue.get_next(DEFAULT_QUEUE_ID)
+    dequeued = [session_queue.dequeue() for _ in range(4)]
+
+    assert [q.batch_id if q else None for q in dequeued] == [
+        prepended.batch.batch_id,
+        first.batch.batch_id,
+        first.batch.batch_id,
+        None,
+    ]
+    assert next_item is not None and dequeued[0] is not None
+    assert next_item.item_id == dequeued[0].item_id
+    assert dequeued[1] is not None and dequeued[2] is not None
+    assert dequeued[1].item_id < dequeued[2].item_id
+
+
+@pytest.mark.slow
+def test_dequeue_benchmark(batch_graph, record_property):
+    def batch(size: int) -> Batch:
+        return Batch(
+            graph=batch_graph,
+            data=[[BatchDatum(node_path="1", field_name="prompt", items=[f"prompt {i}" for i in range(size)])]],
+        )
+
+    def mean_time(fn, n: int = 100) -> float:
+        start = time.perf_counter()
+        for _ in range(n):
+            fn()
+        return (time.perf_counter() - start) / n
+
+    timings: dict[int, tuple[float, float, float]] = {}
+    for depth in (100, 1_000, 10_000):
+        session_queue = start_session_queue(
+            SqliteDatabase(InvokeAIAppConfig(use_memory_db=True), InvokeAILogger.get_logger())
+        )
+        session_queue.enqueue_batch(DEFAULT_QUEUE_ID, batch(depth), prepend=False)
+        timings[depth] = (
+            mean_time(lambda session_queue=session_queue: session_queue.is_full(DEFAULT_QUEUE_ID)),
+            mean_time(lambda session_queue=session_queue: session_queue.get_queue_status(DEFAULT_QUEUE_ID)),
+            mean_time(session_queue.dequeue, n=50),
+        )
+
+    for depth, (is_full, status, dequeue) in timings.items():
+        record_property(f"depth_{depth}_is_full_ms", is_full * 1000)
+        record_property(f"depth_{depth}_get_queue_status_ms", status * 1000)
+        record_property(f"depth_{depth}_dequeue_ms", dequeue * 1000)
+
+    # none of these depend on the number of queue items
+    for i in range(3):
+        assert timings[10_000][i] < timings[100][i] * 3
@@ -0,0 +1,165 @@
+import asyncio
+import base64
+import io
+import time
+from typing import Any
+
+import numpy as np
+import pytest
+from fastapi import FastAPI
+from PIL import Image
+from socketio import AsyncServer, packet
+
+# This import must happen before other invoke imports or test in other files(!!) break
+from .test_nodes import TestEventService  # noqa: F401
+
+# isort: split
+
+from invokeai.app.api.sockets import SocketIO, get_data_url
+from invokeai.app.services.events.events_base import EventServiceBase
+from invokeai.app.services.invocation_processor.invocation_processor_common import ProgressImage
+
+
+def preview_jpeg(size: int = 128) -> bytes:
+    """A progress image of an SDXL generation, which is smooth like a denoised image"""
+    pixels = np.random.randint(0, 256, (size // 8, size // 8, 3), dtype=np.uint8)
+    image = Image.fromarray(pixels).resize((size, size), Image.Resampling.BICUBIC)
+    jpeg = io.BytesIO()
+    image.save(jpeg, format="JPEG")
+    return jpeg.getvalue()
+
+
+def progress_event(jpeg: bytes, step: int = 1) -> tuple[str, Any]:
+    dispatched: dict[str, Any] = {}
+
+    class RecordingEventService(EventServiceBase):
+        def dispatch(self, event_name: str, payload: Any) -> None:
+            dispatched.update(payload)
+
+    RecordingEventService().emit_generator_progress(
+        queue_id="default",
+        queue_item_id=1,
+        queue_batch_id="batch",
+        graph_execution_state_id="session",
+        node={"id": "node"},
+        source_node_id="node",
+        progress_image=ProgressImage(width=1024, height=1024, jpeg=jpeg),
+        step=step,
+        order=0,
+        total_steps=30,
+    )
+    return EventServiceBase.queue_event, dispatched
+
+
+@pytest.fixture
+def emitted(monkeypatch: pytest.MonkeyPatch) -> list[dict[str, Any]]:
+    emitted: list[dict[str, Any]] = []
+
+    async def emit(self, event, data=None, to=None, room=None, skip_sid=None, **kwargs):
+        emitted.append({"event": event, "data": data, "room": to or room, "skip_sid": skip_sid})
+
+    async def enter_or_leave_room(self, sid, room, namespace=None):
+        pass
+
+    monkeypatch.setattr(AsyncServer, "emit", emit)
+    # the clients of these tests are not connected
+    monkeypatch.setattr(AsyncServer, "enter_room", enter_or_leave_room)
+    monkeypatch.setattr(AsyncServer, "leave_room", enter_or_leave_room)
+    return emitted
+
+
+def test_socketio_sends_progress_images_in_the_format_of_each_client(emitted: list[dict[str, Any]]):
+    socket_io = SocketIO(FastAPI())
+    jpeg = preview_jpeg()
+
+    async def run():
+        await socket_io._handle_sub_queue("json", {"queue_id": "default"})
+        await socket_io._handle_sub_queue("binary", {"queue_id": "default", "progress_image_format": "binary"})
+        await socket_io._handle_queue_event(progress_event(jpeg))
+
+    asyncio.run(run())
+    binary, data_url = emitted
+    assert binary["room"] == ["binary"]
+    assert binary["data"]["progress_image"] == {"width": 1024, "height": 1024, "jpeg": jpeg}
+    assert data_url["room"] == ["json"]
+    assert data_url["data"]["progress_image"] == {"width": 1024, "height": 1024, "dataURL": get_data_url(jpeg)}
+    assert base64.b64decode(get_data_url(jpeg).split(",")[1]) == jpeg
+
+
+def test_socketio_only_encodes_data_urls_for_clients_that_need_them(emitted: list[dict[str, Any]]):
+    socket_io = SocketIO(FastAPI())
+
+    async def run():
+        await socket_io._handle_sub_queue("json", {"queue_id": "default"})
+        await socket_io._handle_sub_queue("binary", {"queue_id": "default", "progress_image_format": "binary"})
+        await socket_io._handle_disconnect("json")
+        await socket_io._handle_queue_event(progress_event(preview_jpeg()))
+        await socket_io._handle_unsub_queue("binary", {"queue_id": "default"})
+        await socket_io._handle_queue_event(progress_event(preview_jpeg()))
+
+    asyncio.run(run())
+    assert [event["room"] for event in emitted] == [["binary"]]
+
+
+def test_socketio_sends_progress_images_at_the_interval_of_each_client(emitted: list[dict[str, Any]]):
+    socket_io = SocketIO(FastAPI())
+    intervals: dict[str, list[int]] = {}
+
+    class RecordingEventService(EventServiceBase):
+        def set_progress_image_intervals(self, queue_id: str, intervals_: list[int]) -> None:
+            intervals[queue_id] = intervals_
+
+    socket_io.set_event_service(RecordingEventService())
+
+    async def run():
+        await socket_io._handle_sub_queue("every", {"queue_id": "default"})
+        await socket_io._handle_sub_queue("third", {"queue_id": "default", "progress_image_interval": 3})
+        await socket_io._handle_sub_queue("none", {"queue_id": "default", "progress_image_interval": 0})
+        assert intervals == {"default": [1, 3, 0]}
+        for step in [0, 1, 2, 4, 5]:
+            await socket_io._handle_queue_event(progress_event(preview_jpeg(), step))
+        await socket_io._handle_disconnect("every")
+        assert intervals == {"default": [3, 0]}
+
+    asyncio.run(run())
+    with_image = [(event["data"]["step"], event["room"]) for event in emitted if event["data"]["progress_image"]]
+    # the images of steps 3 and 4 were not made, so the next one is sent instead
+    assert with_image == [
+        (0, ["every", "third"]),
+        (1, ["every"]),
+        (2, ["every"]),
+        (4, ["every", "third"]),
+        (5, ["every"]),
+    ]
+    without_image = [
+        (event["data"]["step"], event["skip_sid"]) for event in emitted if not event["data"]["progress_image"]
+    ]
+    assert without_image == [
+        (0, ["every", "third"]),
+        (1, ["every"]),
+        (2, ["every"]),
+        (4, ["every", "third"]),
+        (5, ["every"]),
+    ]
+
+
+@pytest.mark.slow
+def test_socketio_progress_image_payload_benchmark(record_property):
+    jpeg = preview_jpeg()
+    _, payload = progress_event(jpeg)
+    data = payload["data"]
+    data_url_data = {**data, "progress_image": {"width": 1024, "height": 1024, "dataURL": get_data_url(jpeg)}}
+
+    results = {}
+    for name, event_data in [("data URL", data_url_data), ("binary", data)]:
+        start = time.perf_counter()
+        for _ in range(1000):
+            encoded = packet.Packet(packet.EVENT, data=["generator_progress", event_data]).encode()
+        encode_time = (time.perf_counter() - start) / 1000
+        parts = encoded if isinstance(encoded, list) else [encoded]
+        size = sum(len(part.encode() if isinstance(part, str) else part) for part in parts)
+        results[name] = size
+        record_property(f"{name}_bytes", size)
+        record_property(f"{name}_frames", len(parts))
+        record_property(f"{name}_encode_us", encode_time * 1e6)
+    assert results["binary"] < results["data URL"] * 0.8
@@ -1,3 +1,8 @@
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import pytest
 from pydantic import BaseModel, Field
 
@@ -133,3 +138,118 @@ def test_sqlite_service_can_search_with_pagination_and_offset(db: SqliteItemStor
     assert results.per_page == 2
     assert results.total == 3
     assert results.items == [TestModel(id="3", name="Test")]
+
+
+def wal_database(tmp_path, **kwargs) -> SqliteDatabase:
+    config = InvokeAIAppConfig(root=tmp_path, db_wal_mode=True, **kwargs)
+    return SqliteDatabase(config, InvokeAILogger.get_logger())
+
+
+def test_sqlite_database_uses_wal_mode(tmp_path):
+    db = wal_database(tmp_path, db_read_connections=2, db_synchronous="normal", db_cache_size=-4000)
+    assert db.conn.execute("PRAGMA journal_mode;").fetchone()[0] == "wal"
+    assert db.conn.execute("PRAGMA synchronous;").fetchone()[0] == 1
+    assert db.conn.execute("PRAGMA cache_size;").fetchone()[0] == -4000
+    with db.read() as cursor:
+        assert cursor.execute("PRAGMA synchronous;").fetchone()[0] == 1
+        assert cursor.execute("PRAGMA cache_size;").fetchone()[0] == -4000
+
+
+def test_sqlite_database_reads_see_committed_writes(tmp_path):
+    db = wal_database(tmp_path)
+    db.conn.execute("CREATE TABLE test (id INTEGER PRIMARY KEY);")
+    db.conn.commit()
+    db.conn.execute("INSERT INTO test (id) VALUES (1);")
+    with db.read() as cursor:
+        assert cursor.execute("SELECT COUNT(*) FROM test;").fetchone()[0] == 0
+    db.conn.commit()
+    with db.read() as cursor:
+        assert cursor.execute("SELECT COUNT(*) FROM test;").fetchone()[0] == 1
+
+
+def test_sqlite_database_reads_are_read_only(tmp_path):
+    db = wal_database(tmp_path)
+    db.conn.execute("CREATE TABLE test (id INTEGER PRIMARY KEY);")
+    db.conn.commit()
+    with db.read() as cursor, pytest.raises(sqlite3.OperationalError):
+        cursor.execute("INSERT INTO test (id) VALUES (1);")
+
+
+def test_sqlite_database_reads_do_not_wait_for_lock(tmp_path):
+    db = wal_database(tmp_path)
+    db.conn.execute("CREATE TABLE test (id INTEGER PRIMARY KEY);")
+    db.conn.commit()
+
+    def read() -> int:
+        with db.read() as cursor:
+            return cursor.execute("SELECT COUNT(*) FROM test;").fetchone()[0]
+
+    with db.lock:
+        db.conn.execute("INSERT INTO test (id) VALUES (1);")
+        with ThreadPoolExecutor(1) as executor:
+            # the write is in progress, so readers see the last committed state
+            assert executor.submit(read).result(timeout=5) == 0
+        db.conn.commit()
+    assert read() == 1
+
+
+def test_sqlite_database_memory_db_reads_use_shared_connection():
+    db = SqliteDatabase(InvokeAIAppConfig(use_memory_db=True, db_wal_mode=True), InvokeAILogger.get_logger())
+    db.conn.execute("CREATE TABLE test (id INTEGER PRIMARY KEY);")
+    db.conn.execute("INSERT INTO test (id) VALUES (1);")
+    with db.read() as cursor:
+        assert cursor.connection is db.conn
+        assert cursor.execute("SELECT COUNT(*) FROM test;").fetchone()[0] == 1
+
+
+def read_latencies(db: SqliteDatabase, readers: int, duration: float) -> list[float]:
+    """Measures the latency of reads while a writer holds the lock for a few milliseconds at a time"""
+    db.conn.execute("CREATE TABLE test (id INTEGER PRIMARY KEY, value TEXT);")
+    db.conn.executemany("INSERT INTO test (value) VALUES (?);", (("x" * 100,) for _ in range(10000)))
+    db.conn.commit()
+
+    stop = threading.Event()
+
+    def write():
+        # like a session saving its state after each node
+        while not stop.is_set():
+            with db.lock:
+                db.conn.execute("INSERT INTO test (value) VALUES (?);", ("x" * 100,))
+                time.sleep(0.05)
+                db.conn.commit()
+
+    def read() -> list[float]:
+        latencies = []
+        while not stop.is_set():
+            start = time.perf_counter()
+            with db.read() as cursor:
+                cursor.execute("SELECT * FROM test ORDER BY id DESC LIMIT 100;").fetchall()
+            latencies.append(time.perf_counter() - start)
+            time.sleep(0.001)
+        return latencies
+
+    with ThreadPoolExecutor(readers + 1) as executor:
+        writer = executor.submit(write)
+        futures = [executor.submit(read) for _ in range(readers)]
+        time.sleep(duration)
+        stop.set()
+        writer.result()
+        return sorted(latency for future in futures for latency in future.result())
+
+
+@pytest.mark.slow
+def test_sqlite_database_concurrent_reads_benchmark(tmp_path, record_property):
+    results = {}
+    for wal_mode in [False, True]:
+        config = InvokeAIAppConfig(root=tmp_path / str(wal_mode), db_wal_mode=wal_mode)
+        latencies = read_latencies(SqliteDatabase(config, InvokeAILogger.get_logger()), readers=4, duration=2)
+        median = latencies[len(latencies) // 2]
+        p99 = latencies[len(latencies) * 99 // 100]
+        record_property(f"wal_mode={wal_mode}_reads", len(latencies))
+        record_property(f"wal_mode={wal_mode}_median_ms", median * 1000)
+        record_property(f"wal_mode={wal_mode}_p99_ms", p99 * 1000)
+        results[wal_mode] = (len(latencies), median, p99)
+
+    # without the write-ahead log, reads wait for the writer to release the lock
+    assert results[True][0] > results[False][0] * 2
+    assert results[True][1] < results[False][1] / 2
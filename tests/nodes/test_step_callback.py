@@ -0,0 +1,91 @@
+import time
+from typing import Any
+
+import pytest
+import torch
+
+# This import must happen before other invoke imports or test in other files(!!) break
+from .test_nodes import TestEventService  # noqa: F401
+
+# isort: split
+
+from invokeai.app.invocations.baseinvocation import InvocationContext
+from invokeai.app.services.events.events_base import EventServiceBase
+from invokeai.app.services.invocation_queue.invocation_queue_memory import MemoryInvocationQueue
+from invokeai.app.services.invocation_services import InvocationServices
+from invokeai.app.util.step_callback import stable_diffusion_step_callback
+from invokeai.backend.model_management.models import BaseModelType
+from invokeai.backend.stable_diffusion import PipelineIntermediateState
+
+
+class WatchedEventService(EventServiceBase):
+    def __init__(self, interval: int):
+        self.interval = interval
+        self.progress_images: list[Any] = []
+
+    def dispatch(self, event_name: str, payload: Any) -> None:
+        self.progress_images.append(payload["data"]["progress_image"])
+
+    def wants_progress_image(self, queue_id: str, step: int) -> bool:
+        return self.interval > 0 and step % self.interval == 0
+
+
+def make_context(events: EventServiceBase) -> InvocationContext:
+    services = InvocationServices(
+        board_image_records=None,  # type: ignore
+        board_images=None,  # type: ignore
+        board_records=None,  # type: ignore
+        boards=None,  # type: ignore
+        configuration=None,  # type: ignore
+        events=events,
+        graph_execution_manager=None,  # type: ignore
+        graph_library=None,  # type: ignore
+        image_files=None,  # type: ignore
+        image_records=None,  # type: ignore
+        images=None,  # type: ignore
+        invocation_cache=None,  # type: ignore
+        latents=None,  # type: ignore
+        logger=None,  # type: ignore
+        model_manager=None,  # type: ignore
+        model_records=None,  # type: ignore
+        names=None,  # type: ignore
+        performance_statistics=None,  # type: ignore
+        processor=None,  # type: ignore
+        queue=MemoryInvocationQueue(),
+        session_processor=None,  # type: ignore
+        session_queue=None,  # type: ignore
+        urls=None,  # type: ignore
+        workflow_records=None,  # type: ignore
+        workflow_image_records=None,  # type: ignore
+        latents_collector=None,  # type: ignore
+    )
+    return InvocationContext(services, "default", 1, "batch", "session")
+
+
+def run_steps(context: InvocationContext, steps: int, size: int = 64) -> None:
+    latents = torch.randn(1, 4, size, size)
+    for step in range(steps):
+        state = PipelineIntermediateState(step=step, order=1, total_steps=steps, timestep=0, latents=latents)
+        stable_diffusion_step_callback(context, state, {"id": "node"}, "node", BaseModelType.StableDiffusionXL)
+
+
+def test_step_callback_only_makes_progress_images_that_are_wanted():
+    for interval, expected in [(1, 4), (3, 2), (0, 0)]:
+        events = WatchedEventService(interval)
+        run_steps(make_context(events), 4)
+        assert len(events.progress_images) == 4
+        assert len([image for image in events.progress_images if image is not None]) == expected
+        assert all(image["width"] == 512 for image in events.progress_images if image is not None)
+
+
+@pytest.mark.slow
+def test_step_callback_benchmark(record_property):
+    results = {}
+    for name, interval in [("every step", 1), ("every 5 steps", 5), ("no watchers", 0)]:
+        context = make_context(WatchedEventService(interval))
+        run_steps(context, 2, 128)
+        start = time.perf_counter()
+        run_steps(context, 50, 128)
+        results[interval] = (time.perf_counter() - start) / 50
+        record_property(f"{name}_ms_per_step", results[interval] * 1000)
+    assert results[0] < results[1] / 10
@@ -1,9 +1,14 @@
+import threading
 from pathlib import Path
 
 import pytest
+import torch
 
 from invokeai.app.services.config.config_default import InvokeAIAppConfig
 from invokeai.backend import BaseModelType, ModelManager, ModelType, SubModelType
+from invokeai.backend.model_management import model_manager as model_manager_module
+from invokeai.backend.model_management.model_cache import ModelCache, _CacheRecord
+from invokeai.backend.util.devices import bind_thread_to_device
 
 BASIC_MODEL_NAME = ("SDXL base", BaseModelType.StableDiffusionXL, ModelType.Main)
 VAE_OVERRIDE_MODEL_NAME = ("SDXL with VAE", BaseModelType.StableDiffusionXL, ModelType.Main)
@@ -45,3 +50,59 @@ def test_get_model_path_for_null_overridden_vae(model_manager: ModelManager, dat
     )
     vae_model_path, is_override = model_manager._get_model_path(model_config, SubModelType.Vae)
     assert not is_override
+
+
+def test_model_manager_has_a_cache_per_device(model_manager: ModelManager):
+    def bound_cache(device: str) -> ModelCache:
+        caches = []
+
+        def get_cache():
+            bind_thread_to_device(device)
+            caches.append(model_manager.cache)
+
+        thread = threading.Thread(target=get_cache)
+        thread.start()
+        thread.join()
+        return caches[0]
+
+    default_cache = model_manager.cache
+    max_cache_size = default_cache.max_cache_size
+    cpu_cache = bound_cache("cpu")
+    assert cpu_cache.execution_device == torch.device("cpu")
+    assert cpu_cache is bound_cache("cpu")
+    assert cpu_cache is not default_cache
+    assert bound_cache("auto") is default_cache
+    # the caches share the RAM budget
+    assert cpu_cache.max_cache_size == default_cache.max_cache_size == max_cache_size / 2
+
+
+def test_model_manager_shares_the_cache_of_the_current_cuda_device(model_manager: ModelManager, monkeypatch):
+    monkeypatch.setattr(model_manager, "_device_type", "cuda")
+    monkeypatch.setattr(torch.cuda, "is_available", lambda: False)
+    cache = model_manager.cache
+    assert cache.execution_device == torch.device("cuda", 0)
+    # a worker bound to "cuda:0"
+    monkeypatch.setattr(model_manager_module, "get_thread_device", lambda: torch.device("cuda:0"))
+    assert model_manager.cache is cache
+
+
+class DeviceModel(torch.nn.Linear):
+    @property
+    def device(self) -> torch.device:
+        return self.weight.device
+
+
+def test_model_cache_locks_models_in_use():
+    cache = ModelCache(execution_device=torch.device("cpu"), lazy_offloading=False)
+    cache._cached_models["model"] = _CacheRecord(cache, DeviceModel(1, 1), 1)
+    locker = cache.ModelLocker(cache, "model", cache._cached_models["model"].model, True, 1)
+
+    with locker:
+        assert cache._cached_models["model"].locked
+        # the cache is not held while the model is in use, so other threads can change it
+        thread = threading.Thread(target=cache.uncache_model, args=("model",))
+        thread.start()
+        thread.join(1)
+        assert not thread.is_alive()
+        assert "model" not in cache._cached_models
+    assert not locker.cache_entry.locked